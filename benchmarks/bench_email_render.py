@@ -0,0 +1,80 @@
+"""
+Micro-benchmark del render de emails (plantillas Jinja2 precompiladas).
+
+Mide el email de lead (consulta general, presupuesto con varios productos),
+el reporte de errores y el envío completo de un lead con el transporte a
+archivo (EMAIL_TRANSPORT=file), sin tocar SES.
+
+Uso:
+    python -m benchmarks.bench_email_render [--iterations 2000]
+"""
+import argparse
+import logging
+import tempfile
+import timeit
+
+from chatbot.models import ConversacionData, DatosContacto, EstadoConversacion, TipoConsulta
+
+
+def _conversacion(tipo: TipoConsulta, items: int = 0) -> ConversacionData:
+    presupuesto_items = [
+        {
+            "kind": "extintor",
+            "summary": f"Compra de {idx + 1} extintores de 5 kg PQ (ABC).",
+            "details": {"cantidad": str(idx + 1), "capacidad": "5 kg", "tipo": "PQ (ABC)", "servicio": "compra"},
+        }
+        for idx in range(max(items - 1, 0))
+    ]
+    if items:
+        presupuesto_items.append({
+            "kind": "ifci",
+            "details": {"nivel": "No sé", "hidrantes": "4", "establecimiento": "PB y 2 pisos", "detectores": "Sí", "plano": "No"},
+        })
+    return ConversacionData(
+        numero_telefono="+5491112345678",
+        estado=EstadoConversacion.ENVIANDO,
+        tipo_consulta=tipo,
+        datos_contacto=DatosContacto(
+            email="lead@example.com",
+            direccion="Av. Rivadavia 1234, CABA",
+            horario_visita="Lunes a viernes 9 a 17",
+            descripcion="Necesito asesoramiento para la dotación de un depósito.",
+            razon_social="ACME SA",
+            cuit="30-12345678-9",
+        ),
+        datos_temporales={"_presupuesto_items": presupuesto_items},
+    )
+
+
+def main():
+    from services.email_service import EmailService, email_service
+    from services.email_transport import FileTransport
+    from services.error_reporter import error_reporter
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    # El envío registra cada intento en INFO; no es parte de lo que se mide
+    logging.disable(logging.INFO)
+    sink = tempfile.TemporaryDirectory(prefix="email_sink_")
+    offline_service = EmailService(transport=FileTransport(sink.name))
+
+    casos = {
+        "lead consulta general": lambda c=_conversacion(TipoConsulta.OTRAS): email_service._generate_email_html(c),
+        "lead presupuesto (5 ítems)": lambda c=_conversacion(TipoConsulta.PRESUPUESTO, 5): email_service._generate_email_html(c),
+        "reporte de error": lambda: error_reporter._build_email(
+            "[Chatbot Error] exception",
+            ["Trigger: exception", "Company: Test | Env: bench", "Conversation: abc | Phone: +54911****5678"],
+            {"exception_type": "ValueError", "message": "campo inválido", "stack": "Traceback ..." * 20},
+        ),
+        "lead completo (file sink)": lambda c=_conversacion(TipoConsulta.PRESUPUESTO, 5): offline_service.enviar_lead_email(c),
+    }
+    for nombre, fn in casos.items():
+        elapsed = min(timeit.repeat(fn, number=args.iterations, repeat=3))
+        print(f"{nombre:<28}: {elapsed / args.iterations * 1e6:8.2f} µs/render")
+    sink.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark de los detectores regex de NLU.
+
+Compara el recorrido patrón por patrón (implementación anterior) contra las
+alternancias compiladas en una sola pasada.
+
+Uso:
+    python -m benchmarks.bench_nlu_regex [--iterations 2000]
+"""
+import argparse
+import re
+import timeit
+
+from chatbot.message_context import MessageContext
+from services.nlu_service import (
+    CONTACT_QUERY_PATTERNS,
+    CONTACT_QUERY_REGEX,
+    CONTACT_RESPONSE_FIELD_PATTERNS,
+    CONTACT_RESPONSE_FIELD_REGEX,
+    HUMAN_INTENT_PATTERNS,
+    HUMAN_INTENT_REGEX,
+    HUMAN_NEGATION_PATTERNS,
+    HUMAN_NEGATION_REGEX,
+)
+
+MENSAJES = [
+    "hola",
+    "necesito un presupuesto para 3 matafuegos de 5kg",
+    "cuál es su teléfono?",
+    "quiero hablar con una persona",
+    "no quiero hablar con nadie, solo cotizar",
+    "juan@empresa.com, Av. Corrientes 1234 CABA, de 9 a 17",
+    "hasta que hora atienden?",
+    "ninguna de las anteriores",
+    "tengo una urgencia, se disparó el sistema de incendio",
+    "gracias!!",
+]
+
+
+def _legacy(texts):
+    for text in texts:
+        for pattern in CONTACT_QUERY_PATTERNS:
+            if re.search(pattern, text, re.IGNORECASE):
+                break
+        negated = any(re.search(neg, text, re.IGNORECASE) for neg in HUMAN_NEGATION_PATTERNS)
+        if not negated:
+            for pattern in HUMAN_INTENT_PATTERNS:
+                if re.search(pattern, text, re.IGNORECASE):
+                    break
+        for patterns in CONTACT_RESPONSE_FIELD_PATTERNS.values():
+            any(re.search(pattern, text, re.IGNORECASE) for pattern in patterns)
+
+
+def _compiled(texts):
+    for text in texts:
+        CONTACT_QUERY_REGEX.search(text)
+        if not HUMAN_NEGATION_REGEX.search(text):
+            HUMAN_INTENT_REGEX.search(text)
+        for compiled in CONTACT_RESPONSE_FIELD_REGEX.values():
+            compiled.search(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    texts = [MessageContext(m).accent_free for m in MENSAJES]
+    calls = args.iterations * len(texts)
+
+    legacy = min(timeit.repeat(lambda: _legacy(texts), number=args.iterations, repeat=3))
+    compiled = min(timeit.repeat(lambda: _compiled(texts), number=args.iterations, repeat=3))
+
+    print(f"patrón por patrón : {legacy / calls * 1e6:8.2f} µs/mensaje")
+    print(f"alternancia única : {compiled / calls * 1e6:8.2f} µs/mensaje")
+    print(f"speedup           : {legacy / compiled:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
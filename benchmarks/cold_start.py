@@ -0,0 +1,262 @@
+"""
+Arranque en frío de la app: import de main, lifespan (warmup) y primer webhook.
+
+Cada ronda es un proceso de Python nuevo, como una instancia de Cloud Run que
+escala desde cero. Se mide:
+- el import de `main` con `-X importtime` (total, sin contar FastAPI, y los
+  módulos que más pesan);
+- el lifespan completo (proyección del inbox + warmups en paralelo) contra un
+  Graph API y un OpenAI locales y Firestore en memoria con latencia por RPC;
+- el primer webhook firmado ("hola") hasta la respuesta.
+
+También falla si `import main` carga alguno de los SDKs que los servicios
+importan bajo demanda (LAZY_MODULES). Compara contra
+benchmarks/baselines/cold_start_baseline.json.
+
+Uso:
+    python -m benchmarks.cold_start [--runs 5] [--firestore-latency-ms 10] [--no-warmup] [--check] [--update-baseline]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "cold_start_baseline.json")
+
+# SDKs que los servicios cargan recién al crear su cliente (openai ~0.5 s, gspread ~0.2 s, firestore ~0.15 s)
+LAZY_MODULES = ("openai", "gspread", "google.cloud.firestore", "google.api_core.exceptions", "boto3")
+# Presupuesto del import de main sin contar FastAPI, relativo al import de FastAPI (mide la
+# velocidad de la máquina): ~0.8 con los SDKs bajo demanda, ~2.2 cuando se importaban con main
+IMPORT_BUDGET_RATIO = float(os.getenv("COLD_START_IMPORT_BUDGET_RATIO", "1.2"))
+# Tiempos de arranque: dependen de la máquina y del disco, la tolerancia es amplia
+LATENCY_FACTOR = 2.0
+# Margen absoluto: en mediciones de decenas de ms el ruido del scheduler no es regresión
+LATENCY_SLACK_MS = 50.0
+METRICS = ("import_ms", "app_import_ms", "lifespan_ms", "first_response_ms", "total_ms")
+RESULT_PREFIX = "COLD_START_RESULT "
+DEFAULT_MESSAGE = "hola"
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int, int]]:
+    """módulo -> (µs propios, µs acumulados, profundidad) a partir de la salida de `-X importtime`."""
+    modules: Dict[str, Tuple[int, int, int]] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        head, cumulative_us, name = line.split("|")
+        self_us = head.split(":")[1]
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def bench_environment(extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    from benchmarks.hot_paths import BENCH_ENV_DEFAULTS
+
+    env = dict(os.environ)
+    for key, value in BENCH_ENV_DEFAULTS.items():
+        env.setdefault(key, value)
+    env.setdefault("AGENT_WHATSAPP_NUMBER", "+5491100000000")
+    env.update({"JOB_RUNNER_ENABLED": "false", "JOB_LEASE_BACKEND": "local", "PYTHONDONTWRITEBYTECODE": "1"})
+    env.update(extra or {})
+    return env
+
+
+def measure_import(env: Optional[Dict[str, str]] = None, top: int = 8) -> Dict[str, Any]:
+    """Importa `main` en un proceso nuevo con `-X importtime`."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=REPO_DIR,
+        env=env or bench_environment(),
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import main falló:\n{completed.stderr[-2000:]}")
+    modules = parse_importtime(completed.stderr)
+    main_us = modules["main"][1]
+    framework_us = modules.get("fastapi", (0, 0, 0))[1]
+    # Hijos directos de main: ahí se ve qué servicio o SDK trae cada costo
+    children = sorted(
+        ((name, cumulative) for name, (_, cumulative, depth) in modules.items() if depth == 1),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return {
+        "import_ms": round(main_us / 1000, 1),
+        "app_import_ms": round((main_us - framework_us) / 1000, 1),
+        "app_import_ratio": round((main_us - framework_us) / framework_us, 2) if framework_us else None,
+        "lazy_loaded": [name for name in LAZY_MODULES if name in modules],
+        "top": [(name, round(cumulative / 1000, 1)) for name, cumulative in children[:top]],
+    }
+
+
+def _child(firestore_latency_ms: float, message: str) -> None:
+    """Proceso medido: import de main, lifespan y primer webhook."""
+    started = time.perf_counter()
+    import main as main_module
+
+    imported = time.perf_counter()
+    from fastapi.testclient import TestClient
+
+    from benchmarks.load_test import build_payload, sign
+    from services.in_memory_firestore import InMemoryFirestoreClient
+
+    store = InMemoryFirestoreClient(latency_seconds=firestore_latency_ms / 1000)
+    main_module.conversation_session_service._fs_client = store
+    main_module.handoff_inbox_service._firestore_client = store
+    body = json.dumps(build_payload("5491177000001", "text", message, "wamid.cold-start-1")).encode()
+    headers = {"Content-Type": "application/json", "X-Hub-Signature-256": sign(body)}
+
+    client = TestClient(main_module.app)
+    lifespan_started = time.perf_counter()
+    with client:
+        ready = time.perf_counter()
+        response = client.post("/webhook/whatsapp", content=body, headers=headers)
+        answered = time.perf_counter()
+    print(RESULT_PREFIX + json.dumps({
+        "import_ms": round((imported - started) * 1000, 1),
+        "lifespan_ms": round((ready - lifespan_started) * 1000, 1),
+        "first_response_ms": round((answered - ready) * 1000, 1),
+        "status": response.status_code,
+    }), flush=True)
+
+
+def measure_first_request(env: Dict[str, str], firestore_latency_ms: float, message: str = DEFAULT_MESSAGE) -> Dict[str, Any]:
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.cold_start", "--child", "--firestore-latency-ms", str(firestore_latency_ms), "--message", message],
+        cwd=REPO_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    total_ms = round((time.perf_counter() - started) * 1000, 1)
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            result = json.loads(line[len(RESULT_PREFIX):])
+            # Proceso completo: arranque del intérprete, import, lifespan, primer webhook y apagado
+            result["total_ms"] = total_ms
+            return result
+    raise RuntimeError(f"el proceso medido no reportó resultados:\n{completed.stderr[-2000:]}")
+
+
+def run_benchmark(
+    runs: int = 5, firestore_latency_ms: float = 10.0, warmup: bool = True, message: str = DEFAULT_MESSAGE
+) -> Dict[str, Any]:
+    from benchmarks.load_test import configure_environment, fake_graph_api, fake_openai
+
+    graph = fake_graph_api().start()
+    llm = fake_openai(0.05).start()
+    sink = tempfile.TemporaryDirectory(prefix="cold_start_")
+    saved_environ = dict(os.environ)
+    try:
+        configure_environment(graph.url, llm.url, sink.name)
+        env = bench_environment({"STARTUP_WARMUP_ENABLED": "true" if warmup else "false"})
+        imports = [measure_import(env) for _ in range(runs)]
+        first_requests = [measure_first_request(env, firestore_latency_ms, message) for _ in range(runs)]
+    finally:
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        graph.stop()
+        llm.stop()
+        sink.cleanup()
+
+    report: Dict[str, Any] = {
+        "runs": runs,
+        "import_ms": statistics.median(item["import_ms"] for item in imports),
+        "app_import_ms": statistics.median(item["app_import_ms"] for item in imports),
+        "app_import_ratio": statistics.median(item["app_import_ratio"] for item in imports),
+        "lifespan_ms": statistics.median(item["lifespan_ms"] for item in first_requests),
+        "first_response_ms": statistics.median(item["first_response_ms"] for item in first_requests),
+        "total_ms": statistics.median(item["total_ms"] for item in first_requests),
+        "statuses": sorted({item["status"] for item in first_requests}),
+        "lazy_loaded": sorted({name for item in imports for name in item["lazy_loaded"]}),
+        "top": imports[-1]["top"],
+    }
+    return report
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def compare_to_baseline(
+    report: Dict[str, Any],
+    baseline: Dict[str, Any],
+    latency_factor: float = LATENCY_FACTOR,
+    import_budget_ratio: float = IMPORT_BUDGET_RATIO,
+) -> List[str]:
+    """Lista de regresiones (vacía si el arranque está en línea con el baseline y el presupuesto)."""
+    regressions = [f"import main carga {name} (debe importarse bajo demanda)" for name in report.get("lazy_loaded", [])]
+    if report["app_import_ratio"] > import_budget_ratio:
+        regressions.append(
+            f"import main sin FastAPI: {report['app_import_ratio']}x el import de FastAPI > presupuesto {import_budget_ratio}x"
+        )
+    for metric in METRICS:
+        expected = baseline.get(metric)
+        if expected and report.get(metric) is not None and report[metric] > expected * latency_factor + LATENCY_SLACK_MS:
+            regressions.append(f"{metric}: {report[metric]} ms > {latency_factor}x baseline {expected} ms")
+    return regressions
+
+
+def write_baseline(report: Dict[str, Any], path: str = BASELINE_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump({metric: report[metric] for metric in METRICS}, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="procesos nuevos por medición")
+    parser.add_argument("--firestore-latency-ms", type=float, default=10.0, help="latencia simulada por RPC de Firestore")
+    parser.add_argument("--message", default=DEFAULT_MESSAGE, help="texto del primer webhook")
+    parser.add_argument("--no-warmup", action="store_true", help="arrancar con STARTUP_WARMUP_ENABLED=false")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--check", action="store_true", help="salir con 1 si hay regresiones")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_DIR)
+    if args.child:
+        _child(args.firestore_latency_ms, args.message)
+        return 0
+
+    report = run_benchmark(args.runs, args.firestore_latency_ms, warmup=not args.no_warmup, message=args.message)
+    baseline = load_baseline(args.baseline)
+
+    print(f"{'medición (mediana)':<22}{'ms':>10}{'baseline':>10}")
+    for metric in METRICS:
+        expected = baseline.get(metric)
+        print(f"{metric:<22}{report[metric]:>10}{expected if expected is not None else '-':>10}")
+    print(f"import de main sin FastAPI: {report['app_import_ratio']}x el import de FastAPI (presupuesto {IMPORT_BUDGET_RATIO}x)")
+    print(f"status del primer webhook: {report['statuses']}")
+    print("import de main por módulo (ms acumulados): " + ", ".join(f"{name} {ms}" for name, ms in report["top"]))
+
+    if args.update_baseline:
+        write_baseline(report, args.baseline)
+        print(f"Baseline actualizado: {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(report, baseline)
+    for regression in regressions:
+        print(f"REGRESIÓN {regression}")
+    return 1 if regressions and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""
+Micro-benchmarks de las funciones calientes del bot (CPU puro), con asignaciones.
+
+Mide tiempo por operación (mínimo y mediana de varias rondas) y memoria con
+tracemalloc (pico transitorio y bytes retenidos por operación) para:
+normalización y matcheo de menú, detectores de agradecimiento y de pedido de
+humano, `extract_message_data` sobre payloads reales de Meta
+(benchmarks/data/meta_webhook_payloads.json), serialize/hydrate de
+checkpoints, `list_cases` del inbox con 10/100/1000 casos sobre Firestore en
+memoria, el estado de la cola para el agente y el HTML del email de lead.
+
+Compara contra benchmarks/baselines/hot_paths_baseline.json: tiempo con
+tolerancia amplia (depende de la máquina) y asignaciones con tolerancia
+estricta (son deterministas).
+
+Uso:
+    python -m benchmarks.hot_paths [--iterations 2000] [--only list_cases] [--check] [--update-baseline]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PAYLOADS_PATH = os.path.join(BENCH_DIR, "data", "meta_webhook_payloads.json")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "hot_paths_baseline.json")
+
+LATENCY_FACTOR = 3.0
+ALLOC_FACTOR = 1.25
+# Margen absoluto: diferencias de pocos objetos entre versiones de Python no son regresiones
+ALLOC_SLACK_BYTES = 512
+ROUNDS = 5
+# Presupuesto de tiempo por ronda; los casos lentos (list_cases_1000) corren menos iteraciones
+ROUND_BUDGET_SECONDS = 0.1
+
+MENSAJES = [
+    "hola",
+    "Hola! buen día",
+    "necesito un presupuesto para 3 matafuegos de 5kg",
+    "cuál es su teléfono?",
+    "quiero hablar con una persona",
+    "no quiero hablar con nadie, solo cotizar",
+    "1",
+    "presupuesto",
+    "muchas gracias!! 🙏",
+    "tengo una urgencia, se disparó el sistema de incendio",
+]
+
+BENCH_ENV_DEFAULTS = {
+    "COMPANY_PROFILE": "argenfuego",
+    "META_WA_ACCESS_TOKEN": "bench-token",
+    "META_WA_PHONE_NUMBER_ID": "123456789",
+    "META_WA_APP_SECRET": "bench-secret",
+    "META_WA_VERIFY_TOKEN": "bench-verify",
+    "AGENT_WHATSAPP_NUMBER": "+5491100000000",
+    "OPENAI_API_KEY": "bench-key",
+    "AWS_REGION": "us-east-1",
+    "EMAIL_TRANSPORT": "file",
+    "ENABLE_ERROR_EMAILS": "false",
+    "ENABLE_SHEETS_METRICS": "false",
+}
+
+
+@dataclass
+class Case:
+    name: str
+    run: Callable[[], Any]
+    # Operaciones por llamada a `run` (los casos de texto recorren MENSAJES entero)
+    ops: int = 1
+
+
+class _NoCheckpoints:
+    def load_for_key(self, numero_telefono):
+        return None
+
+    def delete_for_key(self, numero_telefono):
+        return None
+
+
+def load_payloads(path: str = PAYLOADS_PATH) -> Dict[str, dict]:
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def _seeded_inbox(cases: int):
+    from services.handoff_inbox_models import HandoffInboxCaseRecord, HandoffInboxCaseStatus
+    from services.handoff_inbox_service import HandoffInboxService
+    from services.in_memory_firestore import InMemoryFirestoreClient
+
+    store = InMemoryFirestoreClient()
+    service = HandoffInboxService(collection_name="bench_cases", firestore_client=store)
+    base = datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc)
+    for index in range(cases):
+        created_at = base + timedelta(seconds=index)
+        # Uno de cada diez activo, el resto en cola; algunos cerrados para que el filtro trabaje
+        status = (
+            HandoffInboxCaseStatus.ACTIVE if index % 10 == 0
+            else HandoffInboxCaseStatus.CLOSED if index % 7 == 0
+            else HandoffInboxCaseStatus.QUEUED
+        )
+        record = HandoffInboxCaseRecord(
+            case_id=f"case-{index:05d}",
+            client_phone=f"+54911{50000000 + index:08d}",
+            client_name=f"Cliente {index}",
+            tipo_consulta="presupuesto",
+            status=status,
+            has_unread=index % 3 == 0,
+            handoff_context="Necesito recargar los matafuegos del depósito",
+            last_client_message_at=created_at,
+            last_interaction_at=created_at,
+            assigned_agent="+5491100000000" if status == HandoffInboxCaseStatus.ACTIVE else None,
+            created_at=created_at,
+            updated_at=created_at,
+            opened_at=created_at if status == HandoffInboxCaseStatus.ACTIVE else None,
+        )
+        store.collection("bench_cases").document(record.case_id).set(record.model_dump(mode="json"))
+    return service
+
+
+def _queued_manager(size: int):
+    from chatbot.models import EstadoConversacion
+    from chatbot.states import ConversationManager
+
+    manager = ConversationManager(session_service=_NoCheckpoints())
+    now = datetime.utcnow()
+    for index in range(size):
+        phone = f"+54911{60000000 + index:08d}"
+        conversacion = manager.get_conversacion(phone)
+        conversacion.nombre_usuario = f"Cliente {index}"
+        conversacion.estado = EstadoConversacion.ATENDIDO_POR_HUMANO
+        conversacion.atendido_por_humano = True
+        conversacion.handoff_started_at = now - timedelta(minutes=5 * index)
+        conversacion.last_client_message_at = now - timedelta(seconds=40 * index)
+        manager.handoff_queue.append(phone)
+    manager.active_handoff = manager.handoff_queue[0] if manager.handoff_queue else None
+    return manager
+
+
+def build_cases(payloads: Optional[Dict[str, dict]] = None) -> List[Case]:
+    for key, value in BENCH_ENV_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+
+    from benchmarks.bench_email_render import _conversacion
+    from chatbot.message_context import MessageContext
+    from chatbot.models import TipoConsulta
+    from chatbot.rules import ChatbotRules, normalizar_texto
+    from services.conversation_session_service import ConversationSessionService
+    from services.email_service import email_service
+    from services.meta_whatsapp_service import meta_whatsapp_service
+    from services.nlu_service import nlu_service
+
+    payloads = payloads if payloads is not None else load_payloads()
+    for payload in payloads.values():
+        # Los fixtures vienen con el phone_number_id de los tests; se alinean con el servicio
+        for entry in payload.get("entry", []):
+            for change in entry.get("changes", []):
+                change.get("value", {}).get("metadata", {})["phone_number_id"] = meta_whatsapp_service.phone_number_id
+
+    session_service = ConversationSessionService()
+    conversacion = _conversacion(TipoConsulta.PRESUPUESTO, items=3)
+    checkpoint = session_service.serialize(conversacion)
+    queue_manager = _queued_manager(20)
+    ops = len(MENSAJES)
+
+    cases = [
+        Case("normalizar_texto", lambda: [normalizar_texto(text) for text in MENSAJES], ops),
+        # MessageContext nuevo por mensaje: así llega desde el webhook
+        Case("match_menu_option", lambda: [ChatbotRules._match_menu_option(MessageContext(text)) for text in MENSAJES], ops),
+        Case("es_mensaje_agradecimiento", lambda: [ChatbotRules.es_mensaje_agradecimiento(MessageContext(text)) for text in MENSAJES], ops),
+        Case("detectar_solicitud_humano", lambda: [nlu_service.detectar_solicitud_humano(MessageContext(text)) for text in MENSAJES], ops),
+    ]
+    for name, payload in payloads.items():
+        cases.append(Case(f"extract_message_data_{name}", lambda payload=payload: meta_whatsapp_service.extract_message_data(payload)))
+    cases += [
+        Case("session_serialize", lambda: session_service.serialize(conversacion)),
+        Case("session_hydrate", lambda: session_service.hydrate(conversacion.numero_telefono, checkpoint)),
+    ]
+    for size in (10, 100, 1000):
+        inbox = _seeded_inbox(size)
+        cases.append(Case(f"list_cases_{size}", lambda inbox=inbox: inbox.list_cases(limit=50)))
+    cases += [
+        Case("format_queue_status_20", lambda: queue_manager.format_queue_status("+5491100000000")),
+        Case("email_lead_html", lambda: email_service._generate_email_html(conversacion)),
+    ]
+    return cases
+
+
+def _measure_time(case: Case, iterations: int) -> Dict[str, float]:
+    started = time.perf_counter()
+    case.run()
+    single = max(time.perf_counter() - started, 1e-7)
+    iterations = max(1, min(iterations, int(ROUND_BUDGET_SECONDS / single)))
+    per_op = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            case.run()
+        per_op.append((time.perf_counter() - started) / (iterations * case.ops))
+    return {
+        "iterations": iterations,
+        "min_us": round(min(per_op) * 1e6, 2),
+        "median_us": round(statistics.median(per_op) * 1e6, 2),
+    }
+
+
+def _measure_allocations(case: Case) -> Dict[str, int]:
+    # Una llamada previa llena caches (regex, lru) para no contarlos como costo de la operación
+    case.run()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        case.run()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_bytes": max(0, peak - before) // case.ops,
+        "retained_bytes": max(0, current - before) // case.ops,
+    }
+
+
+def run_benchmark(iterations: int = 2000, only: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    report: Dict[str, Dict[str, Any]] = {}
+    for case in build_cases():
+        if only and not any(token in case.name for token in only):
+            continue
+        report[case.name] = {"ops": case.ops, **_measure_time(case, iterations), **_measure_allocations(case)}
+    return report
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def compare_to_baseline(
+    report: Dict[str, Any],
+    baseline: Dict[str, Any],
+    latency_factor: Optional[float] = LATENCY_FACTOR,
+    alloc_factor: float = ALLOC_FACTOR,
+) -> List[str]:
+    """Lista de regresiones de los casos medidos (vacía si todo está en línea con el baseline)."""
+    regressions = []
+    for name, current in report.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if latency_factor and current["min_us"] > expected["min_us"] * latency_factor:
+            regressions.append(f"{name}: {current['min_us']}µs > {latency_factor}x baseline {expected['min_us']}µs")
+        limit = expected["peak_bytes"] * alloc_factor + ALLOC_SLACK_BYTES
+        if current["peak_bytes"] > limit:
+            regressions.append(f"{name}: pico {current['peak_bytes']} B > baseline {expected['peak_bytes']} B")
+    return regressions
+
+
+def write_baseline(report: Dict[str, Any], path: str = BASELINE_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    baseline = load_baseline(path)
+    # --only actualiza solo los casos medidos
+    baseline.update({
+        name: {"min_us": values["min_us"], "peak_bytes": values["peak_bytes"]}
+        for name, values in report.items()
+    })
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(baseline, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def _ratio(current: float, expected: Optional[float]) -> str:
+    if not expected:
+        return "-"
+    return f"{current / expected:.2f}x"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000, help="máximo de iteraciones por ronda")
+    parser.add_argument("--only", action="append", help="medir solo los casos que contengan este texto (repetible)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--check", action="store_true", help="salir con 1 si hay regresiones")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+    # Los servicios registran en INFO al construirse; no es parte de lo que se mide
+    logging.disable(logging.INFO)
+    report = run_benchmark(args.iterations, args.only)
+    baseline = load_baseline(args.baseline)
+
+    print(f"{'caso':<34}{'min µs':>10}{'med µs':>10}{'vs base':>9}{'pico B':>10}{'ret B':>8}{'vs base':>9}")
+    for name, values in report.items():
+        expected = baseline.get(name, {})
+        print(
+            f"{name:<34}{values['min_us']:>10}{values['median_us']:>10}{_ratio(values['min_us'], expected.get('min_us')):>9}"
+            f"{values['peak_bytes']:>10}{values['retained_bytes']:>8}{_ratio(values['peak_bytes'], expected.get('peak_bytes')):>9}"
+        )
+
+    if args.update_baseline:
+        write_baseline(report, args.baseline)
+        print(f"Baseline actualizado: {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(report, baseline)
+    for regression in regressions:
+        print(f"REGRESIÓN {regression}")
+    return 1 if regressions and args.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,465 @@
+"""
+Prueba de carga end-to-end del webhook de WhatsApp, sin servicios reales.
+
+Levanta la app FastAPI con uvicorn y la apunta a stand-ins locales: un Graph
+API falso (META_GRAPH_BASE_URL), un endpoint de OpenAI falso con latencia
+configurable (OPENAI_BASE_URL) y un Firestore en memoria para checkpoints,
+dedupe e inbox de handoff. Los emails de lead van a archivo
+(EMAIL_TRANSPORT=file). Usuarios virtuales mandan `POST /webhook/whatsapp`
+firmados con HMAC siguiendo una mezcla de conversaciones (saludo, presupuesto
+con varios productos, IFCI, handoff con respuestas del agente y encuesta).
+
+Reporta p50/p95/p99 del webhook, throughput y llamadas salientes (Graph API,
+LLM, RPCs de Firestore) por mensaje entrante.
+
+Uso:
+    python -m benchmarks.load_test [--users 10] [--duration 30] [--llm-latency-ms 300]
+        [--mix saludo=3,presupuesto=3,ifci=2,handoff=1,encuesta=1] [--json]
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+
+from services.in_memory_firestore import InMemoryFirestoreClient
+
+APP_SECRET = "load-test-secret"
+PHONE_NUMBER_ID = "100000000000001"
+AGENT_NUMBER = "5491100000000"
+DEFAULT_MIX = "saludo=3,presupuesto=3,ifci=2,handoff=1,encuesta=1"
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class FakeHTTPServer:
+    """Servidor HTTP local en un thread; `respond(path, body)` arma la respuesta JSON."""
+
+    def __init__(self, respond: Callable[[str, dict], dict], latency_seconds: float = 0.0):
+        self.calls: Counter = Counter()
+        self._respond = respond
+        self._latency_seconds = latency_seconds
+        self._lock = threading.Lock()
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    body = {}
+                if server._latency_seconds:
+                    time.sleep(server._latency_seconds)
+                payload = json.dumps(server._record(self.path, body)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                return
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", _free_port()), _Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def _record(self, path: str, body: dict) -> dict:
+        response = self._respond(path, body)
+        with self._lock:
+            self.calls[response.pop("_kind", "request")] += 1
+        return response
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def start(self) -> "FakeHTTPServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def fake_graph_api() -> FakeHTTPServer:
+    counter = itertools.count(1)
+
+    def _respond(path: str, body: dict) -> dict:
+        kind = body.get("type", "request")
+        if kind == "interactive":
+            kind = f"interactive_{(body.get('interactive') or {}).get('type', '')}"
+        return {
+            "_kind": kind,
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+            "messages": [{"id": f"wamid.loadtest.{next(counter)}"}],
+        }
+
+    return FakeHTTPServer(_respond)
+
+
+def fake_openai(latency_seconds: float, content: str = "UNCLEAR") -> FakeHTTPServer:
+    counter = itertools.count(1)
+
+    def _respond(path: str, body: dict) -> dict:
+        return {
+            "_kind": "chat_completion",
+            "id": f"chatcmpl-loadtest-{next(counter)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    return FakeHTTPServer(_respond, latency_seconds)
+
+
+# Cada paso: (remitente, tipo, valor). remitente: cliente | agente; tipo: text | button | list
+Step = Tuple[str, str, str]
+
+_DATOS_CONTACTO: List[Step] = [
+    ("cliente", "text", "compras@empresa.com"),
+    ("cliente", "text", "Av. Rivadavia 1234, CABA"),
+    ("cliente", "text", "Lunes a viernes de 9 a 17"),
+    ("cliente", "text", "ACME SA"),
+    ("cliente", "text", "30-12345678-9"),
+    ("cliente", "button", "si"),
+]
+
+SCENARIOS: Dict[str, List[Step]] = {
+    "saludo": [
+        ("cliente", "text", "hola"),
+        ("cliente", "text", "cuál es su teléfono?"),
+        ("cliente", "text", "gracias!!"),
+    ],
+    "presupuesto": [
+        ("cliente", "text", "hola"),
+        ("cliente", "list", "presupuesto"),
+        ("cliente", "button", "presupuesto_extintores"),
+        ("cliente", "list", "extintor_pq_5kg"),
+        ("cliente", "button", "presupuesto_compra"),
+        ("cliente", "button", "cantidad_2"),
+        ("cliente", "button", "presupuesto_add_extintores"),
+        ("cliente", "list", "extintor_vehicular_1kg"),
+        ("cliente", "button", "presupuesto_mantenimiento"),
+        ("cliente", "button", "cantidad_1"),
+        ("cliente", "button", "presupuesto_continuar"),
+    ] + _DATOS_CONTACTO,
+    "ifci": [
+        ("cliente", "text", "hola"),
+        ("cliente", "list", "presupuesto"),
+        ("cliente", "button", "presupuesto_ifci"),
+        ("cliente", "list", "ifci_nivel_2"),
+        ("cliente", "text", "20"),
+        ("cliente", "text", "4 pisos, sin subsuelo, con estacionamiento"),
+        ("cliente", "button", "ifci_si"),
+        ("cliente", "button", "ifci_no_se"),
+        ("cliente", "button", "presupuesto_continuar"),
+    ] + _DATOS_CONTACTO,
+    "handoff": [
+        ("cliente", "text", "hola"),
+        ("cliente", "text", "quiero hablar con una persona"),
+        ("agente", "text", "Hola, soy Marcos de Argenfuego. ¿En qué te ayudo?"),
+        ("cliente", "text", "necesito recargar 3 matafuegos de 5 kg"),
+        ("agente", "text", "Perfecto, te paso el presupuesto por mail hoy."),
+        ("agente", "text", "/done"),
+        ("cliente", "text", "2"),
+    ],
+    "encuesta": [
+        ("cliente", "text", "hola"),
+        ("cliente", "text", "quiero hablar con un asesor"),
+        ("agente", "text", "Hola, ¿en qué te puedo ayudar?"),
+        ("cliente", "text", "¿hacen la prueba hidráulica de los equipos?"),
+        ("agente", "text", "Sí, la hacemos en el taller."),
+        ("agente", "text", "/done"),
+        ("cliente", "text", "1"),
+        ("cliente", "text", "1"),
+        ("cliente", "text", "5"),
+        ("cliente", "text", "1"),
+    ],
+}
+
+
+def parse_mix(raw: str) -> Dict[str, int]:
+    mix: Dict[str, int] = {}
+    for entry in raw.split(","):
+        name, _, weight = entry.strip().partition("=")
+        if not name:
+            continue
+        if name not in SCENARIOS:
+            raise ValueError(f"escenario desconocido: {name} (opciones: {', '.join(SCENARIOS)})")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def build_payload(
+    from_number: str, kind: str, value: str, message_id: str, profile_name: str = "Cliente Carga", phone_number_id: str = PHONE_NUMBER_ID
+) -> dict:
+    message: Dict[str, Any] = {"from": from_number, "id": message_id, "timestamp": str(int(time.time()))}
+    if kind == "text":
+        message.update({"type": "text", "text": {"body": value}})
+    else:
+        reply_type = "list_reply" if kind == "list" else "button_reply"
+        message.update({"type": "interactive", "interactive": {"type": reply_type, reply_type: {"id": value, "title": value}}})
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": phone_number_id,
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "5491139061038", "phone_number_id": phone_number_id},
+                    "contacts": [{"profile": {"name": profile_name}, "wa_id": from_number}],
+                    "messages": [message],
+                },
+            }],
+        }],
+    }
+
+
+def sign(body: bytes, secret: str = APP_SECRET) -> str:
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def configure_environment(graph_url: str, openai_url: str, sink_dir: str) -> None:
+    """Fuerza las variables que apuntan a servicios externos; debe correr antes de importar `main`."""
+    os.environ.update({
+        "META_WA_ACCESS_TOKEN": "load-test-token",
+        "META_WA_PHONE_NUMBER_ID": PHONE_NUMBER_ID,
+        "META_WA_APP_SECRET": APP_SECRET,
+        "META_WA_VERIFY_TOKEN": "load-test-verify",
+        "META_GRAPH_BASE_URL": f"{graph_url}/v21.0",
+        "AGENT_WHATSAPP_NUMBER": f"+{AGENT_NUMBER}",
+        "OPENAI_API_KEY": "load-test-key",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "EMAIL_TRANSPORT": "file",
+        "EMAIL_FILE_SINK_DIR": os.path.join(sink_dir, "emails"),
+        "LEAD_OUTBOX_BACKEND": "file",
+        "LEAD_OUTBOX_PATH": os.path.join(sink_dir, "lead_outbox.jsonl"),
+        "LLM_CACHE_BACKEND": "",
+        "ENABLE_ERROR_EMAILS": "false",
+        "ENABLE_SHEETS_METRICS": "false",
+        "ENABLE_POST_HANDOFF_SURVEY": "true",
+        "AGENT_NOTIFY_WINDOW_SECONDS": "0",
+        "JOB_RUNNER_ENABLED": "false",
+        "JOB_LEASE_BACKEND": "local",
+        "AWS_EC2_METADATA_DISABLED": "true",
+    })
+    os.environ.setdefault("COMPANY_PROFILE", "argenfuego")
+    os.environ.setdefault("AWS_REGION", "us-east-1")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("ENV", "local")
+
+
+class LoadTest:
+    def __init__(self, base_url: str, mix: Dict[str, int], users: int, duration: float, think_seconds: float, seed: int):
+        self.base_url = base_url
+        self.mix = mix
+        self.users = users
+        self.duration = duration
+        self.think_seconds = think_seconds
+        self.random = random.Random(seed)
+        self.latencies: List[float] = []
+        self.latencies_by_scenario: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.conversations: Counter = Counter()
+        self._phones = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        # Un solo agente: la parte humana de cada handoff se hace de a una conversación
+        self._agent_lock = asyncio.Lock()
+
+    async def _post(self, client, scenario: str, from_number: str, kind: str, value: str) -> None:
+        payload = build_payload(from_number, kind, value, f"wamid.in.{next(self._message_ids)}")
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "X-Hub-Signature-256": sign(body)}
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"{self.base_url}/webhook/whatsapp", content=body, headers=headers)
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        self.latencies.append(elapsed)
+        self.latencies_by_scenario[scenario].append(elapsed)
+        if status != 200:
+            self.errors[str(status)] += 1
+
+    async def _run_conversation(self, client, scenario: str) -> None:
+        phone = f"54911{5000_0000 + next(self._phones):08d}"
+        steps = SCENARIOS[scenario]
+        human_from = next((index for index, step in enumerate(steps) if step[0] == "agente"), None)
+        for index, (sender, kind, value) in enumerate(steps):
+            if human_from is not None and index == human_from - 1:
+                # Desde el pedido de humano hasta el cierre la conversación ocupa al agente
+                async with self._agent_lock:
+                    for sender_h, kind_h, value_h in steps[index:]:
+                        number = AGENT_NUMBER if sender_h == "agente" else phone
+                        await self._post(client, scenario, number, kind_h, value_h)
+                        await self._think()
+                break
+            await self._post(client, scenario, AGENT_NUMBER if sender == "agente" else phone, kind, value)
+            await self._think()
+        self.conversations[scenario] += 1
+
+    async def _think(self) -> None:
+        if self.think_seconds:
+            await asyncio.sleep(self.random.uniform(0, 2 * self.think_seconds))
+
+    async def _user(self, client, deadline: float) -> None:
+        names, weights = list(self.mix), list(self.mix.values())
+        while time.perf_counter() < deadline:
+            await self._run_conversation(client, self.random.choices(names, weights)[0])
+
+    async def run(self) -> float:
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.users, max_keepalive_connections=self.users)
+        async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+            started = time.perf_counter()
+            deadline = started + self.duration
+            await asyncio.gather(*(self._user(client, deadline) for _ in range(self.users)))
+            return time.perf_counter() - started
+
+
+def build_report(
+    test: LoadTest, elapsed: float, graph: FakeHTTPServer, llm: FakeHTTPServer, store: InMemoryFirestoreClient, emails_sent: int = 0
+) -> Dict[str, Any]:
+    inbound = len(test.latencies)
+
+    def _latency(samples: List[float]) -> Dict[str, float]:
+        return {
+            "p50_ms": round(_percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(_percentile(samples, 95) * 1000, 2),
+            "p99_ms": round(_percentile(samples, 99) * 1000, 2),
+        }
+
+    def _per_message(total: int) -> float:
+        return round(total / inbound, 3) if inbound else 0.0
+
+    return {
+        "inbound_messages": inbound,
+        "errors": dict(test.errors),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_msg_s": round(inbound / elapsed, 2) if elapsed else 0.0,
+        "webhook": _latency(test.latencies),
+        "scenarios": {
+            name: {"conversations": test.conversations[name], **_latency(samples)}
+            for name, samples in sorted(test.latencies_by_scenario.items())
+        },
+        "outbound_per_message": {
+            "graph_api": _per_message(graph.total_calls),
+            "llm": _per_message(llm.total_calls),
+            "firestore_rpcs": _per_message(store.rpc_count),
+        },
+        # Leads que llegaron al transporte de archivo: confirma que los flujos de presupuesto terminan
+        "emails_sent": emails_sent,
+        "graph_api_calls": dict(graph.calls),
+        "firestore_rpcs": dict(store.rpcs),
+    }
+
+
+def _start_app(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    for _ in range(200):
+        if server.started:
+            return server, thread
+        time.sleep(0.05)
+    raise RuntimeError("uvicorn no arrancó")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10, help="usuarios virtuales concurrentes")
+    parser.add_argument("--duration", type=float, default=30.0, help="segundos de carga")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="escenario=peso separados por coma")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--firestore-latency-ms", type=float, default=0.0, help="latencia simulada por RPC de Firestore")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pausa media entre mensajes de un usuario")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="imprimir el reporte como JSON")
+    args = parser.parse_args()
+
+    graph = fake_graph_api().start()
+    llm = fake_openai(args.llm_latency_ms / 1000).start()
+    store = InMemoryFirestoreClient(latency_seconds=args.firestore_latency_ms / 1000)
+    sink = tempfile.TemporaryDirectory(prefix="load_test_")
+    configure_environment(graph.url, llm.url, sink.name)
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import main as main_module
+
+    logging.getLogger().setLevel(os.environ["LOG_LEVEL"])
+    main_module.conversation_session_service._fs_client = store
+    main_module.handoff_inbox_service._firestore_client = store
+
+    port = _free_port()
+    server, thread = _start_app(main_module.app, port)
+    test = LoadTest(f"http://127.0.0.1:{port}", parse_mix(args.mix), args.users, args.duration, args.think_ms / 1000, args.seed)
+    try:
+        elapsed = asyncio.run(test.run())
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        graph.stop()
+        llm.stop()
+        emails_dir = os.environ["EMAIL_FILE_SINK_DIR"]
+        emails_sent = len(os.listdir(emails_dir)) if os.path.isdir(emails_dir) else 0
+        sink.cleanup()
+
+    report = build_report(test, elapsed, graph, llm, store, emails_sent)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 0
+
+    print(f"mensajes: {report['inbound_messages']}  errores: {sum(test.errors.values())}  "
+          f"duración: {report['elapsed_seconds']} s  throughput: {report['throughput_msg_s']} msg/s")
+    webhook = report["webhook"]
+    print(f"webhook p50 {webhook['p50_ms']} ms  p95 {webhook['p95_ms']} ms  p99 {webhook['p99_ms']} ms")
+    print(f"{'escenario':<14}{'conv':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report["scenarios"].items():
+        print(f"{name:<14}{row['conversations']:>6}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    outbound = report["outbound_per_message"]
+    print(f"por mensaje entrante: Graph API {outbound['graph_api']}  LLM {outbound['llm']}  "
+          f"RPCs Firestore {outbound['firestore_rpcs']}")
+    print(f"emails de lead enviados: {report['emails_sent']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
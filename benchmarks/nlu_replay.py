@@ -0,0 +1,229 @@
+"""
+Replay offline del corpus de NLU: exactitud, latencia y throughput.
+
+Corre los detectores de contacto y de pedido de humano, el matcheo de menú,
+el ruteo completo de intención (menú → clasificador local → LLM stub) y el
+parser básico de datos de contacto sobre benchmarks/data/nlu_corpus.jsonl, y
+compara contra benchmarks/baselines/nlu_baseline.json.
+
+Uso:
+    python -m benchmarks.nlu_replay [--iterations 50] [--check-latency] [--update-baseline]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(BENCH_DIR, "data", "nlu_corpus.jsonl")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baselines", "nlu_baseline.json")
+
+ACCURACY_TOLERANCE = 0.0
+LATENCY_FACTOR = 3.0
+
+
+class StubLLMClient:
+    """Cliente con la interfaz de AsyncOpenAI que responde siempre lo mismo."""
+
+    def __init__(self, content: str = "UNCLEAR", delay: float = 0.0):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self._content = content
+        self._delay = delay
+
+    async def _create(self, **request):
+        import asyncio
+
+        self.calls += 1
+        if self._delay:
+            await asyncio.sleep(self._delay)
+        message = SimpleNamespace(content=self._content)
+        usage = SimpleNamespace(prompt_tokens=0, completion_tokens=0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def load_corpus(path: str = CORPUS_PATH) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def _build_tasks(stub_client: StubLLMClient) -> Dict[str, Callable[[str], Any]]:
+    from chatbot.intent_classifier import intent_classifier
+    from chatbot.message_context import MessageContext
+    from chatbot.rules import ChatbotRules
+    from services.nlu_service import NLUService, nlu_service
+
+    stub_nlu = NLUService()
+    stub_nlu._get_client = lambda: stub_client
+
+    def menu_intent(text: str) -> Optional[str]:
+        option, _source = ChatbotRules._match_menu_option(MessageContext(text))
+        return option["id"] if option else None
+
+    def menu_routing(text: str) -> Optional[str]:
+        # Mismo orden que ChatbotRules._procesar_seleccion_opcion
+        contexto = MessageContext(text)
+        option, _source = ChatbotRules._match_menu_option(contexto)
+        if option:
+            return option["id"]
+        tipo = intent_classifier.classify(contexto)
+        if tipo is None:
+            tipo = stub_nlu.mapear_intencion(text)
+        return tipo.value if tipo else None
+
+    return {
+        "contact_query": lambda text: nlu_service.detectar_consulta_contacto(MessageContext(text)),
+        "human_request": lambda text: nlu_service.detectar_solicitud_humano(MessageContext(text)),
+        "menu_intent": menu_intent,
+        "menu_routing": menu_routing,
+        "contact_data": ChatbotRules._parsear_datos_contacto_basico,
+    }
+
+
+def _is_correct(task: str, result: Any, expected: Any) -> bool:
+    if task == "contact_data":
+        return all(
+            (result.get(field) or "").strip().lower() == (value or "").strip().lower()
+            for field, value in expected.items()
+        )
+    return result == expected
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def run_benchmark(corpus: Optional[List[Dict[str, Any]]] = None, iterations: int = 50) -> Dict[str, Any]:
+    """Ejecuta el corpus y retorna métricas por tarea."""
+    from services.llm_cache import llm_cache
+
+    corpus = corpus if corpus is not None else load_corpus()
+    stub_client = StubLLMClient()
+    tasks = _build_tasks(stub_client)
+
+    # El cache de LLM ocultaría las llamadas al stub en las repeticiones
+    cache_enabled, llm_cache.enabled = llm_cache.enabled, False
+    previous_level = logging.root.manager.disable
+    logging.disable(logging.INFO)
+    try:
+        by_task: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"n": 0, "correct": 0, "latencies": [], "failures": []})
+        for case in corpus:
+            task = case["task"]
+            fn = tasks[task]
+            stats = by_task[task]
+            result = fn(case["text"])
+            stats["n"] += 1
+            if _is_correct(task, result, case["expected"]):
+                stats["correct"] += 1
+            else:
+                stats["failures"].append({"text": case["text"], "expected": case["expected"], "got": result})
+            for _ in range(iterations):
+                started = time.perf_counter()
+                fn(case["text"])
+                stats["latencies"].append(time.perf_counter() - started)
+    finally:
+        llm_cache.enabled = cache_enabled
+        logging.disable(previous_level)
+
+    report: Dict[str, Any] = {}
+    for task, stats in sorted(by_task.items()):
+        latencies = stats["latencies"] or [0.0]
+        total = sum(latencies)
+        report[task] = {
+            "n": stats["n"],
+            "accuracy": round(stats["correct"] / stats["n"], 4),
+            "p50_us": round(_percentile(latencies, 50) * 1e6, 1),
+            "p95_us": round(_percentile(latencies, 95) * 1e6, 1),
+            "p99_us": round(_percentile(latencies, 99) * 1e6, 1),
+            "throughput_per_s": round(len(latencies) / total, 1) if total else None,
+            "failures": stats["failures"],
+        }
+    report["menu_routing"]["llm_fallbacks"] = stub_client.calls // (iterations + 1) if "menu_routing" in report else 0
+    return report
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def compare_to_baseline(
+    report: Dict[str, Any],
+    baseline: Dict[str, Any],
+    accuracy_tolerance: float = ACCURACY_TOLERANCE,
+    latency_factor: Optional[float] = None,
+) -> List[str]:
+    """Lista de regresiones (vacía si todo está en línea con el baseline)."""
+    regressions = []
+    for task, expected in baseline.items():
+        current = report.get(task)
+        if current is None:
+            regressions.append(f"{task}: falta en el reporte")
+            continue
+        if current["accuracy"] < expected["accuracy"] - accuracy_tolerance:
+            regressions.append(f"{task}: accuracy {current['accuracy']:.2%} < baseline {expected['accuracy']:.2%}")
+        if latency_factor and current["p95_us"] > expected["p95_us"] * latency_factor:
+            regressions.append(f"{task}: p95 {current['p95_us']}µs > {latency_factor}x baseline {expected['p95_us']}µs")
+    return regressions
+
+
+def write_baseline(report: Dict[str, Any], path: str = BASELINE_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    baseline = {
+        task: {"accuracy": values["accuracy"], "p95_us": values["p95_us"]}
+        for task, values in report.items()
+    }
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(baseline, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--check-latency", action="store_true", help=f"fallar si p95 > {LATENCY_FACTOR}x baseline")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--show-failures", action="store_true")
+    args = parser.parse_args()
+
+    report = run_benchmark(load_corpus(args.corpus), iterations=args.iterations)
+
+    print(f"{'tarea':<15}{'n':>4}{'accuracy':>10}{'p50 µs':>10}{'p95 µs':>10}{'p99 µs':>10}{'msg/s':>12}")
+    for task, values in report.items():
+        print(
+            f"{task:<15}{values['n']:>4}{values['accuracy']:>10.2%}{values['p50_us']:>10}"
+            f"{values['p95_us']:>10}{values['p99_us']:>10}{values['throughput_per_s']:>12}"
+        )
+        if args.show_failures:
+            for failure in values["failures"]:
+                print(f"    ✗ {failure['text']!r}: esperado {failure['expected']!r}, obtuvo {failure['got']!r}")
+    print(f"menu_routing: {report['menu_routing']['llm_fallbacks']} mensajes cayeron al LLM (stub)")
+
+    if args.update_baseline:
+        write_baseline(report, args.baseline)
+        print(f"Baseline actualizado: {args.baseline}")
+        return 0
+
+    regressions = compare_to_baseline(
+        report,
+        load_baseline(args.baseline),
+        latency_factor=LATENCY_FACTOR if args.check_latency else None,
+    )
+    for regression in regressions:
+        print(f"REGRESIÓN {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import os
+import re
+import logging
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .message_context import MessageContext
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "data", "gazetteer_amba.tsv")
+GEO_CONFIDENCE_THRESHOLD = float(os.getenv("GEO_CONFIDENCE_THRESHOLD", "0.6"))
+
+ZONA_CABA = "CABA"
+ZONA_PROVINCIA = "PROVINCIA"
+ZONA_UNCLEAR = "UNCLEAR"
+
+# Tokens que indican que el nombre siguiente es una calle y no una localidad
+# ("Av. San Martín", "calle Belgrano")
+STREET_PREFIXES = {
+    "av", "avda", "avenida", "calle", "pasaje", "pje", "diagonal", "diag",
+    "boulevard", "bv", "bvd", "bulevar",
+}
+
+# Códigos postales: CPA (C1425ABC / B1636XYZ) o "CP 1425"
+CPA_REGEX = re.compile(r"\b([cb])\s?(\d{4})(?:[a-z]{3})?\b")
+CP_NUMERICO_REGEX = re.compile(r"\b(?:cp|c p|codigo postal)\s*(\d{4})\b")
+
+_END = "\0"
+
+
+class GeoMatch(NamedTuple):
+    nombre: str
+    zona: str
+    tipo: str
+    peso: float
+
+
+class GeoClassification(NamedTuple):
+    zona: str
+    confianza: float
+    evidencia: Tuple[GeoMatch, ...]
+
+
+class GeoGazetteer:
+    """
+    Clasificador CABA / Provincia basado en un gazetteer de barrios, partidos,
+    localidades y calles características del AMBA.
+
+    El archivo de datos se carga recién en la primera consulta y se indexa en
+    un trie por tokens; cada búsqueda hace una sola pasada sobre los tokens de
+    la dirección, tomando la coincidencia más larga en cada posición.
+    """
+
+    def __init__(self, path: str = GAZETTEER_PATH, threshold: float = GEO_CONFIDENCE_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._trie: Optional[Dict] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return self._size
+
+    def _ensure_loaded(self) -> Dict:
+        if self._trie is None:
+            self._trie = self._load()
+        return self._trie
+
+    def _load(self) -> Dict:
+        trie: Dict = {}
+        seen = set()
+        with open(self.path, encoding="utf-8") as handle:
+            for line in handle:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                zona, tipo, peso, nombre = line.rstrip("\n").split("\t")
+                tokens = MessageContext(nombre).tokens
+                key = (tokens, zona, tipo)
+                if not tokens or key in seen:
+                    continue
+                seen.add(key)
+                node = trie
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                node.setdefault(_END, []).append(GeoMatch(nombre, zona, tipo, float(peso)))
+        self._size = len(seen)
+        logger.info("Gazetteer geográfico cargado: %s entradas", self._size)
+        return trie
+
+    def find_matches(self, direccion: Union[str, MessageContext]) -> List[GeoMatch]:
+        trie = self._ensure_loaded()
+        contexto = MessageContext.from_text(direccion)
+        tokens = contexto.tokens
+        matches: List[GeoMatch] = []
+
+        idx = 0
+        while idx < len(tokens):
+            node = trie
+            best_end = None
+            best_entries = None
+            pos = idx
+            while pos < len(tokens) and tokens[pos] in node:
+                node = node[tokens[pos]]
+                pos += 1
+                if _END in node:
+                    best_end, best_entries = pos, node[_END]
+            if best_end is None:
+                idx += 1
+                continue
+
+            previous = tokens[idx - 1] if idx > 0 else ""
+            following = tokens[best_end] if best_end < len(tokens) else ""
+            is_street = previous in STREET_PREFIXES or following.isdigit() or following == "al"
+            for entry in best_entries:
+                # "Av. Rivadavia 1234" es una calle, no el partido de Rivadavia
+                if is_street and entry.tipo != "calle":
+                    continue
+                matches.append(entry)
+            idx = best_end
+
+        matches.extend(self._match_postal_codes(contexto))
+        return matches
+
+    @staticmethod
+    def _match_postal_codes(contexto: MessageContext) -> List[GeoMatch]:
+        matches = []
+        for letra, numero in CPA_REGEX.findall(contexto.accent_free):
+            zona = ZONA_CABA if letra == "c" else ZONA_PROVINCIA
+            matches.append(GeoMatch(f"{letra.upper()}{numero}", zona, "cp", 0.95))
+        for numero in CP_NUMERICO_REGEX.findall(contexto.words):
+            valor = int(numero)
+            if 1000 <= valor <= 1499:
+                matches.append(GeoMatch(numero, ZONA_CABA, "cp", 0.9))
+            elif 1600 <= valor <= 1999 or 7000 <= valor <= 7699:
+                matches.append(GeoMatch(numero, ZONA_PROVINCIA, "cp", 0.85))
+        return matches
+
+    def classify(self, direccion: Union[str, MessageContext]) -> GeoClassification:
+        """
+        Retorna la zona más probable y una confianza en [0, 1]. Si la evidencia
+        es débil o contradictoria la zona es UNCLEAR.
+        """
+        matches = self.find_matches(direccion)
+        if not matches:
+            return GeoClassification(ZONA_UNCLEAR, 0.0, ())
+
+        scores = {ZONA_CABA: 0.0, ZONA_PROVINCIA: 0.0}
+        for match in matches:
+            scores[match.zona] = max(scores[match.zona], match.peso)
+
+        ganadora, perdedora = (
+            (ZONA_CABA, ZONA_PROVINCIA)
+            if scores[ZONA_CABA] >= scores[ZONA_PROVINCIA]
+            else (ZONA_PROVINCIA, ZONA_CABA)
+        )
+        confianza = round(max(0.0, scores[ganadora] - scores[perdedora] / 2), 2)
+        zona = ganadora if confianza >= self.threshold else ZONA_UNCLEAR
+        return GeoClassification(zona, confianza, tuple(matches))
+
+
+geo_gazetteer = GeoGazetteer()
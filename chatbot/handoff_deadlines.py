@@ -0,0 +1,115 @@
+import heapq
+import itertools
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from .models import ConversacionData, EstadoConversacion
+
+HANDOFF_INACTIVITY_MINUTES = int(os.getenv("HANDOFF_INACTIVITY_MINUTES", "60"))
+SURVEY_OFFER_TIMEOUT = timedelta(minutes=2)
+SURVEY_TIMEOUT = timedelta(minutes=15)
+RESOLUTION_QUESTION_TIMEOUT = timedelta(minutes=10)
+
+CLOSE_REASON_SURVEY_OFFER = "Oferta de encuesta sin respuesta"
+CLOSE_REASON_SURVEY = "Encuesta de satisfacción sin completar"
+CLOSE_REASON_RESOLUTION = "Pregunta de resolución sin respuesta"
+CLOSE_REASON_INACTIVITY = "Inactividad general"
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # Los timestamps del inbox llegan con zona; los runtime son utcnow() naive
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def handoff_deadline(
+    conv: ConversacionData,
+    inactivity_minutes: int = HANDOFF_INACTIVITY_MINUTES,
+) -> Optional[Tuple[datetime, str]]:
+    """
+    Momento en que vence una conversación en handoff y el motivo de cierre,
+    o None si no está en handoff. Las reglas son las del TTL sweep: la
+    conversación vence cuando `ahora` supera el valor retornado.
+    """
+    if not (conv.atendido_por_humano or conv.estado == EstadoConversacion.ATENDIDO_POR_HUMANO):
+        return None
+    if conv.estado == EstadoConversacion.ESPERANDO_RESPUESTA_ENCUESTA and conv.survey_offer_sent_at:
+        return _naive_utc(conv.survey_offer_sent_at) + SURVEY_OFFER_TIMEOUT, CLOSE_REASON_SURVEY_OFFER
+    if conv.estado == EstadoConversacion.ENCUESTA_SATISFACCION and conv.survey_sent_at:
+        return _naive_utc(conv.survey_sent_at) + SURVEY_TIMEOUT, CLOSE_REASON_SURVEY
+    if conv.resolution_question_sent and conv.resolution_question_sent_at:
+        return _naive_utc(conv.resolution_question_sent_at) + RESOLUTION_QUESTION_TIMEOUT, CLOSE_REASON_RESOLUTION
+    last_ts = conv.last_client_message_at or conv.handoff_started_at
+    if last_ts:
+        return _naive_utc(last_ts) + timedelta(minutes=inactivity_minutes), CLOSE_REASON_INACTIVITY
+    return None
+
+
+class HandoffDeadlineIndex:
+    """
+    Heap de vencimientos por número de teléfono.
+
+    Solo se agrega una entrada cuando el vencimiento se adelanta; si se
+    atrasa (p. ej. un mensaje nuevo del cliente), la entrada vieja queda y
+    al salir del heap se recalcula contra la conversación. Así el heap no
+    crece con cada mensaje y un sweep solo toca lo vencido.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, str]] = []
+        # Entrada vigente de cada número: (vencimiento, secuencia)
+        self._entries: Dict[str, Tuple[datetime, int]] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, numero_telefono: str) -> bool:
+        return numero_telefono in self._entries
+
+    def schedule(self, numero_telefono: str, deadline: datetime) -> None:
+        with self._lock:
+            current = self._entries.get(numero_telefono)
+            if current is not None and current[0] <= deadline:
+                return
+            seq = next(self._seq)
+            self._entries[numero_telefono] = (deadline, seq)
+            heapq.heappush(self._heap, (deadline, seq, numero_telefono))
+
+    def discard(self, numero_telefono: str) -> None:
+        with self._lock:
+            self._entries.pop(numero_telefono, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+            self._entries.clear()
+
+    def next_deadline(self) -> Optional[datetime]:
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now: datetime) -> List[str]:
+        """Saca del índice los números con vencimiento anterior a `now`."""
+        expired: List[str] = []
+        with self._lock:
+            while self._heap:
+                self._drop_stale()
+                if not self._heap or self._heap[0][0] >= now:
+                    break
+                _, _, numero_telefono = heapq.heappop(self._heap)
+                self._entries.pop(numero_telefono, None)
+                expired.append(numero_telefono)
+        return expired
+
+    def _drop_stale(self) -> None:
+        while self._heap:
+            deadline, seq, numero_telefono = self._heap[0]
+            if self._entries.get(numero_telefono) == (deadline, seq):
+                return
+            heapq.heappop(self._heap)
@@ -0,0 +1,250 @@
+import math
+import os
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from .message_context import MessageContext
+from .models import TipoConsulta
+
+logger = logging.getLogger(__name__)
+
+INTENT_CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "intent_corpus.tsv")
+# Corpus adicional opcional (p. ej. mensajes reales exportados de los logs), mismo formato TSV
+INTENT_EXTRA_CORPUS_PATH = os.getenv("INTENT_EXTRA_CORPUS_PATH", "").strip()
+INTENT_CLASSIFIER_THRESHOLD = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.8"))
+# URGENCIA dispara un handoff inmediato: el modelo local solo la rutea con una confianza
+# mucho más alta y varias palabras conocidas; si no, decide el LLM
+INTENT_CLASSIFIER_URGENCIA_THRESHOLD = float(os.getenv("INTENT_CLASSIFIER_URGENCIA_THRESHOLD", "0.97"))
+INTENT_CLASSIFIER_URGENCIA_MIN_WORDS = int(os.getenv("INTENT_CLASSIFIER_URGENCIA_MIN_WORDS", "2"))
+# Aprendizaje en línea con las etiquetas del LLM (apagado por defecto): cada instancia
+# aprende por su cuenta, así que se limita la cantidad de ejemplos y solo se suman los
+# que el modelo ya apuntaba a la misma intención
+INTENT_ONLINE_LEARNING = os.getenv("INTENT_ONLINE_LEARNING", "false").lower() == "true"
+INTENT_ONLINE_LEARNING_MAX = int(os.getenv("INTENT_ONLINE_LEARNING_MAX", "200"))
+INTENT_ONLINE_LEARNING_MIN_CONFIDENCE = float(os.getenv("INTENT_ONLINE_LEARNING_MIN_CONFIDENCE", "0.5"))
+
+LABELS = {
+    "PRESUPUESTO": TipoConsulta.PRESUPUESTO,
+    "URGENCIA": TipoConsulta.URGENCIA,
+    "OTRAS": TipoConsulta.OTRAS,
+}
+# Respuestas sin intención de menú ("no entiendo", "ninguna"): si ganan, el modelo se abstiene
+NO_INTENT_LABEL = "NINGUNA"
+CORPUS_LABELS = frozenset(LABELS) | {NO_INTENT_LABEL}
+# Palabras sin contenido (ya sin tildes, como `MessageContext.tokens`): no aportan
+# features, así "no", "sí" o "no sé" no quedan clasificados con confianza alta
+STOPWORDS = frozenset({
+    "a", "al", "con", "de", "del", "el", "en", "es", "esa", "ese", "eso", "esta", "este", "esto",
+    "la", "las", "le", "lo", "los", "me", "mi", "mis", "no", "o", "para", "pero", "por", "que",
+    "se", "si", "su", "sus", "te", "tu", "un", "una", "uno", "y", "ya", "yo",
+})
+CHAR_NGRAM_SIZES = (3, 4, 5)
+# Peso de la verosimilitud media por feature: Naive Bayes sobre n-gramas solapados
+# es sobreconfiado si se suman todas las log-probabilidades
+FEATURE_WEIGHT = 4.0
+# Fracción mínima de features conocidas para confiar en la posterior
+MIN_COVERAGE = 0.6
+# Palabras de contenido conocidas por el modelo para emitir una predicción
+MIN_KNOWN_WORDS = 1
+# URGENCIA dispara un handoff inmediato: una etiqueta errónea del LLM no puede volverse
+# una ruta local que ya no consulta al LLM
+ONLINE_LEARNING_EXCLUDED = frozenset({TipoConsulta.URGENCIA})
+
+
+class IntentPrediction(NamedTuple):
+    tipo: TipoConsulta
+    confianza: float
+
+
+def extract_features(texto: Union[str, MessageContext]) -> List[str]:
+    """
+    Features del mensaje: palabras + n-gramas de caracteres (3 a 5) por palabra,
+    sin stopwords. Los n-gramas toleran errores de tipeo y variaciones
+    ("matafuego", "matafuegos").
+    """
+    features = []
+    for token in MessageContext.from_text(texto).tokens:
+        if token in STOPWORDS:
+            continue
+        features.append(f"w:{token}")
+        padded = f" {token} "
+        for size in CHAR_NGRAM_SIZES:
+            for idx in range(len(padded) - size + 1):
+                features.append(padded[idx:idx + size])
+    return features
+
+
+class IntentClassifier:
+    """
+    Clasificador Naive Bayes multinomial (puro Python) para la intención del
+    menú principal: PRESUPUESTO, URGENCIA u OTRAS.
+
+    Se entrena en la primera consulta con el corpus del repo y, si existe,
+    con INTENT_EXTRA_CORPUS_PATH. La confianza es la probabilidad posterior
+    calculada con la log-verosimilitud media por feature; si el mensaje tiene
+    pocas features conocidas se pondera por esa fracción, y sin palabras de
+    contenido conocidas (o si gana NINGUNA) no hay predicción, así los mensajes
+    ajenos al dominio no quedan clasificados con confianza alta.
+    """
+
+    def __init__(
+        self,
+        corpus_paths: Optional[Iterable[str]] = None,
+        threshold: float = INTENT_CLASSIFIER_THRESHOLD,
+        urgencia_threshold: float = INTENT_CLASSIFIER_URGENCIA_THRESHOLD,
+        urgencia_min_words: int = INTENT_CLASSIFIER_URGENCIA_MIN_WORDS,
+        alpha: float = 0.5,
+        online_learning: bool = INTENT_ONLINE_LEARNING,
+        online_max_examples: int = INTENT_ONLINE_LEARNING_MAX,
+        online_min_confidence: float = INTENT_ONLINE_LEARNING_MIN_CONFIDENCE,
+    ):
+        if corpus_paths is None:
+            corpus_paths = [INTENT_CORPUS_PATH] + ([INTENT_EXTRA_CORPUS_PATH] if INTENT_EXTRA_CORPUS_PATH else [])
+        self.corpus_paths = list(corpus_paths)
+        self.threshold = threshold
+        self.urgencia_threshold = urgencia_threshold
+        self.urgencia_min_words = urgencia_min_words
+        self.alpha = alpha
+        self.online_learning = online_learning
+        self.online_max_examples = online_max_examples
+        self.online_min_confidence = online_min_confidence
+        self._online_examples = 0
+        self._lock = threading.Lock()
+        self._trained = False
+        self._doc_counts: Counter = Counter()
+        self._feature_counts: Dict[str, Counter] = {label: Counter() for label in CORPUS_LABELS}
+        self._feature_totals: Counter = Counter()
+        self._vocabulary: set = set()
+
+    @staticmethod
+    def _read_corpus(path: str) -> List[Tuple[str, str]]:
+        examples = []
+        with open(path, encoding="utf-8") as handle:
+            for line in handle:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                label, _, texto = line.rstrip("\n").partition("\t")
+                label = label.strip().upper()
+                if label in CORPUS_LABELS and texto.strip():
+                    examples.append((label, texto))
+        return examples
+
+    def _ensure_trained(self) -> None:
+        if self._trained:
+            return
+        with self._lock:
+            if self._trained:
+                return
+            total = 0
+            for path in self.corpus_paths:
+                try:
+                    examples = self._read_corpus(path)
+                except OSError as e:
+                    logger.warning(f"No se pudo leer el corpus de intención {path}: {str(e)}")
+                    continue
+                for label, texto in examples:
+                    self._add_example(label, texto)
+                total += len(examples)
+            self._trained = True
+            logger.info("Clasificador de intención entrenado con %s ejemplos", total)
+
+    def _add_example(self, label: str, texto: Union[str, MessageContext]) -> None:
+        features = extract_features(texto)
+        if not features:
+            return
+        self._doc_counts[label] += 1
+        self._feature_counts[label].update(features)
+        self._feature_totals[label] += len(features)
+        self._vocabulary.update(features)
+
+    def learn(self, texto: Union[str, MessageContext], tipo: TipoConsulta) -> None:
+        """Suma un ejemplo etiquetado (p. ej. la respuesta del LLM) al modelo en memoria."""
+        label = next((name for name, value in LABELS.items() if value == tipo), None)
+        if label is None:
+            return
+        self._ensure_trained()
+        with self._lock:
+            self._add_example(label, texto)
+
+    def learn_from_llm(self, texto: Union[str, MessageContext], tipo: TipoConsulta) -> bool:
+        """
+        Suma la etiqueta del LLM al modelo solo si el aprendizaje en línea está
+        habilitado, no es URGENCIA, no se llegó al tope de ejemplos y el modelo
+        ya predecía esa intención con `online_min_confidence` (por debajo del
+        umbral de uso). Retorna True si aprendió.
+        """
+        if not self.online_learning or tipo in ONLINE_LEARNING_EXCLUDED:
+            return False
+        if self._online_examples >= self.online_max_examples:
+            return False
+        prediccion = self.predict(texto)
+        if prediccion is None or prediccion.tipo != tipo or prediccion.confianza < self.online_min_confidence:
+            return False
+        with self._lock:
+            if self._online_examples >= self.online_max_examples:
+                return False
+            self._online_examples += 1
+        self.learn(texto, tipo)
+        return True
+
+    def predict(self, texto: Union[str, MessageContext]) -> Optional[IntentPrediction]:
+        self._ensure_trained()
+        features = extract_features(texto)
+        total_docs = sum(self._doc_counts.values())
+        if not features or not total_docs:
+            return None
+
+        known = [feature for feature in features if feature in self._vocabulary]
+        # Sin palabras de contenido conocidas solo hay n-gramas sueltos ("buen dia", "no entiendo")
+        if sum(1 for feature in known if feature.startswith("w:")) < MIN_KNOWN_WORDS:
+            return None
+        coverage = len(known) / len(features)
+
+        vocab_size = len(self._vocabulary)
+        log_scores = {}
+        for label, counts in self._feature_counts.items():
+            if not self._doc_counts[label]:
+                continue
+            denominator = self._feature_totals[label] + self.alpha * vocab_size
+            log_likelihood = sum(
+                math.log((counts.get(feature, 0) + self.alpha) / denominator) for feature in known
+            ) / len(known)
+            log_scores[label] = math.log(self._doc_counts[label] / total_docs) + FEATURE_WEIGHT * log_likelihood
+
+        best = max(log_scores, key=log_scores.get)
+        if best == NO_INTENT_LABEL:
+            return None
+        top = log_scores[best]
+        normalizer = sum(math.exp(score - top) for score in log_scores.values())
+        confianza = 1.0 / normalizer
+        if coverage < MIN_COVERAGE:
+            confianza *= coverage
+        return IntentPrediction(LABELS[best], round(confianza, 4))
+
+    def known_words(self, texto: Union[str, MessageContext]) -> int:
+        """Cantidad de palabras de contenido del mensaje que el modelo conoce."""
+        self._ensure_trained()
+        return sum(
+            1 for feature in extract_features(texto)
+            if feature.startswith("w:") and feature in self._vocabulary
+        )
+
+    def classify(self, texto: Union[str, MessageContext]) -> Optional[TipoConsulta]:
+        """
+        Retorna la intención solo si la confianza supera el umbral configurado.
+        URGENCIA exige `urgencia_threshold` y `urgencia_min_words` palabras conocidas.
+        """
+        prediccion = self.predict(texto)
+        if not prediccion or prediccion.confianza < self.threshold:
+            return None
+        if prediccion.tipo == TipoConsulta.URGENCIA and (
+            prediccion.confianza < self.urgencia_threshold
+            or self.known_words(texto) < self.urgencia_min_words
+        ):
+            return None
+        return prediccion.tipo
+
+
+intent_classifier = IntentClassifier()
@@ -0,0 +1,138 @@
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+class KeywordMatch(NamedTuple):
+    keyword: str
+    category: str
+    start: int
+    end: int
+
+
+class KeywordIndex:
+    """
+    Autómata Aho-Corasick para buscar muchas keywords en una sola pasada.
+
+    Cada keyword se registra con una categoría (p. ej. "gratitud", "geo:caba")
+    y, opcionalmente, como palabra completa. El costo de `find_all` depende del
+    largo del texto y de la cantidad de coincidencias, no del tamaño del
+    vocabulario. Las keywords y el texto deben llegar ya normalizados con el
+    mismo criterio (ver `MessageContext.words`).
+
+    El autómata se construye bajo lock (en la primera consulta o con `build`) y
+    se publica completo, así que puede consultarse desde varios hilos. Un índice
+    compartido se congela con `freeze` para que no se le agreguen keywords.
+    """
+
+    def __init__(self, entries: Optional[Iterable[Tuple[str, str, bool]]] = None):
+        self._goto: List[Dict[str, int]] = [{}]
+        # Keywords propias de cada nodo; las salidas del autómata suman las heredadas por fallo
+        self._own: List[List[int]] = [[]]
+        # (enlaces de fallo, salidas) del último autómata construido
+        self._automaton: Tuple[List[int], List[List[int]]] = ([0], [[]])
+        self._keywords: List[Tuple[str, str, bool]] = []
+        self._seen: Set[Tuple[str, str, bool]] = set()
+        self._lock = threading.Lock()
+        self._frozen = False
+        self._built = True
+        for keyword, category, whole_word in entries or ():
+            self.add(keyword, category, whole_word=whole_word)
+
+    def __len__(self) -> int:
+        return len(self._keywords)
+
+    def add(self, keyword: str, category: str, *, whole_word: bool = False) -> None:
+        if not keyword:
+            return
+        entry = (keyword, category, whole_word)
+        with self._lock:
+            if self._frozen:
+                raise RuntimeError("KeywordIndex congelado: no admite nuevas keywords")
+            if entry in self._seen:
+                return
+            self._seen.add(entry)
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._own.append([])
+                node = next_node
+            self._own[node].append(len(self._keywords))
+            self._keywords.append(entry)
+            self._built = False
+
+    def build(self) -> None:
+        """Construye el autómata si hay keywords nuevas desde la última construcción."""
+        if self._built:
+            return
+        with self._lock:
+            if not self._built:
+                self._build()
+
+    def freeze(self) -> "KeywordIndex":
+        """Construye el autómata y rechaza nuevas keywords (índices compartidos entre hilos)."""
+        with self._lock:
+            if not self._built:
+                self._build()
+            self._frozen = True
+        return self
+
+    def _build(self) -> None:
+        # BFS para calcular los enlaces de fallo; las salidas heredadas se
+        # recalculan desde las propias, así reconstruir es idempotente
+        goto = self._goto
+        own = self._own
+        fail = [0] * len(goto)
+        output: List[List[int]] = [list(own[0])] + [[] for _ in range(len(goto) - 1)]
+        queue = list(goto[0].values())
+        for node in queue:
+            output[node] = list(own[node])
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in goto[node].items():
+                queue.append(child)
+                fallback = fail[node]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                candidate = goto[fallback].get(char, 0)
+                fail[child] = candidate if candidate != child else 0
+                output[child] = own[child] + output[fail[child]]
+        # Se publica el autómata completo: un lector nunca ve enlaces a medio calcular
+        self._automaton = (fail, output)
+        self._built = True
+
+    def find_all(self, text: str) -> List[KeywordMatch]:
+        """Retorna todas las keywords presentes en `text` con su categoría."""
+        if not self._built:
+            self.build()
+        goto = self._goto
+        fail, output = self._automaton
+        keywords = self._keywords
+        matches: List[KeywordMatch] = []
+        node = 0
+        text_len = len(text)
+        for idx, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not output[node]:
+                continue
+            end = idx + 1
+            for keyword_id in output[node]:
+                keyword, category, whole_word = keywords[keyword_id]
+                start = end - len(keyword)
+                if whole_word and (
+                    (start > 0 and text[start - 1].isalnum())
+                    or (end < text_len and text[end].isalnum())
+                ):
+                    continue
+                matches.append(KeywordMatch(keyword, category, start, end))
+        return matches
+
+    def categories(self, text: str) -> Set[str]:
+        return {match.category for match in self.find_all(text)}
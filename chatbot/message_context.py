@@ -0,0 +1,74 @@
+import unicodedata
+from functools import cached_property
+from typing import Any, Callable, Tuple, Union
+
+
+def quitar_acentos(texto: str) -> str:
+    """Elimina tildes/diacríticos (NFD + descarta marcas Mn)."""
+    if texto.isascii():
+        return texto
+    return ''.join(
+        c for c in unicodedata.normalize('NFD', texto)
+        if unicodedata.category(c) != 'Mn'
+    )
+
+
+class MessageContext:
+    """
+    Representaciones de un mensaje entrante calculadas una sola vez.
+
+    Se construye una vez por webhook y se pasa a `procesar_mensaje`, a los
+    detectores de NLU y al parser de encuestas. Cada forma se calcula de
+    manera perezosa y queda cacheada en la instancia.
+    """
+
+    def __init__(self, raw: str):
+        self.raw = raw or ""
+        self._derived = {}
+
+    @classmethod
+    def from_text(cls, value: Union[str, "MessageContext", None]) -> "MessageContext":
+        if isinstance(value, MessageContext):
+            return value
+        return cls(value or "")
+
+    def __str__(self) -> str:
+        return self.raw
+
+    def __repr__(self) -> str:
+        return f"MessageContext({self.raw!r})"
+
+    @cached_property
+    def stripped(self) -> str:
+        return self.raw.strip()
+
+    @cached_property
+    def lower(self) -> str:
+        """Texto sin espacios extremos y en minúsculas."""
+        return self.stripped.lower()
+
+    @cached_property
+    def accent_free(self) -> str:
+        """`lower` sin tildes (equivalente a la normalización de NLU)."""
+        return quitar_acentos(self.lower)
+
+    @cached_property
+    def words(self) -> str:
+        """`accent_free` con puntuación reemplazada por espacios y espacios colapsados."""
+        text = ''.join(c if c.isalnum() or c.isspace() else ' ' for c in self.accent_free)
+        return " ".join(text.split())
+
+    @cached_property
+    def compact(self) -> str:
+        """`accent_free` sin espacios ni puntos (bsas = bs as = bs. as.)."""
+        return self.accent_free.replace(' ', '').replace('.', '')
+
+    @cached_property
+    def tokens(self) -> Tuple[str, ...]:
+        return tuple(self.words.split())
+
+    def memo(self, key: str, factory: Callable[["MessageContext"], Any]) -> Any:
+        """Cachea un resultado derivado del mensaje (p. ej. coincidencias de keywords)."""
+        if key not in self._derived:
+            self._derived[key] = factory(self)
+        return self._derived[key]
@@ -0,0 +1,23 @@
+from typing import List, Tuple
+
+IFCI_ITEM_TITLE = "Consulta IFCI (Hidrantes)"
+IFCI_DETAIL_FIELDS = (
+    ("nivel", "Nivel de instalación"),
+    ("hidrantes", "Cantidad de hidrantes"),
+    ("establecimiento", "Pisos / subsuelo / estacionamiento"),
+    ("detectores", "Detectores de humo"),
+    ("plano", "Plano de incendio"),
+)
+
+
+def describe_presupuesto_item(item: dict) -> Tuple[str, List[str]]:
+    """
+    Título y detalles de un ítem de `_presupuesto_items`.
+    Lo usan tanto la descripción de texto del resumen como el email del lead.
+    """
+    if item.get("kind") == "extintor":
+        return item.get("summary", "").strip(), []
+    details = item.get("details", {})
+    return IFCI_ITEM_TITLE, [
+        f"{label}: {details.get(field, 'No especificado')}" for field, label in IFCI_DETAIL_FIELDS
+    ]
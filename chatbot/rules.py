@@ -1,13 +1,25 @@
+import logging
 import os
 import re
-import unicodedata
-from typing import Optional
+import threading
+import uuid
+from typing import Optional, Union
+from .geo_gazetteer import geo_gazetteer
+from .intent_classifier import intent_classifier
+from .keyword_index import KeywordIndex
+from .message_context import MessageContext
 from .models import EstadoConversacion, TipoConsulta
+from .presupuesto_items import describe_presupuesto_item
 from .states import conversation_manager
 from config.company_profiles import get_urgency_redirect_message, get_active_company_profile
 from datetime import datetime, timedelta
 from services.error_reporter import error_reporter, ErrorTrigger
+from services.lead_outbox_service import LEAD_CONFIRMATION_ID_KEY
 from services.metrics_service import metrics_service
+from services.nlu_metrics import llm_caller_state
+from services.runtime_metrics import PROCESAR_MENSAJE_SECONDS
+
+logger = logging.getLogger(__name__)
 
 POST_FINALIZADO_WINDOW_SECONDS = int(os.getenv("POST_FINALIZADO_WINDOW_SECONDS", "120"))
 POST_FINALIZADO_ACK_MESSAGE = os.getenv(
@@ -15,16 +27,12 @@ POST_FINALIZADO_ACK_MESSAGE = os.getenv(
     "¡Gracias por tu mensaje! Ya registramos tu solicitud. Si necesitás otra cosa, escribime \"hola\" para comenzar de nuevo. 🤖",
 )
 
-def normalizar_texto(texto: str) -> str:
+def normalizar_texto(texto: Union[str, MessageContext]) -> str:
     """
     Normaliza texto: lowercase + sin acentos + sin espacios + sin puntos
     """
-    texto = texto.lower().strip()
-    # Remover acentos
-    sin_acentos = ''.join(c for c in unicodedata.normalize('NFD', texto) 
-                          if unicodedata.category(c) != 'Mn')
     # Remover espacios y puntos para mejor matching (bsas = bs as = bs. as.)
-    return sin_acentos.replace(' ', '').replace('.', '')
+    return MessageContext.from_text(texto).compact
 
 # Mapeo de sinónimos para validación geográfica (solo minúsculas, se normalizan automáticamente)
 SINONIMOS_CABA = [
@@ -79,6 +87,8 @@ class ChatbotRules:
         "otras": ["consulta", "consultas", "informacion", "información", "visita", "visitas"],
     }
     _MENU_KEYWORDS = None
+    _KEYWORD_INDEX = None
+    _KEYWORD_INDEX_LOCK = threading.Lock()
 
     GRATITUDE_KEYWORDS = {
         "gracias",
@@ -241,14 +251,8 @@ class ChatbotRules:
         return "\n".join(lines)
 
     @classmethod
-    def _normalize_menu_text(cls, text: str) -> str:
-        text = text.lower().strip()
-        text = ''.join(
-            c for c in unicodedata.normalize('NFD', text)
-            if unicodedata.category(c) != 'Mn'
-        )
-        text = ''.join(c if c.isalnum() or c.isspace() else ' ' for c in text)
-        return " ".join(text.split())
+    def _normalize_menu_text(cls, text: Union[str, MessageContext]) -> str:
+        return MessageContext.from_text(text).words
 
     @classmethod
     def _get_menu_keywords(cls) -> dict:
@@ -270,6 +274,36 @@ class ChatbotRules:
         cls._MENU_KEYWORDS = keywords
         return keywords
 
+    @classmethod
+    def _get_keyword_index(cls) -> KeywordIndex:
+        """
+        Índice único (Aho-Corasick) con keywords de menú y agradecimiento.
+        Todas se normalizan como `MessageContext.words`. Se construye una sola
+        vez bajo lock y queda congelado: lo consultan varios hilos a la vez.
+        """
+        if cls._KEYWORD_INDEX is not None:
+            return cls._KEYWORD_INDEX
+        with cls._KEYWORD_INDEX_LOCK:
+            if cls._KEYWORD_INDEX is not None:
+                return cls._KEYWORD_INDEX
+            index = KeywordIndex()
+            for option_id, tokens in cls._get_menu_keywords().items():
+                for token in tokens:
+                    index.add(token, f"menu:{option_id}", whole_word=True)
+            for keyword in cls.GRATITUDE_KEYWORDS:
+                index.add(MessageContext(keyword).words, "gratitud")
+            cls._KEYWORD_INDEX = index.freeze()
+            return cls._KEYWORD_INDEX
+
+    @classmethod
+    def _keyword_categories(cls, mensaje: Union[str, MessageContext]) -> set:
+        """Categorías de keywords presentes en el mensaje (una pasada, cacheada por mensaje)."""
+        contexto = MessageContext.from_text(mensaje)
+        return contexto.memo(
+            "keyword_categories",
+            lambda ctx: cls._get_keyword_index().categories(ctx.words),
+        )
+
     @classmethod
     def _get_menu_option_by_id(cls, option_id: str):
         for option in cls.MENU_OPTIONS:
@@ -278,24 +312,24 @@ class ChatbotRules:
         return None
 
     @classmethod
-    def _match_menu_option(cls, mensaje: str):
-        if not mensaje:
+    def _match_menu_option(cls, mensaje: Union[str, MessageContext]):
+        contexto = MessageContext.from_text(mensaje)
+        if not contexto.raw:
             return None, ""
-        digits = re.findall(r"\d", mensaje)
+        digits = re.findall(r"\d", contexto.raw)
         if len(digits) == 1:
             idx = int(digits[0])
             if 1 <= idx <= len(cls.MENU_OPTIONS):
                 return cls.MENU_OPTIONS[idx - 1], "number"
-        normalized = cls._normalize_menu_text(mensaje)
+        normalized = contexto.words
         if not normalized:
             return None, ""
         for option in cls.MENU_OPTIONS:
             if normalized == option["id"]:
                 return option, "id"
-        message_tokens = set(normalized.split())
-        keywords = cls._get_menu_keywords()
+        categorias = cls._keyword_categories(contexto)
         for option_id in cls.MENU_MATCH_PRIORITY:
-            if keywords.get(option_id, set()) & message_tokens:
+            if f"menu:{option_id}" in categorias:
                 return cls._get_menu_option_by_id(option_id), "keyword"
         return None, ""
 
@@ -310,27 +344,21 @@ class ChatbotRules:
 Responde con el número de la opción que necesitas 📱"""
     
     @staticmethod
-    def _normalizar_agradecimiento(texto: str) -> str:
-        texto = texto.strip().lower()
-        texto = ''.join(
-            c for c in unicodedata.normalize('NFD', texto)
-            if unicodedata.category(c) != 'Mn'
-        )
-        texto = ''.join(c if c.isalnum() or c.isspace() else ' ' for c in texto)
-        texto = " ".join(texto.split())
-        return texto
+    def _normalizar_agradecimiento(texto: Union[str, MessageContext]) -> str:
+        return MessageContext.from_text(texto).words
     
     @staticmethod
-    def es_mensaje_agradecimiento(texto: str) -> bool:
-        if not texto:
+    def es_mensaje_agradecimiento(texto: Union[str, MessageContext]) -> bool:
+        contexto = MessageContext.from_text(texto)
+        if not contexto.raw:
             return False
         
-        raw = texto.strip()
+        raw = contexto.stripped
         # Emojis o reacciones cortas
         if raw and len(raw) <= 8 and any(emoji in raw for emoji in ChatbotRules.GRATITUDE_EMOJIS):
             return True
         
-        normalizado = ChatbotRules._normalizar_agradecimiento(raw)
+        normalizado = ChatbotRules._normalizar_agradecimiento(contexto)
         if not normalizado:
             return False
         
@@ -341,9 +369,8 @@ Responde con el número de la opción que necesitas 📱"""
         if compact in {"gracias", "muchasgracias", "milgracias", "graciass", "graciasss", "thankyou"}:
             return True
         
-        for keyword in ChatbotRules.GRATITUDE_KEYWORDS:
-            if keyword in normalizado:
-                return True
+        if "gratitud" in ChatbotRules._keyword_categories(contexto):
+            return True
         
         palabras = set(normalizado.split())
         if "gracias" in palabras or "thanks" in palabras:
@@ -356,11 +383,11 @@ Responde con el número de la opción que necesitas 📱"""
         return POST_FINALIZADO_ACK_MESSAGE
     
     @staticmethod
-    def _detectar_volver_menu(mensaje: str) -> bool:
+    def _detectar_volver_menu(mensaje: Union[str, MessageContext]) -> bool:
         """
         Detecta si el usuario quiere volver al menú principal
         """
-        mensaje_lower = mensaje.lower().strip()
+        mensaje_lower = MessageContext.from_text(mensaje).lower
         frases_menu = [
             'volver', 'menu', 'menú', 'inicio', 'empezar de nuevo',
             'me equivoqué', 'me equivoque', 'error', 'atrás', 'atras',
@@ -398,6 +425,7 @@ Responde con el número de la opción que necesitas 📱"""
         conversacion.atendido_por_humano = True
         conversacion.handoff_started_at = datetime.utcnow()
         conversacion.mensaje_handoff_contexto = mensaje_contexto
+        conversation_manager.schedule_handoff_deadline(numero_telefono)
         conversation_manager.add_to_handoff_queue(numero_telefono)
 
     @staticmethod
@@ -418,7 +446,7 @@ Responde con el número de la opción que necesitas 📱"""
 
         conversation_manager.update_estado(numero_telefono, EstadoConversacion.RECOLECTANDO_SECUENCIAL)
 
-        if source == "nlu" and tipo_consulta != TipoConsulta.OTRAS:
+        if source in ("nlu", "classifier") and tipo_consulta != TipoConsulta.OTRAS:
             return (
                 f"¡Listo! 📝 Entendí que necesitás {ChatbotRules._get_texto_tipo_consulta(tipo_consulta)}.\n\n"
                 f"{ChatbotRules.get_mensaje_inicio_secuencial(tipo_consulta)}"
@@ -937,17 +965,9 @@ Responde con el número de la opción que necesitas 📱"""
     def _render_presupuesto_items(numero_telefono: str) -> str:
         lines = []
         for item in ChatbotRules._get_presupuesto_items(numero_telefono):
-            if item.get("kind") == "extintor":
-                lines.append(f"- {item.get('summary', '').strip()}")
-                continue
-
-            details = item.get("details", {})
-            lines.append("- Consulta IFCI (Hidrantes)")
-            lines.append(f"  - Nivel de instalación: {details.get('nivel', 'No especificado')}")
-            lines.append(f"  - Cantidad de hidrantes: {details.get('hidrantes', 'No especificado')}")
-            lines.append(f"  - Pisos / subsuelo / estacionamiento: {details.get('establecimiento', 'No especificado')}")
-            lines.append(f"  - Detectores de humo: {details.get('detectores', 'No especificado')}")
-            lines.append(f"  - Plano de incendio: {details.get('plano', 'No especificado')}")
+            title, details = describe_presupuesto_item(item)
+            lines.append(f"- {title}")
+            lines.extend(f"  - {detail}" for detail in details)
         return "\n".join(lines).strip()
 
     @staticmethod
@@ -1918,28 +1938,20 @@ _💡 También puedes escribir "menú" para volver al menú principal en cualqui
         return errores.get(campo, "El formato no es válido.")
     
     @staticmethod
-    def _validar_ubicacion_geografica(direccion: str) -> str:
+    def _validar_ubicacion_geografica(direccion: Union[str, MessageContext]) -> str:
         """
-        Valida si una dirección especifica CABA o Provincia usando comparación de keywords
+        Valida si una dirección especifica CABA o Provincia usando el gazetteer del AMBA
+        (barrios, partidos, localidades, calles y códigos postales).
         Retorna: 'CABA', 'PROVINCIA', o 'UNCLEAR'
         """
-        direccion_lower = direccion.lower()
-        
-        # Buscar keywords en la dirección
         try:
-            for sinonimo in SINONIMOS_CABA:
-                if sinonimo in direccion_lower:
-                    return 'CABA'
-            
-            for sinonimo in SINONIMOS_PROVINCIA:
-                if sinonimo in direccion_lower:
-                    return 'PROVINCIA'
-        except Exception:
-            print('LOCATION ERROR: NO SE PUDO VALIDAR CON KEYWORDS SI ES CABA O PROVINCIA')
+            clasificacion = geo_gazetteer.classify(MessageContext.from_text(direccion))
+        except Exception as exc:
+            logger.warning("geo_gazetteer_classify_failed zona=UNCLEAR error=%s", str(exc))
             return 'UNCLEAR'
-            
-        # Si no encuentra keywords, retornar UNCLEAR para que el usuario seleccione manualmente
-        return 'UNCLEAR'
+
+        # Si la evidencia es débil o contradictoria, el usuario selecciona manualmente
+        return clasificacion.zona
     
     @staticmethod
     def _get_mensaje_seleccion_ubicacion() -> str:
@@ -1949,7 +1961,7 @@ _💡 También puedes escribir "menú" para volver al menú principal en cualqui
 """
     
     @staticmethod
-    def _procesar_seleccion_ubicacion(numero_telefono: str, mensaje: str) -> str:
+    def _procesar_seleccion_ubicacion(numero_telefono: str, mensaje: Union[str, MessageContext]) -> str:
         """
         Procesa la selección del usuario para CABA o Provincia
         Acepta números (1, 2) y texto (caba, provincia, capital federal, bs as, etc.)
@@ -2077,11 +2089,18 @@ _💡 También puedes escribir "menú" para volver al menú principal en cualqui
     @staticmethod
     def _extraer_datos_con_llm(mensaje: str) -> dict:
         """
-        Usa el servicio NLU para extraer datos cuando el parsing básico no es suficiente
+        Usa el servicio NLU para extraer y validar los datos de contacto en una
+        sola llamada; solo se devuelven los campos que el LLM marcó como válidos.
         """
         try:
             from services.nlu_service import nlu_service
-            return nlu_service.extraer_datos_estructurados(mensaje)
+            campos = {campo: "" for campo in ('email', 'direccion', 'horario_visita', 'descripcion')}
+            resultado = nlu_service.procesar_campos_lote(campos, mensaje_usuario=mensaje)
+            return {
+                campo: datos["valor"]
+                for campo, datos in resultado.items()
+                if datos["valido"] and datos["valor"]
+            }
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -2630,14 +2649,25 @@ Responde con el número del campo que deseas modificar."""
         return ChatbotRules._finish_ifci_correction(numero_telefono)
     
     @staticmethod
-    def procesar_mensaje(numero_telefono: str, mensaje: str, nombre_usuario: str = "") -> str:
+    def procesar_mensaje(numero_telefono: str, mensaje: Union[str, MessageContext], nombre_usuario: str = "") -> str:
+        # Las llamadas al LLM de este mensaje se atribuyen al estado en que llegó
+        estado = conversation_manager.get_conversacion(numero_telefono).estado
+        estado = getattr(estado, "value", str(estado))
+        with llm_caller_state(estado), PROCESAR_MENSAJE_SECONDS.time(estado=estado):
+            return ChatbotRules._procesar_mensaje(numero_telefono, mensaje, nombre_usuario)
+
+    @staticmethod
+    def _procesar_mensaje(numero_telefono: str, mensaje: Union[str, MessageContext], nombre_usuario: str = "") -> str:
         conversacion = conversation_manager.get_conversacion(numero_telefono)
         
         # Guardar nombre de usuario si es la primera vez que lo vemos
         if nombre_usuario and not conversacion.nombre_usuario:
             conversation_manager.set_nombre_usuario(numero_telefono, nombre_usuario)
 
-        mensaje_limpio = mensaje.strip().lower()
+        # Normalizar una sola vez; los detectores reutilizan las formas cacheadas
+        contexto = MessageContext.from_text(mensaje)
+        mensaje = contexto.raw
+        mensaje_limpio = contexto.lower
 
         if mensaje_limpio in ['hola', 'hi', 'hello', 'inicio', 'empezar']:
             conversation_manager.reset_conversacion(numero_telefono)
@@ -2660,7 +2690,7 @@ Responde con el número del campo que deseas modificar."""
             return ChatbotRules._enviar_flujo_saludo_completo(numero_telefono, nombre_usuario)
 
         if (
-            ChatbotRules._detectar_volver_menu(mensaje)
+            ChatbotRules._detectar_volver_menu(contexto)
             and conversacion.estado not in [EstadoConversacion.INICIO, EstadoConversacion.ESPERANDO_OPCION]
         ):
             local_back_result = ChatbotRules._handle_presupuesto_multi_back(numero_telefono)
@@ -2669,8 +2699,8 @@ Responde con el número del campo que deseas modificar."""
         
         # INTERCEPTAR CONSULTAS DE CONTACTO EN CUALQUIER MOMENTO (Contextual Intent Interruption)
         from services.nlu_service import nlu_service
-        if nlu_service.detectar_consulta_contacto(mensaje):
-            respuesta_contacto = nlu_service.generar_respuesta_contacto(mensaje)
+        if nlu_service.detectar_consulta_contacto(contexto):
+            respuesta_contacto = nlu_service.generar_respuesta_contacto(contexto)
             
             # Si estamos en un flujo activo, agregar mensaje para continuar
             if conversacion.estado not in [EstadoConversacion.INICIO, EstadoConversacion.ESPERANDO_OPCION]:
@@ -2679,7 +2709,7 @@ Responde con el número del campo que deseas modificar."""
             return respuesta_contacto
         
         # INTERCEPTAR SOLICITUD DE HABLAR CON HUMANO EN CUALQUIER MOMENTO -> activar handoff
-        if nlu_service.detectar_solicitud_humano(mensaje):
+        if nlu_service.detectar_solicitud_humano(contexto):
             ChatbotRules._activar_handoff(numero_telefono, mensaje)
 
             # Enviar mensaje de handoff con botones interactivos
@@ -2721,7 +2751,7 @@ Responde con el número del campo que deseas modificar."""
             EstadoConversacion.PRESUPUESTO_AGREGAR_OTRO,
         }
         if (
-            ChatbotRules._detectar_volver_menu(mensaje)
+            ChatbotRules._detectar_volver_menu(contexto)
             and conversacion.estado not in [EstadoConversacion.INICIO, EstadoConversacion.ESPERANDO_OPCION]
             and conversacion.estado not in local_back_states
         ):
@@ -2732,7 +2762,7 @@ Responde con el número del campo que deseas modificar."""
             return ChatbotRules._enviar_flujo_saludo_completo(numero_telefono, conversacion.nombre_usuario or nombre_usuario)
         
         elif conversacion.estado == EstadoConversacion.ESPERANDO_OPCION:
-            return ChatbotRules._procesar_seleccion_opcion(numero_telefono, mensaje)
+            return ChatbotRules._procesar_seleccion_opcion(numero_telefono, contexto)
 
         elif conversacion.estado == EstadoConversacion.PRESUPUESTO_MENU:
             return ChatbotRules._procesar_presupuesto_menu(numero_telefono, mensaje)
@@ -2773,7 +2803,7 @@ Responde con el número del campo que deseas modificar."""
             return ChatbotRules._procesar_campo_secuencial(numero_telefono, mensaje)
         
         elif conversacion.estado == EstadoConversacion.VALIDANDO_UBICACION:
-            return ChatbotRules._procesar_seleccion_ubicacion(numero_telefono, mensaje_limpio)
+            return ChatbotRules._procesar_seleccion_ubicacion(numero_telefono, contexto)
 
         elif conversacion.estado == EstadoConversacion.IFCI_NIVEL:
             return ChatbotRules._procesar_ifci_nivel(numero_telefono, mensaje)
@@ -2838,17 +2868,30 @@ Responde con el número del campo que deseas modificar."""
             return False
     
     @staticmethod
-    def _procesar_seleccion_opcion(numero_telefono: str, mensaje: str) -> str:
+    def _procesar_seleccion_opcion(numero_telefono: str, mensaje: Union[str, MessageContext]) -> str:
         conversacion = conversation_manager.get_conversacion(numero_telefono)
-        opcion, source = ChatbotRules._match_menu_option(mensaje)
+        contexto = MessageContext.from_text(mensaje)
+        mensaje = contexto.raw
+        opcion, source = ChatbotRules._match_menu_option(contexto)
         if opcion:
             return ChatbotRules._aplicar_opcion_menu(numero_telefono, opcion, mensaje, source)
 
+        # Fast path: clasificador local; el LLM solo se consulta con baja confianza
+        try:
+            tipo_consulta_local = intent_classifier.classify(contexto)
+        except Exception:
+            logger.exception("Error en clasificador local de intención")
+            tipo_consulta_local = None
+        if tipo_consulta_local:
+            return ChatbotRules._aplicar_tipo_consulta(numero_telefono, tipo_consulta_local, mensaje, "classifier")
+
         # Fallback: usar NLU para mapear mensaje a intención
         from services.nlu_service import nlu_service
         tipo_consulta_nlu = nlu_service.mapear_intencion(mensaje)
 
         if tipo_consulta_nlu:
+            # Aprendizaje en línea opcional y acotado (ver IntentClassifier.learn_from_llm)
+            intent_classifier.learn_from_llm(contexto, tipo_consulta_nlu)
             return ChatbotRules._aplicar_tipo_consulta(numero_telefono, tipo_consulta_nlu, mensaje, "nlu")
 
         # Reportar intención no clara (fricción NLU)
@@ -2984,6 +3027,8 @@ Responde con el número del campo que deseas modificar."""
         conversacion = conversation_manager.get_conversacion(numero_telefono)
 
         if mensaje in ['si', 'sí', 'yes', 'confirmo', 'ok', 'correcto', '1', '1️⃣']:
+            # Identifica esta confirmación en la clave del outbox; se guarda con el checkpoint
+            conversacion.datos_temporales.setdefault(LEAD_CONFIRMATION_ID_KEY, uuid.uuid4().hex)
             conversation_manager.update_estado(numero_telefono, EstadoConversacion.ENVIANDO)
             return "⏳ Procesando tu solicitud..."
         elif mensaje in ['no', 'nope', 'incorrecto', 'error', '2', '2️⃣']:
@@ -1,6 +1,9 @@
+import asyncio
 import os
-from typing import Dict, Optional, List, Any
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, List, Any
 from .models import ConversacionData, EstadoConversacion, TipoConsulta, DatosContacto, DatosConsultaGeneral
+from .handoff_deadlines import HandoffDeadlineIndex, handoff_deadline
 from pydantic import ValidationError
 from services.metrics_service import metrics_service
 from services.conversation_session_service import conversation_session_service
@@ -17,6 +20,40 @@ class ConversationManager:
         # Sistema de cola FIFO para handoffs
         self.handoff_queue: List[str] = []  # Lista de números de teléfono en orden FIFO
         self.active_handoff: Optional[str] = None  # Número de teléfono activo actualmente
+        # Con varios agentes: caso en foco de cada agente y agente de cada cliente atendido
+        self.active_handoffs: Dict[str, str] = {}
+        self.handoff_assignments: Dict[str, str] = {}
+        # Vencimientos de handoff (inactividad / encuesta) para el TTL sweep
+        self.handoff_deadlines = HandoffDeadlineIndex()
+        # Event loop de la app: la cola runtime se modifica solo desde ahí
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind_event_loop(self, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        self._loop = loop
+
+    def run_on_loop(self, fn: Callable[..., Any], *args) -> Any:
+        """
+        Corre `fn` en el event loop de la app y espera el resultado. Pensado para
+        los threads del webhook; desde el loop (o sin loop activo) llama directo.
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            return fn(*args)
+        try:
+            if asyncio.get_running_loop() is loop:
+                return fn(*args)
+        except RuntimeError:
+            pass
+        result: Future = Future()
+
+        def _call() -> None:
+            try:
+                result.set_result(fn(*args))
+            except BaseException as exc:
+                result.set_exception(exc)
+
+        loop.call_soon_threadsafe(_call)
+        return result.result()
 
     def _load_checkpoint(self, numero_telefono: str) -> Optional[ConversacionData]:
         try:
@@ -52,16 +89,30 @@ class ConversationManager:
         except Exception:
             pass
     
+    def delete_checkpoint(self, numero_telefono: str) -> None:
+        """I/O del cierre (borra el checkpoint persistido); se puede llamar desde un thread."""
+        self._delete_checkpoint(numero_telefono, "finalizar_conversacion")
+
+    def load_missing_checkpoints(self, phones: List[str]) -> Dict[str, Optional[ConversacionData]]:
+        """I/O (se puede llamar desde un thread): checkpoints de los teléfonos que no están en memoria."""
+        return {phone: self._load_checkpoint(phone) for phone in phones if phone not in self.conversaciones}
+
+    def _install_conversacion(
+        self, numero_telefono: str, checkpoint_conversation: Optional[ConversacionData]
+    ) -> ConversacionData:
+        if checkpoint_conversation is not None:
+            self.conversaciones[numero_telefono] = checkpoint_conversation
+            self.schedule_handoff_deadline(numero_telefono)
+        else:
+            self.conversaciones[numero_telefono] = ConversacionData(
+                numero_telefono=numero_telefono,
+                estado=EstadoConversacion.INICIO
+            )
+        return self.conversaciones[numero_telefono]
+
     def get_conversacion(self, numero_telefono: str) -> ConversacionData:
         if numero_telefono not in self.conversaciones:
-            checkpoint_conversation = self._load_checkpoint(numero_telefono)
-            if checkpoint_conversation is not None:
-                self.conversaciones[numero_telefono] = checkpoint_conversation
-            else:
-                self.conversaciones[numero_telefono] = ConversacionData(
-                    numero_telefono=numero_telefono,
-                    estado=EstadoConversacion.INICIO
-                )
+            self._install_conversacion(numero_telefono, self._load_checkpoint(numero_telefono))
         return self.conversaciones[numero_telefono]
     
     def update_estado(self, numero_telefono: str, nuevo_estado: EstadoConversacion):
@@ -157,10 +208,15 @@ class ConversationManager:
         conversacion.nombre_usuario = nombre
     
     def finalizar_conversacion(self, numero_telefono: str):
+        self.finalizar_conversacion_runtime(numero_telefono)
+        self.delete_checkpoint(numero_telefono)
+
+    def finalizar_conversacion_runtime(self, numero_telefono: str):
+        """Parte en memoria de `finalizar_conversacion`, sin I/O (el checkpoint se borra aparte)."""
         self.recently_finalized[numero_telefono] = datetime.utcnow()
         if numero_telefono in self.conversaciones:
             del self.conversaciones[numero_telefono]
-        self._delete_checkpoint(numero_telefono, "finalizar_conversacion")
+        self.handoff_deadlines.discard(numero_telefono)
         try:
             metrics_service.on_conversation_finished()
         except Exception:
@@ -169,6 +225,7 @@ class ConversationManager:
     def reset_conversacion(self, numero_telefono: str):
         if numero_telefono in self.conversaciones:
             del self.conversaciones[numero_telefono]
+        self.handoff_deadlines.discard(numero_telefono)
         self.recently_finalized.pop(numero_telefono, None)
         self._delete_checkpoint(numero_telefono, "reset_conversacion")
     
@@ -274,15 +331,24 @@ class ConversationManager:
             self.active_handoff = None
             return None
 
-    def get_active_handoff(self) -> Optional[str]:
+    def get_active_handoff(self, agent_phone: Optional[str] = None) -> Optional[str]:
         """
         Obtiene el número de teléfono de la conversación activa.
 
+        Args:
+            agent_phone: Agente (formato +549...); sin agente devuelve el primer activo
+
         Returns:
             Optional[str]: Número activo o None
         """
+        if agent_phone is not None and self.active_handoffs:
+            return self.active_handoffs.get(agent_phone)
         return self.active_handoff
 
+    def get_handoff_agent(self, numero_telefono: str) -> Optional[str]:
+        """Agente asignado al cliente, o None si está en cola."""
+        return self.handoff_assignments.get(numero_telefono)
+
     def get_queue_position(self, numero_telefono: str) -> Optional[int]:
         """
         Obtiene la posición de un número en la cola.
@@ -318,6 +384,7 @@ class ConversationManager:
         if self.active_handoff and self.active_handoff in self.handoff_queue:
             # Remover de la cola
             self.handoff_queue.remove(self.active_handoff)
+            self._drop_handoff_assignment(self.active_handoff)
 
             # Finalizar conversación
             self.finalizar_conversacion(self.active_handoff)
@@ -381,6 +448,7 @@ class ConversationManager:
 
         # Remover de la cola
         self.handoff_queue.remove(numero_telefono)
+        self._drop_handoff_assignment(numero_telefono)
 
         # Si era el activo, activar siguiente
         if was_active:
@@ -389,10 +457,18 @@ class ConversationManager:
 
         return True
 
-    def format_queue_status(self) -> str:
+    def _drop_handoff_assignment(self, numero_telefono: str) -> None:
+        agent = self.handoff_assignments.pop(numero_telefono, None)
+        if agent and self.active_handoffs.get(agent) == numero_telefono:
+            self.active_handoffs.pop(agent, None)
+
+    def format_queue_status(self, agent_phone: Optional[str] = None) -> str:
         """
         Genera un mensaje formateado con el estado completo de la cola.
 
+        Args:
+            agent_phone: Agente que consulta; sus casos se marcan como propios
+
         Returns:
             str: Mensaje formateado
         """
@@ -401,9 +477,11 @@ class ConversationManager:
 
         lines = ["📋 *COLA DE HANDOFFS*\n"]
 
+        own_active = self.get_active_handoff(agent_phone)
         for i, numero in enumerate(self.handoff_queue):
             conversacion = self.get_conversacion(numero)
-            is_active = (numero == self.active_handoff)
+            assigned_agent = self.handoff_assignments.get(numero)
+            is_active = (numero == own_active)
 
             # Calcular tiempo desde el inicio del handoff
             tiempo_desde_inicio = ""
@@ -437,6 +515,14 @@ class ConversationManager:
                     lines.append(f"   ⏱️ Iniciado hace {tiempo_desde_inicio}")
                 if tiempo_ultimo_mensaje:
                     lines.append(f"   💬 Último mensaje hace {tiempo_ultimo_mensaje}")
+            elif assigned_agent or numero == self.active_handoff:
+                if assigned_agent and assigned_agent == agent_phone:
+                    lines.append(f"🟡 *[ASIGNADO]* {nombre}")
+                else:
+                    lines.append(f"🔵 *[ATENDIDO]* {nombre}")
+                lines.append(f"   📞 {numero}")
+                if assigned_agent and assigned_agent != agent_phone:
+                    lines.append(f"   👤 Agente …{assigned_agent[-4:]}")
             else:
                 lines.append(f"\n⏳ *[#{i+1}]* {nombre}")
                 lines.append(f"   📞 {numero}")
@@ -456,9 +542,13 @@ class ConversationManager:
         lines.append(f"📊 Total: {len(self.handoff_queue)} conversación(es)")
 
         # Calcular tiempo promedio de espera
-        if len(self.handoff_queue) > 1:
+        en_espera = [
+            numero for numero in self.handoff_queue
+            if numero not in self.handoff_assignments and numero != self.active_handoff
+        ]
+        if en_espera:
             tiempos_espera = []
-            for numero in self.handoff_queue[1:]:  # Excluir el activo
+            for numero in en_espera:  # Excluir los que ya atiende un agente
                 conv = self.get_conversacion(numero)
                 if conv.handoff_started_at:
                     delta = datetime.utcnow() - conv.handoff_started_at
@@ -530,10 +620,60 @@ class ConversationManager:
         # Retornar los últimos N mensajes
         return conversacion.message_history[-limit:] if conversacion.message_history else []
 
-    def sync_handoff_runtime(self, cases: List[Any]) -> None:
-        """Sincroniza la cola runtime desde la proyección persistida del inbox."""
+    def schedule_handoff_deadline(self, numero_telefono: str) -> None:
+        """
+        Recalcula el vencimiento de la conversación en el índice del TTL sweep.
+        Llamar cada vez que cambian los timestamps de handoff o encuesta.
+        """
+        conversacion = self.conversaciones.get(numero_telefono)
+        due = handoff_deadline(conversacion) if conversacion is not None else None
+        if due is None:
+            self.handoff_deadlines.discard(numero_telefono)
+            return
+        self.handoff_deadlines.schedule(numero_telefono, due[0])
+
+    def pop_expired_handoffs(self, now: Optional[datetime] = None) -> List[tuple]:
+        """
+        Conversaciones en handoff vencidas como [(numero, motivo)]. Solo
+        revisa las entradas vencidas del índice; las que se extendieron desde
+        que se agendaron (mensaje nuevo del cliente) vuelven al índice.
+        """
+        now = now or datetime.utcnow()
+        expired = []
+        for numero_telefono in self.handoff_deadlines.pop_expired(now):
+            conversacion = self.conversaciones.get(numero_telefono)
+            due = handoff_deadline(conversacion) if conversacion is not None else None
+            if due is None:
+                continue
+            deadline, reason = due
+            if deadline < now:
+                expired.append((numero_telefono, reason))
+            else:
+                self.handoff_deadlines.schedule(numero_telefono, deadline)
+        return expired
+
+    def sync_handoff_runtime_from_thread(self, cases: List[Any], loaded_at: datetime) -> None:
+        """Desde un thread: carga acá los checkpoints que falten y aplica la sincronización en el loop."""
+        phones = [case.client_phone for case in cases or [] if getattr(case, "client_phone", None)]
+        checkpoints = self.load_missing_checkpoints(phones)
+        self.run_on_loop(self.sync_handoff_runtime, cases, checkpoints, loaded_at)
+
+    def sync_handoff_runtime(
+        self,
+        cases: List[Any],
+        checkpoints: Optional[Dict[str, Optional[ConversacionData]]] = None,
+        loaded_at: Optional[datetime] = None,
+    ) -> None:
+        """
+        Sincroniza la cola runtime desde la proyección persistida del inbox.
+        Con `checkpoints` (de `load_missing_checkpoints`) no hace I/O. Con
+        `loaded_at` (UTC naive, antes de leer el inbox) se ignoran los clientes
+        finalizados después de la lectura: su caso ya se cerró y no se reinstalan.
+        """
         ordered_phones: List[str] = []
         active_phone: Optional[str] = None
+        active_by_agent: Dict[str, str] = {}
+        assignments: Dict[str, str] = {}
         survey_states = {
             EstadoConversacion.ESPERANDO_RESPUESTA_ENCUESTA,
             EstadoConversacion.ENCUESTA_SATISFACCION,
@@ -543,8 +683,15 @@ class ConversationManager:
             phone = getattr(case, "client_phone", None)
             if not phone:
                 continue
+            finalized_at = self.recently_finalized.get(phone)
+            if loaded_at is not None and finalized_at is not None and finalized_at >= loaded_at:
+                continue
             ordered_phones.append(phone)
-            conversacion = self.get_conversacion(phone)
+            if checkpoints is not None and phone not in self.conversaciones:
+                # Sin entrada: estaba en memoria al leer y se finalizó después, su checkpoint ya no existe
+                conversacion = self._install_conversacion(phone, checkpoints.get(phone))
+            else:
+                conversacion = self.get_conversacion(phone)
             conversacion.handoff_case_id = getattr(case, "case_id", None)
             conversacion.atendido_por_humano = True
             if conversacion.estado not in survey_states:
@@ -557,10 +704,18 @@ class ConversationManager:
                 conversacion.handoff_started_at = case.created_at
             if getattr(case, "last_client_message_at", None):
                 conversacion.last_client_message_at = case.last_client_message_at
+            self.schedule_handoff_deadline(phone)
             if getattr(case, "is_active", False):
-                active_phone = phone
+                active_phone = active_phone or phone
+                agent = getattr(case, "assigned_agent", None)
+                if agent:
+                    assignments[phone] = agent
+                    # Los casos llegan ordenados por foco: el primero de cada agente es el activo
+                    active_by_agent.setdefault(agent, phone)
 
         self.handoff_queue = ordered_phones
         self.active_handoff = active_phone or (ordered_phones[0] if ordered_phones else None)
+        self.active_handoffs = active_by_agent
+        self.handoff_assignments = assignments
 
 conversation_manager = ConversationManager()
@@ -1,43 +1,81 @@
+import asyncio
 import os
 import json
-from contextlib import asynccontextmanager
+import time
+import weakref
+from collections import Counter
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime
 from dotenv import load_dotenv
 
 # Cargar variables de entorno PRIMERO
 load_dotenv()
 
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, Response
 import logging
 from typing import Optional
 from chatbot.rules import ChatbotRules
 from chatbot.states import conversation_manager
 from chatbot.models import EstadoConversacion, ConversacionData
+from chatbot.handoff_deadlines import CLOSE_REASON_SURVEY, CLOSE_REASON_SURVEY_OFFER, CLOSE_REASON_RESOLUTION
+from chatbot.message_context import MessageContext
 from services.meta_whatsapp_service import meta_whatsapp_service
 from services.whatsapp_handoff_service import whatsapp_handoff_service
 from services.email_service import email_service
+from services.lead_outbox_service import lead_outbox
 from services.error_reporter import error_reporter, ErrorTrigger
 from services.metrics_service import metrics_service
+from services.sheets_service import sheets_service
+from services.nlu_service import nlu_service
 from services.conversation_session_service import conversation_session_service
 from services.handoff_inbox_models import HandoffInboxMessageSender
 from services.handoff_inbox_reply_service import handoff_inbox_reply_service
 from services.handoff_inbox_service import handoff_inbox_service
+from services.handoff_scheduler import handoff_scheduler
+from services.agent_notification_service import agent_notification_batcher
+from services.job_runner import JOB_RUNNER_ENABLED, JobResult, job_runner
+from services.logging_setup import configure_logging
+from services.runtime_metrics import (
+    ACTIVE_CONVERSATIONS,
+    HANDOFF_QUEUE_SIZE,
+    HTTP_REQUEST_SECONDS,
+    STAGE_SECONDS,
+    registry as runtime_metrics_registry,
+)
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (JSON + cola; no-op si ya hay handlers, p. ej. en tests)
+configure_logging()
 logger = logging.getLogger(__name__)
+# Eventos por webhook: muestreados según LOG_SAMPLE_RATES
+webhook_logger = logging.getLogger("chatbot.webhook")
 
 
 @asynccontextmanager
 async def runtime_lifespan(app_instance: FastAPI):
-    cases = _sync_runtime_handoff_state()
+    # Los threads del webhook aplican la sincronización de la cola en este loop
+    conversation_manager.bind_event_loop(asyncio.get_running_loop())
+    warmed = await _warmup_runtime()
+    cases = warmed.get("inbox") or []
     logger.info(
         "handoff_runtime_bootstrap loaded_cases=%s active_handoff=%s queue_size=%s",
         len(cases),
         conversation_manager.active_handoff,
         len(conversation_manager.handoff_queue),
     )
+    # Recupera los pendientes con una query al store (Firestore en prod): fuera del loop
+    await asyncio.to_thread(lead_outbox.start)
+    metrics_service.start()
+    job_runner.start()
     yield
+    await job_runner.stop()
+    # Envíos en curso y reintentos cercanos; lo que quede lo retoma `lead_outbox_recover` al vencer el lease
+    if not await asyncio.to_thread(lead_outbox.drain, LEAD_OUTBOX_SHUTDOWN_TIMEOUT_SECONDS):
+        logger.warning("lead_outbox_shutdown_pending stats=%s", lead_outbox.stats())
+    # Los stop() esperan a sus workers y vacían buffers contra Graph API / Sheets: fuera del loop
+    await asyncio.to_thread(agent_notification_batcher.stop)
+    await asyncio.to_thread(metrics_service.stop)
+    await asyncio.to_thread(sheets_service.stop)
 
 # Crear la aplicación FastAPI
 app = FastAPI(
@@ -47,17 +85,68 @@ app = FastAPI(
     lifespan=runtime_lifespan,
 )
 
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Template de la ruta (no el path real) para no abrir una serie por número de teléfono
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, method=request.method, route=route, status=str(status)
+        )
+
 # Cloud Run can scale to zero, so we don't rely on an env var for this.
 # Keep this as a constant to avoid configuration drift between deployments.
 TTL_MINUTES = 60
 SESSION_CHECKPOINT_CLEANUP_BATCH_SIZE = int(os.getenv("SESSION_CHECKPOINT_CLEANUP_BATCH_SIZE", "100"))
 HANDOFF_INACTIVITY_MINUTES = int(os.getenv("HANDOFF_INACTIVITY_MINUTES", str(TTL_MINUTES)))
+# Jobs de mantenimiento dentro del proceso (0 = deshabilitado; los endpoints siguen disponibles)
+JOB_CHECKPOINT_CLEANUP_SECONDS = float(os.getenv("JOB_CHECKPOINT_CLEANUP_SECONDS", "900"))
+JOB_HANDOFF_AUTOCLOSE_SECONDS = float(os.getenv("JOB_HANDOFF_AUTOCLOSE_SECONDS", "900"))
+JOB_HANDOFF_PURGE_SECONDS = float(os.getenv("JOB_HANDOFF_PURGE_SECONDS", "3600"))
+JOB_TTL_SWEEP_SECONDS = float(os.getenv("JOB_TTL_SWEEP_SECONDS", "300"))
+JOB_LEAD_OUTBOX_PURGE_SECONDS = float(os.getenv("JOB_LEAD_OUTBOX_PURGE_SECONDS", "3600"))
+JOB_LEAD_OUTBOX_RECOVER_SECONDS = float(os.getenv("JOB_LEAD_OUTBOX_RECOVER_SECONDS", "300"))
+# Cloud Run da ~10 s entre SIGTERM y SIGKILL
+LEAD_OUTBOX_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("LEAD_OUTBOX_SHUTDOWN_TIMEOUT_SECONDS", "8"))
+# Arranque en frío: abrir pool de Meta, canal de Firestore y cliente LLM antes del primer webhook
+STARTUP_WARMUP_ENABLED = os.getenv("STARTUP_WARMUP_ENABLED", "true").lower() == "true"
+STARTUP_WARMUP_TIMEOUT_SECONDS = float(os.getenv("STARTUP_WARMUP_TIMEOUT_SECONDS", "5"))
 HANDOFF_AUTOCLOSE_MESSAGE = (
     "Cerramos esta conversación por inactividad.\n"
     "Si necesitás ayuda, escribinos nuevamente."
 )
 
 
+# Un lock por teléfono: los mensajes de un mismo cliente (y los cierres por TTL o
+# inactividad) se procesan en orden aunque corran en el threadpool. Se liberan solos
+# cuando nadie los espera.
+_phone_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _phone_lock(numero_telefono: str) -> asyncio.Lock:
+    lock = _phone_locks.get(numero_telefono)
+    if lock is None:
+        lock = asyncio.Lock()
+        _phone_locks[numero_telefono] = lock
+    return lock
+
+
+@asynccontextmanager
+async def _phone_locks_held(*phones: Optional[str]):
+    """Toma los locks de varios teléfonos siempre en el mismo orden (sin deadlocks)."""
+    async with AsyncExitStack() as stack:
+        for phone in sorted({phone for phone in phones if phone}):
+            await stack.enter_async_context(_phone_lock(phone))
+        yield
+
+
 def get_messaging_service(user_id: str):
     """
     Devuelve el servicio de mensajería.
@@ -139,13 +228,15 @@ def _run_post_response_actions(numero_telefono: str, profile_name: str, mensaje_
             try:
                 projection = _ensure_persisted_handoff_case(conversacion_post)
                 position = projection.queue_position or conversation_manager.get_queue_position(numero_telefono) or 1
+                assigned_agent = projection.assigned_agent if projection.is_active else None
+                is_active = projection.is_active
             except Exception:
                 position = conversation_manager.add_to_handoff_queue(numero_telefono)
+                assigned_agent = None
+                is_active = position == 1
             total = conversation_manager.get_queue_size()
 
-            agent_number = os.getenv("AGENT_WHATSAPP_NUMBER", "")
-
-            if position == 1:
+            if is_active:
                 nombre_cliente = conversacion_post.nombre_usuario or profile_name or "Sin nombre"
                 handoff_contexto = conversacion_post.mensaje_handoff_contexto or mensaje_usuario
                 success = whatsapp_handoff_service.notify_agent_new_handoff(
@@ -153,9 +244,11 @@ def _run_post_response_actions(numero_telefono: str, profile_name: str, mensaje_
                     nombre_cliente,
                     handoff_contexto,
                     mensaje_usuario,
+                    agent_phone=assigned_agent,
                 )
             else:
-                active_phone = conversation_manager.get_active_handoff()
+                agent_number = _queued_notification_agent(conversacion_post)
+                active_phone = conversation_manager.get_active_handoff(agent_number)
                 active_conv = (
                     conversation_manager.get_conversacion(active_phone)
                     if active_phone
@@ -190,22 +283,21 @@ def _run_post_response_actions(numero_telefono: str, profile_name: str, mensaje_
         logger.info("Lead email deshabilitado por entorno; se omite envío para %s", numero_telefono)
         email_enviado = True
     else:
-        logger.info(
-            "lead_email_dispatch_start phone=%s source=%s destination=%s region=%s",
-            numero_telefono,
-            getattr(email_service, "from_email", ""),
-            getattr(email_service, "to_email", ""),
-            getattr(email_service, "region", ""),
-        )
-        email_enviado = email_service.enviar_lead_email(conversacion)
+        # El envío por SES lo hace el worker del outbox; acá solo se persiste el lead
+        try:
+            lead_key = lead_outbox.enqueue(conversacion)
+            logger.info("lead_email_enqueued phone=%s key=%s", numero_telefono, lead_key)
+            email_enviado = True
+        except Exception as e:
+            logger.error(f"No se pudo persistir el lead en el outbox para {numero_telefono}, se envía en línea: {e}")
+            email_enviado = email_service.enviar_lead_email(conversacion)
+            if email_enviado:
+                try:
+                    metrics_service.on_lead_sent()
+                except Exception:
+                    pass
 
     if email_enviado:
-        if not disable_lead_emails:
-            try:
-                metrics_service.on_lead_sent()
-            except Exception:
-                pass
-
         mensaje_final = ChatbotRules.get_mensaje_final_exito()
         send_message(numero_telefono, mensaje_final)
         conversation_manager.finalizar_conversacion(numero_telefono)
@@ -218,20 +310,159 @@ def _run_post_response_actions(numero_telefono: str, profile_name: str, mensaje_
     logger.error(f"Error enviando email para {numero_telefono}")
 
 
-def _sync_runtime_handoff_state():
+def _load_handoff_cases():
+    """Lee la proyección del inbox (I/O); None si Firestore no respondió."""
     try:
-        cases = handoff_inbox_service.list_cases()
+        return handoff_inbox_service.list_cases()
     except Exception as exc:
         logger.warning("handoff_runtime_sync_failed error=%s", str(exc))
+        return None
+
+
+def _sync_runtime_handoff_state():
+    """Desde un thread: lee el inbox acá y aplica la cola runtime en el event loop."""
+    loaded_at = datetime.utcnow()
+    cases = _load_handoff_cases()
+    if cases is None:
         return []
-    if cases:
-        conversation_manager.sync_handoff_runtime(cases)
-    else:
-        conversation_manager.handoff_queue = []
-        conversation_manager.active_handoff = None
+    conversation_manager.sync_handoff_runtime_from_thread(cases, loaded_at)
     return cases
 
 
+def _load_handoff_runtime():
+    """I/O de la sincronización: casos del inbox y checkpoints de los clientes que no están en memoria."""
+    loaded_at = datetime.utcnow()
+    cases = _load_handoff_cases()
+    if cases is None:
+        return None, {}, loaded_at
+    phones = [case.client_phone for case in cases if getattr(case, "client_phone", None)]
+    return cases, conversation_manager.load_missing_checkpoints(phones), loaded_at
+
+
+async def _sync_runtime_handoff_state_async():
+    """Igual que `_sync_runtime_handoff_state`, con la lectura en un thread y la mutación en el loop."""
+    cases, checkpoints, loaded_at = await asyncio.to_thread(_load_handoff_runtime)
+    if cases is None:
+        return []
+    conversation_manager.sync_handoff_runtime(cases, checkpoints, loaded_at)
+    return cases
+
+
+def _startup_warmups() -> dict:
+    """Warmups que el arranque espera (acotados por STARTUP_WARMUP_TIMEOUT_SECONDS)."""
+    if not STARTUP_WARMUP_ENABLED:
+        return {}
+    return {
+        "meta": meta_whatsapp_service.warmup,
+        "firestore": conversation_session_service.warmup,
+    }
+
+
+def _background_warmups() -> dict:
+    """Warmups que no frenan el arranque: el SDK de OpenAI tarda ~0.5 s en importarse."""
+    if not STARTUP_WARMUP_ENABLED:
+        return {}
+    return {"llm": nlu_service.warmup}
+
+
+async def _warmup_runtime() -> dict:
+    """
+    Corre en threads y en paralelo la proyección del inbox (estado de handoffs)
+    y los warmups del arranque. El inbox se espera siempre; los demás hasta
+    STARTUP_WARMUP_TIMEOUT_SECONDS, y si fallan el arranque sigue igual.
+    """
+    results = {}
+    durations_ms = {}
+
+    def _timed(name, fn):
+        started = time.perf_counter()
+        try:
+            results[name] = fn()
+        except Exception as exc:
+            logger.warning("startup_warmup_failed step=%s error=%s", name, str(exc))
+        finally:
+            durations_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+            logger.debug("startup_warmup_step step=%s ms=%s", name, durations_ms[name])
+
+    async def _bounded(warmups: dict):
+        pending = [asyncio.to_thread(_timed, name, fn) for name, fn in warmups.items()]
+        try:
+            await asyncio.wait_for(asyncio.gather(*pending), timeout=STARTUP_WARMUP_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("startup_warmup_timeout pending=%s", sorted(set(warmups) - set(durations_ms)))
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        asyncio.to_thread(_timed, "inbox", _sync_runtime_handoff_state),
+        _bounded(_startup_warmups()),
+    )
+    logger.info(
+        "startup_warmup total_ms=%.1f steps=%s",
+        (time.perf_counter() - started) * 1000,
+        durations_ms,
+    )
+    loop = asyncio.get_running_loop()
+    for name, fn in _background_warmups().items():
+        loop.run_in_executor(None, _timed, name, fn)
+    return results
+
+
+def _handoff_agent_for(numero_telefono: str) -> Optional[str]:
+    """Agente que atiende al cliente, o None si sigue esperando en la cola."""
+    agent = conversation_manager.get_handoff_agent(numero_telefono)
+    if agent is None and conversation_manager.get_active_handoff() == numero_telefono:
+        # Cola en memoria (inbox no disponible): el único activo es del agente principal
+        agent = whatsapp_handoff_service.get_agent_phone()
+    return agent
+
+
+def _queued_notification_agent(conversacion: ConversacionData) -> str:
+    """Agente al que se avisa de un cliente en cola: el que probablemente lo tome (corre en un thread)."""
+    loads = {}
+    for agent in conversation_manager.handoff_assignments.values():
+        loads[agent] = loads.get(agent, 0) + 1
+    try:
+        paused = handoff_inbox_service.paused_agents()
+    except Exception as exc:
+        logger.warning("handoff_paused_agents_failed error=%s", str(exc))
+        paused = frozenset()
+    tipo = getattr(conversacion.tipo_consulta, "value", conversacion.tipo_consulta)
+    agent = handoff_scheduler.pick_agent(tipo, loads, paused=paused, respect_capacity=False)
+    return agent or whatsapp_handoff_service.get_agent_phone()
+
+
+def _notify_agent_case_activated(numero_telefono: str) -> bool:
+    conversacion = conversation_manager.get_conversacion(numero_telefono)
+    handoff_contexto = conversacion.mensaje_handoff_contexto or "N/A"
+    return whatsapp_handoff_service.notify_agent_new_handoff(
+        conversacion.numero_telefono,
+        conversacion.nombre_usuario or "Sin nombre",
+        handoff_contexto,
+        handoff_contexto,
+        agent_phone=_handoff_agent_for(numero_telefono),
+    )
+
+
+def _activated_handoffs(previous_assignments: dict, previous_active: Optional[str]) -> list:
+    """Clientes cuyo caso se asignó (o cambió de agente) desde el estado anterior."""
+    if conversation_manager.handoff_assignments:
+        return [
+            client_phone
+            for client_phone, agent in conversation_manager.handoff_assignments.items()
+            if previous_assignments.get(client_phone) != agent
+        ]
+    new_active = conversation_manager.get_active_handoff()
+    if new_active and new_active != previous_active:
+        return [new_active]
+    return []
+
+
+def _notify_activated_handoffs(previous_assignments: dict, previous_active: Optional[str]) -> None:
+    """Avisa a cada agente los casos que se le asignaron desde el estado anterior."""
+    for client_phone in _activated_handoffs(previous_assignments, previous_active):
+        _notify_agent_case_activated(client_phone)
+
+
 def _get_open_handoff_case(numero_telefono: str):
     try:
         projection = handoff_inbox_service.get_open_case_for_client(numero_telefono)
@@ -324,99 +555,108 @@ async def health():
         "service": "argenfuego-chatbot"
     }
 
+def _ttl_close_message(close_reason: str) -> Optional[str]:
+    if close_reason == CLOSE_REASON_SURVEY_OFFER:
+        # Cierre silencioso cuando no responde a oferta de encuesta (no enviar mensaje)
+        return None
+    if close_reason in (CLOSE_REASON_SURVEY, CLOSE_REASON_RESOLUTION):
+        return "¡Gracias por tu consulta! Damos por finalizada esta conversación. ✅"
+    return "Esta conversación se finalizará por inactividad. ¡Muchas gracias por contactarnos! 🕒"
+
+
+def _close_expired_handoff_remote(numero_telefono: str, mensaje: Optional[str]) -> bool:
+    """
+    I/O del cierre por TTL (corre en un thread): mensaje al cliente, cierre del
+    caso en el inbox y borrado del checkpoint. Retorna False si el caso no está
+    en el inbox (cola en memoria).
+    """
+    conversation_manager.delete_checkpoint(numero_telefono)
+    if mensaje:
+        try:
+            # Usa el servicio correcto según el canal
+            send_message(numero_telefono, mensaje)
+        except Exception:
+            pass
+
+    # El cierre en el inbox reasigna la cola; la cola runtime se sincroniza una sola vez al final
+    try:
+        projection = handoff_inbox_service.get_open_case_for_client(numero_telefono)
+    except Exception:
+        projection = None
+    if projection is None:
+        return False
+    try:
+        handoff_inbox_service.close_case(projection.case_id)
+    except Exception as e:
+        logger.error(f"Error cerrando caso de handoff {projection.case_id} por TTL: {e}")
+    return True
+
+
+def _notify_cases_activated(client_phones: list) -> None:
+    for client_phone in client_phones:
+        _notify_agent_case_activated(client_phone)
+
+
+async def _run_ttl_sweep() -> int:
+    """Cierra las conversaciones en handoff vencidas. Solo recorre los vencimientos
+    del índice de deadlines y sincroniza la cola una vez al final.
+
+    Graph API y Firestore van a threads; la cola runtime de conversation_manager
+    se modifica solo desde el event loop (los threads del webhook también aplican
+    su sincronización ahí, vía `run_on_loop`). Trabaja sobre el índice de
+    deadlines de esta instancia, así que corre en todas (sin lease)."""
+    expired = conversation_manager.pop_expired_handoffs()
+    if not expired:
+        return 0
+
+    previous_assignments = dict(conversation_manager.handoff_assignments)
+    previous_active = conversation_manager.get_active_handoff()
+    # Entre los awaits los threads del webhook sincronizan la cola: solo se avisa
+    # por clientes que ya esperaban al empezar, no por handoffs nuevos que avisa el webhook
+    previous_queue = set(conversation_manager.handoff_queue)
+    cerradas = 0
+    for numero_telefono, close_reason in expired:
+        # Mismo lock que el webhook: no se cierra una conversación que un thread está procesando
+        async with _phone_lock(numero_telefono):
+            if close_reason == CLOSE_REASON_SURVEY_OFFER:
+                # Sin get_conversacion: no se carga un checkpoint desde el loop para una conversación que se cierra
+                conversacion = conversation_manager.conversaciones.get(numero_telefono)
+                if conversacion is not None:
+                    conversacion.survey_accepted = None  # Registrar como timeout
+                logger.info(f"⏱️ Timeout de oferta de encuesta para {numero_telefono}")
+
+            in_inbox = await asyncio.to_thread(
+                _close_expired_handoff_remote, numero_telefono, _ttl_close_message(close_reason)
+            )
+            if not in_inbox:
+                # Cola en memoria: si era la activa, se activa la siguiente
+                conversation_manager.remove_from_handoff_queue(numero_telefono)
+            conversation_manager.finalizar_conversacion_runtime(numero_telefono)
+        cerradas += 1
+        logger.info(f"Conversación {numero_telefono} cerrada por: {close_reason}")
+
+    await _sync_runtime_handoff_state_async()
+    # Avisar a cada agente los casos que recibió en lugar de los cerrados
+    try:
+        activated = [
+            client_phone
+            for client_phone in _activated_handoffs(previous_assignments, previous_active)
+            if client_phone in previous_queue
+        ]
+        await asyncio.to_thread(_notify_cases_activated, activated)
+    except Exception as e:
+        logger.error(f"Error notificando siguiente handoff después de TTL: {e}")
+    return cerradas
+
+
 @app.post("/handoff/ttl-sweep")
 async def handoff_ttl_sweep(token: str = Form(...)):
     """Job idempotente para cerrar conversaciones en handoff por inactividad.
-    Ejecutar cada 15 minutos con cron. TTL por env (default 120 min)."""
+    Ejecutar cada 15 minutos con cron. TTL por env (default 120 min).
+    También corre dentro del proceso con el job runner (JOB_TTL_SWEEP_SECONDS)."""
     if token != os.getenv("AGENT_API_TOKEN", ""):
         raise HTTPException(status_code=401, detail="Unauthorized")
-    from datetime import datetime, timedelta
-    ahora = datetime.utcnow()
-    cerradas = 0
-    resolution_timeout_minutes = 10  # Timeout para preguntas de resolución
-    
-    for conv in list(conversation_manager.conversaciones.values()):
-        if conv.atendido_por_humano or conv.estado == EstadoConversacion.ATENDIDO_POR_HUMANO:
-            should_close = False
-            close_reason = ""
-
-            # Verificar timeout de oferta de encuesta (2 minutos)
-            if conv.estado == EstadoConversacion.ESPERANDO_RESPUESTA_ENCUESTA and conv.survey_offer_sent_at:
-                if (ahora - conv.survey_offer_sent_at) > timedelta(minutes=2):
-                    should_close = True
-                    close_reason = "Oferta de encuesta sin respuesta"
-
-            # Verificar timeout de encuesta de satisfacción (15 minutos)
-            elif conv.estado == EstadoConversacion.ENCUESTA_SATISFACCION and conv.survey_sent_at:
-                if (ahora - conv.survey_sent_at) > timedelta(minutes=15):
-                    should_close = True
-                    close_reason = "Encuesta de satisfacción sin completar"
-
-            # Verificar timeout de pregunta de resolución (10 minutos)
-            elif conv.resolution_question_sent and conv.resolution_question_sent_at:
-                if (ahora - conv.resolution_question_sent_at) > timedelta(minutes=resolution_timeout_minutes):
-                    should_close = True
-                    close_reason = "Pregunta de resolución sin respuesta"
-            
-            # Verificar inactividad general del handoff
-            elif conv.last_client_message_at or conv.handoff_started_at:
-                last_ts = conv.last_client_message_at or conv.handoff_started_at
-                if last_ts and (ahora - last_ts) > timedelta(minutes=HANDOFF_INACTIVITY_MINUTES):
-                    should_close = True
-                    close_reason = "Inactividad general"
-            
-            if should_close:
-                try:
-                    # Enviar mensaje de cierre al cliente (usa el servicio correcto según el canal)
-                    if close_reason == "Oferta de encuesta sin respuesta":
-                        # Cierre silencioso cuando no responde a oferta de encuesta (no enviar mensaje)
-                        conv.survey_accepted = None  # Registrar como timeout
-                        logger.info(f"⏱️ Timeout de oferta de encuesta para {conv.numero_telefono}")
-                    elif close_reason == "Encuesta de satisfacción sin completar":
-                        send_message(conv.numero_telefono, "¡Gracias por tu consulta! Damos por finalizada esta conversación. ✅")
-                    elif close_reason == "Pregunta de resolución sin respuesta":
-                        send_message(conv.numero_telefono, "¡Gracias por tu consulta! Damos por finalizada esta conversación. ✅")
-                    else:
-                        send_message(conv.numero_telefono, "Esta conversación se finalizará por inactividad. ¡Muchas gracias por contactarnos! 🕒")
-                except Exception:
-                    pass
-
-                # Verificar si es la conversación activa en la cola
-                _sync_runtime_handoff_state()
-                active_phone = conversation_manager.get_active_handoff()
-                if active_phone == conv.numero_telefono:
-                    # Era la conversación activa, usar close_active_handoff
-                    next_phone = _close_persisted_handoff_case(conv.numero_telefono)
-                    if next_phone is None:
-                        next_phone = conversation_manager.close_active_handoff()
-                    else:
-                        conversation_manager.finalizar_conversacion(conv.numero_telefono)
-                    cerradas += 1
-
-                    # Si hay siguiente conversación, notificar al agente
-                    if next_phone:
-                        try:
-                            next_conv = conversation_manager.get_conversacion(next_phone)
-                            handoff_contexto = next_conv.mensaje_handoff_contexto or "N/A"
-                            whatsapp_handoff_service.notify_agent_new_handoff(
-                                next_conv.numero_telefono,
-                                next_conv.nombre_usuario or "Sin nombre",
-                                handoff_contexto,
-                                handoff_contexto,
-                            )
-                        except Exception as e:
-                            logger.error(f"Error notificando siguiente handoff después de TTL: {e}")
-                else:
-                    # No es la activa, solo remover de cola
-                    next_phone = _close_persisted_handoff_case(conv.numero_telefono)
-                    if next_phone is None:
-                        conversation_manager.remove_from_handoff_queue(conv.numero_telefono)
-                    conversation_manager.finalizar_conversacion(conv.numero_telefono)
-                    cerradas += 1
-
-                logger.info(f"Conversación {conv.numero_telefono} cerrada por: {close_reason}")
-    
-    return {"closed": cerradas}
+    return {"closed": await _run_ttl_sweep()}
 
 
 @app.post("/session-checkpoints/cleanup")
@@ -493,6 +733,39 @@ async def internal_handoff_purge(
     }
 
 
+def _notify_autoclosed_clients(closed_cases: list) -> None:
+    for closed_case in closed_cases:
+        client_phone = _handoff_result_value(closed_case, "client_phone")
+        case_id = _handoff_result_value(closed_case, "case_id")
+        if client_phone:
+            try:
+                sent = send_message(client_phone, HANDOFF_AUTOCLOSE_MESSAGE)
+                if not sent:
+                    logger.warning(
+                        "handoff_autoclose_notify_failed case_id=%s client_phone=%s",
+                        case_id,
+                        client_phone,
+                    )
+            except Exception:
+                logger.exception(
+                    "handoff_autoclose_notify_exception case_id=%s client_phone=%s",
+                    case_id,
+                    client_phone,
+                )
+
+
+async def _finish_autoclosed_cases(closed_cases: list) -> None:
+    """Avisa a los clientes de los casos cerrados por inactividad y los saca del runtime."""
+    await asyncio.to_thread(_notify_autoclosed_clients, closed_cases)
+    await _sync_runtime_handoff_state_async()
+    for closed_case in closed_cases:
+        client_phone = _handoff_result_value(closed_case, "client_phone")
+        if client_phone:
+            async with _phone_lock(client_phone):
+                await asyncio.to_thread(conversation_manager.delete_checkpoint, client_phone)
+                conversation_manager.finalizar_conversacion_runtime(client_phone)
+
+
 @app.post("/internal/handoff/autoclose")
 async def internal_handoff_autoclose(
     token: str = Form(...),
@@ -504,7 +777,8 @@ async def internal_handoff_autoclose(
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     try:
-        result = handoff_inbox_service.auto_close_inactive_cases(
+        result = await asyncio.to_thread(
+            handoff_inbox_service.auto_close_inactive_cases,
             dry_run=dry_run,
             batch_limit=batch_limit,
             inactivity_minutes=HANDOFF_INACTIVITY_MINUTES,
@@ -521,29 +795,7 @@ async def internal_handoff_autoclose(
     closed_cases = list(_handoff_result_value(result, "closed_cases") or [])
 
     if not dry_run:
-        for closed_case in closed_cases:
-            client_phone = _handoff_result_value(closed_case, "client_phone")
-            case_id = _handoff_result_value(closed_case, "case_id")
-            if client_phone:
-                try:
-                    sent = send_message(client_phone, HANDOFF_AUTOCLOSE_MESSAGE)
-                    if not sent:
-                        logger.warning(
-                            "handoff_autoclose_notify_failed case_id=%s client_phone=%s",
-                            case_id,
-                            client_phone,
-                        )
-                except Exception:
-                    logger.exception(
-                        "handoff_autoclose_notify_exception case_id=%s client_phone=%s",
-                        case_id,
-                        client_phone,
-                    )
-        _sync_runtime_handoff_state()
-        for closed_case in closed_cases:
-            client_phone = _handoff_result_value(closed_case, "client_phone")
-            if client_phone:
-                conversation_manager.finalizar_conversacion(client_phone)
+        await _finish_autoclosed_cases(closed_cases)
 
     logger.info(
         "handoff_autoclose dry_run=%s batch_limit=%s inactivity_minutes=%s cases_scanned=%s cases_eligible=%s cases_closed=%s cutoff_before=%s",
@@ -574,6 +826,56 @@ async def internal_handoff_autoclose(
         ],
     }
 
+def _checkpoint_cleanup_job(cursor: Optional[str]) -> JobResult:
+    # Se borran los vencidos, así que cada corrida arranca sola donde quedó la anterior
+    deleted_doc_ids = conversation_session_service.cleanup_expired_checkpoints(
+        limit=SESSION_CHECKPOINT_CLEANUP_BATCH_SIZE,
+    )
+    return JobResult(items=len(deleted_doc_ids))
+
+
+async def _handoff_autoclose_job(cursor: Optional[str]) -> JobResult:
+    result = await asyncio.to_thread(
+        handoff_inbox_service.auto_close_inactive_cases,
+        dry_run=False,
+        inactivity_minutes=HANDOFF_INACTIVITY_MINUTES,
+    )
+    await _finish_autoclosed_cases(result.closed_cases)
+    return JobResult(items=result.cases_closed)
+
+
+def _handoff_purge_job(cursor: Optional[str]) -> JobResult:
+    result = handoff_inbox_service.purge_closed_case_history(dry_run=False, cursor=cursor)
+    return JobResult(
+        items=result.cases_deleted + result.messages_deleted + result.outbox_deleted,
+        cursor=result.next_cursor,
+    )
+
+
+def _lead_outbox_purge_job(cursor: Optional[str]) -> JobResult:
+    # Igual que los checkpoints: se borran los vencidos y la próxima corrida sigue sola
+    return JobResult(items=lead_outbox.purge_expired())
+
+
+def _lead_outbox_recover_job(cursor: Optional[str]) -> JobResult:
+    # Sin esto, un lead en vuelo de una instancia apagada espera a que arranque otra instancia
+    return JobResult(items=lead_outbox.recover())
+
+
+async def _ttl_sweep_job(cursor: Optional[str]) -> JobResult:
+    return JobResult(items=await _run_ttl_sweep())
+
+
+if JOB_RUNNER_ENABLED:
+    job_runner.register("checkpoint_cleanup", JOB_CHECKPOINT_CLEANUP_SECONDS, _checkpoint_cleanup_job)
+    job_runner.register("handoff_autoclose", JOB_HANDOFF_AUTOCLOSE_SECONDS, _handoff_autoclose_job)
+    job_runner.register("handoff_purge", JOB_HANDOFF_PURGE_SECONDS, _handoff_purge_job)
+    job_runner.register("lead_outbox_purge", JOB_LEAD_OUTBOX_PURGE_SECONDS, _lead_outbox_purge_job)
+    job_runner.register("lead_outbox_recover", JOB_LEAD_OUTBOX_RECOVER_SECONDS, _lead_outbox_recover_job)
+    # Los vencimientos viven en memoria de cada instancia: el sweep corre en todas
+    job_runner.register("ttl_sweep", JOB_TTL_SWEEP_SECONDS, _ttl_sweep_job, leased=False)
+
+
 @app.get("/webhook/whatsapp")
 async def webhook_whatsapp_verify(request: Request):
     """
@@ -608,6 +910,283 @@ async def webhook_whatsapp_verify(request: Request):
         logger.error(f"Error en verificación de webhook: {str(e)}")
         return PlainTextResponse("Error", status_code=500)
 
+
+
+def _procesar_y_responder(
+    numero_telefono: str,
+    contexto_mensaje: MessageContext,
+    profile_name: str,
+    mensaje_usuario: str,
+) -> None:
+    respuesta = ChatbotRules.procesar_mensaje(numero_telefono, contexto_mensaje, profile_name)
+
+    # Enviar respuesta usando el servicio correcto (WhatsApp o Messenger)
+    if respuesta and respuesta.strip():
+        if (
+            conversation_manager.conversaciones.get(numero_telefono)
+            and conversation_manager.get_conversacion(numero_telefono).estado == EstadoConversacion.CONFIRMANDO
+            and not _persist_checkpoint_before_send(numero_telefono, "confirmacion_texto")
+        ):
+            return
+        mensaje_enviado = send_message(numero_telefono, respuesta)
+
+        if not mensaje_enviado:
+            logger.error(f"Error enviando mensaje a {numero_telefono}")
+    else:
+        logger.info(f"Respuesta vacía, no se envía mensaje a {numero_telefono}")
+
+    _save_final_checkpoint_if_needed(numero_telefono)
+    _run_post_response_actions(numero_telefono, profile_name, mensaje_usuario)
+
+
+def _procesar_respuesta_oferta_encuesta(
+    numero_telefono: str,
+    contexto_mensaje: MessageContext,
+    conversacion_actual: ConversacionData,
+) -> None:
+    """Respuesta del cliente a la oferta de encuesta (1=sí, 2=no)."""
+    from services.survey_service import survey_service
+    from datetime import datetime
+
+    # Parsear respuesta (1=sí, 2=no)
+    respuesta = contexto_mensaje.lower
+
+    # Keywords de aceptación
+    acepta_keywords = ['1', '1️⃣', 'si', 'sí', 'yes', 'ok', 'dale', 'con gusto', 'acepto']
+    # Keywords de rechazo
+    rechaza_keywords = ['2', '2️⃣', 'no', 'nope', 'no gracias', 'no quiero', 'paso']
+
+    if any(kw in respuesta for kw in acepta_keywords):
+        # Cliente acepta la encuesta
+        conversacion_actual.survey_accepted = True
+
+        # Iniciar encuesta
+        success = survey_service.send_survey(numero_telefono, conversacion_actual)
+
+        if success:
+            logger.info(f"✅ Cliente {numero_telefono} aceptó encuesta, primera pregunta enviada")
+        else:
+            logger.error(f"❌ Error enviando primera pregunta de encuesta a {numero_telefono}")
+            # Fallback: cerrar conversación
+            send_message(
+                numero_telefono,
+                "¡Gracias por tu tiempo! Que tengas un buen día. ✅"
+            )
+
+            # Verificar si esta conversación es la activa antes de cerrar
+            active_phone = conversation_manager.get_active_handoff()
+            if active_phone == numero_telefono:
+                conversation_manager.close_active_handoff()
+            else:
+                conversation_manager.remove_from_handoff_queue(numero_telefono)
+                conversation_manager.finalizar_conversacion(numero_telefono)
+
+        return
+
+    elif any(kw in respuesta for kw in rechaza_keywords):
+        # Cliente rechaza la encuesta
+        conversacion_actual.survey_accepted = False
+
+        # Enviar mensaje de agradecimiento y cerrar
+        send_message(
+            numero_telefono,
+            "¡Gracias por tu tiempo! Que tengas un buen día. ✅"
+        )
+
+        # Verificar si esta conversación es la activa
+        active_phone = conversation_manager.get_active_handoff()
+
+        if active_phone == numero_telefono:
+            # Es la conversación activa, usar close_active_handoff
+            next_phone = conversation_manager.close_active_handoff()
+
+            logger.info(f"✅ Cliente {numero_telefono} rechazó encuesta, conversación cerrada (era activa)")
+
+            # Notificar al agente si hay siguiente conversación
+            if next_phone:
+                _notify_agent_case_activated(next_phone)
+        else:
+            # NO es la conversación activa, solo removerla de la cola sin afectar la activa
+            conversation_manager.remove_from_handoff_queue(numero_telefono)
+            conversation_manager.finalizar_conversacion(numero_telefono)
+
+            logger.info(f"✅ Cliente {numero_telefono} rechazó encuesta, conversación cerrada (NO era activa)")
+
+        return
+    else:
+        # Respuesta no reconocida, pedir que responda con 1 o 2
+        send_message(
+            numero_telefono,
+            "Por favor responde con:\n1️⃣ para aceptar la encuesta\n2️⃣ para omitirla"
+        )
+        return
+
+
+def _procesar_respuesta_encuesta(
+    numero_telefono: str,
+    contexto_mensaje: MessageContext,
+    conversacion_actual: ConversacionData,
+) -> None:
+    """Respuesta a una pregunta de la encuesta de satisfacción."""
+
+    # Procesar respuesta de encuesta
+    from services.survey_service import survey_service
+
+    survey_complete, next_message = survey_service.process_survey_response(
+        numero_telefono, contexto_mensaje, conversacion_actual
+    )
+
+    if next_message:
+        # Enviar siguiente pregunta o mensaje de finalización
+        send_message(numero_telefono, next_message)
+
+    if survey_complete:
+        # Encuesta completada, finalizar conversación
+        # Verificar si esta conversación es la activa
+        active_phone = conversation_manager.get_active_handoff()
+
+        if active_phone == numero_telefono:
+            # Es la conversación activa, cerrar y activar siguiente
+            next_phone = conversation_manager.close_active_handoff()
+            logger.info(f"✅ Encuesta completada y conversación finalizada para {numero_telefono} (era activa)")
+
+            # Notificar al agente si hay siguiente conversación
+            if next_phone:
+                try:
+                    _notify_agent_case_activated(next_phone)
+                except Exception as e:
+                    logger.error(f"Error notificando siguiente handoff después de encuesta: {e}")
+        else:
+            # NO es la conversación activa, solo removerla de la cola sin afectar la activa
+            conversation_manager.remove_from_handoff_queue(numero_telefono)
+            conversation_manager.finalizar_conversacion(numero_telefono)
+            logger.info(f"✅ Encuesta completada y conversación finalizada para {numero_telefono} (NO era activa)")
+
+
+def _reenviar_mensaje_handoff(
+    numero_telefono: str,
+    conversacion_actual: ConversacionData,
+    mensaje_usuario: str,
+    message_id: Optional[str],
+    profile_name: str,
+) -> None:
+    """Mensaje de un cliente en handoff: se avisa al agente y se guarda en el historial."""
+
+    persisted_case = _ensure_persisted_handoff_case(conversacion_actual)
+    # Notificar al agente vía WhatsApp con indicación de posición en cola
+    _sync_runtime_handoff_state()
+    handling_agent = _handoff_agent_for(numero_telefono)
+    agent_number = handling_agent or _queued_notification_agent(conversacion_actual)
+    active_phone = conversation_manager.get_active_handoff(agent_number)
+    is_active = (active_phone == numero_telefono)
+
+    if conversacion_actual.mensaje_handoff_contexto and not conversacion_actual.handoff_notified:
+        # Es el primer mensaje del handoff, incluir contexto completo
+        nombre_cliente = conversacion_actual.nombre_usuario or profile_name or "Sin nombre"
+        handoff_contexto = conversacion_actual.mensaje_handoff_contexto or mensaje_usuario
+        if handling_agent is not None:
+            success = whatsapp_handoff_service.notify_agent_new_handoff(
+                numero_telefono,
+                nombre_cliente,
+                handoff_contexto,
+                mensaje_usuario,
+                agent_phone=agent_number,
+            )
+        else:
+            position = persisted_case.queue_position or conversation_manager.get_queue_position(numero_telefono) or 1
+            active_conv = (
+                conversation_manager.get_conversacion(active_phone)
+                if active_phone
+                else conversacion_actual
+            )
+            notification = _format_handoff_queued_notification(
+                conversacion_actual,
+                position,
+                conversation_manager.get_queue_size() or position,
+                active_conv,
+            )
+            success = meta_whatsapp_service.send_text_message(agent_number, notification)
+        if success:
+            conversacion_actual.handoff_notified = True
+    else:
+        # Es un mensaje posterior durante el handoff
+        # Obtener posición si no es activo
+        position = None if is_active else (
+            persisted_case.queue_position or conversation_manager.get_queue_position(numero_telefono)
+        )
+
+        # Guardar mensaje del cliente en historial
+        conversation_manager.add_message_to_history(numero_telefono, "client", mensaje_usuario)
+        _append_handoff_history_message(
+            numero_telefono,
+            sender=HandoffInboxMessageSender.CLIENT,
+            text=mensaje_usuario,
+            source_message_id=message_id,
+        )
+
+        # Notificación agrupada: una ráfaga de mensajes sale en un solo resumen al agente
+        agent_notification_batcher.notify_client_message(
+            agent_number,
+            numero_telefono,
+            profile_name or '',
+            mensaje_usuario,
+            is_active,
+            position,
+        )
+
+    try:
+        from datetime import datetime
+        conversacion_actual.last_client_message_at = datetime.utcnow()
+        conversation_manager.schedule_handoff_deadline(numero_telefono)
+    except Exception:
+        pass
+
+
+def _procesar_mensaje_cliente(
+    numero_telefono: str,
+    contexto_mensaje: MessageContext,
+    profile_name: str,
+    mensaje_usuario: str,
+    message_id: Optional[str] = None,
+) -> None:
+    """
+    Sección por mensaje de un cliente. Corre en un thread y con el lock de su
+    teléfono tomado: agradecimientos tras un cierre reciente, rehidratación del
+    handoff, encuestas, reenvío al agente y, si nada de eso aplica, el chatbot.
+    """
+    # Manejar mensajes posteriores a cierre reciente (agradecimientos)
+    if conversation_manager.was_finalized_recently(numero_telefono):
+        if ChatbotRules.es_mensaje_agradecimiento(contexto_mensaje):
+            mensaje_gracias = ChatbotRules.get_mensaje_post_finalizado_gracias()
+            if mensaje_gracias:
+                send_message(numero_telefono, mensaje_gracias)
+            logger.info(f"🙏 Mensaje de agradecimiento ignorado para {numero_telefono}")
+            return
+        else:
+            conversation_manager.clear_recently_finalized(numero_telefono)
+
+    # Obtener conversación actual
+    conversacion_actual = _rehydrate_handoff_conversation(numero_telefono)
+
+    # Verificar si está esperando respuesta de encuesta (PRIORIDAD MUY ALTA)
+    if conversacion_actual.estado == EstadoConversacion.ESPERANDO_RESPUESTA_ENCUESTA:
+        _procesar_respuesta_oferta_encuesta(numero_telefono, contexto_mensaje, conversacion_actual)
+        return
+
+    # Verificar si está en encuesta de satisfacción (PRIORIDAD ALTA)
+    if conversacion_actual.estado == EstadoConversacion.ENCUESTA_SATISFACCION:
+        _procesar_respuesta_encuesta(numero_telefono, contexto_mensaje, conversacion_actual)
+        return
+
+    # Si está en handoff, reenviar al agente
+    if conversacion_actual.atendido_por_humano or conversacion_actual.estado == EstadoConversacion.ATENDIDO_POR_HUMANO:
+        _reenviar_mensaje_handoff(numero_telefono, conversacion_actual, mensaje_usuario, message_id, profile_name)
+        return
+
+    # Procesar el mensaje con el chatbot (incluyendo nombre del perfil)
+    _procesar_y_responder(numero_telefono, contexto_mensaje, profile_name, mensaje_usuario)
+
+
 @app.post("/webhook/whatsapp")
 async def webhook_whatsapp_receive(request: Request):
     """
@@ -621,8 +1200,9 @@ async def webhook_whatsapp_receive(request: Request):
         signature = request.headers.get('X-Hub-Signature-256', '')
         
         client_ip = request.client.host if request.client else "unknown"
-        logger.info("Webhook recibido desde %s", client_ip)
-        logger.debug("Headers: %s", dict(request.headers))
+        webhook_logger.info("Webhook recibido desde %s", client_ip)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Headers: %s", dict(request.headers))
         
         # Parsear JSON para detectar origen
         webhook_data = json.loads(body_bytes.decode('utf-8'))
@@ -632,15 +1212,18 @@ async def webhook_whatsapp_receive(request: Request):
             logger.warning("Webhook de origen desconocido: %s", webhook_data.get('object'))
             return PlainTextResponse("OK", status_code=200)
 
-        logger.info("=== WEBHOOK WHATSAPP RECIBIDO ===")
+        webhook_logger.debug("=== WEBHOOK WHATSAPP RECIBIDO ===")
         messaging_service = meta_whatsapp_service
 
         # Validar firma HMAC (mismo app_secret para ambos)
-        if not messaging_service.validate_webhook_signature(body_bytes, signature):
+        with STAGE_SECONDS.time(stage="signature"):
+            signature_ok = messaging_service.validate_webhook_signature(body_bytes, signature)
+        if not signature_ok:
             logger.error("❌ Firma de webhook inválida - request rechazado (client=%s)", client_ip)
             return PlainTextResponse("Forbidden", status_code=403)
         
-        logger.debug("Payload completo: %s", json.dumps(webhook_data))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Payload completo: %s", json.dumps(webhook_data))
         
         # Extraer datos de mensaje usando el servicio apropiado
         message_data = messaging_service.extract_message_data(webhook_data)
@@ -648,13 +1231,18 @@ async def webhook_whatsapp_receive(request: Request):
         if message_data:
             numero_telefono, mensaje_usuario, message_id, profile_name, message_type = message_data
 
+            # El texto del cliente solo en DEBUG: en INFO alcanza con el largo
             logger.info(
-                f"Mensaje recibido de {numero_telefono} ({profile_name or 'sin nombre'}): {mensaje_usuario}"
+                "Mensaje recibido de %s (%s) len=%s", numero_telefono, profile_name or 'sin nombre', len(mensaje_usuario or "")
             )
+            logger.debug("Texto recibido de %s: %s", numero_telefono, mensaje_usuario)
 
             if message_id:
                 try:
-                    is_duplicate = conversation_session_service.mark_message_processed(message_id)
+                    with STAGE_SECONDS.time(stage="dedupe"):
+                        is_duplicate = await asyncio.to_thread(
+                            conversation_session_service.mark_message_processed, message_id
+                        )
                 except Exception as exc:
                     logger.error(
                         "message_dedupe_failed phone=%s message_id=%s error=%s",
@@ -684,17 +1272,10 @@ async def webhook_whatsapp_receive(request: Request):
                     )
                     return PlainTextResponse("", status_code=200)
 
-                respuesta_interactiva = await handle_interactive_button(
-                    numero_telefono,
-                    mensaje_usuario,
-                    profile_name
-                )
-
-                if respuesta_interactiva:
-                    send_message(numero_telefono, respuesta_interactiva)
-
-                _save_final_checkpoint_if_needed(numero_telefono)
-                _run_post_response_actions(numero_telefono, profile_name, mensaje_usuario)
+                async with _phone_lock(numero_telefono):
+                    await asyncio.to_thread(
+                        _responder_boton_interactivo, numero_telefono, mensaje_usuario, profile_name
+                    )
                 return PlainTextResponse("", status_code=200)
 
             # Fallback para contenidos no-texto
@@ -702,255 +1283,28 @@ async def webhook_whatsapp_receive(request: Request):
                 logger.info(
                     f"Mensaje de tipo {message_type or 'desconocido'} sin texto manejable de {numero_telefono}"
                 )
-                send_message(
+                await asyncio.to_thread(
+                    send_message,
                     numero_telefono,
                     "Recibi tu mensaje, pero actualmente este canal solo procesa texto. Por favor, escribi tu consulta."
                 )
                 return PlainTextResponse("", status_code=200)
             
-            # Manejar mensajes posteriores a cierre reciente (agradecimientos)
-            if conversation_manager.was_finalized_recently(numero_telefono):
-                if ChatbotRules.es_mensaje_agradecimiento(mensaje_usuario):
-                    mensaje_gracias = ChatbotRules.get_mensaje_post_finalizado_gracias()
-                    if mensaje_gracias:
-                        send_message(numero_telefono, mensaje_gracias)
-                    logger.info(f"🙏 Mensaje de agradecimiento ignorado para {numero_telefono}")
-                    return PlainTextResponse("", status_code=200)
-                else:
-                    conversation_manager.clear_recently_finalized(numero_telefono)
-            
-            # Obtener conversación actual
-            conversacion_actual = _rehydrate_handoff_conversation(numero_telefono)
-            
-            # Verificar si está esperando respuesta de encuesta (PRIORIDAD MUY ALTA)
-            if conversacion_actual.estado == EstadoConversacion.ESPERANDO_RESPUESTA_ENCUESTA:
-                from services.survey_service import survey_service
-                from datetime import datetime
-                
-                # Parsear respuesta (1=sí, 2=no)
-                respuesta = mensaje_usuario.strip().lower()
-                
-                # Keywords de aceptación
-                acepta_keywords = ['1', '1️⃣', 'si', 'sí', 'yes', 'ok', 'dale', 'con gusto', 'acepto']
-                # Keywords de rechazo
-                rechaza_keywords = ['2', '2️⃣', 'no', 'nope', 'no gracias', 'no quiero', 'paso']
-                
-                if any(kw in respuesta for kw in acepta_keywords):
-                    # Cliente acepta la encuesta
-                    conversacion_actual.survey_accepted = True
-                    
-                    # Iniciar encuesta
-                    success = survey_service.send_survey(numero_telefono, conversacion_actual)
-                    
-                    if success:
-                        logger.info(f"✅ Cliente {numero_telefono} aceptó encuesta, primera pregunta enviada")
-                    else:
-                        logger.error(f"❌ Error enviando primera pregunta de encuesta a {numero_telefono}")
-                        # Fallback: cerrar conversación
-                        send_message(
-                            numero_telefono,
-                            "¡Gracias por tu tiempo! Que tengas un buen día. ✅"
-                        )
-                        
-                        # Verificar si esta conversación es la activa antes de cerrar
-                        active_phone = conversation_manager.get_active_handoff()
-                        if active_phone == numero_telefono:
-                            conversation_manager.close_active_handoff()
-                        else:
-                            conversation_manager.remove_from_handoff_queue(numero_telefono)
-                            conversation_manager.finalizar_conversacion(numero_telefono)
-                    
-                    return PlainTextResponse("", status_code=200)
-                
-                elif any(kw in respuesta for kw in rechaza_keywords):
-                    # Cliente rechaza la encuesta
-                    conversacion_actual.survey_accepted = False
-                    
-                    # Enviar mensaje de agradecimiento y cerrar
-                    send_message(
-                        numero_telefono,
-                        "¡Gracias por tu tiempo! Que tengas un buen día. ✅"
-                    )
-                    
-                    # Verificar si esta conversación es la activa
-                    active_phone = conversation_manager.get_active_handoff()
-                    
-                    if active_phone == numero_telefono:
-                        # Es la conversación activa, usar close_active_handoff
-                        next_phone = conversation_manager.close_active_handoff()
-                        
-                        logger.info(f"✅ Cliente {numero_telefono} rechazó encuesta, conversación cerrada (era activa)")
-                        
-                        # Notificar al agente si hay siguiente conversación
-                        if next_phone:
-                            agent_number = os.getenv("AGENT_WHATSAPP_NUMBER", "")
-                            if agent_number:
-                                next_conv = conversation_manager.get_conversacion(next_phone)
-                                handoff_contexto = next_conv.mensaje_handoff_contexto or "N/A"
-                                whatsapp_handoff_service.notify_agent_new_handoff(
-                                    next_conv.numero_telefono,
-                                    next_conv.nombre_usuario or "Sin nombre",
-                                    handoff_contexto,
-                                    handoff_contexto,
-                                )
-                    else:
-                        # NO es la conversación activa, solo removerla de la cola sin afectar la activa
-                        conversation_manager.remove_from_handoff_queue(numero_telefono)
-                        conversation_manager.finalizar_conversacion(numero_telefono)
-                        
-                        logger.info(f"✅ Cliente {numero_telefono} rechazó encuesta, conversación cerrada (NO era activa)")
-                    
-                    return PlainTextResponse("", status_code=200)
-                else:
-                    # Respuesta no reconocida, pedir que responda con 1 o 2
-                    send_message(
-                        numero_telefono,
-                        "Por favor responde con:\n1️⃣ para aceptar la encuesta\n2️⃣ para omitirla"
-                    )
-                    return PlainTextResponse("", status_code=200)
-            
-            # Verificar si está en encuesta de satisfacción (PRIORIDAD ALTA)
-            if conversacion_actual.estado == EstadoConversacion.ENCUESTA_SATISFACCION:
-                # Procesar respuesta de encuesta
-                from services.survey_service import survey_service
-                
-                survey_complete, next_message = survey_service.process_survey_response(
-                    numero_telefono, mensaje_usuario, conversacion_actual
+            # Normalizar el texto una sola vez para todo el procesamiento del webhook
+            contexto_mensaje = MessageContext.from_text(mensaje_usuario)
+
+            # Todo lo que lee o modifica la conversación del cliente (rehidratación, encuestas,
+            # handoff y chatbot) corre en un thread con el lock de su teléfono: el LLM, Graph API
+            # y Firestore bloquean, y el lock mantiene el orden de sus mensajes
+            async with _phone_lock(numero_telefono):
+                await asyncio.to_thread(
+                    _procesar_mensaje_cliente,
+                    numero_telefono,
+                    contexto_mensaje,
+                    profile_name,
+                    mensaje_usuario,
+                    message_id,
                 )
-                
-                if next_message:
-                    # Enviar siguiente pregunta o mensaje de finalización
-                    send_message(numero_telefono, next_message)
-                
-                if survey_complete:
-                    # Encuesta completada, finalizar conversación
-                    # Verificar si esta conversación es la activa
-                    active_phone = conversation_manager.get_active_handoff()
-                    
-                    if active_phone == numero_telefono:
-                        # Es la conversación activa, cerrar y activar siguiente
-                        next_phone = conversation_manager.close_active_handoff()
-                        logger.info(f"✅ Encuesta completada y conversación finalizada para {numero_telefono} (era activa)")
-                        
-                        # Notificar al agente si hay siguiente conversación
-                        if next_phone:
-                            agent_number = os.getenv("AGENT_WHATSAPP_NUMBER", "")
-                            if agent_number:
-                                try:
-                                    next_conv = conversation_manager.get_conversacion(next_phone)
-                                    handoff_contexto = next_conv.mensaje_handoff_contexto or "N/A"
-                                    whatsapp_handoff_service.notify_agent_new_handoff(
-                                        next_conv.numero_telefono,
-                                        next_conv.nombre_usuario or "Sin nombre",
-                                        handoff_contexto,
-                                        handoff_contexto,
-                                    )
-                                except Exception as e:
-                                    logger.error(f"Error notificando siguiente handoff después de encuesta: {e}")
-                    else:
-                        # NO es la conversación activa, solo removerla de la cola sin afectar la activa
-                        conversation_manager.remove_from_handoff_queue(numero_telefono)
-                        conversation_manager.finalizar_conversacion(numero_telefono)
-                        logger.info(f"✅ Encuesta completada y conversación finalizada para {numero_telefono} (NO era activa)")
-                
-                return PlainTextResponse("", status_code=200)
-            
-            # Si está en handoff, reenviar al agente
-            if conversacion_actual.atendido_por_humano or conversacion_actual.estado == EstadoConversacion.ATENDIDO_POR_HUMANO:
-                persisted_case = _ensure_persisted_handoff_case(conversacion_actual)
-                # Notificar al agente vía WhatsApp con indicación de posición en cola
-                _sync_runtime_handoff_state()
-                active_phone = conversation_manager.get_active_handoff()
-                is_active = (active_phone == numero_telefono)
-                
-                if conversacion_actual.mensaje_handoff_contexto and not conversacion_actual.handoff_notified:
-                    # Es el primer mensaje del handoff, incluir contexto completo
-                    nombre_cliente = conversacion_actual.nombre_usuario or profile_name or "Sin nombre"
-                    handoff_contexto = conversacion_actual.mensaje_handoff_contexto or mensaje_usuario
-                    if is_active:
-                        success = whatsapp_handoff_service.notify_agent_new_handoff(
-                            numero_telefono,
-                            nombre_cliente,
-                            handoff_contexto,
-                            mensaje_usuario,
-                        )
-                    else:
-                        position = persisted_case.queue_position or conversation_manager.get_queue_position(numero_telefono) or 1
-                        active_conv = (
-                            conversation_manager.get_conversacion(active_phone)
-                            if active_phone
-                            else conversacion_actual
-                        )
-                        notification = _format_handoff_queued_notification(
-                            conversacion_actual,
-                            position,
-                            conversation_manager.get_queue_size() or position,
-                            active_conv,
-                        )
-                        agent_number = os.getenv("AGENT_WHATSAPP_NUMBER", "")
-                        success = meta_whatsapp_service.send_text_message(agent_number, notification)
-                    if success:
-                        conversacion_actual.handoff_notified = True
-                else:
-                    # Es un mensaje posterior durante el handoff
-                    # Obtener posición si no es activo
-                    position = None if is_active else (
-                        persisted_case.queue_position or conversation_manager.get_queue_position(numero_telefono)
-                    )
-                    
-                    # Guardar mensaje del cliente en historial
-                    conversation_manager.add_message_to_history(numero_telefono, "client", mensaje_usuario)
-                    _append_handoff_history_message(
-                        numero_telefono,
-                        sender=HandoffInboxMessageSender.CLIENT,
-                        text=mensaje_usuario,
-                        source_message_id=message_id,
-                    )
-                    
-                    # Enviar notificación de mensaje con indicador de posición
-                    notification = _format_client_message_notification(
-                        numero_telefono,
-                        profile_name or '',
-                        mensaje_usuario,
-                        is_active,
-                        position
-                    )
-                    agent_number = os.getenv("AGENT_WHATSAPP_NUMBER", "")
-                    meta_whatsapp_service.send_text_message(agent_number, notification)
-                    
-                    # Si no es activo, agregar recordatorio
-                    if not is_active and position:
-                        reminder = f"ℹ️ Este mensaje es del cliente en posición #{position}. Los mensajes que escribas irán al cliente activo. Usa /next para cambiar o /queue para ver la cola completa."
-                        meta_whatsapp_service.send_text_message(agent_number, reminder)
-                
-                try:
-                    from datetime import datetime
-                    conversacion_actual.last_client_message_at = datetime.utcnow()
-                except Exception:
-                    pass
-                
-                return PlainTextResponse("", status_code=200)
-            
-            # Procesar el mensaje con el chatbot (incluyendo nombre del perfil)
-            respuesta = ChatbotRules.procesar_mensaje(numero_telefono, mensaje_usuario, profile_name)
-            
-            # Enviar respuesta usando el servicio correcto (WhatsApp o Messenger)
-            if respuesta and respuesta.strip():
-                if (
-                    conversation_manager.conversaciones.get(numero_telefono)
-                    and conversation_manager.get_conversacion(numero_telefono).estado == EstadoConversacion.CONFIRMANDO
-                    and not _persist_checkpoint_before_send(numero_telefono, "confirmacion_texto")
-                ):
-                    return PlainTextResponse("", status_code=200)
-                mensaje_enviado = send_message(numero_telefono, respuesta)
-                
-                if not mensaje_enviado:
-                    logger.error(f"Error enviando mensaje a {numero_telefono}")
-            else:
-                logger.info(f"Respuesta vacía, no se envía mensaje a {numero_telefono}")
-
-            _save_final_checkpoint_if_needed(numero_telefono)
-            _run_post_response_actions(numero_telefono, profile_name, mensaje_usuario)
         
         # Extraer datos de estado de mensaje (opcional, para métricas)
         status_data = meta_whatsapp_service.extract_status_data(webhook_data)
@@ -959,7 +1313,7 @@ async def webhook_whatsapp_receive(request: Request):
             message_status = status_data.get('status', '')
             message_id = status_data.get('message_id', '')
             
-            logger.info(f"Status update recibido - ID: {message_id}, Status: {message_status}")
+            webhook_logger.info("Status update recibido - ID: %s, Status: %s", message_id, message_status)
             
             # Registrar métricas
             if message_status == 'sent':
@@ -989,24 +1343,34 @@ async def webhook_whatsapp_receive(request: Request):
             pass
         return PlainTextResponse("Error", status_code=500)
 
+def _send_agent_api_reply(to: str, body: str) -> bool:
+    projection = _get_open_handoff_case(to)
+    if projection is None:
+        return send_message(to, body)  # Usa el servicio correcto según el tipo de usuario
+    result = handoff_inbox_reply_service.send_reply(
+        case_id=projection.case_id,
+        owner_email="agent_api",
+        text=body,
+    )
+    if result.sent:
+        conversation_manager.add_message_to_history(to, "agent", body)
+    return result.sent
+
+
+def _close_agent_api_conversation(to: str) -> None:
+    _close_persisted_handoff_case(to)
+    conversation_manager.finalizar_conversacion(to)
+    cierre_msg = "¡Gracias por tu consulta! Damos por finalizada esta conversación. ✅"
+    send_message(to, cierre_msg)  # Usa el servicio correcto según el tipo de usuario
+
+
 @app.post("/agent/reply")
 async def agent_reply(to: str = Form(...), body: str = Form(...), token: str = Form(...)):
     if token != os.getenv("AGENT_API_TOKEN", ""):
         raise HTTPException(status_code=401, detail="Unauthorized")
     try:
-        sent = False
-        projection = _get_open_handoff_case(to)
-        if projection is not None:
-            result = handoff_inbox_reply_service.send_reply(
-                case_id=projection.case_id,
-                owner_email="agent_api",
-                text=body,
-            )
-            sent = result.sent
-            if sent:
-                conversation_manager.add_message_to_history(to, "agent", body)
-        else:
-            sent = send_message(to, body)  # Usa el servicio correcto según el tipo de usuario
+        async with _phone_lock(to):
+            sent = await asyncio.to_thread(_send_agent_api_reply, to, body)
         if not sent:
             raise HTTPException(status_code=500, detail="Failed to send message")
         return {"status": "ok"}
@@ -1022,19 +1386,33 @@ async def agent_close(to: str = Form(...), token: str = Form(...)):
     if token != os.getenv("AGENT_API_TOKEN", ""):
         raise HTTPException(status_code=401, detail="Unauthorized")
     try:
-        _close_persisted_handoff_case(to)
-        conversation_manager.finalizar_conversacion(to)
-        cierre_msg = "¡Gracias por tu consulta! Damos por finalizada esta conversación. ✅"
-        send_message(to, cierre_msg)  # Usa el servicio correcto según el tipo de usuario
+        async with _phone_lock(to):
+            await asyncio.to_thread(_close_agent_api_conversation, to)
         return {"status": "ok"}
     except Exception as e:
         logger.error(f"agent_close error: {e}")
         raise HTTPException(status_code=500, detail="Internal error")
 
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas del proceso en formato texto de Prometheus."""
+    ACTIVE_CONVERSATIONS.set(len(conversation_manager.conversaciones))
+    HANDOFF_QUEUE_SIZE.set(len(conversation_manager.handoff_queue))
+    return Response(
+        runtime_metrics_registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.get("/stats")
 async def get_stats():
     """Endpoint para obtener estadísticas básicas del chatbot"""
     total_conversaciones = len(conversation_manager.conversaciones)
+    try:
+        paused_agents = await asyncio.to_thread(handoff_inbox_service.paused_agents)
+    except Exception as e:
+        logger.error(f"No se pudo leer la disponibilidad de agentes: {str(e)}")
+        paused_agents = frozenset()
     conversaciones_por_estado = {}
     
     for conversacion in conversation_manager.conversaciones.values():
@@ -1044,6 +1422,17 @@ async def get_stats():
     return {
         "total_conversaciones_activas": total_conversaciones,
         "conversaciones_por_estado": conversaciones_por_estado,
+        "llm_cache": nlu_service.cache_stats(),
+        "llm_runner": nlu_service.runner_stats(),
+        "llm_usage": nlu_service.usage_stats(),
+        "lead_outbox": lead_outbox.stats(),
+        "agent_notifications": dict(agent_notification_batcher.stats),
+        "handoff_agents": handoff_scheduler.status(
+            Counter(conversation_manager.handoff_assignments.values()),
+            paused=paused_agents,
+        ),
+        "sheets_writer": dict(sheets_service.stats),
+        "jobs": {name: dict(stats) for name, stats in job_runner.stats.items()},
         "timestamp": "2024-01-01T00:00:00Z"  # Placeholder timestamp
     }
 
@@ -1119,45 +1508,35 @@ def _format_handoff_queued_notification(conversacion: ConversacionData, position
 Continúa con {nombre_activo} o usa `/next` para cambiar."""
 
 
-def _format_client_message_notification(numero_telefono: str, nombre: str, mensaje: str, is_active: bool, position: int = None) -> str:
+async def handle_interactive_button(numero_telefono: str, button_id: str, profile_name: str = "") -> str:
     """
-    Genera notificación de mensaje de cliente (activo o en cola).
+    Maneja las respuestas de botones interactivos (en un thread: el motor
+    conversacional y el envío del menú bloquean).
 
     Args:
-        numero_telefono: Número del cliente
-        nombre: Nombre del cliente
-        mensaje: Mensaje del cliente
-        is_active: Si es la conversación activa
-        position: Posición en cola si no es activo
+        numero_telefono: Número de teléfono del usuario
+        button_id: ID del botón presionado
+        profile_name: Nombre del perfil del usuario
 
     Returns:
-        str: Mensaje formateado
+        str: Respuesta a enviar al usuario (si hay alguna)
     """
-    nombre_display = nombre or "Cliente"
+    return await asyncio.to_thread(_procesar_boton_interactivo, numero_telefono, button_id, profile_name)
 
-    # Truncar mensaje si es muy largo
-    mensaje_display = mensaje
-    if len(mensaje) > 100:
-        mensaje_display = mensaje[:100] + "..."
 
-    if is_active:
-        return f"💬 *{nombre_display}:* \"{mensaje_display}\""
-    else:
-        return f"💬 *[#{position}] {nombre_display}:* \"{mensaje_display}\" (en cola)"
+def _responder_boton_interactivo(numero_telefono: str, button_id: str, profile_name: str = "") -> None:
+    """Procesa un botón/lista y envía la respuesta (corre en un thread con el lock del teléfono)."""
+    respuesta_interactiva = _procesar_boton_interactivo(numero_telefono, button_id, profile_name)
 
+    if respuesta_interactiva:
+        send_message(numero_telefono, respuesta_interactiva)
 
-async def handle_interactive_button(numero_telefono: str, button_id: str, profile_name: str = "") -> str:
-    """
-    Maneja las respuestas de botones interactivos
-    
-    Args:
-        numero_telefono: Número de teléfono del usuario
-        button_id: ID del botón presionado
-        profile_name: Nombre del perfil del usuario
-        
-    Returns:
-        str: Respuesta a enviar al usuario (si hay alguna)
-    """
+    _save_final_checkpoint_if_needed(numero_telefono)
+    _run_post_response_actions(numero_telefono, profile_name, button_id)
+
+
+def _procesar_boton_interactivo(numero_telefono: str, button_id: str, profile_name: str = "") -> str:
+    """Respuesta a un botón/lista interactivo (sincrónico; ver `handle_interactive_button`)."""
     try:
         from chatbot.rules import ChatbotRules
         from chatbot.states import conversation_manager
@@ -1213,61 +1592,66 @@ async def handle_interactive_button(numero_telefono: str, button_id: str, profil
 
 async def handle_agent_message(agent_phone: str, message: str, profile_name: str = ""):
     """
-    Maneja mensajes del agente humano con sistema de cola FIFO.
+    Maneja mensajes de un agente humano. Cada agente registrado tiene su
+    propia conversación activa; se lo identifica por el número que escribe.
+
+    Corre en un thread con el lock del agente y el de su cliente activo, que
+    es la conversación que el mensaje (o el comando) modifica.
 
     Args:
         agent_phone: Número de teléfono del agente
         message: Mensaje del agente
         profile_name: Nombre del perfil del agente (si está disponible)
     """
+    agent_id = handoff_scheduler.resolve_agent(agent_phone) or agent_phone
+    client_phone = conversation_manager.get_active_handoff(agent_id)
+    async with _phone_locks_held(agent_phone, client_phone):
+        await asyncio.to_thread(_procesar_mensaje_agente, agent_phone, message, profile_name)
+
+
+def _procesar_mensaje_agente(agent_phone: str, message: str, profile_name: str = "") -> None:
     try:
         from services.agent_command_service import agent_command_service
 
         logger.info(f"Procesando mensaje del agente {agent_phone}: {message}")
+        agent_id = handoff_scheduler.resolve_agent(agent_phone) or agent_phone
         _sync_runtime_handoff_state()
 
         # PASO 1: Verificar si es un comando
         if agent_command_service.is_command(message):
             command = agent_command_service.parse_command(message)
 
-            if command == 'done':
-                # Cerrar conversación activa y activar siguiente
-                old_active = conversation_manager.get_active_handoff()
-                response = agent_command_service.execute_done_command(agent_phone)
+            if command in ('done', 'resume'):
+                # Cerrar conversación activa (o volver de la pausa) y repartir la cola
+                previous_assignments = dict(conversation_manager.handoff_assignments)
+                previous_active = conversation_manager.get_active_handoff(agent_id)
+                if command == 'done':
+                    response = agent_command_service.execute_done_command(agent_phone)
+                else:
+                    response = agent_command_service.execute_resume_command(agent_phone)
                 meta_whatsapp_service.send_text_message(agent_phone, response)
 
-                # Si hay nuevo activo, notificar
+                # Notificar a cada agente los casos que recibió
                 _sync_runtime_handoff_state()
-                new_active = conversation_manager.get_active_handoff()
-                if new_active:
-                    if new_active != old_active:
-                        new_conv = conversation_manager.get_conversacion(new_active)
-                        handoff_contexto = new_conv.mensaje_handoff_contexto or "N/A"
-                        whatsapp_handoff_service.notify_agent_new_handoff(
-                            new_conv.numero_telefono,
-                            new_conv.nombre_usuario or "Sin nombre",
-                            handoff_contexto,
-                            handoff_contexto,
-                        )
+                _notify_activated_handoffs(previous_assignments, previous_active)
                 return
 
             elif command == 'next':
                 # Mover al siguiente sin cerrar
+                old_active = conversation_manager.get_active_handoff(agent_id)
                 response = agent_command_service.execute_next_command(agent_phone)
                 meta_whatsapp_service.send_text_message(agent_phone, response)
 
                 # Notificar nuevo activo
                 _sync_runtime_handoff_state()
-                new_active = conversation_manager.get_active_handoff()
-                if new_active:
-                    new_conv = conversation_manager.get_conversacion(new_active)
-                    handoff_contexto = new_conv.mensaje_handoff_contexto or "N/A"
-                    whatsapp_handoff_service.notify_agent_new_handoff(
-                        new_conv.numero_telefono,
-                        new_conv.nombre_usuario or "Sin nombre",
-                        handoff_contexto,
-                        handoff_contexto,
-                    )
+                new_active = conversation_manager.get_active_handoff(agent_id)
+                if new_active and new_active != old_active:
+                    _notify_agent_case_activated(new_active)
+                return
+
+            elif command == 'pause':
+                response = agent_command_service.execute_pause_command(agent_phone)
+                meta_whatsapp_service.send_text_message(agent_phone, response)
                 return
 
             elif command == 'queue':
@@ -1294,8 +1678,8 @@ async def handle_agent_message(agent_phone: str, message: str, profile_name: str
                 meta_whatsapp_service.send_text_message(agent_phone, response)
                 return
 
-        # PASO 2: Es un mensaje normal, enviar a conversación activa
-        active_phone = conversation_manager.get_active_handoff()
+        # PASO 2: Es un mensaje normal, enviar a la conversación activa de este agente
+        active_phone = conversation_manager.get_active_handoff(agent_id)
 
         if not active_phone:
             # No hay conversación activa
@@ -1,7 +1,9 @@
 import logging
+from datetime import datetime
 from typing import Optional
 from chatbot.states import conversation_manager
 from services.handoff_inbox_service import handoff_inbox_service
+from services.handoff_scheduler import handoff_scheduler
 from services.meta_whatsapp_service import meta_whatsapp_service
 
 logger = logging.getLogger(__name__)
@@ -15,15 +17,13 @@ def _get_client_messaging_service(client_id: str):
 
 
 def _sync_runtime_handoff_state():
+    # Los comandos corren en un thread: la lectura queda acá y la cola se aplica en el event loop
+    loaded_at = datetime.utcnow()
     try:
         cases = handoff_inbox_service.list_cases()
     except Exception:
         return []
-    if cases:
-        conversation_manager.sync_handoff_runtime(cases)
-    else:
-        conversation_manager.handoff_queue = []
-        conversation_manager.active_handoff = None
+    conversation_manager.sync_handoff_runtime_from_thread(cases, loaded_at)
     return cases
 
 
@@ -47,9 +47,16 @@ class AgentCommandService:
         'queue': ['queue', 'q', 'cola', 'list', 'lista'],
         'help': ['help', 'h', 'ayuda', '?', 'comandos'],
         'active': ['active', 'current', 'a', 'activo', 'actual'],
-        'historial': ['historial', 'history', 'contexto', 'context', 'chat', 'recap', 'mensajes', 'messages']
+        'historial': ['historial', 'history', 'contexto', 'context', 'chat', 'recap', 'mensajes', 'messages'],
+        'pause': ['pausa', 'pause', 'ausente', 'away', 'off'],
+        'resume': ['disponible', 'resume', 'online', 'on', 'volver']
     }
 
+    @staticmethod
+    def _agent_id(agent_phone: str) -> str:
+        """Identidad del agente según el número que escribió (formato +549...)."""
+        return handoff_scheduler.resolve_agent(agent_phone) or agent_phone
+
     def is_command(self, message: str) -> bool:
         """
         Verifica si un mensaje es un comando del agente.
@@ -113,7 +120,8 @@ class AgentCommandService:
             from datetime import datetime
 
             _sync_runtime_handoff_state()
-            active_phone = conversation_manager.get_active_handoff()
+            agent_id = self._agent_id(agent_phone)
+            active_phone = conversation_manager.get_active_handoff(agent_id)
 
             if not active_phone:
                 return "⚠️ No hay conversación activa para finalizar.\n\nUsa /queue para ver el estado de la cola."
@@ -138,6 +146,7 @@ class AgentCommandService:
                     conversacion.survey_offered = True
                     conversacion.survey_offer_sent_at = datetime.utcnow()
                     conversacion.atendido_por_humano = False
+                    conversation_manager.schedule_handoff_deadline(active_phone)
 
                     case_id = _find_open_case_id(active_phone)
                     if case_id:
@@ -168,7 +177,7 @@ class AgentCommandService:
                     handoff_inbox_service.close_case(case_id)
                     _sync_runtime_handoff_state()
                     conversation_manager.finalizar_conversacion(active_phone)
-                    next_phone = conversation_manager.get_active_handoff()
+                    next_phone = conversation_manager.get_active_handoff(agent_id)
                 else:
                     next_phone = conversation_manager.close_active_handoff()
 
@@ -216,7 +225,8 @@ Si no respondes en 2 minutos, cerraremos la conversación automáticamente."""
         """
         try:
             _sync_runtime_handoff_state()
-            active_phone = conversation_manager.get_active_handoff()
+            agent_id = self._agent_id(agent_phone)
+            active_phone = conversation_manager.get_active_handoff(agent_id)
 
             if not active_phone:
                 return "⚠️ No hay conversación activa.\n\nUsa /queue para ver el estado de la cola."
@@ -230,11 +240,13 @@ Si no respondes en 2 minutos, cerraremos la conversación automáticamente."""
             old_conversacion = conversation_manager.get_conversacion(active_phone)
             old_nombre = old_conversacion.nombre_usuario or "Cliente anterior"
 
-            # Mover al final y activar siguiente
-            next_projection = handoff_inbox_service.advance_next()
+            # Mover al final y activar siguiente (entre los casos que este agente puede tomar)
+            next_projection = handoff_inbox_service.advance_next(agent_phone=agent_id)
             if next_projection is not None:
                 _sync_runtime_handoff_state()
                 next_phone = next_projection.client_phone
+                if next_phone == active_phone:
+                    return "⚠️ No hay otra conversación en cola que puedas tomar. Usa /done para finalizarla."
             else:
                 next_phone = conversation_manager.move_to_next_in_queue()
 
@@ -264,7 +276,7 @@ Si no respondes en 2 minutos, cerraremos la conversación automáticamente."""
         """
         try:
             _sync_runtime_handoff_state()
-            queue_status = conversation_manager.format_queue_status()
+            queue_status = conversation_manager.format_queue_status(self._agent_id(agent_phone))
             logger.info(f"Agente {agent_phone} solicitó estado de cola")
             return queue_status
 
@@ -312,6 +324,14 @@ Si no respondes en 2 minutos, cerraremos la conversación automáticamente."""
    Útil para recordar qué se habló antes de cambiar con /next.
    Ejemplo: /historial
 
+**/pausa** (o /ausente)
+   Deja de recibir casos nuevos; tus conversaciones activas siguen asignadas.
+   Ejemplo: /pausa
+
+**/disponible**
+   Vuelve a recibir casos de la cola.
+   Ejemplo: /disponible
+
 **/help** (o /ayuda)
    Muestra este mensaje de ayuda.
    Ejemplo: /help
@@ -320,8 +340,9 @@ Si no respondes en 2 minutos, cerraremos la conversación automáticamente."""
 
 💡 *Funcionamiento del Sistema de Cola:*
 
-• Siempre hay UNA conversación activa
-• Los mensajes que escribas van al cliente activo
+• Cada agente tiene UNA conversación activa a la vez
+• Los mensajes que escribas van a tu cliente activo
+• Los casos en cola se reparten entre los agentes disponibles
 • Usa /done cuando termines con un cliente
 • La siguiente conversación se activa automáticamente
 • Puedes ver la cola completa con /queue
@@ -345,7 +366,7 @@ Si no respondes en 2 minutos, cerraremos la conversación automáticamente."""
         """
         try:
             _sync_runtime_handoff_state()
-            active_phone = conversation_manager.get_active_handoff()
+            active_phone = conversation_manager.get_active_handoff(self._agent_id(agent_phone))
 
             if not active_phone:
                 return "ℹ️ No hay conversación activa.\n\nUsa /queue para ver el estado de la cola."
@@ -389,6 +410,49 @@ Si no respondes en 2 minutos, cerraremos la conversación automáticamente."""
             logger.error(f"Error ejecutando comando /active: {e}")
             return f"❌ Error obteniendo conversación activa: {str(e)}"
     
+    def execute_pause_command(self, agent_phone: str) -> str:
+        """
+        Ejecuta el comando /pausa: el agente deja de recibir casos nuevos.
+
+        Args:
+            agent_phone: Número del agente
+
+        Returns:
+            str: Mensaje de respuesta para el agente
+        """
+        try:
+            handoff_inbox_service.set_agent_available(self._agent_id(agent_phone), False)
+        except Exception as e:
+            logger.error(f"Error ejecutando comando /pausa: {e}")
+            return f"❌ Error actualizando disponibilidad: {str(e)}"
+        logger.info(f"Agente {agent_phone} en pausa")
+        return "⏸️ Pausa activada: no vas a recibir casos nuevos.\n\nTus conversaciones activas siguen asignadas a vos. Usa /disponible para volver."
+
+    def execute_resume_command(self, agent_phone: str) -> str:
+        """
+        Ejecuta el comando /disponible: el agente vuelve a recibir casos y toma
+        los que estén esperando en la cola hasta completar su capacidad.
+
+        Args:
+            agent_phone: Número del agente
+
+        Returns:
+            str: Mensaje de respuesta para el agente
+        """
+        try:
+            agent_id = self._agent_id(agent_phone)
+            handoff_inbox_service.set_agent_available(agent_id, True)
+            promoted = handoff_inbox_service.assign_queued_cases()
+            _sync_runtime_handoff_state()
+            propios = sum(1 for case in promoted if case.assigned_agent == agent_id)
+            logger.info(f"Agente {agent_phone} disponible ({propios} caso(s) asignados de la cola)")
+            if propios:
+                return f"▶️ Estás disponible.\n\n✅ Se te asignaron {propios} conversación(es) de la cola."
+            return "▶️ Estás disponible.\n\n📋 No hay conversaciones esperando en este momento."
+        except Exception as e:
+            logger.error(f"Error ejecutando comando /disponible: {e}")
+            return f"❌ Error actualizando disponibilidad: {str(e)}"
+
     def execute_historial_command(self, agent_phone: str, numero_especifico: Optional[str] = None) -> str:
         """
         Ejecuta el comando /historial: muestra los últimos mensajes de la conversación activa.
@@ -412,7 +476,7 @@ Si no respondes en 2 minutos, cerraremos la conversación automáticamente."""
                     return f"⚠️ El número {numero_telefono} no está en handoff actualmente."
             else:
                 # Usar conversación activa
-                active_phone = conversation_manager.get_active_handoff()
+                active_phone = conversation_manager.get_active_handoff(self._agent_id(agent_phone))
                 
                 if not active_phone:
                     return "⚠️ No hay conversación activa.\n\nUsa /queue para ver las conversaciones en cola."
@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Ventana de agrupación: el primer mensaje pendiente de un agente sale a más tardar en este tiempo
+AGENT_NOTIFY_WINDOW_SECONDS = float(os.getenv("AGENT_NOTIFY_WINDOW_SECONDS", "3"))
+# Con este volumen pendiente se envía sin esperar al final de la ventana
+AGENT_NOTIFY_MAX_MESSAGES = int(os.getenv("AGENT_NOTIFY_MAX_MESSAGES", "20"))
+DIGEST_MESSAGE_MAX_CHARS = 100
+
+
+@dataclass
+class _CaseDigest:
+    client_phone: str
+    nombre: str
+    is_active: bool
+    position: Optional[int]
+    messages: List[str] = field(default_factory=list)
+
+
+class AgentNotificationBatcher:
+    """
+    Agrupa los mensajes de clientes en handoff que van a un mismo agente.
+
+    En lugar de un envío por mensaje (más un recordatorio por cada mensaje
+    de un caso en cola), el agente recibe un solo resumen por ventana con
+    los mensajes de todos sus casos. Un mensaje nunca espera más de
+    `window_seconds` desde que entró al buffer.
+    """
+
+    def __init__(
+        self,
+        sender: Optional[Callable[[str, str], bool]] = None,
+        window_seconds: float = AGENT_NOTIFY_WINDOW_SECONDS,
+        max_messages: int = AGENT_NOTIFY_MAX_MESSAGES,
+    ):
+        self._sender = sender
+        self.window_seconds = window_seconds
+        self.max_messages = max(1, max_messages)
+        self._pending: Dict[str, Dict[str, _CaseDigest]] = {}
+        self._deadlines: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._stopping = False
+        self.stats = {"messages": 0, "digests_sent": 0, "send_failures": 0}
+
+    def _send(self, agent_phone: str, text: str) -> bool:
+        sender = self._sender
+        if sender is None:
+            from services.meta_whatsapp_service import meta_whatsapp_service
+
+            sender = meta_whatsapp_service.send_text_message
+        try:
+            return bool(sender(agent_phone, text))
+        except Exception as e:
+            logger.error(f"Error enviando resumen de mensajes al agente {agent_phone}: {e}")
+            return False
+
+    def notify_client_message(
+        self,
+        agent_phone: str,
+        client_phone: str,
+        nombre: str,
+        mensaje: str,
+        is_active: bool,
+        position: Optional[int] = None,
+    ) -> None:
+        """Encola el mensaje de un cliente para el próximo resumen del agente."""
+        with self._cond:
+            self.stats["messages"] += 1
+            cases = self._pending.setdefault(agent_phone, {})
+            digest = cases.get(client_phone)
+            if digest is None:
+                digest = cases[client_phone] = _CaseDigest(client_phone, nombre, is_active, position)
+            # El estado más reciente del caso (activo / posición) es el que se muestra
+            digest.nombre = nombre or digest.nombre
+            digest.is_active = is_active
+            digest.position = position
+            digest.messages.append(mensaje)
+            self._deadlines.setdefault(agent_phone, time.monotonic() + self.window_seconds)
+            total = sum(len(item.messages) for item in cases.values())
+            if self.window_seconds <= 0 or total >= self.max_messages:
+                self._deadlines[agent_phone] = 0.0
+            self._cond.notify_all()
+        if self.window_seconds <= 0:
+            # Sin ventana: envío inmediato en el mismo request (tests, debug)
+            self.flush(agent_phone)
+            return
+        self._ensure_worker()
+
+    def _ensure_worker(self) -> None:
+        with self._cond:
+            if self._worker is not None:
+                return
+            self._stopping = False
+            self._worker = threading.Thread(target=self._worker_loop, name="agent-notify", daemon=True)
+            self._worker.start()
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                now = time.monotonic()
+                due = [agent for agent, deadline in self._deadlines.items() if deadline <= now]
+                if not due:
+                    next_deadline = min(self._deadlines.values(), default=None)
+                    self._cond.wait(None if next_deadline is None else next_deadline - now)
+                    continue
+            for agent_phone in due:
+                self.flush(agent_phone)
+
+    def flush(self, agent_phone: Optional[str] = None) -> int:
+        """Envía los resúmenes pendientes (de un agente o de todos). Retorna cuántos se enviaron."""
+        with self._cond:
+            agents = [agent_phone] if agent_phone is not None else list(self._pending)
+            batches = []
+            for agent in agents:
+                cases = self._pending.pop(agent, None)
+                self._deadlines.pop(agent, None)
+                if cases:
+                    batches.append((agent, list(cases.values())))
+        sent = 0
+        for agent, cases in batches:
+            if self._send(agent, format_agent_digest(cases)):
+                sent += 1
+                self.stats["digests_sent"] += 1
+            else:
+                self.stats["send_failures"] += 1
+                logger.error(
+                    f"❌ No se pudo enviar el resumen de {sum(len(case.messages) for case in cases)} mensaje(s) al agente {agent}"
+                )
+        return sent
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Detiene el worker y envía lo que quedó pendiente (apagado)."""
+        with self._cond:
+            worker = self._worker
+            self._stopping = True
+            self._cond.notify_all()
+        if worker is not None:
+            worker.join(timeout=timeout)
+            self._worker = None
+        self.flush()
+
+
+def _truncate(mensaje: str) -> str:
+    if len(mensaje) > DIGEST_MESSAGE_MAX_CHARS:
+        return mensaje[:DIGEST_MESSAGE_MAX_CHARS] + "..."
+    return mensaje
+
+
+def format_agent_digest(cases: List[_CaseDigest]) -> str:
+    """
+    Un mensaje suelto de un caso activo conserva el formato de siempre
+    (`💬 *Nombre:* "texto"`); varios mensajes o casos se listan juntos y el
+    recordatorio de casos en cola aparece una sola vez al final.
+    """
+    lines: List[str] = []
+    for case in cases:
+        nombre = case.nombre or "Cliente"
+        header = f"💬 *{nombre}:*" if case.is_active else f"💬 *[#{case.position}] {nombre}:*"
+        if len(case.messages) == 1:
+            line = f"{header} \"{_truncate(case.messages[0])}\""
+            lines.append(line if case.is_active else f"{line} (en cola)")
+            continue
+        lines.append(header if case.is_active else f"{header} (en cola)")
+        lines.extend(f"  • \"{_truncate(mensaje)}\"" for mensaje in case.messages)
+
+    queued_positions = [f"#{case.position}" for case in cases if not case.is_active and case.position]
+    if queued_positions:
+        lines.append("")
+        lines.append(
+            f"ℹ️ Mensajes de clientes en cola ({', '.join(queued_positions)}). "
+            "Los mensajes que escribas irán al cliente activo. Usa /next para cambiar o /queue para ver la cola completa."
+        )
+    return "\n".join(lines)
+
+
+agent_notification_batcher = AgentNotificationBatcher()
@@ -5,17 +5,9 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-try:
-    from google.cloud import firestore
-except Exception:
-    firestore = None
-
-try:
-    from google.api_core.exceptions import AlreadyExists
-except Exception:
-    AlreadyExists = None
-
 from chatbot.models import ConversacionData, DatosContacto, EstadoConversacion, TipoConsulta
+from services.firestore_support import is_already_exists, load_firestore
+from services.runtime_metrics import STAGE_SECONDS
 
 
 logger = logging.getLogger(__name__)
@@ -105,7 +97,7 @@ class ConversationCheckpoint:
 
 
 class ConversationSessionService:
-    def __init__(self) -> None:
+    def __init__(self, firestore_client=None) -> None:
         self.database = (
             os.getenv(FIRESTORE_DATABASE_ENV, DEFAULT_FIRESTORE_DATABASE).strip()
             or DEFAULT_FIRESTORE_DATABASE
@@ -113,15 +105,17 @@ class ConversationSessionService:
         if self.database == "default":
             self.database = "(default)"
         self.collection = CHECKPOINT_COLLECTION
-        self._fs_client = None
+        self._fs_client = firestore_client
 
     def _get_firestore_client(self):
-        if firestore is None:
-            raise RuntimeError("google-cloud-firestore not installed")
         if self._fs_client is None:
-            self._fs_client = firestore.Client(database=self.database)
+            self._fs_client = load_firestore().Client(database=self.database)
         return self._fs_client
 
+    def warmup(self) -> None:
+        """Crea el cliente y abre el canal gRPC (una lectura) antes del primer webhook."""
+        self._get_firestore_client().collection(self.collection).document("_warmup").get()
+
     @staticmethod
     def build_doc_id(channel: str, identifier: str) -> str:
         return f"{channel}:{identifier}"
@@ -219,13 +213,15 @@ class ConversationSessionService:
             last_user_message_at=last_user_message_at,
             updated_at=updated_at,
         )
-        document.set(payload)
+        with STAGE_SECONDS.time(stage="checkpoint_save"):
+            document.set(payload)
         logger.info("checkpoint_save doc_id=%s estado=%s", doc_id, payload["estado"])
         return payload
 
     def load(self, channel: str, identifier: str) -> Optional[ConversationCheckpoint]:
         doc_id, document = self._document(channel, identifier)
-        snapshot = document.get()
+        with STAGE_SECONDS.time(stage="checkpoint_load"):
+            snapshot = document.get()
         if not snapshot.exists:
             return None
         checkpoint = self.hydrate(identifier, snapshot.to_dict() or {}, channel=channel)
@@ -317,7 +313,7 @@ class ConversationSessionService:
                     return True
                 document.set(payload)
         except Exception as exc:
-            if AlreadyExists and isinstance(exc, AlreadyExists):
+            if is_already_exists(exc):
                 return True
             raise
         logger.info("message_marker_saved message_id=%s", message_id)
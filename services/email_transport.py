@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from email.utils import parseaddr
+from typing import Dict, List, Optional
+
+from services.runtime_metrics import SES_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# ses (producción) | smtp (p. ej. `python -m aiosmtpd -n -l localhost:8025`) | file (pruebas de carga)
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "ses").strip().lower()
+EMAIL_SMTP_HOST = os.getenv("EMAIL_SMTP_HOST", "localhost")
+EMAIL_SMTP_PORT = int(os.getenv("EMAIL_SMTP_PORT", "8025"))
+EMAIL_FILE_SINK_DIR = os.getenv("EMAIL_FILE_SINK_DIR", "email_sink")
+
+
+class EmailTransportError(Exception):
+    """Error del proveedor al enviar (SES, SMTP o disco)."""
+
+
+@dataclass
+class OutgoingEmail:
+    source: str
+    to: List[str]
+    subject: str
+    html: str
+    reply_to: List[str] = field(default_factory=list)
+
+
+@dataclass
+class SendResult:
+    ok: bool
+    message_id: str = "unknown"
+    status: int = 0
+    raw: Optional[dict] = None
+
+
+_ses_clients: Dict[str, object] = {}
+_ses_lock = threading.Lock()
+
+
+def get_ses_client(region: str):
+    """Cliente SES compartido por región; boto3 se importa recién en el primer envío."""
+    client = _ses_clients.get(region)
+    if client is None:
+        with _ses_lock:
+            client = _ses_clients.get(region)
+            if client is None:
+                import boto3
+
+                client = boto3.client("ses", region_name=region)
+                _ses_clients[region] = client
+    return client
+
+
+class SESTransport:
+    name = "ses"
+
+    def __init__(self, region: Optional[str] = None, client=None):
+        self.region = region or os.getenv("AWS_REGION", "us-east-1")
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_ses_client(self.region)
+        return self._client
+
+    def send(self, email: OutgoingEmail) -> SendResult:
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        send_kwargs = {
+            "Source": email.source,
+            "Destination": {"ToAddresses": list(email.to)},
+            "Message": {
+                "Subject": {"Data": email.subject, "Charset": "UTF-8"},
+                "Body": {"Html": {"Data": email.html, "Charset": "UTF-8"}},
+            },
+        }
+        if email.reply_to:
+            send_kwargs["ReplyToAddresses"] = list(email.reply_to)
+        started = time.perf_counter()
+        try:
+            response = self.client.send_email(**send_kwargs)
+        except (ClientError, BotoCoreError) as e:
+            SES_SEND_SECONDS.observe(time.perf_counter() - started, outcome="error")
+            raise EmailTransportError(f"{type(e).__name__}: {str(e)}") from e
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        SES_SEND_SECONDS.observe(time.perf_counter() - started, outcome="ok" if status == 200 else "error")
+        return SendResult(
+            ok=status == 200,
+            message_id=response.get("MessageId", "unknown"),
+            status=status,
+            raw=response,
+        )
+
+
+class SMTPTransport:
+    name = "smtp"
+
+    def __init__(self, host: str = EMAIL_SMTP_HOST, port: int = EMAIL_SMTP_PORT, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def send(self, email: OutgoingEmail) -> SendResult:
+        message = EmailMessage()
+        message["From"] = email.source
+        message["To"] = ", ".join(email.to)
+        message["Subject"] = email.subject
+        if email.reply_to:
+            message["Reply-To"] = ", ".join(email.reply_to)
+        message_id = f"<{uuid.uuid4().hex}@chatbot.local>"
+        message["Message-ID"] = message_id
+        message.set_content("Este mensaje requiere un cliente con soporte HTML.")
+        message.add_alternative(email.html, subtype="html")
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+                smtp.send_message(message, from_addr=parseaddr(email.source)[1])
+        except (OSError, smtplib.SMTPException) as e:
+            raise EmailTransportError(f"{type(e).__name__}: {str(e)}") from e
+        return SendResult(ok=True, message_id=message_id, status=250)
+
+
+class FileTransport:
+    """Escribe cada email como JSON en un directorio; no sale nada a la red."""
+
+    name = "file"
+
+    def __init__(self, directory: str = EMAIL_FILE_SINK_DIR):
+        self.directory = directory
+
+    def send(self, email: OutgoingEmail) -> SendResult:
+        message_id = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{message_id}.json"), "w", encoding="utf-8") as handle:
+                json.dump({
+                    "source": email.source,
+                    "to": email.to,
+                    "reply_to": email.reply_to,
+                    "subject": email.subject,
+                    "html": email.html,
+                }, handle, ensure_ascii=False)
+        except OSError as e:
+            raise EmailTransportError(f"{type(e).__name__}: {str(e)}") from e
+        return SendResult(ok=True, message_id=message_id, status=200)
+
+
+def build_email_transport(kind: str = EMAIL_TRANSPORT):
+    if kind == "smtp":
+        return SMTPTransport()
+    if kind == "file":
+        return FileTransport()
+    if kind != "ses":
+        logger.warning("EMAIL_TRANSPORT desconocido: %s (se usa SES)", kind)
+    return SESTransport()
+
+
+# Transporte compartido por EmailService y ErrorReporter
+email_transport = build_email_transport()
@@ -5,11 +5,10 @@ import hashlib
 import logging
 from typing import Dict, Any, List
 
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
-
+from services.email_transport import EmailTransportError, OutgoingEmail, email_transport
 from services.sheets_service import sheets_service
 from config.company_profiles import get_active_company_profile
+from templates.email_templates import ERROR_REPORT_TEMPLATE
 
 logger = logging.getLogger(__name__)
 
@@ -90,7 +89,7 @@ class InMemoryRateLimiter:
 
 
 class ErrorReporter:
-    def __init__(self):
+    def __init__(self, transport=None):
         # Use only ENABLE_ERROR_EMAILS (no legacy fallback)
         self.enabled = os.getenv("ENABLE_ERROR_EMAILS", "true").lower() == "true"
         self.error_email = os.getenv("ERROR_LOG_EMAIL", "").strip()
@@ -98,7 +97,7 @@ class ErrorReporter:
         self.region = os.getenv("AWS_REGION", "us-east-1")
         self.reply_to = os.getenv("REPLY_TO_EMAIL", "").strip()
         self.rate_limiter = InMemoryRateLimiter(window_seconds=int(os.getenv("ERROR_RATE_WINDOW_SEC", "300")))
-        self.ses = boto3.client("ses", region_name=self.region)
+        self.transport = transport or email_transport
 
         if not self.error_email:
             logger.warning("ERROR_LOG_EMAIL not set - error emails disabled")
@@ -113,29 +112,11 @@ class ErrorReporter:
 
     def _build_email(self, subject: str, summary_lines: List[str], details: Dict[str, Any]) -> Dict[str, str]:
         profile = get_active_company_profile()
-
-        def render_kv(d: Dict[str, Any]) -> str:
-            rows = []
-            for k, v in d.items():
-                rows.append(f"<tr><td style='padding:4px 8px;font-weight:600;'>{k}</td><td style='padding:4px 8px;'>{v}</td></tr>")
-            return "\n".join(rows)
-
-        summary_html = "<br/>".join([_sanitize_text(s, 500) for s in summary_lines])
-        details_html = render_kv(details)
-
-        html = f"""
-        <div style='font-family:Arial, sans-serif;max-width:700px;margin:0 auto;'>
-          <div style='background:#111827;color:#fff;padding:12px 16px;border-radius:6px 6px 0 0;'>
-            <strong>{profile['name']}</strong> · Chatbot Error Report
-          </div>
-          <div style='border:1px solid #e5e7eb;border-top:none;padding:16px;border-radius:0 0 6px 6px;'>
-            <p style='margin:0 0 12px 0;'>{summary_html}</p>
-            <table style='width:100%;border-collapse:collapse;background:#fff;border:1px solid #f3f4f6;'>
-              {details_html}
-            </table>
-          </div>
-        </div>
-        """
+        html = ERROR_REPORT_TEMPLATE.render(
+            company_name=profile['name'],
+            summary_lines=[_sanitize_text(s, 500) for s in summary_lines],
+            details=details,
+        )
 
         return {
             "subject": subject,
@@ -145,32 +126,25 @@ class ErrorReporter:
 
     def _send_email(self, subject: str, html: str, from_name: str) -> bool:
         try:
-            send_kwargs = {
-                "Source": f"{from_name} <{self.from_email or 'notificaciones.chatbot@gmail.com'}>",
-                "Destination": {"ToAddresses": [self.error_email]},
-                "Message": {
-                    "Subject": {"Data": subject, "Charset": "UTF-8"},
-                    "Body": {"Html": {"Data": html, "Charset": "UTF-8"}},
-                },
-            }
-
-            if self.reply_to:
-                send_kwargs["ReplyToAddresses"] = [self.reply_to]
-
-            resp = self.ses.send_email(**send_kwargs)
-            status = resp.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
-            if status == 200:
+            result = self.transport.send(OutgoingEmail(
+                source=f"{from_name} <{self.from_email or 'notificaciones.chatbot@gmail.com'}>",
+                to=[self.error_email],
+                subject=subject,
+                html=html,
+                reply_to=[self.reply_to] if self.reply_to else [],
+            ))
+            if result.ok:
                 logger.info(
                     "Error report email sent | message_id=%s status=%s",
-                    resp.get("MessageId", "unknown"),
-                    status,
+                    result.message_id,
+                    result.status,
                 )
                 return True
 
-            logger.error("SES error report send failed | status=%s resp=%s", status, resp)
+            logger.error("Error report send failed | transport=%s status=%s resp=%s", self.transport.name, result.status, result.raw)
             return False
-        except (ClientError, BotoCoreError) as e:
-            logger.error("SES client error sending error report: %s", str(e))
+        except EmailTransportError as e:
+            logger.error("Transport error sending error report (%s): %s", self.transport.name, str(e))
             return False
         except Exception as e:
             logger.error("Unexpected error sending error report: %s", str(e))
@@ -0,0 +1,36 @@
+"""
+Carga diferida de google-cloud-firestore.
+
+Importar el SDK cuesta ~150 ms (grpc, protobuf, google-auth); los servicios lo
+cargan recién al crear su primer cliente, así `import main` no lo paga en el
+arranque en frío de Cloud Run.
+"""
+import importlib.util
+import sys
+
+
+def firestore_available() -> bool:
+    """Indica si el SDK está instalado, sin importarlo."""
+    try:
+        return importlib.util.find_spec("google.cloud.firestore") is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def load_firestore():
+    """Devuelve el módulo `google.cloud.firestore` (RuntimeError si no está instalado)."""
+    try:
+        from google.cloud import firestore
+    except Exception as exc:
+        raise RuntimeError("google-cloud-firestore not installed") from exc
+    return firestore
+
+
+def is_already_exists(exc: BaseException) -> bool:
+    """
+    `AlreadyExists` de google-api-core sin importarlo: si el SDK no se cargó,
+    la excepción no pudo venir de Firestore.
+    """
+    exceptions = sys.modules.get("google.api_core.exceptions")
+    already_exists = getattr(exceptions, "AlreadyExists", None)
+    return already_exists is not None and isinstance(exc, already_exists)
@@ -48,6 +48,7 @@ class HandoffInboxCaseRecord(BaseModel):
     last_agent_message_at: Optional[datetime] = None
     last_interaction_at: Optional[datetime] = None
     owner_email: Optional[str] = None
+    assigned_agent: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     opened_at: Optional[datetime] = None
@@ -69,6 +70,7 @@ class HandoffInboxCaseProjection(BaseModel):
     last_agent_message_at: Optional[datetime] = None
     last_interaction_at: Optional[datetime] = None
     owner_email: Optional[str] = None
+    assigned_agent: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     opened_at: Optional[datetime] = None
@@ -128,6 +130,8 @@ class HandoffInboxRetentionResult(BaseModel):
     cases_deleted: int = 0
     messages_deleted: int = 0
     outbox_deleted: int = 0
+    # Último caso revisado si la corrida cortó por batch_limit; None = se llegó al final
+    next_cursor: Optional[str] = None
 
 
 class HandoffInboxAutocloseCaseRecord(BaseModel):
@@ -3,9 +3,11 @@ from __future__ import annotations
 from datetime import datetime, timedelta, timezone
 import logging
 import os
-from typing import Optional
+import threading
+from typing import Callable, Optional
 from uuid import uuid4
 
+from services.firestore_support import load_firestore
 from services.handoff_inbox_models import (
     HandoffInboxAutocloseCaseRecord,
     HandoffInboxAutocloseResult,
@@ -23,15 +25,16 @@ from services.handoff_inbox_models import (
     HandoffInboxRetentionResult,
     HandoffInboxSummary,
 )
-
-try:
-    from google.cloud import firestore
-except Exception:
-    firestore = None
+from services.handoff_scheduler import handoff_scheduler, normalize_agent_phone
+from services.runtime_metrics import FIRESTORE_INBOX_SECONDS
 
 
 logger = logging.getLogger(__name__)
 
+# Documento (en la colección de agentes) que toda asignación lee y escribe en su
+# transacción: dos asignaciones concurrentes chocan y Firestore reintenta una
+ASSIGNMENT_DOCUMENT_ID = "_assignment"
+
 
 class HandoffInboxConflictError(ValueError):
     pass
@@ -52,18 +55,23 @@ class HandoffInboxService:
         collection_name: Optional[str] = None,
         messages_subcollection_name: str = "messages",
         outbox_subcollection_name: str = "outbox",
+        agents_collection_name: Optional[str] = None,
         database: Optional[str] = None,
         firestore_client=None,
         now_fn=None,
         case_id_factory=None,
         message_id_factory=None,
         outbox_id_factory=None,
+        scheduler=None,
     ) -> None:
         self.collection_name = (
             collection_name or os.getenv("HANDOFF_INBOX_CASES_COLLECTION", "handoff_inbox_cases")
         ).strip() or "handoff_inbox_cases"
         self.messages_subcollection_name = messages_subcollection_name.strip() or "messages"
         self.outbox_subcollection_name = outbox_subcollection_name.strip() or "outbox"
+        self.agents_collection_name = (
+            agents_collection_name or os.getenv("HANDOFF_INBOX_AGENTS_COLLECTION", "handoff_inbox_agents")
+        ).strip() or "handoff_inbox_agents"
         self.database = (
             database or os.getenv("CHATBOT_FIRESTORE_DATABASE", "(default)")
         ).strip() or "(default)"
@@ -74,6 +82,9 @@ class HandoffInboxService:
         self._case_id_factory = case_id_factory or self._build_case_id
         self._message_id_factory = message_id_factory or self._build_message_id
         self._outbox_id_factory = outbox_id_factory or self._build_outbox_id
+        self._scheduler = scheduler or handoff_scheduler
+        # Dentro de la instancia las asignaciones se serializan antes de llegar a Firestore
+        self._assignment_lock = threading.Lock()
 
     @staticmethod
     def _utc_now() -> datetime:
@@ -94,9 +105,7 @@ class HandoffInboxService:
     def _get_firestore_client(self):
         if self._firestore_client is not None:
             return self._firestore_client
-        if firestore is None:
-            raise RuntimeError("google-cloud-firestore not installed")
-        self._firestore_client = firestore.Client(database=self.database)
+        self._firestore_client = load_firestore().Client(database=self.database)
         return self._firestore_client
 
     def _cases_collection(self):
@@ -108,6 +117,9 @@ class HandoffInboxService:
     def _outbox_collection(self, case_id: str):
         return self._cases_collection().document(case_id).collection(self.outbox_subcollection_name)
 
+    def _agents_collection(self):
+        return self._get_firestore_client().collection(self.agents_collection_name)
+
     @staticmethod
     def _snapshot_payload(snapshot) -> Optional[dict]:
         if snapshot is None:
@@ -159,6 +171,7 @@ class HandoffInboxService:
         )
 
     @staticmethod
+    @FIRESTORE_INBOX_SECONDS.time(operation="create_document")
     def _create_document_if_absent(document_ref, payload: dict) -> bool:
         create_method = getattr(document_ref, "create", None)
         if callable(create_method):
@@ -199,20 +212,27 @@ class HandoffInboxService:
         *,
         update_case: bool = True,
     ) -> HandoffInboxMessageRecord:
-        self._messages_collection(case_id).document(message.message_id).set(message.model_dump(mode="json"))
+        with FIRESTORE_INBOX_SECONDS.time(operation="write_message"):
+            self._messages_collection(case_id).document(message.message_id).set(message.model_dump(mode="json"))
         if update_case:
             self._update_case_after_message(case_id, message)
         return message
 
+    def _with_last_interaction(self, record: HandoffInboxCaseRecord) -> HandoffInboxCaseRecord:
+        return record.model_copy(update={"last_interaction_at": self._derive_case_last_interaction_at(record)})
+
+    @FIRESTORE_INBOX_SECONDS.time(operation="persist_case")
     def _persist_case(self, record: HandoffInboxCaseRecord) -> HandoffInboxCaseRecord:
-        record = record.model_copy(update={"last_interaction_at": self._derive_case_last_interaction_at(record)})
+        record = self._with_last_interaction(record)
         self._cases_collection().document(record.case_id).set(record.model_dump(mode="json"))
         return record
 
     @staticmethod
+    @FIRESTORE_INBOX_SECONDS.time(operation="delete_document")
     def _delete_document(document_ref) -> None:
         document_ref.delete()
 
+    @FIRESTORE_INBOX_SECONDS.time(operation="load_case")
     def _load_case_record(self, case_id: str, *, raise_if_missing: bool = True) -> Optional[HandoffInboxCaseRecord]:
         snapshot = self._cases_collection().document(case_id).get()
         payload = self._snapshot_payload(snapshot)
@@ -222,6 +242,7 @@ class HandoffInboxService:
             return None
         return HandoffInboxCaseRecord.model_validate(payload)
 
+    @FIRESTORE_INBOX_SECONDS.time(operation="list_cases")
     def _list_case_records(self) -> list[HandoffInboxCaseRecord]:
         records = []
         for snapshot in self._cases_collection().stream():
@@ -231,14 +252,91 @@ class HandoffInboxService:
             records.append(HandoffInboxCaseRecord.model_validate(payload))
         return records
 
+    @FIRESTORE_INBOX_SECONDS.time(operation="list_open_cases")
+    def _list_unclosed_case_records(self, transaction) -> list[HandoffInboxCaseRecord]:
+        # Solo los abiertos: la transacción no bloquea el historial de casos cerrados
+        query = self._cases_collection().where(
+            "status", "in", [HandoffInboxCaseStatus.QUEUED.value, HandoffInboxCaseStatus.ACTIVE.value]
+        )
+        records = []
+        for snapshot in query.stream(transaction=transaction):
+            payload = self._snapshot_payload(snapshot)
+            if payload is None:
+                continue
+            records.append(HandoffInboxCaseRecord.model_validate(payload))
+        return records
+
     def _list_open_case_records(self) -> list[HandoffInboxCaseRecord]:
-        records = [record for record in self._list_case_records() if record.status != HandoffInboxCaseStatus.CLOSED]
+        return self._order_open_records(self._list_case_records())
+
+    @staticmethod
+    def _order_open_records(records: list[HandoffInboxCaseRecord]) -> list[HandoffInboxCaseRecord]:
+        records = [record for record in records if record.status != HandoffInboxCaseStatus.CLOSED]
         active = [record for record in records if record.status == HandoffInboxCaseStatus.ACTIVE]
         queued = [record for record in records if record.status == HandoffInboxCaseStatus.QUEUED]
-        active.sort(key=lambda item: (item.created_at, item.case_id))
+        # Entre los activos, el de opened_at más viejo es el que el agente tiene en foco
+        active.sort(key=lambda item: (item.opened_at or item.created_at, item.case_id))
         queued.sort(key=lambda item: (item.created_at, item.case_id))
         return active + queued
 
+    def _case_agent(self, record: HandoffInboxCaseRecord) -> Optional[str]:
+        if record.status != HandoffInboxCaseStatus.ACTIVE:
+            return None
+        # Casos activos anteriores al scheduler: quedan con el agente principal
+        return record.assigned_agent or self._scheduler.primary_agent()
+
+    def _agent_loads(self, records: list[HandoffInboxCaseRecord]) -> dict[str, int]:
+        loads: dict[str, int] = {}
+        for record in records:
+            agent = self._case_agent(record)
+            if agent is not None:
+                loads[agent] = loads.get(agent, 0) + 1
+        return loads
+
+    def _activated(self, record: HandoffInboxCaseRecord, agent: str) -> HandoffInboxCaseRecord:
+        now = self._now_fn()
+        return record.model_copy(
+            update={
+                "status": HandoffInboxCaseStatus.ACTIVE,
+                "assigned_agent": agent or None,
+                "opened_at": now,
+                "updated_at": now,
+            }
+        )
+
+    def _activate_for_agent(self, record: HandoffInboxCaseRecord, agent: str) -> HandoffInboxCaseRecord:
+        return self._persist_case(self._activated(record, agent))
+
+    @FIRESTORE_INBOX_SECONDS.time(operation="assign_cases")
+    def _assign_in_transaction(
+        self,
+        plan: Callable[[list[HandoffInboxCaseRecord]], list[HandoffInboxCaseRecord]],
+    ) -> list[HandoffInboxCaseRecord]:
+        """
+        Lee los casos abiertos, calcula la carga y escribe lo que devuelve `plan` en una
+        sola transacción. Así dos handoffs concurrentes no superan la capacidad
+        de un agente ni dos instancias promueven el mismo caso de la cola.
+        """
+        client = self._get_firestore_client()
+        assignment_ref = self._agents_collection().document(ASSIGNMENT_DOCUMENT_ID)
+        firestore = load_firestore()
+
+        @firestore.transactional
+        def _assign(transaction) -> list[HandoffInboxCaseRecord]:
+            assignment = self._snapshot_payload(assignment_ref.get(transaction=transaction)) or {}
+            records = [self._with_last_interaction(record) for record in plan(self._list_unclosed_case_records(transaction))]
+            for record in records:
+                transaction.set(self._cases_collection().document(record.case_id), record.model_dump(mode="json"))
+            if records:
+                transaction.set(
+                    assignment_ref,
+                    {"version": int(assignment.get("version") or 0) + 1, "updated_at": self._now_fn()},
+                )
+            return records
+
+        with self._assignment_lock:
+            return _assign(client.transaction())
+
     @staticmethod
     def _derive_case_last_interaction_at(record: HandoffInboxCaseRecord) -> datetime:
         candidates = [record.created_at]
@@ -271,9 +369,11 @@ class HandoffInboxService:
                 **record.model_dump(mode="python"),
                 "is_active": record.status == HandoffInboxCaseStatus.ACTIVE,
                 "queue_position": queue_position,
+                "assigned_agent": self._case_agent(record) or None,
             }
         )
 
+    @FIRESTORE_INBOX_SECONDS.time(operation="list_messages")
     def _iter_case_messages(self, case_id: str) -> list[HandoffInboxMessageRecord]:
         messages = []
         for snapshot in self._messages_collection(case_id).stream():
@@ -283,6 +383,7 @@ class HandoffInboxService:
             messages.append(HandoffInboxMessageRecord.model_validate(payload))
         return messages
 
+    @FIRESTORE_INBOX_SECONDS.time(operation="list_outbox")
     def _iter_case_outbox(self, case_id: str) -> list[HandoffInboxOutboxRecord]:
         outbox_records = []
         for snapshot in self._outbox_collection(case_id).stream():
@@ -292,23 +393,52 @@ class HandoffInboxService:
             outbox_records.append(HandoffInboxOutboxRecord.model_validate(payload))
         return outbox_records
 
-    def _promote_oldest_queued_case(self) -> Optional[HandoffInboxCaseRecord]:
-        queued_cases = [
-            record
-            for record in self._list_case_records()
-            if record.status == HandoffInboxCaseStatus.QUEUED
-        ]
-        queued_cases.sort(key=lambda item: (item.created_at, item.case_id))
-        if not queued_cases:
-            return None
-        now = self._now_fn()
-        next_case = queued_cases[0].model_copy(
-            update={
-                "status": HandoffInboxCaseStatus.ACTIVE,
-                "updated_at": now,
-            }
+    def _assign_queued_cases(self) -> list[HandoffInboxCaseRecord]:
+        # Fuera de `_plan`: Firestore puede reintentar la transacción y repetiría la query
+        paused = self.paused_agents()
+
+        def _plan(records: list[HandoffInboxCaseRecord]) -> list[HandoffInboxCaseRecord]:
+            loads = self._agent_loads(records)
+            queued_cases = [record for record in records if record.status == HandoffInboxCaseStatus.QUEUED]
+            queued_cases.sort(key=lambda item: (item.created_at, item.case_id))
+            promoted = []
+            for record in queued_cases:
+                agent = self._scheduler.pick_agent(record.tipo_consulta, loads, paused=paused)
+                if agent is None:
+                    continue
+                loads[agent] = loads.get(agent, 0) + 1
+                promoted.append(self._activated(record, agent))
+            return promoted
+
+        return self._assign_in_transaction(_plan)
+
+    def assign_queued_cases(self) -> list[HandoffInboxCaseProjection]:
+        """Reparte la cola entre los agentes con lugar libre (p. ej. al volver de /pausa)."""
+        promoted = self._assign_queued_cases()
+        if not promoted:
+            return []
+        ordered_ids = [record.case_id for record in self._list_open_case_records()]
+        return [self._project_case(record, ordered_open_case_ids=ordered_ids) for record in promoted]
+
+    def agent_loads(self) -> dict[str, int]:
+        return self._agent_loads(self._list_case_records())
+
+    def set_agent_available(self, agent_phone: str, available: bool) -> None:
+        """/pausa y /disponible: se guarda en Firestore para que lo vean todas las instancias."""
+        agent = normalize_agent_phone(agent_phone)
+        self._agents_collection().document(agent).set(
+            {"agent": agent, "available": available, "updated_at": self._now_fn()},
+            merge=True,
         )
-        return self._persist_case(next_case)
+        logger.info("handoff_agent_availability agent=%s available=%s", agent, available)
+
+    def paused_agents(self) -> frozenset[str]:
+        paused = set()
+        for snapshot in self._agents_collection().where("available", "==", False).stream():
+            payload = self._snapshot_payload(snapshot)
+            if payload and payload.get("agent"):
+                paused.add(payload["agent"])
+        return frozenset(paused)
 
     def get_open_case_for_client(self, client_phone: str) -> Optional[HandoffInboxCaseProjection]:
         normalized_phone = self._normalize_text(client_phone)
@@ -332,24 +462,42 @@ class HandoffInboxService:
             return existing
 
         now = self._now_fn()
-        has_active_case = any(
-            record.status == HandoffInboxCaseStatus.ACTIVE for record in self._list_case_records()
-        )
-        status = HandoffInboxCaseStatus.QUEUED if has_active_case else HandoffInboxCaseStatus.ACTIVE
-        record = HandoffInboxCaseRecord.model_validate(
-            {
-                "case_id": self._case_id_factory(),
-                "client_phone": self._normalize_text(client_phone),
-                "client_name": self._normalize_text(client_name) or None,
-                "tipo_consulta": self._normalize_text(tipo_consulta) or None,
-                "status": status,
-                "handoff_context": self._normalize_text(handoff_context) or None,
-                "created_at": now,
-                "last_interaction_at": now,
-                "updated_at": now,
-            }
-        )
-        self._persist_case(record)
+        normalized_phone = self._normalize_text(client_phone)
+        normalized_tipo = self._normalize_text(tipo_consulta) or None
+        paused = self.paused_agents()
+        case_id = self._case_id_factory()
+
+        def _plan(records: list[HandoffInboxCaseRecord]) -> list[HandoffInboxCaseRecord]:
+            if any(
+                record.client_phone == normalized_phone and record.status != HandoffInboxCaseStatus.CLOSED
+                for record in records
+            ):
+                # Otra instancia abrió el caso del cliente mientras tanto
+                return []
+            agent = self._scheduler.pick_agent(normalized_tipo, self._agent_loads(records), paused=paused)
+            status = HandoffInboxCaseStatus.QUEUED if agent is None else HandoffInboxCaseStatus.ACTIVE
+            return [
+                HandoffInboxCaseRecord.model_validate(
+                    {
+                        "case_id": case_id,
+                        "client_phone": normalized_phone,
+                        "client_name": self._normalize_text(client_name) or None,
+                        "tipo_consulta": normalized_tipo,
+                        "status": status,
+                        "assigned_agent": agent or None,
+                        "opened_at": now if agent is not None else None,
+                        "handoff_context": self._normalize_text(handoff_context) or None,
+                        "created_at": now,
+                        "last_interaction_at": now,
+                        "updated_at": now,
+                    }
+                )
+            ]
+
+        created = self._assign_in_transaction(_plan)
+        if not created:
+            return self.get_open_case_for_client(client_phone)
+        record = created[0]
         ordered = self._list_open_case_records()
         return self._project_case(record, ordered_open_case_ids=[item.case_id for item in ordered])
 
@@ -422,7 +570,9 @@ class HandoffInboxService:
         ordered = self._list_open_case_records()
         projection = self._project_case(record, ordered_open_case_ids=[item.case_id for item in ordered])
         messages = []
-        for snapshot in self._messages_collection(case_id).stream():
+        with FIRESTORE_INBOX_SECONDS.time(operation="list_messages"):
+            snapshots = list(self._messages_collection(case_id).stream())
+        for snapshot in snapshots:
             payload = self._snapshot_payload(snapshot)
             if payload is None:
                 continue
@@ -453,6 +603,7 @@ class HandoffInboxService:
         messages_days: Optional[int] = None,
         outbox_days: Optional[int] = None,
         cases_days: Optional[int] = None,
+        cursor: Optional[str] = None,
     ) -> HandoffInboxRetentionResult:
         now = self._now_fn()
         messages_days = int(messages_days or os.getenv("HANDOFF_RETENTION_MESSAGES_DAYS", "3"))
@@ -471,20 +622,29 @@ class HandoffInboxService:
             cutoffs=cutoffs,
         )
 
-        closed_records = [
-            record for record in self._list_case_records()
-            if record.status == HandoffInboxCaseStatus.CLOSED
-        ]
-        closed_records.sort(
-            key=lambda item: (
-                item.closed_at or datetime.max.replace(tzinfo=timezone.utc),
-                item.case_id,
-            )
+        # Solo se leen los casos del lote (uno más para saber si quedan), no toda la colección.
+        # Requiere el índice compuesto status + closed_at + case_id (firestore.indexes.json)
+        query = (
+            self._cases_collection()
+            .where("status", "==", HandoffInboxCaseStatus.CLOSED.value)
+            .order_by("closed_at")
+            .order_by("case_id")
         )
+        if cursor:
+            # Corrida incremental: se retoma después del último caso revisado
+            closed_at, _, case_id = cursor.rpartition("|")
+            query = query.start_after({"closed_at": closed_at or None, "case_id": case_id})
+        payloads = [
+            payload
+            for payload in (self._snapshot_payload(snapshot) for snapshot in query.limit(resolved_batch_limit + 1).stream())
+            if payload is not None
+        ]
 
-        for record in closed_records:
-            if result.cases_scanned >= resolved_batch_limit:
+        for index, payload in enumerate(payloads):
+            if index >= resolved_batch_limit:
+                result.next_cursor = self._format_retention_cursor(payloads[index - 1])
                 break
+            record = HandoffInboxCaseRecord.model_validate(payload)
             result.cases_scanned += 1
             if record.closed_at is None:
                 result.cases_skipped_missing_closed_at += 1
@@ -513,6 +673,11 @@ class HandoffInboxService:
 
         return result
 
+    @staticmethod
+    def _format_retention_cursor(payload: dict) -> str:
+        # Valores tal como están guardados: es el mismo orden que usa la query
+        return f"{payload.get('closed_at') or ''}|{payload.get('case_id') or ''}"
+
     def auto_close_inactive_cases(
         self,
         *,
@@ -636,7 +801,8 @@ class HandoffInboxService:
                 "updated_at": now,
             }
         )
-        self._outbox_collection(case_id).document(outbox.outbox_id).set(outbox.model_dump(mode="json"))
+        with FIRESTORE_INBOX_SECONDS.time(operation="write_outbox"):
+            self._outbox_collection(case_id).document(outbox.outbox_id).set(outbox.model_dump(mode="json"))
         return outbox
 
     def update_outbox_status(
@@ -647,7 +813,8 @@ class HandoffInboxService:
         status: HandoffInboxOutboxStatus,
         error_message: Optional[str] = None,
     ) -> HandoffInboxOutboxRecord:
-        snapshot = self._outbox_collection(case_id).document(outbox_id).get()
+        with FIRESTORE_INBOX_SECONDS.time(operation="load_outbox"):
+            snapshot = self._outbox_collection(case_id).document(outbox_id).get()
         payload = self._snapshot_payload(snapshot)
         if payload is None:
             raise HandoffInboxNotFoundError(f"Handoff outbox record not found: {outbox_id}")
@@ -659,7 +826,8 @@ class HandoffInboxService:
                 "error_message": self._normalize_text(error_message) or None,
             }
         )
-        self._outbox_collection(case_id).document(outbox_id).set(updated.model_dump(mode="json"))
+        with FIRESTORE_INBOX_SECONDS.time(operation="write_outbox"):
+            self._outbox_collection(case_id).document(outbox_id).set(updated.model_dump(mode="json"))
         return updated
 
     def close_case(self, case_id: str, *, actor_email: Optional[str] = None) -> HandoffInboxCaseProjection:
@@ -680,30 +848,60 @@ class HandoffInboxService:
         )
         self._persist_case(updated)
         if record.status == HandoffInboxCaseStatus.ACTIVE:
-            self._promote_oldest_queued_case()
+            self._assign_queued_cases()
         return self._project_case(updated, ordered_open_case_ids=None)
 
-    def advance_next(self) -> Optional[HandoffInboxCaseProjection]:
-        ordered = self._list_open_case_records()
-        active = next((record for record in ordered if record.status == HandoffInboxCaseStatus.ACTIVE), None)
-        queued = [record for record in ordered if record.status == HandoffInboxCaseStatus.QUEUED]
-        if active is None:
-            if queued:
-                promoted = self._promote_oldest_queued_case()
-                if promoted is None:
-                    return None
-                refreshed = self._list_open_case_records()
-                return self._project_case(promoted, ordered_open_case_ids=[item.case_id for item in refreshed])
-            return None
-        if not queued:
-            return self._project_case(active, ordered_open_case_ids=[item.case_id for item in ordered])
+    def advance_next(self, agent_phone: Optional[str] = None) -> Optional[HandoffInboxCaseProjection]:
+        """
+        /next de un agente: rota el foco entre sus casos activos o, si tiene
+        uno solo, lo devuelve a la cola y toma el caso en espera más viejo
+        que puede atender. Un agente en pausa no toma casos de la cola.
+        """
+        agent = self._scheduler.resolve_agent(agent_phone) if agent_phone else None
+        agent = agent or self._scheduler.primary_agent()
+        paused = self.paused_agents()
+        focus: list[HandoffInboxCaseRecord] = []
+
+        def _plan(records: list[HandoffInboxCaseRecord]) -> list[HandoffInboxCaseRecord]:
+            # Firestore puede reintentar la transacción: el foco se recalcula en cada intento
+            focus.clear()
+            ordered = self._order_open_records(records)
+            mine = [record for record in ordered if self._case_agent(record) == agent]
+            queued = [] if agent in paused else [
+                record
+                for record in ordered
+                if record.status == HandoffInboxCaseStatus.QUEUED and self._scheduler.can_handle(agent, record.tipo_consulta)
+            ]
+            now = self._now_fn()
+            if not mine:
+                if not queued or self._agent_loads(records).get(agent, 0) >= self._scheduler.capacity(agent):
+                    return []
+                focus.append(self._activated(queued[0], agent))
+                return list(focus)
+
+            current = mine[0]
+            if len(mine) > 1:
+                # El caso en foco pasa al final de los del agente
+                focus.append(mine[1])
+                return [current.model_copy(update={"opened_at": now, "updated_at": now})]
+            if not queued:
+                focus.append(current)
+                return []
+            demoted = current.model_copy(
+                update={
+                    "status": HandoffInboxCaseStatus.QUEUED,
+                    "assigned_agent": None,
+                    "opened_at": None,
+                    "updated_at": now,
+                }
+            )
+            focus.append(self._activated(queued[0], agent))
+            return [demoted, focus[0]]
 
-        now = self._now_fn()
-        demoted = active.model_copy(update={"status": HandoffInboxCaseStatus.QUEUED, "updated_at": now})
-        self._persist_case(demoted)
-        next_queued = queued[0]
-        promoted = next_queued.model_copy(update={"status": HandoffInboxCaseStatus.ACTIVE, "updated_at": self._now_fn()})
-        self._persist_case(promoted)
+        written = {record.case_id: record for record in self._assign_in_transaction(_plan)}
+        if not focus:
+            return None
+        promoted = written.get(focus[0].case_id, focus[0])
         refreshed = self._list_open_case_records()
         return self._project_case(promoted, ordered_open_case_ids=[item.case_id for item in refreshed])
 
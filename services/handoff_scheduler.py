@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import AbstractSet, Dict, FrozenSet, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# least_loaded: cualquier agente disponible | skills: primero los que atienden ese tipo_consulta
+HANDOFF_ASSIGNMENT_STRATEGY = os.getenv("HANDOFF_ASSIGNMENT_STRATEGY", "least_loaded").strip().lower()
+HANDOFF_AGENT_CAPACITY = max(1, int(os.getenv("HANDOFF_AGENT_CAPACITY", "1")))
+
+
+def normalize_agent_phone(phone: Optional[str]) -> str:
+    """Formato canónico del número de agente: `+<dígitos>` (Meta entrega el `from` sin +)."""
+    digits = (phone or "").replace("whatsapp:", "").replace("+", "").replace(" ", "").strip()
+    return f"+{digits}" if digits else ""
+
+
+@dataclass(frozen=True)
+class HandoffAgent:
+    phone: str
+    capacity: int = HANDOFF_AGENT_CAPACITY
+    # Valores de TipoConsulta que atiende; vacío = atiende todo
+    skills: FrozenSet[str] = field(default_factory=frozenset)
+
+    def handles(self, tipo_consulta: Optional[str]) -> bool:
+        return not self.skills or (tipo_consulta or "") in self.skills
+
+
+def parse_agents(raw: str, default_capacity: int = HANDOFF_AGENT_CAPACITY) -> List[HandoffAgent]:
+    """
+    Parsea AGENT_WHATSAPP_NUMBERS: entradas separadas por coma con formato
+    `telefono[:capacidad][:skill|skill]`, p. ej.
+    `+5491111111111:2:presupuesto|urgencia,+5492222222222`.
+    """
+    agents: List[HandoffAgent] = []
+    for entry in (raw or "").split(","):
+        parts = [part.strip() for part in entry.strip().split(":")]
+        phone = normalize_agent_phone(parts[0] if parts else "")
+        if not phone:
+            continue
+        capacity = default_capacity
+        skills: FrozenSet[str] = frozenset()
+        for part in parts[1:]:
+            if not part:
+                continue
+            if part.isdigit():
+                capacity = max(1, int(part))
+            else:
+                skills = frozenset(skill.strip().lower() for skill in part.split("|") if skill.strip())
+        if any(agent.phone == phone for agent in agents):
+            logger.warning("Agente duplicado en AGENT_WHATSAPP_NUMBERS: %s", phone)
+            continue
+        agents.append(HandoffAgent(phone=phone, capacity=capacity, skills=skills))
+    return agents
+
+
+class HandoffScheduler:
+    """
+    Registro de agentes humanos y reglas de asignación de casos de handoff.
+
+    No guarda estado: la carga de cada agente (casos ACTIVE asignados) y los
+    agentes en /pausa los lee el inbox de Firestore, compartido entre
+    instancias, y se los pasa a `pick_agent`.
+    """
+
+    def __init__(self, agents: Optional[Iterable[HandoffAgent]] = None, strategy: str = HANDOFF_ASSIGNMENT_STRATEGY):
+        self.agents: Dict[str, HandoffAgent] = {}
+        for agent in agents or []:
+            self.agents[normalize_agent_phone(agent.phone)] = agent
+        if strategy not in ("least_loaded", "skills"):
+            logger.warning("HANDOFF_ASSIGNMENT_STRATEGY desconocida: %s (se usa least_loaded)", strategy)
+            strategy = "least_loaded"
+        self.strategy = strategy
+        self._last_assigned_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "HandoffScheduler":
+        agents = parse_agents(os.getenv("AGENT_WHATSAPP_NUMBERS", ""))
+        # AGENT_WHATSAPP_NUMBER (configuración histórica de un solo agente) queda como agente principal
+        primary = normalize_agent_phone(os.getenv("AGENT_WHATSAPP_NUMBER", ""))
+        if primary:
+            listed = next((agent for agent in agents if agent.phone == primary), None)
+            agents = [listed or HandoffAgent(phone=primary)] + [agent for agent in agents if agent.phone != primary]
+        if not agents:
+            logger.warning("Sin agentes configurados (AGENT_WHATSAPP_NUMBERS / AGENT_WHATSAPP_NUMBER)")
+        return cls(agents)
+
+    def primary_agent(self) -> str:
+        """Primer agente configurado; recibe los casos históricos sin agente asignado."""
+        return next(iter(self.agents), "")
+
+    def resolve_agent(self, phone: Optional[str]) -> Optional[str]:
+        normalized = normalize_agent_phone(phone)
+        return normalized if normalized in self.agents else None
+
+    def get_agent(self, phone: Optional[str]) -> Optional[HandoffAgent]:
+        return self.agents.get(normalize_agent_phone(phone))
+
+    def capacity(self, phone: Optional[str]) -> int:
+        agent = self.get_agent(phone)
+        return agent.capacity if agent is not None else HANDOFF_AGENT_CAPACITY
+
+    def can_handle(self, phone: Optional[str], tipo_consulta: Optional[str]) -> bool:
+        agent = self.get_agent(phone)
+        return agent is None or self.strategy != "skills" or agent.handles(tipo_consulta)
+
+    def _candidates(self, tipo_consulta: Optional[str], paused: AbstractSet[str]) -> List[HandoffAgent]:
+        agents = list(self.agents.values()) or [HandoffAgent(phone="", capacity=1)]
+        online = [agent for agent in agents if agent.phone not in paused]
+        if self.strategy == "skills":
+            specialists = [agent for agent in online if agent.skills and agent.handles(tipo_consulta)]
+            generalists = [agent for agent in online if not agent.skills]
+            # Los especialistas tienen prioridad; los generalistas cubren el resto
+            return specialists + generalists
+        return online
+
+    def pick_agent(
+        self,
+        tipo_consulta: Optional[str],
+        loads: Dict[str, int],
+        *,
+        respect_capacity: bool = True,
+        paused: AbstractSet[str] = frozenset(),
+    ) -> Optional[str]:
+        """
+        Agente que debe tomar un caso de `tipo_consulta` dada la carga actual
+        ({agente: casos ACTIVE}) y los agentes en pausa. None si nadie
+        disponible tiene lugar. Desempata por el que hace más tiempo no recibe un caso.
+        """
+        candidates = self._candidates(tipo_consulta, paused)
+        if respect_capacity:
+            candidates = [agent for agent in candidates if loads.get(agent.phone, 0) < agent.capacity]
+        if not candidates:
+            return None
+        if self.strategy == "skills" and candidates[0].skills:
+            candidates = [agent for agent in candidates if agent.skills]
+        chosen = min(
+            candidates,
+            key=lambda agent: (
+                loads.get(agent.phone, 0) / agent.capacity,
+                self._last_assigned_at.get(agent.phone, 0.0),
+            ),
+        )
+        if respect_capacity:
+            with self._lock:
+                self._last_assigned_at[chosen.phone] = time.monotonic()
+        return chosen.phone
+
+    def status(self, loads: Optional[Dict[str, int]] = None, paused: AbstractSet[str] = frozenset()) -> List[dict]:
+        loads = loads or {}
+        return [
+            {
+                "agent": agent.phone,
+                "capacity": agent.capacity,
+                "skills": sorted(agent.skills),
+                "available": agent.phone not in paused,
+                "active_cases": loads.get(agent.phone, 0),
+            }
+            for agent in self.agents.values()
+        ]
+
+
+handoff_scheduler = HandoffScheduler.from_env()
@@ -0,0 +1,566 @@
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from google.api_core.exceptions import AlreadyExists, NotFound, ServiceUnavailable
+except Exception:
+    AlreadyExists = None
+    NotFound = None
+    ServiceUnavailable = None
+
+# Ruta de un documento: (colección, doc, subcolección, doc, ...)
+DocPath = Tuple[str, ...]
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+
+
+def _copy_tree(value):
+    # Los documentos son árboles de dict/list con hojas inmutables: más barato que deepcopy
+    if isinstance(value, dict):
+        return {key: _copy_tree(item) if isinstance(item, (dict, list)) else item for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_tree(item) if isinstance(item, (dict, list)) else item for item in value]
+    return value
+
+
+def _already_exists(path: str) -> Exception:
+    message = f"Document already exists: {path}"
+    return AlreadyExists(message) if AlreadyExists is not None else ValueError(message)
+
+
+def _not_found(path: str) -> Exception:
+    message = f"No document to update: {path}"
+    return NotFound(message) if NotFound is not None else KeyError(message)
+
+
+def _unavailable(operation: str) -> Exception:
+    message = f"Falla inyectada en {operation}"
+    return ServiceUnavailable(message) if ServiceUnavailable is not None else RuntimeError(message)
+
+
+def _array_contains_any(left, right) -> bool:
+    return isinstance(left, list) and any(item in left for item in right)
+
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": lambda left, right: left == right,
+    "!=": lambda left, right: left != right,
+    "<": lambda left, right: left < right,
+    "<=": lambda left, right: left <= right,
+    ">": lambda left, right: left > right,
+    ">=": lambda left, right: left >= right,
+    "in": lambda left, right: left in right,
+    "not-in": lambda left, right: left not in right,
+    "array_contains": lambda left, right: isinstance(left, list) and right in left,
+    "array-contains": lambda left, right: isinstance(left, list) and right in left,
+    "array_contains_any": _array_contains_any,
+    "array-contains-any": _array_contains_any,
+}
+
+_MISSING = object()
+
+
+def _field(data: dict, field_path: str):
+    current: Any = data
+    for part in field_path.split("."):
+        if not isinstance(current, dict) or part not in current:
+            return _MISSING
+        current = current[part]
+    return current
+
+
+def _sort_value(value):
+    # Firestore ordena primero por tipo; alcanza con separar None del resto
+    return (value is not None, value)
+
+
+class InMemorySnapshot:
+    def __init__(self, reference: "InMemoryDocumentReference", data: Optional[dict], update_time: Optional[datetime] = None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        # Referencia al documento guardado: las escrituras lo reemplazan, nunca lo mutan
+        self._data = data
+
+    def to_dict(self) -> Optional[dict]:
+        return _copy_tree(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        value = _field(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return _copy_tree(value)
+
+
+class _Watch:
+    def __init__(self, client: "InMemoryFirestoreClient", target, callback):
+        self._client = client
+        self._target = target
+        self._callback = callback
+        self._last: Dict[str, dict] = {}
+        self._started = False
+
+    def _notify(self) -> None:
+        if isinstance(self._target, InMemoryDocumentReference):
+            snapshots = [self._target._snapshot()]
+        else:
+            snapshots = self._target._run()
+        current = {snapshot.reference.path: snapshot._data for snapshot in snapshots if snapshot.exists}
+        changes = []
+        for snapshot in snapshots:
+            if not snapshot.exists:
+                continue
+            previous = self._last.get(snapshot.reference.path, _MISSING)
+            if previous is _MISSING:
+                changes.append(DocumentChange("ADDED", snapshot))
+            elif previous != snapshot._data:
+                changes.append(DocumentChange("MODIFIED", snapshot))
+        for path in self._last.keys() - current.keys():
+            reference = self._client.document(path)
+            changes.append(DocumentChange("REMOVED", InMemorySnapshot(reference, None)))
+        self._last = current
+        # La primera notificación llega siempre (estado inicial), después solo con cambios
+        if changes or not self._started:
+            self._started = True
+            self._callback(snapshots, changes, datetime.now(timezone.utc))
+
+    def unsubscribe(self) -> None:
+        self._client._watches.discard(self)
+
+
+class DocumentChange:
+    def __init__(self, type_name: str, document: InMemorySnapshot):
+        self.type = type_name
+        self.document = document
+
+
+class InMemoryDocumentReference:
+    def __init__(self, client: "InMemoryFirestoreClient", path: DocPath):
+        self._client = client
+        self._path = path
+        self.id = path[-1]
+
+    @property
+    def path(self) -> str:
+        return "/".join(self._path)
+
+    @property
+    def parent(self) -> "InMemoryCollectionReference":
+        return InMemoryCollectionReference(self._client, self._path[:-1])
+
+    def collection(self, name: str) -> "InMemoryCollectionReference":
+        return InMemoryCollectionReference(self._client, self._path + (name,))
+
+    def _snapshot(self) -> InMemorySnapshot:
+        with self._client._lock:
+            data = self._client._docs.get(self._path)
+            update_time = self._client._update_times.get(self._path)
+            return InMemorySnapshot(self, data, update_time)
+
+    def get(self, field_paths=None, transaction=None, **kwargs) -> InMemorySnapshot:
+        self._client._rpc("get")
+        return self._snapshot()
+
+    def set(self, document_data: dict, merge: bool = False) -> None:
+        self._client._rpc("set")
+        self._client._apply([("set", self._path, document_data, merge)])
+
+    def create(self, document_data: dict) -> None:
+        self._client._rpc("create")
+        self._client._apply([("create", self._path, document_data, False)])
+
+    def update(self, field_updates: dict, **kwargs) -> None:
+        self._client._rpc("update")
+        self._client._apply([("update", self._path, field_updates, False)])
+
+    def delete(self, **kwargs) -> None:
+        self._client._rpc("delete")
+        self._client._apply([("delete", self._path, None, False)])
+
+    def on_snapshot(self, callback) -> _Watch:
+        return self._client._watch(self, callback)
+
+
+class InMemoryQuery:
+    def __init__(
+        self,
+        client: "InMemoryFirestoreClient",
+        path: DocPath,
+        filters: Tuple = (),
+        orders: Tuple = (),
+        limit_count: Optional[int] = None,
+        cursor: Optional[Tuple[Any, bool]] = None,
+    ):
+        self._client = client
+        self._path = path
+        self._filters = filters
+        self._orders = orders
+        self._limit = limit_count
+        self._cursor = cursor
+
+    def _copy(self, **changes) -> "InMemoryQuery":
+        state = {
+            "filters": self._filters,
+            "orders": self._orders,
+            "limit_count": self._limit,
+            "cursor": self._cursor,
+        }
+        state.update(changes)
+        return InMemoryQuery(self._client, self._path, **state)
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None, *, filter=None) -> "InMemoryQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        if op_string not in _OPERATORS:
+            raise ValueError(f"Operador no soportado: {op_string}")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "InMemoryQuery":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "InMemoryQuery":
+        return self._copy(limit_count=count)
+
+    def start_after(self, document_fields_or_snapshot) -> "InMemoryQuery":
+        return self._copy(cursor=(document_fields_or_snapshot, False))
+
+    def start_at(self, document_fields_or_snapshot) -> "InMemoryQuery":
+        return self._copy(cursor=(document_fields_or_snapshot, True))
+
+    def _matches(self, data: dict) -> bool:
+        for field_path, op_string, value in self._filters:
+            current = _field(data, field_path)
+            if current is _MISSING:
+                return False
+            try:
+                if not _OPERATORS[op_string](current, value):
+                    return False
+            except TypeError:
+                return False
+        # Como en Firestore, los documentos sin el campo de orden quedan afuera
+        return all(_field(data, field_path) is not _MISSING for field_path, _ in self._orders)
+
+    def _sort_key(self, path: DocPath, data: dict) -> tuple:
+        return tuple(_sort_value(_field(data, field_path)) for field_path, _ in self._orders) + (path[-1],)
+
+    def _cursor_key(self) -> Optional[tuple]:
+        if self._cursor is None:
+            return None
+        cursor, _ = self._cursor
+        if isinstance(cursor, InMemorySnapshot):
+            return self._sort_key(cursor.reference._path, cursor._data or {})
+        if isinstance(cursor, dict):
+            return tuple(_sort_value(cursor.get(field_path)) for field_path, _ in self._orders)
+        values = cursor if isinstance(cursor, (list, tuple)) else (cursor,)
+        return tuple(_sort_value(value) for value in values)
+
+    def _run(self) -> List[InMemorySnapshot]:
+        depth = len(self._path) + 1
+        with self._client._lock:
+            rows = [
+                (path, data, self._client._update_times.get(path))
+                for path, data in self._client._docs.items()
+                if len(path) == depth and path[:-1] == self._path and self._matches(data)
+            ]
+
+        # Orden estable campo por campo (último criterio primero), con el id de documento al final
+        rows.sort(key=lambda row: row[0][-1])
+        for index in range(len(self._orders) - 1, -1, -1):
+            field_path, direction = self._orders[index]
+            rows.sort(key=lambda row: _sort_value(_field(row[1], field_path)), reverse=direction == DESCENDING)
+
+        cursor_key = self._cursor_key()
+        if cursor_key is not None:
+            inclusive = self._cursor[1]
+            width = len(cursor_key)
+            skipped = 0
+            for path, data, _ in rows:
+                key = self._sort_key(path, data)[:width]
+                if self._before_cursor(key, cursor_key, inclusive):
+                    skipped += 1
+                else:
+                    break
+            rows = rows[skipped:]
+        if self._limit is not None:
+            rows = rows[: self._limit]
+        return [InMemorySnapshot(InMemoryDocumentReference(self._client, path), data, update_time) for path, data, update_time in rows]
+
+    def _before_cursor(self, key: tuple, cursor_key: tuple, inclusive: bool) -> bool:
+        for index, (value, bound) in enumerate(zip(key, cursor_key)):
+            descending = index < len(self._orders) and self._orders[index][1] == DESCENDING
+            if value == bound:
+                continue
+            return (value > bound) if descending else (value < bound)
+        return not inclusive
+
+    def stream(self, transaction=None, **kwargs) -> Iterator[InMemorySnapshot]:
+        self._client._rpc("run_query")
+        return iter(self._run())
+
+    def get(self, transaction=None, **kwargs) -> List[InMemorySnapshot]:
+        return list(self.stream(transaction=transaction))
+
+    def on_snapshot(self, callback) -> _Watch:
+        return self._client._watch(self, callback)
+
+
+class InMemoryCollectionReference(InMemoryQuery):
+    def __init__(self, client: "InMemoryFirestoreClient", path: DocPath):
+        super().__init__(client, path)
+        self.id = path[-1]
+
+    def document(self, document_id: Optional[str] = None) -> InMemoryDocumentReference:
+        return InMemoryDocumentReference(self._client, self._path + (document_id or uuid.uuid4().hex[:20],))
+
+    def add(self, document_data: dict, document_id: Optional[str] = None):
+        reference = self.document(document_id)
+        reference.create(document_data)
+        return datetime.now(timezone.utc), reference
+
+    def list_documents(self) -> List[InMemoryDocumentReference]:
+        depth = len(self._path) + 1
+        with self._client._lock:
+            paths = sorted(path for path in self._client._docs if len(path) == depth and path[:-1] == self._path)
+        return [InMemoryDocumentReference(self._client, path) for path in paths]
+
+
+class InMemoryWriteBatch:
+    """Escrituras que se aplican juntas en `commit()` (una sola RPC)."""
+
+    def __init__(self, client: "InMemoryFirestoreClient"):
+        self._client = client
+        self._writes: List[tuple] = []
+
+    def set(self, reference: InMemoryDocumentReference, document_data: dict, merge: bool = False) -> None:
+        self._writes.append(("set", reference._path, document_data, merge))
+
+    def create(self, reference: InMemoryDocumentReference, document_data: dict) -> None:
+        self._writes.append(("create", reference._path, document_data, False))
+
+    def update(self, reference: InMemoryDocumentReference, field_updates: dict, **kwargs) -> None:
+        self._writes.append(("update", reference._path, field_updates, False))
+
+    def delete(self, reference: InMemoryDocumentReference, **kwargs) -> None:
+        self._writes.append(("delete", reference._path, None, False))
+
+    def commit(self, **kwargs) -> list:
+        self._client._rpc("commit")
+        writes, self._writes = self._writes, []
+        self._client._apply(writes)
+        return [datetime.now(timezone.utc)] * len(writes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+
+class InMemoryTransaction(InMemoryWriteBatch):
+    """
+    Transacción serializable: toma el lock global del cliente desde `_begin`
+    hasta `_commit` / `_rollback`. Implementa la interfaz que usa
+    `firestore.transactional`, así el código de producción corre sin cambios.
+    """
+
+    _read_only = False
+
+    def __init__(self, client: "InMemoryFirestoreClient", max_attempts: int = 5):
+        super().__init__(client)
+        self._max_attempts = max_attempts
+        self._id: Optional[bytes] = None
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    def _clean_up(self) -> None:
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None) -> None:
+        self._client._rpc("begin_transaction")
+        self._client._lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self) -> list:
+        try:
+            return self.commit()
+        finally:
+            self._release()
+
+    def _rollback(self) -> None:
+        if self._id is None:
+            return
+        self._client._rpc("rollback")
+        self._writes = []
+        self._release()
+
+    def _release(self) -> None:
+        if self._id is not None:
+            self._id = None
+            self._client._lock.release()
+
+    def get(self, ref_or_query, **kwargs):
+        if isinstance(ref_or_query, InMemoryDocumentReference):
+            return iter([ref_or_query.get()])
+        return ref_or_query.stream()
+
+
+class InMemoryFirestoreClient:
+    """
+    Backend en memoria compatible con la parte de `firestore.Client` que usa el
+    bot: colecciones y subcolecciones, where/order_by/limit/start_after,
+    transacciones (`firestore.transactional`), batches y `on_snapshot`.
+
+    Para tests y benchmarks: `rpcs` cuenta cada round trip por operación,
+    `latency_seconds` (global o por operación) simula la red y
+    `fail_next(...)` / `failure_rate` inyectan errores (`ServiceUnavailable`).
+    """
+
+    def __init__(
+        self,
+        database: str = "(default)",
+        *,
+        latency_seconds: float = 0.0,
+        latency_by_operation: Optional[Dict[str, float]] = None,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.database = database
+        self.latency_seconds = latency_seconds
+        self.latency_by_operation = dict(latency_by_operation or {})
+        self.failure_rate = failure_rate
+        self.rpcs: Counter = Counter()
+        self._docs: Dict[DocPath, dict] = {}
+        self._update_times: Dict[DocPath, datetime] = {}
+        # RLock: una transacción abierta puede leer y escribir desde el mismo thread
+        self._lock = threading.RLock()
+        self._counter_lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._pending_failures: Dict[str, List[Exception]] = {}
+        self._watches: set = set()
+
+    # --- API de firestore.Client ---
+
+    def collection(self, *path: str) -> InMemoryCollectionReference:
+        parts = tuple(part for segment in path for part in segment.split("/") if part)
+        if len(parts) % 2 == 0:
+            raise ValueError(f"Ruta de colección inválida: {'/'.join(parts)}")
+        return InMemoryCollectionReference(self, parts)
+
+    def document(self, *path: str) -> InMemoryDocumentReference:
+        parts = tuple(part for segment in path for part in segment.split("/") if part)
+        if len(parts) % 2 != 0:
+            raise ValueError(f"Ruta de documento inválida: {'/'.join(parts)}")
+        return InMemoryDocumentReference(self, parts)
+
+    def batch(self) -> InMemoryWriteBatch:
+        return InMemoryWriteBatch(self)
+
+    def transaction(self, max_attempts: int = 5, **kwargs) -> InMemoryTransaction:
+        return InMemoryTransaction(self, max_attempts=max_attempts)
+
+    def get_all(self, references, **kwargs) -> Iterator[InMemorySnapshot]:
+        self._rpc("batch_get")
+        return iter([reference._snapshot() for reference in references])
+
+    def collections(self) -> List[InMemoryCollectionReference]:
+        with self._lock:
+            names = sorted({path[0] for path in self._docs})
+        return [InMemoryCollectionReference(self, (name,)) for name in names]
+
+    # --- instrumentación ---
+
+    @property
+    def rpc_count(self) -> int:
+        return sum(self.rpcs.values())
+
+    def reset_counters(self) -> None:
+        with self._counter_lock:
+            self.rpcs.clear()
+
+    def fail_next(self, operation: str, error: Optional[Exception] = None, times: int = 1) -> None:
+        """Las próximas `times` llamadas a `operation` (get, set, run_query, commit, ...) fallan."""
+        with self._counter_lock:
+            self._pending_failures.setdefault(operation, []).extend(
+                [error or _unavailable(operation)] * times
+            )
+
+    def _rpc(self, operation: str) -> None:
+        with self._counter_lock:
+            self.rpcs[operation] += 1
+            pending = self._pending_failures.get(operation)
+            injected = pending.pop(0) if pending else None
+            random_failure = self.failure_rate and self._random.random() < self.failure_rate
+        delay = self.latency_by_operation.get(operation, self.latency_seconds)
+        if delay:
+            time.sleep(delay)
+        if injected is not None:
+            raise injected
+        if random_failure:
+            raise _unavailable(operation)
+
+    def _apply(self, writes: List[tuple]) -> None:
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            # Validar todo antes de escribir: un batch falla o se aplica entero
+            for kind, path, _, _ in writes:
+                if kind == "create" and path in self._docs:
+                    raise _already_exists("/".join(path))
+                if kind == "update" and path not in self._docs:
+                    raise _not_found("/".join(path))
+            for kind, path, data, merge in writes:
+                if kind == "delete":
+                    # Igual que Firestore: las subcolecciones no se borran con el documento
+                    self._docs.pop(path, None)
+                    self._update_times.pop(path, None)
+                    continue
+                payload = _copy_tree(data)
+                if kind == "update":
+                    payload = self._merge_fields(self._docs[path], payload)
+                elif kind == "set" and merge and path in self._docs:
+                    payload = self._deep_merge(self._docs[path], payload)
+                self._docs[path] = payload
+                self._update_times[path] = now
+            watches = list(self._watches)
+        for watch in watches:
+            watch._notify()
+
+    @staticmethod
+    def _merge_fields(current: dict, updates: dict) -> dict:
+        merged = _copy_tree(current)
+        for key, value in updates.items():
+            # "a.b" en update() apunta a un campo anidado
+            target = merged
+            parts = key.split(".")
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+        return merged
+
+    @classmethod
+    def _deep_merge(cls, current: dict, updates: dict) -> dict:
+        # set(..., merge=True) combina mapas anidados en vez de reemplazarlos
+        merged = _copy_tree(current)
+        for key, value in updates.items():
+            if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key] = cls._deep_merge(merged[key], value)
+            else:
+                merged[key] = value
+        return merged
+
+    def _watch(self, target, callback) -> _Watch:
+        watch = _Watch(self, target, callback)
+        with self._lock:
+            self._watches.add(watch)
+        watch._notify()
+        return watch
@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+from services.firestore_support import firestore_available, load_firestore
+
+logger = logging.getLogger(__name__)
+
+JOB_RUNNER_ENABLED = os.getenv("JOB_RUNNER_ENABLED", "true").lower() == "true"
+# firestore (un solo líder entre instancias) | local (lock en memoria, una instancia o desarrollo)
+JOB_LEASE_BACKEND = os.getenv("JOB_LEASE_BACKEND", "firestore").strip().lower()
+JOB_LEASES_COLLECTION = os.getenv("JOB_LEASES_COLLECTION", "job-leases").strip() or "job-leases"
+# Fracción del intervalo que se suma/resta al azar para que las instancias no se sincronicen
+JOB_RUNNER_JITTER = float(os.getenv("JOB_RUNNER_JITTER", "0.1"))
+# Mientras corre, el job renueva su lease cada esta fracción del intervalo
+JOB_LEASE_RENEW_FRACTION = 1 / 3
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class JobResult:
+    items: int = 0
+    # Posición desde donde retoma la próxima corrida; None = vuelve a empezar
+    cursor: Optional[str] = None
+
+
+@dataclass
+class PeriodicJob:
+    name: str
+    interval_seconds: float
+    # Recibe el cursor guardado de la corrida anterior. Las funciones síncronas corren en
+    # un thread; las async corren en el event loop (mandan su I/O a threads y solo tocan
+    # el estado runtime de conversaciones desde el loop, igual que los endpoints)
+    run: Callable[[Optional[str]], Union[JobResult, Awaitable[JobResult]]]
+    # False: el job trabaja sobre estado de la instancia y corre en todas, sin lease ni cursor
+    leased: bool = True
+
+
+class LocalJobLeaseStore:
+    """Lease y cursores en memoria: alcanza con una sola instancia (o en desarrollo)."""
+
+    name = "local"
+
+    def __init__(self, now_fn=None):
+        self._now_fn = now_fn or _utc_now
+        self._lock = threading.Lock()
+        self._docs: Dict[str, dict] = {}
+
+    def acquire(self, job: str, holder: str, ttl_seconds: float) -> bool:
+        now = self._now_fn()
+        with self._lock:
+            doc = self._docs.setdefault(job, {})
+            expires_at = doc.get("lease_expires_at")
+            if doc.get("holder") not in (None, holder) and expires_at and expires_at > now:
+                return False
+            doc["holder"] = holder
+            doc["lease_expires_at"] = now + timedelta(seconds=ttl_seconds)
+            return True
+
+    def release(self, job: str, holder: str) -> None:
+        with self._lock:
+            doc = self._docs.get(job, {})
+            if doc.get("holder") == holder:
+                doc["lease_expires_at"] = self._now_fn()
+
+    def load_cursor(self, job: str) -> Optional[str]:
+        with self._lock:
+            return self._docs.get(job, {}).get("cursor")
+
+    def record_run(self, job: str, *, cursor: Optional[str], items: int, duration_ms: float) -> None:
+        with self._lock:
+            self._docs.setdefault(job, {}).update({
+                "cursor": cursor,
+                "last_run_at": self._now_fn(),
+                "last_items": items,
+                "last_duration_ms": round(duration_ms, 1),
+            })
+
+
+class FirestoreJobLeaseStore:
+    """
+    Un documento por job en `JOB_LEASES_COLLECTION` con el lease (holder +
+    vencimiento), el cursor incremental y los datos de la última corrida.
+    El lease se toma en una transacción, así solo una instancia corre cada job.
+    """
+
+    name = "firestore"
+
+    def __init__(self, collection_name: str = JOB_LEASES_COLLECTION, database: Optional[str] = None, firestore_client=None, now_fn=None):
+        self.collection_name = collection_name
+        self.database = (database or os.getenv("CHATBOT_FIRESTORE_DATABASE", "(default)")).strip() or "(default)"
+        if self.database == "default":
+            self.database = "(default)"
+        self._firestore_client = firestore_client
+        self._now_fn = now_fn or _utc_now
+
+    def _get_firestore_client(self):
+        if self._firestore_client is not None:
+            return self._firestore_client
+        self._firestore_client = load_firestore().Client(database=self.database)
+        return self._firestore_client
+
+    def _document(self, job: str):
+        return self._get_firestore_client().collection(self.collection_name).document(job)
+
+    def acquire(self, job: str, holder: str, ttl_seconds: float) -> bool:
+        client = self._get_firestore_client()
+        document = self._document(job)
+        now = self._now_fn()
+        firestore = load_firestore()
+
+        @firestore.transactional
+        def _take(transaction) -> bool:
+            snapshot = document.get(transaction=transaction)
+            payload = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            expires_at = payload.get("lease_expires_at")
+            if payload.get("holder") not in (None, holder) and expires_at and expires_at > now:
+                return False
+            transaction.set(
+                document,
+                {"holder": holder, "lease_expires_at": now + timedelta(seconds=ttl_seconds)},
+                merge=True,
+            )
+            return True
+
+        return _take(client.transaction())
+
+    def release(self, job: str, holder: str) -> None:
+        document = self._document(job)
+        snapshot = document.get()
+        if snapshot.exists and (snapshot.to_dict() or {}).get("holder") == holder:
+            document.set({"lease_expires_at": self._now_fn()}, merge=True)
+
+    def load_cursor(self, job: str) -> Optional[str]:
+        snapshot = self._document(job).get()
+        if not snapshot.exists:
+            return None
+        return (snapshot.to_dict() or {}).get("cursor")
+
+    def record_run(self, job: str, *, cursor: Optional[str], items: int, duration_ms: float) -> None:
+        self._document(job).set({
+            "cursor": cursor,
+            "last_run_at": self._now_fn(),
+            "last_items": items,
+            "last_duration_ms": round(duration_ms, 1),
+        }, merge=True)
+
+
+def build_job_lease_store(kind: str = JOB_LEASE_BACKEND):
+    if kind == "firestore":
+        if firestore_available():
+            return FirestoreJobLeaseStore()
+        logger.warning("google-cloud-firestore no instalado: los leases de jobs quedan en memoria")
+    elif kind != "local":
+        logger.warning("JOB_LEASE_BACKEND desconocido: %s (se usa local)", kind)
+    return LocalJobLeaseStore()
+
+
+class JobRunner:
+    """
+    Corre los jobs de mantenimiento (limpieza de checkpoints, autoclose,
+    retención, TTL sweep) dentro del proceso, sin esperar a Cloud Scheduler.
+
+    Cada job tiene su propia task de asyncio con intervalo ± jitter. Antes de
+    correr toma el lease del job (válido por un intervalo) y lo renueva
+    mientras corre, así con varias instancias una sola lo ejecuta aunque la
+    corrida dure más que el intervalo; el cursor y la duración de cada corrida
+    quedan en el lease store. Los jobs sin lease (`leased=False`) corren en
+    cada instancia.
+    """
+
+    def __init__(self, lease_store=None, jitter: float = JOB_RUNNER_JITTER, holder: Optional[str] = None):
+        self._lease_store = lease_store
+        self.jitter = max(0.0, jitter)
+        self.holder = holder or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, PeriodicJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    @property
+    def lease_store(self):
+        if self._lease_store is None:
+            self._lease_store = build_job_lease_store()
+        return self._lease_store
+
+    def register(
+        self,
+        name: str,
+        interval_seconds: float,
+        run: Callable[[Optional[str]], Union[JobResult, Awaitable[JobResult]]],
+        *,
+        leased: bool = True,
+    ) -> None:
+        if interval_seconds <= 0:
+            logger.info("job_disabled name=%s", name)
+            return
+        self.jobs[name] = PeriodicJob(name, interval_seconds, run, leased)
+        self.stats[name] = {
+            "runs": 0,
+            "items": 0,
+            "failures": 0,
+            "lease_skipped": 0,
+            "last_duration_ms": 0.0,
+            "last_items": 0,
+        }
+
+    def _delay(self, job: PeriodicJob) -> float:
+        spread = job.interval_seconds * self.jitter
+        return max(0.0, job.interval_seconds + random.uniform(-spread, spread))
+
+    def start(self) -> None:
+        """Lanza una task por job en el event loop actual (llamar desde el lifespan)."""
+        for name, job in self.jobs.items():
+            if name not in self._tasks:
+                self._tasks[name] = asyncio.get_running_loop().create_task(self._loop(job), name=f"job-{name}")
+        if self._tasks:
+            logger.info("job_runner_started holder=%s jobs=%s", self.holder, ",".join(sorted(self._tasks)))
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _loop(self, job: PeriodicJob) -> None:
+        # La primera corrida también se desplaza para no coincidir con el arranque de otras instancias
+        await asyncio.sleep(random.uniform(0, job.interval_seconds))
+        while True:
+            await self.run_once(job.name)
+            await asyncio.sleep(self._delay(job))
+
+    async def run_once(self, name: str) -> Optional[JobResult]:
+        """Corre un job si se obtiene su lease (o si no usa lease). Retorna None si no corrió."""
+        job = self.jobs[name]
+        stats = self.stats[name]
+        cursor = None
+        if job.leased:
+            try:
+                acquired = await asyncio.to_thread(self.lease_store.acquire, name, self.holder, job.interval_seconds)
+                if not acquired:
+                    stats["lease_skipped"] += 1
+                    return None
+                cursor = await asyncio.to_thread(self.lease_store.load_cursor, name)
+            except Exception as e:
+                stats["failures"] += 1
+                logger.error(f"Error tomando lease del job {name}: {e}")
+                return None
+
+        started = time.perf_counter()
+        renewal = asyncio.create_task(self._renew_lease(job)) if job.leased else None
+        try:
+            if asyncio.iscoroutinefunction(job.run):
+                result = await job.run(cursor)
+            else:
+                result = await asyncio.to_thread(job.run, cursor)
+            result = result or JobResult()
+        except Exception as e:
+            stats["failures"] += 1
+            logger.error(f"Error ejecutando job {name}: {e}")
+            if job.leased:
+                await self._stop_renewal(renewal)
+                await asyncio.to_thread(self._release, name)
+            return None
+        finally:
+            await self._stop_renewal(renewal)
+
+        duration_ms = (time.perf_counter() - started) * 1000
+        stats["runs"] += 1
+        stats["items"] += result.items
+        stats["last_items"] = result.items
+        stats["last_duration_ms"] = round(duration_ms, 1)
+        logger.info("job_run name=%s items=%s duration_ms=%.1f cursor=%s", name, result.items, duration_ms, result.cursor)
+        if not job.leased:
+            return result
+        try:
+            await asyncio.to_thread(
+                self.lease_store.record_run, name, cursor=result.cursor, items=result.items, duration_ms=duration_ms
+            )
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el resultado del job {name}: {e}")
+        return result
+
+    async def _renew_lease(self, job: PeriodicJob) -> None:
+        # Sin renovar, una corrida más larga que el intervalo dejaría vencer el lease y otra instancia la duplicaría
+        while True:
+            await asyncio.sleep(job.interval_seconds * JOB_LEASE_RENEW_FRACTION)
+            try:
+                renewed = await asyncio.to_thread(self.lease_store.acquire, job.name, self.holder, job.interval_seconds)
+            except Exception as e:
+                logger.warning(f"No se pudo renovar el lease del job {job.name}: {e}")
+                continue
+            if not renewed:
+                logger.warning("job_lease_lost name=%s holder=%s", job.name, self.holder)
+                return
+
+    @staticmethod
+    async def _stop_renewal(renewal: Optional[asyncio.Task]) -> None:
+        if renewal is None or renewal.done():
+            return
+        renewal.cancel()
+        await asyncio.gather(renewal, return_exceptions=True)
+
+    def _release(self, name: str) -> None:
+        # Tras un error se libera el lease para que otra instancia reintente
+        try:
+            self.lease_store.release(name, self.holder)
+        except Exception:
+            pass
+
+
+job_runner = JobRunner()
@@ -0,0 +1,540 @@
+import hashlib
+import heapq
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from chatbot.models import ConversacionData
+from services.firestore_support import is_already_exists, load_firestore
+from services.nlu_metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+PRODUCTION_ENVS = {"prod", "production"}
+IS_PRODUCTION = os.getenv("ENV", "prod").strip().lower() in PRODUCTION_ENVS
+# En producción el journal local se pierde al reiniciar el contenedor: por defecto va a Firestore
+LEAD_OUTBOX_BACKEND = (
+    os.getenv("LEAD_OUTBOX_BACKEND", "").strip().lower() or ("firestore" if IS_PRODUCTION else "file")
+)
+LEAD_OUTBOX_PATH = os.getenv("LEAD_OUTBOX_PATH", "lead_outbox.jsonl")
+LEAD_OUTBOX_COLLECTION = os.getenv("LEAD_OUTBOX_COLLECTION", "lead-outbox").strip() or "lead-outbox"
+LEAD_OUTBOX_WORKERS = int(os.getenv("LEAD_OUTBOX_WORKERS", "2"))
+LEAD_OUTBOX_MAX_ATTEMPTS = int(os.getenv("LEAD_OUTBOX_MAX_ATTEMPTS", "5"))
+LEAD_OUTBOX_BACKOFF_SECONDS = float(os.getenv("LEAD_OUTBOX_BACKOFF_SECONDS", "2"))
+# Un worker que reclamó un lead tiene este tiempo para enviarlo; si se cae, otro lo retoma al vencer
+LEAD_OUTBOX_LEASE_SECONDS = float(os.getenv("LEAD_OUTBOX_LEASE_SECONDS", "120"))
+# Los envíos terminados se conservan este tiempo para descartar duplicados
+LEAD_OUTBOX_RETENTION_HOURS = int(os.getenv("LEAD_OUTBOX_RETENTION_HOURS", "24"))
+LEAD_OUTBOX_PURGE_BATCH_SIZE = int(os.getenv("LEAD_OUTBOX_PURGE_BATCH_SIZE", "100"))
+DEFAULT_FIRESTORE_DATABASE = "(default)"
+FIRESTORE_DATABASE_ENV = "CHATBOT_FIRESTORE_DATABASE"
+
+STATUS_PENDING = "pending"
+STATUS_IN_FLIGHT = "in_flight"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_FINISHED = (STATUS_SENT, STATUS_FAILED)
+
+# Id de la confirmación del lead, guardado en datos_temporales al pasar a ENVIANDO
+LEAD_CONFIRMATION_ID_KEY = "_lead_confirmation_id"
+
+
+def build_lead_key(conversacion: ConversacionData) -> str:
+    """
+    Clave de idempotencia de la confirmación: teléfono + hash del lead.
+    Una confirmación reprocesada (reintento del webhook) genera la misma clave;
+    un lead nuevo con los mismos datos trae otro id de confirmación y otra clave.
+    """
+    lead = {
+        "confirmation_id": (conversacion.datos_temporales or {}).get(LEAD_CONFIRMATION_ID_KEY),
+        "tipo_consulta": getattr(conversacion.tipo_consulta, "value", conversacion.tipo_consulta),
+        "datos_contacto": (
+            conversacion.datos_contacto.model_dump(mode="json")
+            if conversacion.datos_contacto
+            else None
+        ),
+    }
+    digest = hashlib.sha1(json.dumps(lead, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"{conversacion.numero_telefono}:{digest[:16]}"
+
+
+def _is_claimable(entry: Optional[Dict[str, Any]], now: float) -> bool:
+    if not entry:
+        return False
+    if entry.get("status") == STATUS_PENDING:
+        return True
+    # Reclamado por un worker que no terminó (caída o reinicio) y cuyo lease ya venció
+    return entry.get("status") == STATUS_IN_FLIGHT and (entry.get("lease_until") or 0) <= now
+
+
+def _is_expired(entry: Dict[str, Any], cutoff: float) -> bool:
+    return entry.get("status") in STATUS_FINISHED and (entry.get("updated_at") or 0) < cutoff
+
+
+def _retention_cutoff(now: Optional[float] = None) -> float:
+    return (time.time() if now is None else now) - LEAD_OUTBOX_RETENTION_HOURS * 3600
+
+
+def _claim_fields(holder: str, lease_seconds: float, now: float) -> Dict[str, Any]:
+    return {"status": STATUS_IN_FLIGHT, "claimed_by": holder, "lease_until": now + lease_seconds, "updated_at": now}
+
+
+class FileOutboxStore:
+    """
+    Journal local append-only (JSONL). Cada línea es el estado completo de una
+    entrada; al cargar gana la última línea de cada clave. Se compacta al iniciar
+    y en cada purga.
+    """
+
+    def __init__(self, path: str = LEAD_OUTBOX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # Líneas escritas en el archivo, para saber si la compactación ahorra algo
+        self._lines = 0
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        lines = 0
+        with open(self.path, encoding="utf-8") as handle:
+            for line in handle:
+                if not line.strip():
+                    continue
+                # Las líneas inválidas también cuentan, así la compactación reescribe el archivo
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Última línea truncada por un corte a mitad de escritura
+                    logger.warning("lead_outbox_journal_linea_invalida path=%s", self.path)
+                    continue
+                self._entries[entry["key"]] = entry
+        self._lines = lines
+        self._compact()
+
+    def _compact(self, now: Optional[float] = None) -> int:
+        cutoff = _retention_cutoff(now)
+        expired = [key for key, entry in self._entries.items() if _is_expired(entry, cutoff)]
+        for key in expired:
+            del self._entries[key]
+        if self._lines <= len(self._entries):
+            return len(expired)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            for entry in self._entries.values():
+                handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, self.path)
+        self._lines = len(self._entries)
+        return len(expired)
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._lines += 1
+
+    def create(self, entry: Dict[str, Any]) -> bool:
+        with self._lock:
+            if entry["key"] in self._entries:
+                return False
+            self._append(entry)
+            self._entries[entry["key"]] = dict(entry)
+            return True
+
+    def update(self, key: str, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            entry = {**self._entries[key], **fields}
+            self._append(entry)
+            self._entries[key] = entry
+
+    def claim(self, key: str, holder: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            now = time.time()
+            if not _is_claimable(self._entries.get(key), now):
+                return None
+            entry = {**self._entries[key], **_claim_fields(holder, lease_seconds, now)}
+            self._append(entry)
+            self._entries[key] = entry
+            return dict(entry)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry else None
+
+    def pending(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            now = time.time()
+            return [dict(entry) for entry in self._entries.values() if _is_claimable(entry, now)]
+
+    def purge_expired(self, *, now: Optional[float] = None, limit: int = LEAD_OUTBOX_PURGE_BATCH_SIZE) -> int:
+        """Descarta los envíos terminados fuera de la retención y compacta el journal."""
+        with self._lock:
+            return self._compact(now=now)
+
+
+class FirestoreOutboxStore:
+    """Outbox en Firestore, compartido entre instancias; el doc id es la clave de idempotencia."""
+
+    def __init__(self, collection: str = LEAD_OUTBOX_COLLECTION, firestore_client=None):
+        self.collection = collection
+        self.database = (
+            os.getenv(FIRESTORE_DATABASE_ENV, DEFAULT_FIRESTORE_DATABASE).strip()
+            or DEFAULT_FIRESTORE_DATABASE
+        )
+        if self.database == "default":
+            self.database = "(default)"
+        self._fs_client = firestore_client
+
+    def _get_firestore_client(self):
+        if self._fs_client is None:
+            self._fs_client = load_firestore().Client(database=self.database)
+        return self._fs_client
+
+    def _document(self, key: str):
+        # "/" no es válido en un doc id de Firestore
+        return self._get_firestore_client().collection(self.collection).document(key.replace("/", "_"))
+
+    def create(self, entry: Dict[str, Any]) -> bool:
+        document = self._document(entry["key"])
+        try:
+            document.create(entry)
+        except Exception as exc:
+            if is_already_exists(exc):
+                return False
+            raise
+        return True
+
+    def update(self, key: str, fields: Dict[str, Any]) -> None:
+        if fields.get("status") in STATUS_FINISHED:
+            # Firestore no purga solo: el job de purga borra por expires_at, igual que la compactación del journal
+            expires_at = datetime.fromtimestamp(fields["updated_at"], tz=timezone.utc) + timedelta(
+                hours=LEAD_OUTBOX_RETENTION_HOURS
+            )
+            fields = {**fields, "expires_at": expires_at}
+        self._document(key).update(fields)
+
+    def claim(self, key: str, holder: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        client = self._get_firestore_client()
+        document = self._document(key)
+        firestore = load_firestore()
+
+        @firestore.transactional
+        def _take(transaction) -> Optional[Dict[str, Any]]:
+            snapshot = document.get(transaction=transaction)
+            entry = snapshot.to_dict() if snapshot.exists else None
+            now = time.time()
+            if not _is_claimable(entry, now):
+                return None
+            fields = _claim_fields(holder, lease_seconds, now)
+            transaction.update(document, fields)
+            return {**entry, **fields}
+
+        return _take(client.transaction())
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        snapshot = self._document(key).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def pending(self) -> List[Dict[str, Any]]:
+        query = self._get_firestore_client().collection(self.collection).where(
+            "status", "in", [STATUS_PENDING, STATUS_IN_FLIGHT]
+        )
+        now = time.time()
+        entries = (snapshot.to_dict() or {} for snapshot in query.stream())
+        return [entry for entry in entries if _is_claimable(entry, now)]
+
+    def purge_expired(self, *, now: Optional[float] = None, limit: int = LEAD_OUTBOX_PURGE_BATCH_SIZE) -> int:
+        """Borra hasta `limit` envíos terminados cuyo expires_at ya pasó."""
+        moment = datetime.fromtimestamp(time.time() if now is None else now, tz=timezone.utc)
+        query = (
+            self._get_firestore_client()
+            .collection(self.collection)
+            .where("expires_at", "<=", moment)
+            .limit(limit)
+        )
+        removed = 0
+        for snapshot in query.stream():
+            snapshot.reference.delete()
+            removed += 1
+        return removed
+
+
+def build_outbox_store(kind: str = LEAD_OUTBOX_BACKEND):
+    if kind == "firestore":
+        return FirestoreOutboxStore()
+    if kind != "file":
+        logger.warning("LEAD_OUTBOX_BACKEND desconocido: %s (se usa el journal local)", kind)
+    if IS_PRODUCTION:
+        logger.error(
+            "lead_outbox_journal_local_en_produccion path=%s: los leads pendientes se pierden al reiniciar "
+            "el contenedor y no se comparten entre instancias (usar LEAD_OUTBOX_BACKEND=firestore)",
+            LEAD_OUTBOX_PATH,
+        )
+    return FileOutboxStore()
+
+
+def _send_with_email_service(conversacion: ConversacionData) -> bool:
+    from services.email_service import email_service
+
+    return email_service.enviar_lead_email(conversacion)
+
+
+class LeadOutbox:
+    """
+    Outbox durable de emails de lead.
+
+    El webhook solo persiste el lead (`enqueue`) y responde; un pool de
+    workers lo envía por SES en segundo plano, con reintentos y backoff
+    exponencial. Al arrancar (`start`) se retoman las entradas pendientes que
+    haya dejado una instancia anterior.
+
+    Antes de enviar, el worker reclama la entrada en el store (status
+    in_flight + lease_until); otro worker o instancia no la toma hasta que el
+    lease venza. Si falla la escritura del resultado, se reintenta solo esa
+    escritura, sin volver a enviar el email.
+    """
+
+    def __init__(
+        self,
+        store=None,
+        sender: Callable[[ConversacionData], bool] = _send_with_email_service,
+        workers: int = LEAD_OUTBOX_WORKERS,
+        max_attempts: int = LEAD_OUTBOX_MAX_ATTEMPTS,
+        backoff_seconds: float = LEAD_OUTBOX_BACKOFF_SECONDS,
+        lease_seconds: float = LEAD_OUTBOX_LEASE_SECONDS,
+    ):
+        self._store = store
+        self.sender = sender
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.holder = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self._schedule: List[tuple] = []
+        # Resultados ya decididos cuya escritura en el store falló: clave -> (campos, reintento del envío)
+        self._unsaved: Dict[str, tuple] = {}
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dispatcher: Optional[threading.Thread] = None
+        self.latency = LatencyHistogram()
+        self.counters = {"enqueued": 0, "duplicates": 0, "sent": 0, "failed_attempts": 0, "dead_letters": 0}
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = build_outbox_store()
+        return self._store
+
+    def start(self) -> int:
+        """Arranca los workers y reprograma los pendientes persistidos."""
+        self._ensure_started()
+        try:
+            return self.recover()
+        except Exception as e:
+            logger.error(f"No se pudieron recuperar leads pendientes del outbox: {str(e)}")
+            return 0
+
+    def recover(self) -> int:
+        """
+        Reprograma las entradas reclamables del store (pendientes o con el lease
+        vencido, p. ej. de una instancia que se apagó a mitad de un envío) que
+        esta instancia no tenga ya agendadas. Corre al arrancar y periódicamente.
+        """
+        pending = self.store.pending()
+        with self._cond:
+            scheduled = {key for _, key in self._schedule} | set(self._unsaved)
+        keys = [entry["key"] for entry in pending if entry["key"] not in scheduled]
+        if not keys:
+            return 0
+        self._ensure_started()
+        for key in keys:
+            self._schedule_key(key, 0.0)
+        logger.info("lead_outbox_recover pendientes=%s", len(keys))
+        return len(keys)
+
+    def purge_expired(self, *, now: Optional[float] = None, limit: int = LEAD_OUTBOX_PURGE_BATCH_SIZE) -> int:
+        """Borra del store los envíos terminados que superaron LEAD_OUTBOX_RETENTION_HOURS."""
+        removed = self.store.purge_expired(now=now, limit=limit)
+        if removed:
+            logger.info("lead_outbox_purged entradas=%s", removed)
+        return removed
+
+    def _ensure_started(self) -> None:
+        with self._cond:
+            if self._dispatcher is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="lead-outbox")
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="lead-outbox-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def enqueue(self, conversacion: ConversacionData) -> str:
+        """Persiste el lead y lo agenda para envío. Levanta excepción si no se pudo persistir."""
+        key = build_lead_key(conversacion)
+        now = time.time()
+        entry = {
+            "key": key,
+            "phone": conversacion.numero_telefono,
+            "status": STATUS_PENDING,
+            "attempts": 0,
+            "payload": conversacion.model_dump(mode="json"),
+            "created_at": now,
+            "updated_at": now,
+            "last_error": None,
+        }
+        if not self.store.create(entry):
+            self.counters["duplicates"] += 1
+            logger.info("lead_outbox_duplicate key=%s", key)
+            return key
+        self.counters["enqueued"] += 1
+        logger.info("lead_outbox_enqueued key=%s", key)
+        self._ensure_started()
+        self._schedule_key(key, 0.0)
+        return key
+
+    def _schedule_key(self, key: str, delay: float) -> None:
+        with self._cond:
+            heapq.heappush(self._schedule, (time.time() + delay, key))
+            self._cond.notify_all()
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._schedule or self._schedule[0][0] > time.time():
+                    timeout = self._schedule[0][0] - time.time() if self._schedule else None
+                    self._cond.wait(timeout)
+                _, key = heapq.heappop(self._schedule)
+                self._in_flight += 1
+            self._executor.submit(self._deliver_and_release, key)
+
+    def _deliver_and_release(self, key: str) -> None:
+        try:
+            self._deliver(key)
+        except Exception as e:
+            logger.error(f"Error inesperado en el worker del outbox para {key}: {str(e)}")
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def _deliver(self, key: str) -> None:
+        with self._cond:
+            unsaved = self._unsaved.pop(key, None)
+        if unsaved is not None:
+            self._save_result(key, *unsaved)
+            return
+
+        entry = self.store.claim(key, self.holder, self.lease_seconds)
+        if entry is None:
+            # Ya enviado o reclamado por otro worker/instancia
+            return
+
+        conversacion = ConversacionData.model_validate(entry["payload"])
+        started = time.perf_counter()
+        error = None
+        try:
+            enviado = bool(self.sender(conversacion))
+        except Exception as e:
+            enviado = False
+            error = f"{type(e).__name__}: {str(e)}"
+        latency_ms = (time.perf_counter() - started) * 1000
+        with self._cond:
+            self.latency.observe(latency_ms)
+        attempts = int(entry.get("attempts") or 0) + 1
+
+        try:
+            from services.metrics_service import metrics_service
+            metrics_service.on_lead_email(latency_ms, enviado)
+            if enviado:
+                metrics_service.on_lead_sent()
+        except Exception:
+            pass
+
+        if enviado:
+            self.counters["sent"] += 1
+            self._save_result(key, {"status": STATUS_SENT, "attempts": attempts, "updated_at": time.time()})
+            logger.info("lead_outbox_sent key=%s attempts=%s latency_ms=%.0f", key, attempts, latency_ms)
+            return
+
+        self.counters["failed_attempts"] += 1
+        error = error or "SES no confirmó el envío"
+        if attempts >= self.max_attempts:
+            self.counters["dead_letters"] += 1
+            self._save_result(key, {
+                "status": STATUS_FAILED, "attempts": attempts, "updated_at": time.time(), "last_error": error,
+            })
+            logger.error("lead_outbox_dead_letter key=%s attempts=%s error=%s", key, attempts, error)
+            try:
+                from services.error_reporter import error_reporter
+                error_reporter.capture_exception(
+                    RuntimeError(f"Lead sin enviar tras {attempts} intentos: {error}"),
+                    {"numero_telefono": entry.get("phone", ""), "conversation_id": key},
+                )
+            except Exception:
+                pass
+            return
+
+        delay = self.backoff_seconds * (2 ** (attempts - 1))
+        logger.warning("lead_outbox_retry key=%s attempts=%s delay_s=%.1f error=%s", key, attempts, delay, error)
+        self._save_result(
+            key,
+            {
+                "status": STATUS_PENDING, "attempts": attempts, "updated_at": time.time(), "last_error": error,
+                "lease_until": None, "claimed_by": None,
+            },
+            retry_delay=delay,
+        )
+
+    def _save_result(self, key: str, fields: Dict[str, Any], retry_delay: Optional[float] = None) -> None:
+        """
+        Persiste el resultado del intento y, si corresponde, agenda el reintento.
+        Si el store falla la clave vuelve a la agenda con solo la escritura pendiente.
+        """
+        try:
+            self.store.update(key, fields)
+        except Exception as e:
+            logger.error("lead_outbox_store_update_failed key=%s error=%s", key, str(e))
+            with self._cond:
+                self._unsaved[key] = (fields, retry_delay)
+            self._schedule_key(key, max(self.backoff_seconds, 1.0))
+            return
+        if retry_delay is not None:
+            self._schedule_key(key, retry_delay)
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """Espera a que no queden envíos agendados ni en curso (tests y apagado)."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._schedule or self._in_flight:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            scheduled = len(self._schedule)
+            in_flight = self._in_flight
+        return {
+            **self.counters,
+            "scheduled": scheduled,
+            "in_flight": in_flight,
+            "send_latency": self.latency.snapshot(),
+        }
+
+
+lead_outbox = LeadOutbox()
@@ -0,0 +1,320 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from chatbot.message_context import MessageContext
+from services.firestore_support import load_firestore
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Nivel persistente opcional: "" (solo memoria), "sqlite" o "firestore"
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "").strip().lower()
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_COLLECTION = os.getenv("LLM_CACHE_COLLECTION", "llm-cache").strip() or "llm-cache"
+DEFAULT_FIRESTORE_DATABASE = "(default)"
+FIRESTORE_DATABASE_ENV = "CHATBOT_FIRESTORE_DATABASE"
+
+
+def prompt_version(*parts: Any) -> str:
+    """Hash corto del prompt/modelo; si cambia la plantilla, cambian las claves."""
+    raw = "\x1f".join(str(part) for part in parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def normalize_loose(text: Any) -> str:
+    """Normalización para clasificación: minúsculas, sin tildes ni puntuación."""
+    return MessageContext.from_text(text).words
+
+
+def normalize_exact(text: Any) -> str:
+    """Normalización para extracción: solo espacios (emails/nombres se respetan)."""
+    return " ".join(MessageContext.from_text(text).stripped.split())
+
+
+class LRUCache:
+    """LRU en memoria con TTL por entrada. Thread-safe."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl_seconds: int = LLM_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None) -> None:
+        expires_at = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCacheBackend:
+    """Nivel persistente en un archivo SQLite local (útil en desarrollo o con disco persistente)."""
+
+    def __init__(self, path: str = LLM_CACHE_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0]
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+        return cursor.rowcount
+
+
+class FirestoreCacheBackend:
+    """
+    Nivel persistente en Firestore, compartido entre instancias de Cloud Run.
+    `expires_at` se guarda como timestamp para poder usar una TTL policy nativa.
+    """
+
+    def __init__(self, collection: str = LLM_CACHE_COLLECTION, firestore_client=None):
+        self.collection = collection
+        self.database = (
+            os.getenv(FIRESTORE_DATABASE_ENV, DEFAULT_FIRESTORE_DATABASE).strip()
+            or DEFAULT_FIRESTORE_DATABASE
+        )
+        if self.database == "default":
+            self.database = "(default)"
+        self._fs_client = firestore_client
+
+    def _get_firestore_client(self):
+        if self._fs_client is None:
+            self._fs_client = load_firestore().Client(database=self.database)
+        return self._fs_client
+
+    def get(self, key: str) -> Optional[str]:
+        snapshot = self._get_firestore_client().collection(self.collection).document(key).get()
+        if not snapshot.exists:
+            return None
+        data = snapshot.to_dict() or {}
+        expires_at = data.get("expires_at")
+        if expires_at is not None and expires_at.timestamp() <= time.time():
+            return None
+        return data.get("value")
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        self._get_firestore_client().collection(self.collection).document(key).set({
+            "value": value,
+            "expires_at": datetime.fromtimestamp(expires_at, tz=timezone.utc),
+        })
+
+
+def build_persistent_backend(kind: str = LLM_CACHE_BACKEND):
+    if not kind:
+        return None
+    try:
+        if kind == "sqlite":
+            return SQLiteCacheBackend()
+        if kind == "firestore":
+            return FirestoreCacheBackend()
+        logger.warning("LLM_CACHE_BACKEND desconocido: %s (se usa solo memoria)", kind)
+    except Exception as e:
+        logger.error(f"No se pudo inicializar el cache persistente de LLM ({kind}): {str(e)}")
+    return None
+
+
+class LLMCache:
+    """
+    Cache de dos niveles para respuestas del LLM: LRU en memoria y un nivel
+    persistente opcional (SQLite o Firestore).
+
+    La clave es un hash de namespace + versión del prompt + texto normalizado,
+    así frases equivalentes ("Quiero presupuesto!" / "quiero presupuesto")
+    comparten respuesta y un cambio de plantilla invalida las entradas viejas.
+    Los valores deben ser serializables a JSON.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        backend=None,
+        enabled: bool = LLM_CACHE_ENABLED,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.memory = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def build_key(
+        namespace: str,
+        version: str,
+        texts: Iterable[Any],
+        normalizer: Callable[[Any], str] = normalize_loose,
+    ) -> str:
+        normalized = "\x1f".join(normalizer(text) for text in texts)
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{namespace}:{version}:{digest}"
+
+    def _record(self, namespace: str, field: str, amount: float = 1.0) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(namespace, {
+                "hits_memory": 0, "hits_persistent": 0, "misses": 0, "llm_ms_total": 0.0,
+            })
+            stats[field] += amount
+
+    def _read_persistent(self, key: str) -> Any:
+        if self.backend is None:
+            return None
+        try:
+            raw = self.backend.get(key)
+            return None if raw is None else json.loads(raw)
+        except Exception as e:
+            logger.warning(f"Error leyendo cache persistente de LLM: {str(e)}")
+            return None
+
+    def _write_persistent(self, key: str, value: Any) -> None:
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Error escribiendo cache persistente de LLM: {str(e)}")
+
+    def _lookup(self, namespace: str, key: str) -> Any:
+        value = self.memory.get(key)
+        if value is not None:
+            self._record(namespace, "hits_memory")
+            # Copia para que quien llama pueda mutar el resultado sin tocar el cache
+            return copy.deepcopy(value)
+
+        value = self._read_persistent(key)
+        if value is not None:
+            self.memory.set(key, value)
+            self._record(namespace, "hits_persistent")
+            return copy.deepcopy(value)
+        return None
+
+    def _store(self, namespace: str, key: str, value: Any, started: float, cacheable: Callable[[Any], bool]) -> None:
+        self._record(namespace, "misses")
+        self._record(namespace, "llm_ms_total", (time.perf_counter() - started) * 1000)
+        if cacheable(value):
+            self.memory.set(key, copy.deepcopy(value))
+            self._write_persistent(key, value)
+
+    def get_or_compute(
+        self,
+        namespace: str,
+        version: str,
+        texts: Iterable[Any],
+        compute: Callable[[], Any],
+        normalizer: Callable[[Any], str] = normalize_loose,
+        cacheable: Callable[[Any], bool] = lambda value: value is not None,
+    ) -> Any:
+        """
+        Retorna el valor cacheado o ejecuta `compute`. Solo se guardan los
+        resultados para los que `cacheable(valor)` es verdadero (p. ej. no se
+        cachean respuestas vacías o JSON inválido). Las excepciones de
+        `compute` se propagan sin cachear.
+        """
+        if not self.enabled:
+            return compute()
+
+        key = self.build_key(namespace, version, texts, normalizer)
+        value = self._lookup(namespace, key)
+        if value is not None:
+            return value
+
+        started = time.perf_counter()
+        value = compute()
+        self._store(namespace, key, value, started, cacheable)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate y latencia ahorrada (estimada con la latencia media de los misses)."""
+        with self._lock:
+            snapshot = {namespace: dict(values) for namespace, values in self._stats.items()}
+
+        namespaces = {}
+        totals = {"hits": 0, "misses": 0, "saved_latency_ms": 0.0}
+        for namespace, values in snapshot.items():
+            hits = values["hits_memory"] + values["hits_persistent"]
+            misses = values["misses"]
+            avg_ms = values["llm_ms_total"] / misses if misses else 0.0
+            saved_ms = hits * avg_ms
+            namespaces[namespace] = {
+                "hits_memory": int(values["hits_memory"]),
+                "hits_persistent": int(values["hits_persistent"]),
+                "misses": int(misses),
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                "avg_llm_ms": round(avg_ms, 1),
+                "saved_latency_ms": round(saved_ms, 1),
+            }
+            totals["hits"] += int(hits)
+            totals["misses"] += int(misses)
+            totals["saved_latency_ms"] += saved_ms
+
+        total_calls = totals["hits"] + totals["misses"]
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "entries_memory": len(self.memory),
+            "hit_rate": round(totals["hits"] / total_calls, 4) if total_calls else 0.0,
+            "saved_latency_ms": round(totals["saved_latency_ms"], 1),
+            "namespaces": namespaces,
+        }
+
+    def clear(self) -> None:
+        self.memory.clear()
+        with self._lock:
+            self._stats.clear()
+
+
+llm_cache = LLMCache(backend=build_persistent_backend())
@@ -0,0 +1,182 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "6"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+# Demora fija para el pedido de cobertura; 0 = usar el p95 observado
+LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "0"))
+LLM_HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+
+class LLMTimeoutError(TimeoutError):
+    """El LLM no respondió dentro del deadline; el llamador debe usar su respuesta degradada."""
+
+
+class LatencyWindow:
+    """Ventana móvil de latencias (segundos) para estimar percentiles."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[idx]
+
+
+class AsyncLLMRunner:
+    """
+    Ejecuta completions de `AsyncOpenAI` en un event loop propio (thread daemon).
+
+    - Cada llamada tiene un deadline; al vencer se cancela y se levanta
+      `LLMTimeoutError` para que el llamador use su respuesta degradada.
+    - Un semáforo limita las llamadas en vuelo (LLM_MAX_CONCURRENCY).
+    - Opcionalmente se lanza un segundo pedido (hedging) si el primero supera
+      el p95 observado, y se usa el que responda primero.
+
+    ChatbotRules usa `complete`, que bloquea el thread llamador: el webhook
+    corre `procesar_mensaje` en el threadpool, no en el event loop de FastAPI.
+    `arun` sirve para llamadores async que no deben bloquear su loop.
+    """
+
+    def __init__(
+        self,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        hedge_enabled: bool = LLM_HEDGE_ENABLED,
+        hedge_delay_ms: float = LLM_HEDGE_DELAY_MS,
+    ):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.hedge_enabled = hedge_enabled
+        self.hedge_delay_ms = hedge_delay_ms
+        self.latencies = LatencyWindow()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+        self.in_flight = 0
+        self.timeouts = 0
+        self.hedges = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-runner", daemon=True)
+                thread.start()
+                self._loop = loop
+        return self._loop
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_enabled:
+            return None
+        if self.hedge_delay_ms > 0:
+            return self.hedge_delay_ms / 1000
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return self.latencies.percentile(95)
+
+    async def _call(self, client, request: dict) -> Any:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                response = await client.chat.completions.create(**request)
+            finally:
+                self.in_flight -= 1
+            self.latencies.add(time.perf_counter() - started)
+            return response
+
+    async def _hedged(self, client, request: dict) -> Any:
+        delay = self._hedge_delay()
+        first = asyncio.ensure_future(self._call(client, request))
+        if delay is None:
+            return await first
+
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.hedges += 1
+        logger.info("LLM hedging: segundo pedido tras %.0f ms", delay * 1000)
+        pending = {first, asyncio.ensure_future(self._call(client, request))}
+        last_error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _run(self, client, request: dict, deadline: float) -> Any:
+        try:
+            return await asyncio.wait_for(self._hedged(client, request), timeout=deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LLMTimeoutError(f"LLM sin respuesta en {deadline:.1f}s")
+
+    def complete(self, client, deadline: Optional[float] = None, **request) -> Any:
+        """Versión síncrona: bloquea como máximo `deadline` segundos."""
+        deadline = self.timeout if deadline is None else deadline
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(client, request, deadline), self._ensure_loop()
+        )
+        try:
+            # Margen para que el timeout interno (que cancela el pedido) gane
+            return future.result(timeout=deadline + 0.5)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.timeouts += 1
+            raise LLMTimeoutError(f"LLM sin respuesta en {deadline:.1f}s")
+
+    async def arun(self, client, deadline: Optional[float] = None, **request) -> Any:
+        """Versión async para llamadores en otro event loop (p. ej. FastAPI)."""
+        deadline = self.timeout if deadline is None else deadline
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(client, request, deadline), self._ensure_loop()
+        )
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        p50 = self.latencies.percentile(50)
+        p95 = self.latencies.percentile(95)
+        return {
+            "in_flight": self.in_flight,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+llm_runner = AsyncLLMRunner()
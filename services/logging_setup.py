@@ -0,0 +1,155 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper() or "INFO"
+# json (Cloud Logging lee `severity` y `message`) | text (desarrollo local)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").strip().lower()
+# logger=fracción de registros INFO/DEBUG que se emiten; WARNING y superiores siempre salen
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "chatbot.webhook=0.1")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Atributos propios de LogRecord; lo demás vino por `extra=` y va como campo del JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro, con los campos pasados en `extra=`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def parse_sample_rates(raw: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for entry in (raw or "").split(","):
+        name, _, value = entry.strip().partition("=")
+        if not name or not value:
+            continue
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Deja pasar 1 de cada N registros INFO/DEBUG de los loggers configurados
+    (el prefijo más largo gana). Es determinista: con 0.1 sale el 1.º, el
+    11.º, el 21.º... así un evento frecuente sigue apareciendo en los logs.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = dict(rates)
+        self._counters: Dict[str, itertools.count] = {name: itertools.count() for name in self.rates}
+
+    def _match(self, logger_name: str) -> Optional[str]:
+        best = None
+        for name in self.rates:
+            if logger_name == name or logger_name.startswith(name + "."):
+                if best is None or len(name) > len(best):
+                    best = name
+        return best
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        name = self._match(record.name)
+        if name is None:
+            return True
+        rate = self.rates[name]
+        if rate <= 0:
+            return False
+        interval = max(1, round(1 / rate))
+        return next(self._counters[name]) % interval == 0
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Se congela el mensaje al encolar: los args (dicts, modelos) pueden cambiar antes de
+        # que el listener lo escriba. El resto del formateo (JSON, traceback) queda en el listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Sin espacio se descarta antes que bloquear el request
+            pass
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_lock = threading.Lock()
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    fmt: str = LOG_FORMAT,
+    sample_rates: Optional[Dict[str, float]] = None,
+    *,
+    force: bool = False,
+) -> None:
+    """
+    Logging no bloqueante: los loggers solo encolan (QueueHandler) y un
+    thread (QueueListener) formatea y escribe a stdout. Igual que
+    `basicConfig`, no hace nada si el root ya tiene handlers (salvo `force`).
+    """
+    global _listener
+    with _lock:
+        root = logging.getLogger()
+        if root.handlers and not force:
+            return
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        if fmt == "text":
+            stream_handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+        else:
+            stream_handler.setFormatter(JsonFormatter())
+
+        queue_handler = _InProcessQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+        queue_handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES) if sample_rates is None else sample_rates))
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+
+
+def stop_logging() -> None:
+    """Vacía la cola y detiene el listener (apagado del proceso)."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+atexit.register(stop_logging)
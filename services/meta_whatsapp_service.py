@@ -4,10 +4,13 @@ import hmac
 import hashlib
 import logging
 import re
+import time
 from typing import Optional, Dict, Any, Tuple
 import requests
 from requests.adapters import HTTPAdapter
 
+from services.runtime_metrics import META_SEND_SECONDS
+
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +37,8 @@ class MetaWhatsAppService:
         
         # Graph API version (hardcodeado para estabilidad)
         self.api_version = "v21.0"
-        self.base_url = f"https://graph.facebook.com/{self.api_version}"
+        # Override solo para pruebas de carga contra un Graph API local (benchmarks/load_test.py)
+        self.base_url = os.getenv("META_GRAPH_BASE_URL", "").rstrip("/") or f"https://graph.facebook.com/{self.api_version}"
         
         # Headers comunes para todas las peticiones
         self.headers = {
@@ -50,6 +54,24 @@ class MetaWhatsAppService:
         
         logger.info(f"MetaWhatsAppService inicializado. Phone ID: {self.phone_number_id}, API: {self.api_version}")
 
+    def warmup(self, timeout: float = 3.0) -> None:
+        """
+        Deja una conexión TLS abierta en el pool antes del primer envío.
+        HEAD sin token a la raíz de Graph API: no envía nada ni consume cuota.
+        """
+        self._session.head(self.base_url, timeout=timeout)
+
+    def _post(self, url: str, payload: Dict[str, Any]) -> requests.Response:
+        """POST a Graph API con la sesión compartida; registra la latencia por tipo de mensaje."""
+        started = time.perf_counter()
+        outcome = "exception"
+        try:
+            response = self._session.post(url, headers=self.headers, json=payload, timeout=10)
+            outcome = "ok" if response.status_code in (200, 201) else "error"
+            return response
+        finally:
+            META_SEND_SECONDS.observe(time.perf_counter() - started, type=payload.get("type", ""), outcome=outcome)
+
     @staticmethod
     def _normalize_interactive_body_text(body_text: str, buttons: list) -> str:
         """
@@ -79,13 +101,8 @@ class MetaWhatsAppService:
             bool: True si se envió exitosamente
         """
         try:
-            logger.info(f"=== META WHATSAPP SEND TEXT DEBUG ===")
-            logger.info(f"to_number original: {to_number}")
-            logger.info(f"message: {message}")
-            
             # Normalizar número (remover whatsapp: si existe, asegurar que tenga +)
             normalized_number = self._normalize_phone_number(to_number)
-            logger.info(f"to_number normalizado: {normalized_number}")
             
             # Construir payload
             url = f"{self.base_url}/{self.phone_number_id}/messages"
@@ -100,20 +117,20 @@ class MetaWhatsAppService:
                 }
             }
             
-            logger.info(f"URL: {url}")
-            logger.info(f"Payload: {json.dumps(payload, indent=2)}")
+            # El dump del payload (con el texto del mensaje) solo se arma si DEBUG está activo
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("meta_send_payload url=%s payload=%s", url, json.dumps(payload, indent=2))
             
             # Enviar petición
-            response = self._session.post(url, headers=self.headers, json=payload, timeout=10)
-            
-            logger.info(f"Status code: {response.status_code}")
-            logger.debug(f"Response: {response.text}")
+            response = self._post(url, payload)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("meta_send_response status=%s body=%s", response.status_code, response.text)
             
             # Validar respuesta
             if response.status_code in [200, 201]:
                 response_data = response.json()
                 message_id = response_data.get('messages', [{}])[0].get('id', 'N/A')
-                logger.info(f"✅ Mensaje enviado exitosamente a {normalized_number}. Message ID: {message_id}")
+                logger.info("✅ Mensaje enviado exitosamente a %s. Message ID: %s", normalized_number, message_id)
                 return True
             else:
                 logger.error(f"❌ Error enviando mensaje a {normalized_number}: {response.status_code} - {response.text}")
@@ -151,12 +168,12 @@ class MetaWhatsAppService:
                 }
             }
             
-            response = self._session.post(url, headers=self.headers, json=payload, timeout=10)
+            response = self._post(url, payload)
             
             if response.status_code in [200, 201]:
                 response_data = response.json()
                 message_id = response_data.get('messages', [{}])[0].get('id', 'N/A')
-                logger.info(f"✅ Media enviado exitosamente a {normalized_number}. Message ID: {message_id}")
+                logger.info("✅ Media enviado exitosamente a %s. Message ID: %s", normalized_number, message_id)
                 return True
             else:
                 logger.error(f"❌ Error enviando media a {normalized_number}: {response.status_code} - {response.text}")
@@ -198,12 +215,12 @@ class MetaWhatsAppService:
                 "sticker": sticker_payload
             }
             
-            response = self._session.post(url, headers=self.headers, json=payload, timeout=10)
+            response = self._post(url, payload)
             
             if response.status_code in [200, 201]:
                 response_data = response.json()
                 message_id = response_data.get('messages', [{}])[0].get('id', 'N/A')
-                logger.info(f"✅ Sticker enviado exitosamente a {normalized_number}. Message ID: {message_id}")
+                logger.info("✅ Sticker enviado exitosamente a %s. Message ID: %s", normalized_number, message_id)
                 return True
             else:
                 logger.error(f"❌ Error enviando sticker a {normalized_number}: {response.status_code} - {response.text}")
@@ -248,14 +265,14 @@ class MetaWhatsAppService:
             if components:
                 payload["template"]["components"] = components
             
-            logger.info(f"Enviando template '{template_name}' a {normalized_number}")
+            logger.info("Enviando template '%s' a %s", template_name, normalized_number)
             
-            response = self._session.post(url, headers=self.headers, json=payload, timeout=10)
+            response = self._post(url, payload)
             
             if response.status_code in [200, 201]:
                 response_data = response.json()
                 message_id = response_data.get('messages', [{}])[0].get('id', 'N/A')
-                logger.info(f"✅ Template enviado exitosamente a {normalized_number}. Message ID: {message_id}")
+                logger.info("✅ Template enviado exitosamente a %s. Message ID: %s", normalized_number, message_id)
                 return True
             else:
                 logger.error(f"❌ Error enviando template a {normalized_number}: {response.status_code} - {response.text}")
@@ -325,10 +342,10 @@ class MetaWhatsAppService:
                 "interactive": interactive
             }
             
-            response = self._session.post(url, headers=self.headers, json=payload, timeout=10)
+            response = self._post(url, payload)
             
             if response.status_code in [200, 201]:
-                logger.info(f"✅ Botones interactivos enviados a {normalized_number}")
+                logger.info("✅ Botones interactivos enviados a %s", normalized_number)
                 return True
             else:
                 logger.error(f"❌ Error enviando botones a {normalized_number}: {response.status_code} - {response.text}")
@@ -386,10 +403,10 @@ class MetaWhatsAppService:
                 "interactive": interactive
             }
             
-            response = self._session.post(url, headers=self.headers, json=payload, timeout=10)
+            response = self._post(url, payload)
             
             if response.status_code in [200, 201]:
-                logger.info(f"✅ Lista interactiva enviada a {normalized_number}")
+                logger.info("✅ Lista interactiva enviada a %s", normalized_number)
                 return True
             else:
                 logger.error(f"❌ Error enviando lista a {normalized_number}: {response.status_code} - {response.text}")
@@ -431,8 +448,8 @@ class MetaWhatsAppService:
             
             if not is_valid:
                 logger.error("❌ Firma de webhook inválida")
-                logger.debug(f"Expected: {expected_hash}")
-                logger.debug(f"Computed: {computed_hash}")
+                logger.debug("Expected: %s", expected_hash)
+                logger.debug("Computed: %s", computed_hash)
             
             return is_valid
             
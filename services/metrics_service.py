@@ -1,7 +1,9 @@
 import os
+import re
 import time
 import logging
-from typing import Dict, Any
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from services.sheets_service import sheets_service
 
@@ -12,8 +14,15 @@ class MetricsService:
     def __init__(self):
         self.enabled = os.getenv('ENABLE_SHEETS_METRICS', 'false').lower() == 'true'
         self.window_seconds = int(os.getenv('METRICS_FLUSH_SECONDS', '300'))
-        self._last_flush = 0
+        self.max_retries = int(os.getenv('METRICS_FLUSH_RETRIES', '3'))
+        self.retry_backoff_seconds = 2.0
+        self._lock = threading.Lock()
         self._day_cache: Dict[str, Dict[str, float]] = {}
+        self._dirty: Set[str] = set()
+        # Rango A1 de la fila ya escrita para (planilla, día)
+        self._day_rows: Dict[Tuple[str, str], str] = {}
+        self._stop_event = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
 
     def _key(self) -> str:
         return time.strftime('%Y-%m-%d')
@@ -22,8 +31,10 @@ class MetricsService:
         if not self.enabled:
             return
         day = self._key()
-        bucket = self._day_cache.setdefault(day, {})
-        bucket[metric] = bucket.get(metric, 0.0) + amount
+        with self._lock:
+            bucket = self._day_cache.setdefault(day, {})
+            bucket[metric] = bucket.get(metric, 0.0) + amount
+            self._dirty.add(day)
 
     # Hooks de negocio
     def on_conversation_started(self):
@@ -35,6 +46,12 @@ class MetricsService:
     def on_lead_sent(self):
         self._inc('leads_sent')
 
+    def on_lead_email(self, latency_ms: float, ok: bool):
+        self._inc('lead_email_attempts')
+        self._inc('lead_email_latency_ms_total', latency_ms)
+        if not ok:
+            self._inc('lead_email_failures')
+
     def on_intent(self, intent: str):
         self._inc(f'intent_{intent}')
 
@@ -57,6 +74,15 @@ class MetricsService:
     def on_validation_failure(self, field: str):
         self._inc(f'validation_fail_{field}')
 
+    def on_llm_call(self, latency_ms: float, prompt_tokens: int, completion_tokens: int, cost_usd: float, outcome: str = 'ok'):
+        self._inc('llm_calls')
+        self._inc('llm_latency_ms_total', latency_ms)
+        self._inc('llm_prompt_tokens', prompt_tokens)
+        self._inc('llm_completion_tokens', completion_tokens)
+        self._inc('llm_cost_usd', cost_usd)
+        if outcome == 'timeout':
+            self._inc('llm_timeouts')
+
     # Hooks de estado de entrega de mensajes
     def on_message_sent(self):
         self._inc('messages_sent')
@@ -73,52 +99,144 @@ class MetricsService:
     def on_message_read(self):
         self._inc('messages_read')
 
+    # Filas diarias
+    @staticmethod
+    def _business_row(day: str, bucket: Dict[str, float]) -> List[Any]:
+        return [
+            day,
+            int(bucket.get('conv_started', 0)),
+            int(bucket.get('conv_finished', 0)),
+            int(bucket.get('leads_sent', 0)),
+            int(bucket.get('human_requests', 0)),
+            int(bucket.get('intent_presupuesto', 0)),
+            int(bucket.get('intent_visita_tecnica', 0)),
+            int(bucket.get('intent_urgencia', 0)),
+            int(bucket.get('intent_otras', 0)),
+            int(bucket.get('geo_caba', 0)),
+            int(bucket.get('geo_provincia', 0)),
+            int(bucket.get('messages_sent', 0)),
+            int(bucket.get('messages_delivered', 0)),
+            int(bucket.get('messages_failed', 0)),
+            int(bucket.get('messages_undelivered', 0)),
+            int(bucket.get('messages_read', 0)),
+        ]
+
+    @staticmethod
+    def _tech_row(day: str, bucket: Dict[str, float]) -> List[Any]:
+        return [
+            day,
+            int(bucket.get('nlu_unclear', 0)),
+            int(bucket.get('exceptions', 0)),
+            int(bucket.get('validation_fail_email', 0)),
+            int(bucket.get('validation_fail_direccion', 0)),
+            int(bucket.get('validation_fail_horario_visita', 0)),
+            int(bucket.get('validation_fail_descripcion', 0)),
+            int(bucket.get('llm_calls', 0)),
+            int(bucket.get('llm_timeouts', 0)),
+            round(bucket.get('llm_latency_ms_total', 0) / bucket['llm_calls'], 1) if bucket.get('llm_calls') else 0,
+            int(bucket.get('llm_prompt_tokens', 0)),
+            int(bucket.get('llm_completion_tokens', 0)),
+            round(bucket.get('llm_cost_usd', 0), 4),
+            int(bucket.get('lead_email_failures', 0)),
+            round(bucket.get('lead_email_latency_ms_total', 0) / bucket['lead_email_attempts'], 1) if bucket.get('lead_email_attempts') else 0,
+        ]
+
     # Flush
-    def flush_if_needed(self):
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Copia atómica de los días con cambios desde el último flush."""
+        with self._lock:
+            dirty = {day: dict(self._day_cache.get(day, {})) for day in self._dirty}
+            self._dirty.clear()
+        return dirty
+
+    def _write_target(self, target: str, days: Dict[str, Dict[str, float]], build_row) -> None:
+        # Un día ya escrito se sobrescribe en su fila; uno nuevo se agrega al final
+        updates = {}
+        appends = []
+        for day in sorted(days):
+            row = build_row(day, days[day])
+            a1_range = self._day_rows.get((target, day))
+            if a1_range:
+                updates[a1_range] = row
+            else:
+                appends.append((day, row))
+        if updates:
+            sheets_service.update_rows(target, updates)
+        if appends:
+            written = sheets_service.append_rows(target, [row for _, row in appends])
+            for (day, _), a1_range in zip(appends, _split_row_ranges(written)):
+                self._day_rows[(target, day)] = a1_range
+
+    def flush(self) -> bool:
+        """
+        Escribe los días con cambios (una llamada por planilla) con reintentos y
+        backoff. Si falla, los días quedan marcados para el próximo flush.
+        """
         if not self.enabled:
             return False
-        now = time.time()
-        if now - self._last_flush < self.window_seconds:
+        days = self.snapshot()
+        if not days:
             return False
-        self._last_flush = now
-        try:
-            day = self._key()
-            bucket = self._day_cache.get(day, {})
-            if not bucket:
-                return False
-            # Enviar a BUSINESS
-            sheets_service.append_row('business', [
-                day,
-                int(bucket.get('conv_started', 0)),
-                int(bucket.get('conv_finished', 0)),
-                int(bucket.get('leads_sent', 0)),
-                int(bucket.get('human_requests', 0)),
-                int(bucket.get('intent_presupuesto', 0)),
-                int(bucket.get('intent_visita_tecnica', 0)),
-                int(bucket.get('intent_urgencia', 0)),
-                int(bucket.get('intent_otras', 0)),
-                int(bucket.get('geo_caba', 0)),
-                int(bucket.get('geo_provincia', 0)),
-                int(bucket.get('messages_sent', 0)),
-                int(bucket.get('messages_delivered', 0)),
-                int(bucket.get('messages_failed', 0)),
-                int(bucket.get('messages_undelivered', 0)),
-                int(bucket.get('messages_read', 0)),
-            ])
-            # Enviar a TECH
-            sheets_service.append_row('tech', [
-                day,
-                int(bucket.get('nlu_unclear', 0)),
-                int(bucket.get('exceptions', 0)),
-                int(bucket.get('validation_fail_email', 0)),
-                int(bucket.get('validation_fail_direccion', 0)),
-                int(bucket.get('validation_fail_horario_visita', 0)),
-                int(bucket.get('validation_fail_descripcion', 0)),
-            ])
-            return True
-        except Exception as e:
-            logger.error(f'Metrics flush failed: {str(e)}')
+        pending = {'business': self._business_row, 'tech': self._tech_row}
+        for attempt in range(self.max_retries + 1):
+            for target in list(pending):
+                try:
+                    self._write_target(target, days, pending[target])
+                    del pending[target]
+                except Exception as e:
+                    logger.warning(f'Metrics flush {target} falló (intento {attempt + 1}): {str(e)}')
+            if not pending:
+                break
+            if attempt < self.max_retries:
+                time.sleep(self.retry_backoff_seconds * (2 ** attempt))
+
+        if pending:
+            logger.error(f'Metrics flush falló para {", ".join(pending)}; se reintenta en el próximo ciclo')
+            with self._lock:
+                self._dirty.update(days)
             return False
+        self._prune_old_days()
+        return True
+
+    def _prune_old_days(self) -> None:
+        today = self._key()
+        with self._lock:
+            for day in [d for d in self._day_cache if d < today and d not in self._dirty]:
+                del self._day_cache[day]
+            for key in [k for k in self._day_rows if k[1] < today and k[1] not in self._day_cache]:
+                del self._day_rows[key]
+
+    def start(self) -> None:
+        """Arranca el flusher en segundo plano (cada METRICS_FLUSH_SECONDS)."""
+        if not self.enabled or self._flusher is not None:
+            return
+        self._stop_event.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop_event.wait(self.window_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f'Metrics flusher error: {str(e)}')
+
+    def stop(self) -> None:
+        """Detiene el flusher y hace un último flush (apagado de la instancia)."""
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        self.flush()
+
+
+def _split_row_ranges(a1_range: Optional[str]) -> List[str]:
+    """'A10:P11' -> ['A10:P10', 'A11:P11']"""
+    match = re.match(r'^([A-Z]+)(\d+):([A-Z]+)(\d+)$', a1_range or '')
+    if not match:
+        return []
+    first_col, first_row, last_col, last_row = match.groups()
+    return [f'{first_col}{row}:{last_col}{row}' for row in range(int(first_row), int(last_row) + 1)]
 
 
 metrics_service = MetricsService()
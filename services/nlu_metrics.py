@@ -0,0 +1,195 @@
+import bisect
+import contextvars
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Precio USD por 1K tokens (input, output); se puede sobreescribir por env
+MODEL_PRICES_PER_1K = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+}
+LLM_PRICE_INPUT_PER_1K = os.getenv("LLM_PRICE_INPUT_PER_1K")
+LLM_PRICE_OUTPUT_PER_1K = os.getenv("LLM_PRICE_OUTPUT_PER_1K")
+
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+# Estado de la conversación que originó la llamada al LLM (lo fija ChatbotRules.procesar_mensaje)
+_caller_state: contextvars.ContextVar[str] = contextvars.ContextVar("llm_caller_state", default="sin_estado")
+
+
+@contextmanager
+def llm_caller_state(estado: str):
+    token = _caller_state.set(estado or "sin_estado")
+    try:
+        yield
+    finally:
+        _caller_state.reset(token)
+
+
+def current_caller_state() -> str:
+    return _caller_state.get()
+
+
+# Encoding de tiktoken por modelo (None si no está disponible); se resuelve una
+# sola vez porque tiktoken descarga sus tablas en el primer uso
+_encodings: Dict[str, Any] = {}
+
+
+def _get_encoding(model: str):
+    if model not in _encodings:
+        try:
+            import tiktoken
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.info(f"tiktoken no disponible para {model}, se estima por longitud: {str(e)}")
+            _encodings[model] = None
+    return _encodings[model]
+
+
+def estimate_tokens(text: str, model: str) -> int:
+    """Estimación con tiktoken cuando la respuesta no trae `usage`."""
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text or ""))
+    # Sin tiktoken (o sin acceso a sus tablas): ~4 caracteres por token
+    return max(1, len(text or "") // 4) if text else 0
+
+
+def estimate_cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICES_PER_1K.get(model, MODEL_PRICES_PER_1K["gpt-3.5-turbo"])
+    if LLM_PRICE_INPUT_PER_1K:
+        input_price = float(LLM_PRICE_INPUT_PER_1K)
+    if LLM_PRICE_OUTPUT_PER_1K:
+        output_price = float(LLM_PRICE_OUTPUT_PER_1K)
+    return prompt_tokens / 1000 * input_price + completion_tokens / 1000 * output_price
+
+
+class LatencyHistogram:
+    """Histograma de buckets fijos (ms) con conteo y suma, al estilo Prometheus."""
+
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Cota superior del bucket que contiene el cuantil `q`."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for idx, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.buckets[idx] if idx < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"le_{bucket}" for bucket in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 1) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class NLUMetrics:
+    """
+    Contabiliza cada llamada al LLM: latencia, tokens, costo estimado y
+    resultado, agrupados por operación (intent, extraction, ...) y por estado
+    de la conversación que la originó.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latency: Dict[Tuple[str, str], LatencyHistogram] = {}
+            self._counters: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def record(
+        self,
+        operation: str,
+        model: str,
+        latency_ms: float,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        outcome: str = "ok",
+        estado: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        estado = estado or current_caller_state()
+        cost = estimate_cost_usd(model, prompt_tokens, completion_tokens)
+        key = (operation, estado)
+        with self._lock:
+            self._latency.setdefault(key, LatencyHistogram()).observe(latency_ms)
+            counters = self._counters.setdefault(key, {
+                "calls": 0, "timeouts": 0, "errors": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0,
+            })
+            counters["calls"] += 1
+            if outcome == "timeout":
+                counters["timeouts"] += 1
+            elif outcome != "ok":
+                counters["errors"] += 1
+            counters["prompt_tokens"] += prompt_tokens
+            counters["completion_tokens"] += completion_tokens
+            counters["cost_usd"] += cost
+
+        # Totales diarios para la planilla TECH (best-effort)
+        try:
+            from services.metrics_service import metrics_service
+            metrics_service.on_llm_call(latency_ms, prompt_tokens, completion_tokens, cost, outcome)
+        except Exception:
+            pass
+        return {"operation": operation, "estado": estado, "latency_ms": latency_ms, "cost_usd": cost}
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            rows: List[Dict[str, Any]] = []
+            for key, counters in self._counters.items():
+                operation, estado = key
+                row = {"operation": operation, "estado": estado, **counters}
+                row["cost_usd"] = round(row["cost_usd"], 6)
+                row["latency"] = self._latency[key].snapshot()
+                rows.append(row)
+
+        by_state: Dict[str, Dict[str, float]] = {}
+        for row in rows:
+            totals = by_state.setdefault(row["estado"], {"calls": 0, "latency_ms_total": 0.0, "cost_usd": 0.0})
+            totals["calls"] += row["calls"]
+            totals["latency_ms_total"] += row["latency"]["avg_ms"] * row["latency"]["count"] if row["latency"]["count"] else 0.0
+            totals["cost_usd"] += row["cost_usd"]
+        return {
+            "calls": sum(row["calls"] for row in rows),
+            "cost_usd": round(sum(row["cost_usd"] for row in rows), 6),
+            "by_state": {
+                estado: {
+                    "calls": int(totals["calls"]),
+                    "latency_ms_total": round(totals["latency_ms_total"], 1),
+                    "cost_usd": round(totals["cost_usd"], 6),
+                }
+                for estado, totals in sorted(by_state.items(), key=lambda item: -item[1]["latency_ms_total"])
+            },
+            "series": sorted(rows, key=lambda row: (row["operation"], row["estado"])),
+        }
+
+
+nlu_metrics = NLUMetrics()
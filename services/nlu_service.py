@@ -2,10 +2,15 @@ import os
 import logging
 import json
 import re
-from typing import Optional, Dict, Any
-from openai import OpenAI
+import time
+from typing import Optional, Dict, Any, List, Union
+from chatbot.message_context import MessageContext
 from chatbot.models import TipoConsulta
-from templates.template import NLU_INTENT_PROMPT, NLU_MESSAGE_PARSING_PROMPT
+from services.llm_cache import llm_cache, normalize_exact, normalize_loose, prompt_version
+from services.llm_client import LLM_TIMEOUT_SECONDS, LLMTimeoutError, llm_runner
+from services.nlu_metrics import estimate_tokens, nlu_metrics
+from services.runtime_metrics import LLM_CALL_SECONDS
+from templates.template import NLU_BATCH_FIELDS_PROMPT, NLU_INTENT_PROMPT
 from config.company_profiles import get_active_company_profile, get_company_info_text
 
 logger = logging.getLogger(__name__)
@@ -111,145 +116,271 @@ CONTACT_SUMMARY_PATTERNS = [
     r"\bc[oó]mo\s+(?:los|las)\s+contacto\b",
 ]
 
+# Negaciones simples para evitar falsos positivos en la detección de humano
+HUMAN_NEGATION_PATTERNS = [
+    r"no\s+quiero\s+hablar",
+    r"no\s+humano",
+    r"sin\s+humano",
+]
+
+
+def _compile_alternation(patterns: List[str]) -> "re.Pattern":
+    """
+    Compila una lista de patrones en una única alternancia con grupos nombrados
+    (p0, p1, ...) para resolver todo en una sola pasada sobre el texto.
+    """
+    return re.compile(
+        "|".join(f"(?P<p{idx}>{pattern})" for idx, pattern in enumerate(patterns)),
+        re.IGNORECASE,
+    )
+
+
+def _search_pattern(compiled: "re.Pattern", patterns: List[str], text: str) -> Optional[str]:
+    """Retorna el patrón original que disparó la coincidencia, o None."""
+    match = compiled.search(text)
+    if match is None:
+        return None
+    for name, value in match.groupdict().items():
+        if value is not None:
+            return patterns[int(name[1:])]
+    return None
+
+
+CONTACT_QUERY_REGEX = _compile_alternation(CONTACT_QUERY_PATTERNS)
+HUMAN_NEGATION_REGEX = _compile_alternation(HUMAN_NEGATION_PATTERNS)
+HUMAN_INTENT_REGEX = _compile_alternation(HUMAN_INTENT_PATTERNS)
+CONTACT_RESPONSE_FIELD_REGEX = {
+    field: _compile_alternation(patterns)
+    for field, patterns in CONTACT_RESPONSE_FIELD_PATTERNS.items()
+}
+CONTACT_SUMMARY_REGEX = _compile_alternation(CONTACT_SUMMARY_PATTERNS)
+
+NLU_MODEL = "gpt-3.5-turbo"
+INTENT_SYSTEM_PROMPT = "Eres un clasificador de intenciones para un chatbot de equipos contra incendios. Responde solo con la categoría exacta solicitada."
+BATCH_SYSTEM_PROMPT = "Extraes y validas datos de contacto. Responde solo con un objeto JSON."
+
+# Campos que acepta la validación/extracción en lote
+BATCH_FIELDS = ("email", "direccion", "horario_visita", "descripcion", "razon_social", "cuit")
+
+# Versiones de prompt para las claves del cache: cambiar una plantilla invalida sus entradas
+INTENT_PROMPT_VERSION = prompt_version(NLU_MODEL, INTENT_SYSTEM_PROMPT, NLU_INTENT_PROMPT.render(mensaje_usuario="{}"))
+BATCH_PROMPT_VERSION = prompt_version(NLU_MODEL, BATCH_SYSTEM_PROMPT, NLU_BATCH_FIELDS_PROMPT.render(mensaje_usuario="{}", campos={}))
+
+# Etiquetas que puede devolver el prompt de intención; cualquier otra respuesta ("" o texto
+# libre) no se cachea para no fijar una respuesta rota durante todo el TTL
+INTENT_LABELS = frozenset({"PRESUPUESTO", "VISITA_TECNICA", "URGENCIA", "OTRAS", "UNCLEAR"})
+
+
+def _intent_cacheable(value: Any) -> bool:
+    return value in INTENT_LABELS
+
+
+def _non_empty_dict(value: Any) -> bool:
+    return isinstance(value, dict) and bool(value)
+
+
 class NLUService:
     
     def __init__(self):
         self._client = None
 
-    def _get_client(self) -> OpenAI:
+    def _get_client(self):
         if self._client is None:
             api_key = os.getenv("OPENAI_API_KEY")
             if not api_key:
                 raise ValueError("OPENAI_API_KEY es requerido para usar NLU LLM")
-            self._client = OpenAI(api_key=api_key)
+            # El SDK de OpenAI tarda ~0.5 s en importarse: se carga con el primer cliente, no con main
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(api_key=api_key, timeout=LLM_TIMEOUT_SECONDS, max_retries=1)
         return self._client
+
+    def warmup(self) -> None:
+        """Importa el SDK y arma el cliente antes del primer mensaje (warmup del lifespan)."""
+        self._get_client()
+
+    @staticmethod
+    def _build_request(system_prompt: str, user_prompt: str, max_tokens: int, json_mode: bool = False) -> Dict[str, Any]:
+        request = {
+            "model": NLU_MODEL,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": 0,
+            "max_tokens": max_tokens,
+        }
+        if json_mode:
+            request["response_format"] = {"type": "json_object"}
+        return request
+
+    @staticmethod
+    def _record_call(operation: str, request: Dict[str, Any], response: Any, started: float, outcome: str = "ok") -> None:
+        """Registra latencia, tokens (de `usage` o estimados con tiktoken) y costo de la llamada."""
+        latency_ms = (time.perf_counter() - started) * 1000
+        model = request["model"]
+        usage = getattr(response, "usage", None) if response is not None else None
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if not isinstance(prompt_tokens, int):
+            prompt_tokens = estimate_tokens("\n".join(m["content"] for m in request["messages"]), model)
+        if not isinstance(completion_tokens, int):
+            content = response.choices[0].message.content if response is not None else ""
+            completion_tokens = estimate_tokens(content or "", model)
+        nlu_metrics.record(operation, model, latency_ms, prompt_tokens, completion_tokens, outcome)
+        LLM_CALL_SECONDS.observe(latency_ms / 1000, operation=operation, outcome=outcome)
+
+    def _chat(
+        self,
+        operation: str,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        deadline: Optional[float] = None,
+        json_mode: bool = False,
+    ) -> str:
+        """Completion síncrona con deadline (usada por ChatbotRules)."""
+        request = self._build_request(system_prompt, user_prompt, max_tokens, json_mode=json_mode)
+        started = time.perf_counter()
+        try:
+            response = llm_runner.complete(self._get_client(), deadline=deadline, **request)
+        except LLMTimeoutError:
+            self._record_call(operation, request, None, started, outcome="timeout")
+            raise
+        except Exception:
+            self._record_call(operation, request, None, started, outcome="error")
+            raise
+        self._record_call(operation, request, response, started)
+        return response.choices[0].message.content.strip()
+
+    @staticmethod
+    def _map_intent(resultado: Optional[str]) -> Optional[TipoConsulta]:
+        mapeo = {
+            'PRESUPUESTO': TipoConsulta.PRESUPUESTO,
+            'VISITA_TECNICA': TipoConsulta.VISITA_TECNICA,
+            'URGENCIA': TipoConsulta.URGENCIA,
+            'OTRAS': TipoConsulta.OTRAS
+        }
+        return mapeo.get(resultado)
+
+    @staticmethod
+    def _parse_json_response(resultado_text: str, log_errors: bool = True) -> Optional[Dict[str, Any]]:
+        # Las respuestas inválidas retornan None y no se cachean
+        try:
+            return json.loads(resultado_text)
+        except json.JSONDecodeError:
+            if log_errors:
+                logger.error(f"Error parseando JSON de LLM: {resultado_text}")
+            return None
     
     def mapear_intencion(self, mensaje_usuario: str) -> Optional[TipoConsulta]:
         """
-        Mapea un mensaje de usuario a una de las opciones disponibles usando LLM
+        Mapea un mensaje de usuario a una de las opciones disponibles usando LLM.
+        Si el LLM no responde a tiempo retorna None (equivalente a UNCLEAR).
         """
         try:
             prompt = NLU_INTENT_PROMPT.render(mensaje_usuario=mensaje_usuario)
-
-            response = self._get_client().chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Eres un clasificador de intenciones para un chatbot de equipos contra incendios. Responde solo con la categoría exacta solicitada."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0,
-                max_tokens=10
+            resultado = llm_cache.get_or_compute(
+                "intent", INTENT_PROMPT_VERSION, [mensaje_usuario],
+                lambda: self._chat("intent", INTENT_SYSTEM_PROMPT, prompt, 10).upper(),
+                normalizer=normalize_loose,
+                cacheable=_intent_cacheable,
             )
-            
-            resultado = response.choices[0].message.content.strip().upper()
             logger.info(f"NLU mapeo: '{mensaje_usuario}' -> '{resultado}'")
-            
-            # Mapear respuesta a enum
-            mapeo = {
-                'PRESUPUESTO': TipoConsulta.PRESUPUESTO,
-                'VISITA_TECNICA': TipoConsulta.VISITA_TECNICA,
-                'URGENCIA': TipoConsulta.URGENCIA,
-                'OTRAS': TipoConsulta.OTRAS
-            }
-            
-            return mapeo.get(resultado)
-            
+            return self._map_intent(resultado)
+
+        except LLMTimeoutError as e:
+            logger.warning(f"NLU mapeo degradado a UNCLEAR: {str(e)}")
+            return None
         except Exception as e:
             logger.error(f"Error en mapeo de intención: {str(e)}")
             return None
-    
-    def extraer_datos_estructurados(self, mensaje_usuario: str) -> Dict[str, Any]:
+
+    @staticmethod
+    def _fallback_campo(valor: str) -> Dict[str, Any]:
+        # Sin respuesta válida del LLM: se acepta lo que haya (la validación local decide)
+        valor = (valor or "").strip()
+        return {"valor": valor, "valido": bool(valor), "sugerencia": ""}
+
+    @staticmethod
+    def _check_batch_schema(data: Any, campos: Dict[str, str]) -> Optional[Dict[str, Dict[str, Any]]]:
         """
-        Extrae datos de contacto de un mensaje usando LLM con enfoque semántico LLM-first
+        Verifica que la respuesta tenga {"campos": {campo: {"valor": str, "valido": bool,
+        "sugerencia": str}}} para todos los campos pedidos. Retorna None si no cumple.
         """
-        try:
-            prompt = NLU_MESSAGE_PARSING_PROMPT.render(mensaje_usuario=mensaje_usuario)
-
-            response = self._get_client().chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Eres un extractor de datos de contacto. Responde solo con JSON válido."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0,
-                max_tokens=200
-            )
-            
-            resultado_text = response.choices[0].message.content.strip()
-            logger.info(f"NLU extracción: '{mensaje_usuario}' -> '{resultado_text}'")
-            
-            # Intentar parsear JSON
-            try:
-                datos = json.loads(resultado_text)
-                return datos
-            except json.JSONDecodeError:
-                logger.error(f"Error parseando JSON de LLM: {resultado_text}")
-                return {}
-            
-        except Exception as e:
-            logger.error(f"Error en extracción de datos: {str(e)}")
-            return {}
-    
-    def validar_campo_individual(self, campo: str, valor: str, contexto: str = "") -> Dict[str, Any]:
+        if not isinstance(data, dict) or not isinstance(data.get("campos"), dict):
+            return None
+        resultado = {}
+        for campo in campos:
+            entrada = data["campos"].get(campo)
+            if not isinstance(entrada, dict):
+                return None
+            valor = entrada.get("valor", "")
+            valido = entrada.get("valido")
+            sugerencia = entrada.get("sugerencia") or ""
+            if not isinstance(valor, str) or not isinstance(valido, bool) or not isinstance(sugerencia, str):
+                return None
+            resultado[campo] = {"valor": valor.strip(), "valido": valido, "sugerencia": sugerencia.strip()}
+        return resultado
+
+    def procesar_campos_lote(self, campos: Dict[str, str], mensaje_usuario: str = "") -> Dict[str, Dict[str, Any]]:
         """
-        Valida y mejora un campo individual usando LLM
+        Extrae y valida varios campos en una sola completion (JSON mode).
+
+        `campos` mapea cada campo de BATCH_FIELDS a su valor actual; un valor vacío
+        significa "extraerlo de `mensaje_usuario`". Retorna, por campo,
+        {"valor", "valido", "sugerencia"}. Si el LLM falla, no responde a tiempo o
+        la respuesta no cumple el esquema, cada campo vuelve con el valor original.
         """
+        campos = {campo: (valor or "").strip() for campo, valor in campos.items() if campo in BATCH_FIELDS}
+        if not campos:
+            return {}
+        fallback = {campo: self._fallback_campo(valor) for campo, valor in campos.items()}
+
         try:
-            prompts_campo = {
-                'email': f"¿Es '{valor}' un email válido? Responde: {{'valido': true/false, 'sugerencia': 'email corregido o mensaje'}}",
-                'direccion': f"¿Es '{valor}' una dirección válida en Argentina? Responde: {{'valido': true/false, 'sugerencia': 'dirección mejorada o mensaje'}}",
-                'horario_visita': f"¿Es '{valor}' un horario/disponibilidad comprensible? Responde: {{'valido': true/false, 'sugerencia': 'horario mejorado o mensaje'}}",
-                'descripcion': f"¿Es '{valor}' una descripción clara de servicios contra incendios? Responde: {{'valido': true/false, 'sugerencia': 'descripción mejorada o mensaje'}}"
-            }
-            
-            if campo not in prompts_campo:
-                return {'valido': True, 'sugerencia': valor}
-            
-            prompt = prompts_campo[campo]
-            if contexto:
-                prompt += f"\nContexto: {contexto}"
-            
-            response = self._get_client().chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Valida datos de contacto. Responde solo con JSON válido."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0,
-                max_tokens=100
+            prompt = NLU_BATCH_FIELDS_PROMPT.render(mensaje_usuario=mensaje_usuario, campos=campos)
+
+            def _consultar_llm() -> Optional[Dict[str, Dict[str, Any]]]:
+                resultado_text = self._chat("batch_fields", BATCH_SYSTEM_PROMPT, prompt, 60 + 80 * len(campos), json_mode=True)
+                resultado = self._check_batch_schema(self._parse_json_response(resultado_text), campos)
+                if resultado is None:
+                    logger.warning(f"NLU lote: respuesta fuera de esquema: {resultado_text}")
+                return resultado
+
+            resultado = llm_cache.get_or_compute(
+                "batch_fields", BATCH_PROMPT_VERSION,
+                [mensaje_usuario, json.dumps(campos, sort_keys=True, ensure_ascii=False)],
+                _consultar_llm,
+                normalizer=normalize_exact,
+                cacheable=_non_empty_dict,
             )
-            
-            resultado_text = response.choices[0].message.content.strip()
-            try:
-                return json.loads(resultado_text)
-            except json.JSONDecodeError:
-                return {'valido': True, 'sugerencia': valor}
-            
+            if resultado is None:
+                return fallback
+            logger.info(f"NLU lote: {sorted(campos)} -> {sum(1 for r in resultado.values() if r['valido'])} válidos")
+            return resultado
+
+        except LLMTimeoutError as e:
+            logger.warning(f"NLU lote degradado a validación local: {str(e)}")
+            return fallback
         except Exception as e:
-            logger.error(f"Error validando campo {campo}: {str(e)}")
-            return {'valido': True, 'sugerencia': valor}
+            logger.error(f"Error procesando campos en lote: {str(e)}")
+            return fallback
 
     @staticmethod
-    def _normalize_text(text: str) -> str:
-        import unicodedata
-
-        text = (text or "").lower().strip()
-        return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+    def _normalize_text(text: Union[str, MessageContext]) -> str:
+        return MessageContext.from_text(text).accent_free
 
-    def _extract_requested_contact_fields(self, mensaje_usuario: str, include_website: bool = True) -> list[str]:
+    def _extract_requested_contact_fields(self, mensaje_usuario: Union[str, MessageContext], include_website: bool = True) -> list[str]:
         normalized = self._normalize_text(mensaje_usuario)
         requested_fields = []
 
-        for field, patterns in CONTACT_RESPONSE_FIELD_PATTERNS.items():
+        for field, compiled in CONTACT_RESPONSE_FIELD_REGEX.items():
             if field == "website" and not include_website:
                 continue
-            if any(re.search(pattern, normalized, re.IGNORECASE) for pattern in patterns):
+            if compiled.search(normalized):
                 requested_fields.append(field)
 
-        wants_summary = any(
-            re.search(pattern, normalized, re.IGNORECASE)
-            for pattern in CONTACT_SUMMARY_PATTERNS
-        )
+        wants_summary = CONTACT_SUMMARY_REGEX.search(normalized) is not None
 
         if wants_summary or not requested_fields:
             requested_fields = ["phone", "address", "hours", "email"]
@@ -305,62 +436,52 @@ class NLUService:
         return "\n".join(lines).strip()
     
     
-    def detectar_consulta_contacto(self, mensaje_usuario: str) -> bool:
+    def detectar_consulta_contacto(self, mensaje_usuario: Union[str, MessageContext]) -> bool:
         """
         Detecta si el usuario está preguntando sobre información de contacto de la empresa usando regex
         """
         try:
             # Normalización básica: minúsculas y remover tildes
-            import unicodedata
-            def _normalize(s: str) -> str:
-                s = s.lower().strip()
-                return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-
-            mensaje_lower = _normalize(mensaje_usuario)
+            contexto = MessageContext.from_text(mensaje_usuario)
+            mensaje_usuario = contexto.raw
+            mensaje_lower = contexto.accent_free
             
-            # Buscar coincidencias con los patrones de consulta de contacto
-            for pattern in CONTACT_QUERY_PATTERNS:
-                if re.search(pattern, mensaje_lower, re.IGNORECASE):
-                    logger.info(f"Detección consulta contacto (regex): '{mensaje_usuario}' -> CONTACTO (pattern: {pattern})")
-                    return True
+            # Buscar coincidencias con los patrones de consulta de contacto (una sola pasada)
+            pattern = _search_pattern(CONTACT_QUERY_REGEX, CONTACT_QUERY_PATTERNS, mensaje_lower)
+            if pattern is not None:
+                logger.info("Detección consulta contacto (regex) -> CONTACTO (pattern: %s)", pattern)
+                logger.debug("Detección consulta contacto texto: %r", mensaje_usuario)
+                return True
             
-            logger.info(f"Detección consulta contacto (regex): '{mensaje_usuario}' -> NO")
+            logger.debug("Detección consulta contacto (regex): %r -> NO", mensaje_usuario)
             return False
         except Exception as e:
             logger.error(f"Error detectando consulta de contacto: {str(e)}")
             return False
 
-    def detectar_solicitud_humano(self, mensaje_usuario: str) -> bool:
+    def detectar_solicitud_humano(self, mensaje_usuario: Union[str, MessageContext]) -> bool:
         """
         Detecta si el usuario solicita hablar con un humano/agente.
         Usa patrones regex tolerantes a acentos y variaciones comunes.
         """
         try:
             # Normalización básica
-            import unicodedata
-            def _normalize(s: str) -> str:
-                s = s.lower().strip()
-                return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-
-            mensaje_lower = _normalize(mensaje_usuario)
+            contexto = MessageContext.from_text(mensaje_usuario)
+            mensaje_usuario = contexto.raw
+            mensaje_lower = contexto.accent_free
 
             # Negaciones simples para evitar falsos positivos
-            negaciones = [
-                r"no\s+quiero\s+hablar",
-                r"no\s+humano",
-                r"sin\s+humano",
-            ]
-            for neg in negaciones:
-                if re.search(neg, mensaje_lower, re.IGNORECASE):
-                    logger.info(f"Detección humano (regex): '{mensaje_usuario}' -> NO (negación)")
-                    return False
+            if _search_pattern(HUMAN_NEGATION_REGEX, HUMAN_NEGATION_PATTERNS, mensaje_lower) is not None:
+                logger.debug("Detección humano (regex): %r -> NO (negación)", mensaje_usuario)
+                return False
 
-            for pattern in HUMAN_INTENT_PATTERNS:
-                if re.search(pattern, mensaje_lower, re.IGNORECASE):
-                    logger.info(f"Detección humano (regex): '{mensaje_usuario}' -> HUMANO (pattern: {pattern})")
-                    return True
+            pattern = _search_pattern(HUMAN_INTENT_REGEX, HUMAN_INTENT_PATTERNS, mensaje_lower)
+            if pattern is not None:
+                logger.info("Detección humano (regex) -> HUMANO (pattern: %s)", pattern)
+                logger.debug("Detección humano texto: %r", mensaje_usuario)
+                return True
 
-            logger.info(f"Detección humano (regex): '{mensaje_usuario}' -> NO")
+            logger.debug("Detección humano (regex): %r -> NO", mensaje_usuario)
             return False
         except Exception as e:
             logger.error(f"Error detectando solicitud humano: {str(e)}")
@@ -404,16 +525,18 @@ class NLUService:
             # Fallback a info general de contacto
             return get_company_info_text()
     
-    def generar_respuesta_contacto(self, mensaje_usuario: str) -> str:
+    def generar_respuesta_contacto(self, mensaje_usuario: Union[str, MessageContext]) -> str:
         """
         Genera una respuesta determinística sobre información de contacto de la empresa.
         No usa LLM para evitar que texto arbitrario del usuario termine afectando
         la redacción de salida.
         """
         try:
+            contexto = MessageContext.from_text(mensaje_usuario)
+            mensaje_usuario = contexto.raw
             company_profile = get_active_company_profile()
             requested_fields = self._extract_requested_contact_fields(
-                mensaje_usuario,
+                contexto,
                 include_website=bool(company_profile.get("website")),
             )
             respuesta = self._build_contact_response(company_profile, requested_fields)
@@ -427,5 +550,20 @@ class NLUService:
             logger.error(f"Error generando respuesta de contacto: {str(e)}")
             return get_company_info_text()
     
+    @staticmethod
+    def cache_stats() -> Dict[str, Any]:
+        """Estadísticas del cache de respuestas del LLM (hit rate, latencia ahorrada)."""
+        return llm_cache.stats()
+
+    @staticmethod
+    def runner_stats() -> Dict[str, Any]:
+        """Llamadas en vuelo, timeouts, hedges y percentiles de latencia del LLM."""
+        return llm_runner.stats()
+
+    @staticmethod
+    def usage_stats() -> Dict[str, Any]:
+        """Llamadas, latencia, tokens y costo del LLM por operación y estado de conversación."""
+        return nlu_metrics.snapshot()
+
 # Instancia global del servicio
 nlu_service = NLUService()
@@ -3,14 +3,8 @@ import json
 import base64
 import time
 import logging
-from typing import List, Dict, Any, Optional
-
-try:
-    import gspread
-    from google.oauth2.service_account import Credentials
-except Exception:
-    gspread = None
-    Credentials = None
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +14,18 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive.readonly'
 ]
 
+SHEETS_HANDLE_TTL_SECONDS = int(os.getenv('SHEETS_HANDLE_TTL_SECONDS', '1800'))
+SHEETS_BATCH_SIZE = int(os.getenv('SHEETS_BATCH_SIZE', '20'))
+SHEETS_FLUSH_SECONDS = float(os.getenv('SHEETS_FLUSH_SECONDS', '10'))
+SHEETS_MAX_BUFFERED_ROWS = int(os.getenv('SHEETS_MAX_BUFFERED_ROWS', '1000'))
+SHEETS_MAX_BACKOFF_SECONDS = 300.0
+
+
+def _is_quota_error(error: Exception) -> bool:
+    code = getattr(error, 'code', None)
+    text = str(error)
+    return code == 429 or '429' in text or 'RESOURCE_EXHAUSTED' in text or 'Quota exceeded' in text
+
 
 class SheetsService:
     def __init__(self):
@@ -38,6 +44,22 @@ class SheetsService:
         self._last_auth_ts = 0
         self._auth_ttl = 60 * 30  # 30 min
 
+        # Handles de worksheet por target: (worksheet, timestamp)
+        self._worksheets: Dict[str, Tuple[Any, float]] = {}
+        self._handle_ttl = SHEETS_HANDLE_TTL_SECONDS
+        # Filas pendientes por target; las escribe el worker en lotes
+        self.batch_size = SHEETS_BATCH_SIZE
+        self.flush_seconds = SHEETS_FLUSH_SECONDS
+        self.max_buffered_rows = SHEETS_MAX_BUFFERED_ROWS
+        self._buffers: Dict[str, List[List[Any]]] = {}
+        # Protege buffers, stats, backoff y handles: los tocan los requests y el worker
+        self._cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._stopping = False
+        self._backoff_until = 0.0
+        self._backoff_seconds = 0.0
+        self.stats = {'rows_buffered': 0, 'rows_written': 0, 'rows_dropped': 0, 'api_calls': 0, 'quota_errors': 0}
+
         if not self.enabled:
             logger.info('SheetsService disabled (ENABLE_SHEETS_METRICS=false)')
         elif not self.spreadsheet_metrics_id:
@@ -55,6 +77,8 @@ class SheetsService:
             else:
                 decoded = base64.b64decode(sa_raw)
                 info = json.loads(decoded)
+            from google.oauth2.service_account import Credentials
+
             creds = Credentials.from_service_account_info(info, scopes=SCOPES)
             return creds
         except Exception as e:
@@ -64,48 +88,168 @@ class SheetsService:
         now = time.time()
         if self._gc and now - self._last_auth_ts < self._auth_ttl:
             return self._gc
-        if gspread is None or Credentials is None:
+        # gspread (y google-auth, que trae) se importa recién acá: ~0.2 s menos en el arranque
+        try:
+            import gspread
+        except Exception:
             raise RuntimeError('gspread/google-auth not installed')
         creds = self._load_credentials()
         self._gc = gspread.authorize(creds)
         self._last_auth_ts = now
         return self._gc
 
+    def _resolve_target(self, target: str):
+        if target == 'errors':
+            return self.spreadsheet_errors_id, self.errors_sheet_name
+        if target == 'business':
+            return self.spreadsheet_metrics_id, self.business_sheet_name
+        if target == 'survey':
+            return self.spreadsheet_metrics_id, self.survey_sheet_name
+        if target == 'kpis':
+            return self.spreadsheet_metrics_id, self.kpi_sheet_name
+        return self.spreadsheet_metrics_id, self.tech_sheet_name
+
+    def _get_worksheet(self, target: str):
+        now = time.time()
+        with self._cond:
+            cached = self._worksheets.get(target)
+        if cached and now - cached[1] < self._handle_ttl:
+            return cached[0]
+        # La apertura va a la red: se hace sin el lock para no frenar a append_row
+        ss_id, sheet_name = self._resolve_target(target)
+        sh = self._get_client().open_by_key(ss_id)
+        ws = sh.worksheet(sheet_name)
+        with self._cond:
+            self._worksheets[target] = (ws, now)
+        return ws
+
+    def _invalidate_worksheet(self, target: str) -> None:
+        with self._cond:
+            self._worksheets.pop(target, None)
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._cond:
+            self.stats[key] += amount
+
     def append_row(self, target: str, row: List[Any]) -> bool:
         """
         target: 'business', 'tech', 'errors', 'survey', or 'kpis'
         row: list of values to append
+
+        La fila queda en el buffer del target y la escribe el worker en un
+        solo `values.append` junto con las demás (por tamaño o por tiempo).
         """
         if not self.enabled:
             return False
+        with self._cond:
+            buffer = self._buffers.setdefault(target, [])
+            buffer.append(list(row))
+            self.stats['rows_buffered'] += 1
+            if len(buffer) > self.max_buffered_rows:
+                # Sheets caído por mucho tiempo: se descartan las filas más viejas
+                del buffer[0]
+                self.stats['rows_dropped'] += 1
+                logger.warning(f'Sheets buffer lleno ({target}); se descarta la fila más antigua')
+            if len(buffer) >= self.batch_size:
+                self._cond.notify_all()
+        self._ensure_worker()
+        return True
+
+    def _ensure_worker(self) -> None:
+        with self._cond:
+            if self._worker is not None:
+                return
+            self._stopping = False
+            self._worker = threading.Thread(target=self._worker_loop, name='sheets-writer', daemon=True)
+            self._worker.start()
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or any(len(rows) >= self.batch_size for rows in self._buffers.values()),
+                    timeout=self.flush_seconds,
+                )
+                if self._stopping:
+                    return
+                wait = self._backoff_until - time.time()
+            if wait > 0:
+                time.sleep(min(wait, self.flush_seconds))
+                continue
+            self.flush_buffers()
+
+    def flush_buffers(self) -> bool:
+        """Escribe lo pendiente de cada target con una sola llamada; True si no quedó nada."""
+        with self._cond:
+            pending = {target: rows for target, rows in self._buffers.items() if rows}
+            for target in pending:
+                self._buffers[target] = []
+        ok = True
+        for target, rows in pending.items():
+            try:
+                self.append_rows(target, rows)
+                with self._cond:
+                    self.stats['rows_written'] += len(rows)
+                    self._backoff_seconds = 0.0
+            except Exception as e:
+                ok = False
+                quota = _is_quota_error(e)
+                with self._cond:
+                    self._backoff_seconds = min(max(self._backoff_seconds * 2, 5.0), SHEETS_MAX_BACKOFF_SECONDS)
+                    self._backoff_until = time.time() + self._backoff_seconds
+                    backoff = self._backoff_seconds
+                    if quota:
+                        self.stats['quota_errors'] += 1
+                    # Se devuelven al frente del buffer para conservar el orden
+                    self._buffers[target] = (rows + self._buffers.get(target, []))[-self.max_buffered_rows:]
+                if quota:
+                    logger.warning(f'Sheets quota ({target}); reintento en {backoff:.0f}s')
+                else:
+                    logger.error(f'Sheets append error ({target}): {str(e)}; reintento en {backoff:.0f}s')
+        return ok
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Detiene el worker y escribe lo que quedó en los buffers (apagado)."""
+        with self._cond:
+            worker = self._worker
+            self._stopping = True
+            self._cond.notify_all()
+        if worker is not None:
+            worker.join(timeout=timeout)
+            self._worker = None
+        if self.enabled:
+            self.flush_buffers()
+
+    def append_rows(self, target: str, rows: List[List[Any]]) -> Optional[str]:
+        """
+        Agrega varias filas con un solo `values.append`. Retorna el rango
+        escrito (p. ej. 'A10:N11') y propaga el error para que el llamador reintente.
+        """
+        if not self.enabled or not rows:
+            return None
+        self._count('api_calls')
         try:
-            gc = self._get_client()
-            if target == 'errors':
-                ss_id = self.spreadsheet_errors_id
-                sheet_name = self.errors_sheet_name
-            elif target == 'business':
-                ss_id = self.spreadsheet_metrics_id
-                sheet_name = self.business_sheet_name
-            elif target == 'tech':
-                ss_id = self.spreadsheet_metrics_id
-                sheet_name = self.tech_sheet_name
-            elif target == 'survey':
-                ss_id = self.spreadsheet_metrics_id
-                sheet_name = self.survey_sheet_name
-            elif target == 'kpis':
-                ss_id = self.spreadsheet_metrics_id
-                sheet_name = self.kpi_sheet_name
-            else:
-                ss_id = self.spreadsheet_metrics_id
-                sheet_name = self.tech_sheet_name
+            response = self._get_worksheet(target).append_rows(rows, value_input_option='RAW')
+        except Exception:
+            # El handle puede haber quedado inválido (hoja renombrada, credencial vencida)
+            self._invalidate_worksheet(target)
+            raise
+        updated_range = (response or {}).get('updates', {}).get('updatedRange', '')
+        return updated_range.split('!', 1)[-1] or None
 
-            sh = gc.open_by_key(ss_id)
-            ws = sh.worksheet(sheet_name)
-            ws.append_row(row, value_input_option='RAW')
-            return True
-        except Exception as e:
-            logger.error(f'Sheets append_row error ({target}): {str(e)}')
-            return False
+    def update_rows(self, target: str, updates: Dict[str, List[Any]]) -> None:
+        """Sobrescribe filas existentes ({rango A1: fila}) con un solo `batch_update`."""
+        if not self.enabled or not updates:
+            return
+        self._count('api_calls')
+        try:
+            self._get_worksheet(target).batch_update(
+                [{'range': a1_range, 'values': [row]} for a1_range, row in updates.items()],
+                value_input_option='RAW',
+            )
+        except Exception:
+            self._invalidate_worksheet(target)
+            raise
 
 
 sheets_service = SheetsService()
@@ -1,10 +1,11 @@
 import os
 import logging
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional, Tuple, Union
 from datetime import datetime
 
 from services.meta_whatsapp_service import meta_whatsapp_service
 from services.sheets_service import sheets_service
+from chatbot.message_context import MessageContext
 from chatbot.models import ConversacionData, EstadoConversacion
 
 logger = logging.getLogger(__name__)
@@ -99,6 +100,8 @@ class SurveyService:
             # Cambiar estado a ENCUESTA_SATISFACCION
             from chatbot.models import EstadoConversacion
             conversation.estado = EstadoConversacion.ENCUESTA_SATISFACCION
+            from chatbot.states import conversation_manager
+            conversation_manager.schedule_handoff_deadline(client_phone)
 
             # Construir mensaje de la primera pregunta (sin preámbulo, ya viene del opt-in)
             question_data = self.questions[1]
@@ -122,7 +125,7 @@ class SurveyService:
             logger.error(f"Error en send_survey: {e}")
             return False
     
-    def process_survey_response(self, client_phone: str, message: str, conversation: ConversacionData) -> Tuple[bool, Optional[str]]:
+    def process_survey_response(self, client_phone: str, message: Union[str, MessageContext], conversation: ConversacionData) -> Tuple[bool, Optional[str]]:
         """
         Procesa la respuesta del cliente a la encuesta
         
@@ -195,7 +198,7 @@ class SurveyService:
         """Construye el mensaje de finalización de la encuesta"""
         return "¡Gracias por tu tiempo! Tus respuestas nos ayudan a mejorar nuestro servicio. ✅"
     
-    def _parse_response(self, message: str, question_data: Dict) -> Optional[str]:
+    def _parse_response(self, message: Union[str, MessageContext], question_data: Dict) -> Optional[str]:
         """
         Parsea la respuesta del cliente y la convierte al formato estándar
         
@@ -206,7 +209,7 @@ class SurveyService:
         Returns:
             Optional[str]: Respuesta parseada o None si es inválida
         """
-        message = message.strip().lower()
+        message = MessageContext.from_text(message).lower
 
         # Robust: accept "1", "1️⃣", "1.", "opción 1", etc.
         digits = "".join(c for c in message if c.isdigit())
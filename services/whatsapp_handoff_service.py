@@ -5,6 +5,7 @@ from datetime import datetime
 import json
 
 from .meta_whatsapp_service import meta_whatsapp_service
+from .handoff_scheduler import handoff_scheduler, normalize_agent_phone
 
 logger = logging.getLogger(__name__)
 
@@ -29,18 +30,23 @@ class WhatsAppHandoffService:
     """Servicio para manejar handoffs a agentes humanos vía WhatsApp usando Meta Cloud API."""
 
     def __init__(self):
-        self.agent_whatsapp_number = os.getenv("AGENT_WHATSAPP_NUMBER", "")
+        # Agente principal: recibe las notificaciones que no tienen un agente asignado
+        self.agent_whatsapp_number = os.getenv("AGENT_WHATSAPP_NUMBER", "") or handoff_scheduler.primary_agent()
         if not self.agent_whatsapp_number:
-            raise ValueError("AGENT_WHATSAPP_NUMBER es requerido para el handoff a WhatsApp")
+            raise ValueError("AGENT_WHATSAPP_NUMBER (o AGENT_WHATSAPP_NUMBERS) es requerido para el handoff a WhatsApp")
         
         # Asegurar que el número tenga el formato correcto
         if not self.agent_whatsapp_number.startswith('+'):
             self.agent_whatsapp_number = f'+{self.agent_whatsapp_number}'
         
-        logger.info(f"WhatsApp Handoff Service inicializado (Meta API). Agente: {self.agent_whatsapp_number}")
+        logger.info(
+            f"WhatsApp Handoff Service inicializado (Meta API). Agente: {self.agent_whatsapp_number} "
+            f"({len(handoff_scheduler.agents)} agente(s) registrados)"
+        )
 
     def notify_agent_new_handoff(self, client_phone: str, client_name: str, 
-                                handoff_message: str, current_message: str) -> bool:
+                                handoff_message: str, current_message: str,
+                                agent_phone: Optional[str] = None) -> bool:
         """
         Notifica al agente sobre una nueva solicitud de handoff.
         
@@ -49,12 +55,14 @@ class WhatsAppHandoffService:
             client_name: Nombre del cliente (si está disponible)
             handoff_message: Mensaje que disparó el handoff
             current_message: Último mensaje del cliente
+            agent_phone: Agente asignado (default: agente principal)
             
         Returns:
             bool: True si la notificación se envió exitosamente
         """
         try:
-            template_sent = self._send_handoff_template(client_phone, client_name, handoff_message)
+            agent_phone = agent_phone or self.agent_whatsapp_number
+            template_sent = self._send_handoff_template(client_phone, client_name, handoff_message, agent_phone)
             if template_sent:
                 logger.info(f"✅ Template de handoff enviado al agente para cliente {client_phone}")
                 return True
@@ -64,7 +72,7 @@ class WhatsAppHandoffService:
                 client_phone, client_name, handoff_message, current_message
             )
             success = meta_whatsapp_service.send_text_message(
-                self.agent_whatsapp_number,
+                agent_phone,
                 notification
             )
 
@@ -80,7 +88,7 @@ class WhatsAppHandoffService:
             return False
 
     def notify_agent_new_message(self, client_phone: str, client_name: str, 
-                                message: str) -> bool:
+                                message: str, agent_phone: Optional[str] = None) -> bool:
         """
         Notifica al agente sobre un nuevo mensaje del cliente durante el handoff.
         
@@ -88,6 +96,7 @@ class WhatsAppHandoffService:
             client_phone: Número de teléfono del cliente
             client_name: Nombre del cliente
             message: Nuevo mensaje del cliente
+            agent_phone: Agente asignado (default: agente principal)
             
         Returns:
             bool: True si la notificación se envió exitosamente
@@ -98,7 +107,7 @@ class WhatsAppHandoffService:
             agent_message += f"Mensaje: {message}"
             
             success = meta_whatsapp_service.send_text_message(
-                self.agent_whatsapp_number, 
+                agent_phone or self.agent_whatsapp_number, 
                 agent_message
             )
             
@@ -145,13 +154,15 @@ class WhatsAppHandoffService:
             logger.error(f"Error en send_agent_response_to_client: {e}")
             return False
 
-    def notify_handoff_resolved(self, client_phone: str, client_name: str) -> bool:
+    def notify_handoff_resolved(self, client_phone: str, client_name: str,
+                                agent_phone: Optional[str] = None) -> bool:
         """
         Notifica al agente que el handoff ha sido resuelto.
         
         Args:
             client_phone: Número de teléfono del cliente
             client_name: Nombre del cliente
+            agent_phone: Agente asignado (default: agente principal)
             
         Returns:
             bool: True si la notificación se envió exitosamente
@@ -162,7 +173,7 @@ class WhatsAppHandoffService:
             agent_message += f"La conversación ha sido finalizada exitosamente."
             
             success = meta_whatsapp_service.send_text_message(
-                self.agent_whatsapp_number, 
+                agent_phone or self.agent_whatsapp_number, 
                 agent_message
             )
             
@@ -192,7 +203,8 @@ class WhatsAppHandoffService:
         
         return message
 
-    def _send_handoff_template(self, client_phone: str, client_name: str, handoff_message: str) -> bool:
+    def _send_handoff_template(self, client_phone: str, client_name: str, handoff_message: str,
+                               agent_phone: Optional[str] = None) -> bool:
         components = [
             {
                 "type": "body",
@@ -204,7 +216,7 @@ class WhatsAppHandoffService:
             }
         ]
         return meta_whatsapp_service.send_template_message(
-            self.agent_whatsapp_number,
+            agent_phone or self.agent_whatsapp_number,
             HANDOFF_TEMPLATE_NAME,
             HANDOFF_TEMPLATE_LANGUAGE,
             components,
@@ -212,19 +224,19 @@ class WhatsAppHandoffService:
 
     def is_agent_message(self, from_number: str) -> bool:
         """
-        Verifica si un mensaje proviene del agente.
+        Verifica si un mensaje proviene de alguno de los agentes registrados.
         
         Args:
             from_number: Número de teléfono que envió el mensaje
             
         Returns:
-            bool: True si el mensaje proviene del agente
+            bool: True si el mensaje proviene de un agente
         """
         # Normalizar números para comparación
-        normalized_from = from_number.replace('whatsapp:', '').replace('+', '')
-        normalized_agent = self.agent_whatsapp_number.replace('+', '')
-        
-        return normalized_from == normalized_agent
+        normalized_from = normalize_agent_phone(from_number)
+        if normalized_from == normalize_agent_phone(self.agent_whatsapp_number):
+            return True
+        return handoff_scheduler.resolve_agent(normalized_from) is not None
 
     def is_resolution_command(self, message: str) -> bool:
         """
@@ -244,7 +256,8 @@ class WhatsAppHandoffService:
         return message.strip().lower() in resolution_commands
 
     def send_agent_buttons(self, client_phone: str, client_name: str, 
-                          handoff_message: str, current_message: str) -> bool:
+                          handoff_message: str, current_message: str,
+                          agent_phone: Optional[str] = None) -> bool:
         """
         Envía notificación al agente con opciones de respuesta.
         
@@ -265,7 +278,7 @@ class WhatsAppHandoffService:
             
             # Enviar mensaje principal
             success = meta_whatsapp_service.send_text_message(
-                self.agent_whatsapp_number, 
+                agent_phone or self.agent_whatsapp_number, 
                 main_message
             )
             
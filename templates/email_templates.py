@@ -0,0 +1,155 @@
+from jinja2 import Environment
+from markupsafe import Markup, escape
+
+
+def _nl2br(value) -> Markup:
+    return Markup("<br>").join(escape(line) for line in str(value or "").split("\n"))
+
+
+# Entorno único con autoescape: los datos del cliente nunca se insertan sin escapar.
+# Las plantillas se compilan una sola vez al importar el módulo.
+_env = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
+_env.filters["nl2br"] = _nl2br
+
+
+LEAD_EMAIL_TEMPLATE = _env.from_string("""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Nueva Consulta - {{ company_name }}</title>
+</head>
+<body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+
+    <div style="background-color: #1f2937; color: white; padding: 20px; text-align: center; border-radius: 8px 8px 0 0;">
+        <h1 style="margin: 0; font-size: 24px;">🔥 {{ company_name | upper }}</h1>
+        <p style="margin: 5px 0 0 0; font-size: 14px;">Nueva consulta desde WhatsApp</p>
+    </div>
+
+    <div style="background-color: #f9fafb; border: 1px solid #e5e7eb; border-top: none; padding: 20px; border-radius: 0 0 8px 8px;">
+
+        <div style="{% if es_urgencia %}background-color: #fee2e2; border-left: 4px solid #dc2626; padding: 10px; margin: 10px 0;{% endif %}">
+            <h2 style="color: #dc2626; margin: 0 0 10px 0;">
+                {{ tipo_consulta_texto }}
+            </h2>
+        </div>
+
+        <div style="background-color: white; padding: 20px; border-radius: 8px; box-shadow: 0 1px 3px rgba(0,0,0,0.1);">
+
+            <h3 style="color: #1f2937; border-bottom: 2px solid #f59e0b; padding-bottom: 5px;">
+                📋 Datos del Cliente
+            </h3>
+
+            <table style="width: 100%; border-collapse: collapse; margin: 15px 0;">
+                <tr>
+                    <td style="padding: 8px 0; font-weight: bold; color: #374151; width: 30%;">📧 Email:</td>
+                    <td style="padding: 8px 0; color: #1f2937;">
+                        <a href="mailto:{{ contacto.email }}" style="color: #2563eb; text-decoration: none;">
+                            {{ contacto.email }}
+                        </a>
+                    </td>
+                </tr>
+                {% if mostrar_datos_visita %}
+                {% if contacto.razon_social %}
+                <tr style="background-color: #ffffff;">
+                    <td style="padding: 8px 0; font-weight: bold; color: #374151;">🏢 Razón social:</td>
+                    <td style="padding: 8px 0; color: #1f2937;">{{ contacto.razon_social }}</td>
+                </tr>
+                {% endif %}
+                {% if contacto.cuit %}
+                <tr style="background-color: #f9fafb;">
+                    <td style="padding: 8px 0; font-weight: bold; color: #374151;">🧾 CUIT:</td>
+                    <td style="padding: 8px 0; color: #1f2937;">{{ contacto.cuit }}</td>
+                </tr>
+                {% endif %}
+                <tr style="background-color: #f9fafb;">
+                    <td style="padding: 8px 0; font-weight: bold; color: #374151;">📍 Dirección:</td>
+                    <td style="padding: 8px 0; color: #1f2937;">{{ contacto.direccion }}</td>
+                </tr>
+                <tr>
+                    <td style="padding: 8px 0; font-weight: bold; color: #374151;">🕒 Horario de visita:</td>
+                    <td style="padding: 8px 0; color: #1f2937;">{{ contacto.horario_visita }}</td>
+                </tr>
+                {% endif %}
+                <tr style="background-color: #f9fafb;">
+                    <td style="padding: 8px 0; font-weight: bold; color: #374151;">📱 WhatsApp:</td>
+                    <td style="padding: 8px 0; color: #1f2937;">
+                        <a href="https://wa.me/{{ phone_href }}" style="color: #059669; text-decoration: none;">
+                            {{ numero_telefono }}
+                        </a>
+                    </td>
+                </tr>
+            </table>
+
+            {% if items %}
+            <h3 style="color: #1f2937; border-bottom: 2px solid #f59e0b; padding-bottom: 5px; margin-top: 30px;">
+                🧯 Productos solicitados
+            </h3>
+
+            <div style="margin: 15px 0;">
+                {% for item in items %}
+                <div style="background-color: #f0f9ff; border: 1px solid #dbeafe; border-radius: 10px; padding: 14px 16px; margin-bottom: 12px;">
+                    <div style="color: #0f172a; font-weight: 700; margin: 0;">
+                        {{ loop.index }}. {{ item.title }}
+                    </div>
+                    {% if item.details %}
+                    <ul style="margin: 10px 0 0 18px; padding: 0; color: #374151;">
+                        {% for detail in item.details %}
+                        <li style="margin: 0 0 6px 0;">{{ detail }}</li>
+                        {% endfor %}
+                    </ul>
+                    {% endif %}
+                </div>
+                {% endfor %}
+            </div>
+            {% else %}
+            <h3 style="color: #1f2937; border-bottom: 2px solid #f59e0b; padding-bottom: 5px; margin-top: 30px;">
+                📝 Descripción de la Necesidad
+            </h3>
+            <div style="background-color: #f0f9ff; border-left: 4px solid #0ea5e9; padding: 15px; margin: 15px 0; border-radius: 0 8px 8px 0;">
+                <p style="margin: 0; color: #1f2937; font-style: italic;">
+                    "{{ contacto.descripcion | nl2br }}"
+                </p>
+            </div>
+            {% endif %}
+
+        </div>
+
+        <div style="margin-top: 20px; padding: 15px; background-color: #ecfdf5; border-radius: 8px; border-left: 4px solid #10b981;">
+            <h4 style="color: #047857; margin: 0 0 10px 0;">✅ Próximos Pasos</h4>
+            <ul style="margin: 0; padding-left: 20px; color: #065f46;">
+                <li>Contactar al cliente vía email o WhatsApp</li>
+                <li>Evaluar la solicitud y preparar respuesta</li>
+                <li>Coordinar visita técnica si es necesario</li>
+            </ul>
+        </div>
+
+        <hr style="border: none; border-top: 1px solid #e5e7eb; margin: 20px 0;">
+
+        <p style="text-align: center; color: #6b7280; font-size: 12px; margin: 0;">
+            📅 Solicitud generada el {{ fecha_actual }}<br>
+            🤖 Procesado automáticamente por {{ bot_name }} - Asistente Virtual de {{ company_name }}
+        </p>
+
+    </div>
+
+</body>
+</html>
+""")
+
+
+ERROR_REPORT_TEMPLATE = _env.from_string("""
+<div style='font-family:Arial, sans-serif;max-width:700px;margin:0 auto;'>
+  <div style='background:#111827;color:#fff;padding:12px 16px;border-radius:6px 6px 0 0;'>
+    <strong>{{ company_name }}</strong> · Chatbot Error Report
+  </div>
+  <div style='border:1px solid #e5e7eb;border-top:none;padding:16px;border-radius:0 0 6px 6px;'>
+    <p style='margin:0 0 12px 0;'>{% for line in summary_lines %}{{ line }}{% if not loop.last %}<br/>{% endif %}{% endfor %}</p>
+    <table style='width:100%;border-collapse:collapse;background:#fff;border:1px solid #f3f4f6;'>
+      {% for key, value in details.items() %}
+      <tr><td style='padding:4px 8px;font-weight:600;'>{{ key }}</td><td style='padding:4px 8px;'>{{ value }}</td></tr>
+      {% endfor %}
+    </table>
+  </div>
+</div>
+""")
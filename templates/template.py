@@ -28,73 +28,6 @@ Si no puedes determinar la intención con certeza, responde: UNCLEAR
 """)
 
 
-NLU_MESSAGE_PARSING_PROMPT = Template("""
-Eres un experto en parsing de datos para servicios contra incendios en Argentina.
-
-Analiza este mensaje y extrae la información de contacto:
-"{{mensaje_usuario}}"
-
-REGLAS CRÍTICAS DE EXTRACCIÓN:
-
-**DIRECCIONES** - Solo extraer ubicaciones físicas reales:
-✅ EXTRAER: "Av. Corrientes 1234", "Del Valle Centenera 322 piso 4", "Palermo Norte", "Rivadavia 4500"
-❌ NO EXTRAER: "Mi mail es...", "email:", "correo:", cualquier línea que mencione email/mail/correo
-
-**EMAILS** - Solo direcciones de correo válidas:
-✅ EXTRAER: "juan@empresa.com", "info@local.com.ar"
-❌ NO EXTRAER: "por email", "envíen email", "manden correo" (menciones de email, no emails)
-
-**CONSERVADURISMO**: Es mejor dejar un campo vacío ("") que extraer información incorrecta.
-
-**SEPARACIÓN INTELIGENTE**: Una línea puede contener dirección Y horario separados por comas:
-- "Del valle centenera 3222 piso 4D, pueden pasar de 15-17h" → direccion + horario_visita
-
-Devuelve JSON con estos campos (cadena vacía si no encuentras):
-- "email": email válido
-- "direccion": dirección física (SIN el horario si están juntos)
-- "horario_visita": horario/disponibilidad (extraído de la misma línea si está con dirección)
-- "descripcion": qué necesita específicamente
-- "tipo_consulta": PRESUPUESTO, VISITA_TECNICA, URGENCIA, o OTRAS
-
-EJEMPLOS CRÍTICOS:
-
-# EJEMPLO 1: Dirección + horario en una línea
-Input: "Del valle centenera 3222 piso 4D, pueden pasar de 15-17h"
-Output: {{ "{" }}"direccion": "Del valle centenera 3222 piso 4D", "horario_visita": "15-17h", "email": "", "descripcion": "", "tipo_consulta": ""{{ "}" }}
-
-# EJEMPLO 2: Email + dirección + descripción completa
-Input: "juan@empresa.com, Luis Viale 2020, necesito 4 extintores clase ABC 5kg"
-Output: {{ "{" }}"email": "juan@empresa.com", "direccion": "Luis Viale 2020", "descripcion": "necesito 4 extintores clase ABC 5kg", "horario_visita": "", "tipo_consulta": ""{{ "}" }}
-
-# EJEMPLO 3: Solo email (NO extraer como dirección)
-Input: "Mi Mail es carlos@hotmail.com"
-Output: {{ "{" }}"email": "carlos@hotmail.com", "direccion": "", "descripcion": "", "horario_visita": "", "tipo_consulta": ""{{ "}" }}
-
-# EJEMPLO 4: Solo descripción de necesidad
-Input: "Quiero comprar 5 matafuegos para mi local gastronómico"
-Output: {{ "{" }}"email": "", "direccion": "", "descripcion": "Quiero comprar 5 matafuegos para mi local gastronómico", "horario_visita": "", "tipo_consulta": ""{{ "}" }}
-
-# EJEMPLO 5: Email mencionado como texto (NO extraer)
-Input: "necesito que me envíen por email la cotización"
-Output: {{ "{" }}"email": "", "direccion": "", "descripcion": "necesito que me envíen por email la cotización", "horario_visita": "", "tipo_consulta": ""{{ "}" }}
-
-# EJEMPLO 6: Formato "mi X es Y" - extraer correctamente
-Input: "mi dirección es Rivadavia 4500 y mi email es jose@empresa.com"
-Output: {{ "{" }}"email": "jose@empresa.com", "direccion": "Rivadavia 4500", "descripcion": "", "horario_visita": "", "tipo_consulta": ""{{ "}" }}
-
-# EJEMPLO 7: Solo horario disponible
-Input: "Estoy disponible mañanas de 9 a 12"
-Output: {{ "{" }}"email": "", "direccion": "", "descripcion": "", "horario_visita": "mañanas de 9 a 12", "tipo_consulta": ""{{ "}" }}
-
-# EJEMPLO 8: Dirección informal pero válida
-Input: "Estoy en Palermo cerca del shopping, necesito extintores"
-Output: {{ "{" }}"email": "", "direccion": "Palermo cerca del shopping", "descripcion": "necesito extintores", "horario_visita": "", "tipo_consulta": ""{{ "}" }}
-
-Responde ÚNICAMENTE con JSON válido, sin texto adicional.
-""")
-
-
-
 NLU_LOCATION_PROMPT=Template("""
 Analiza esta dirección en Argentina: "{{direccion}}"
 
@@ -165,3 +98,34 @@ Instrucciones:
 
 Genera una respuesta natural en español.
 """)
+
+# Extracción + validación de varios campos en una sola llamada (JSON mode)
+NLU_BATCH_FIELDS_PROMPT = Template("""
+Eres un experto en datos de contacto para servicios contra incendios en Argentina.
+{% if mensaje_usuario %}
+Mensaje del cliente:
+"{{mensaje_usuario}}"
+{% endif %}
+Campos a procesar (valor actual entre comillas; vacío = extraerlo del mensaje si está):
+{% for campo, valor in campos.items() %}- {{campo}}: "{{valor}}"
+{% endfor %}
+CRITERIOS POR CAMPO:
+- email: dirección de correo válida. Menciones como "por email" NO son emails.
+- direccion: ubicación física real en Argentina, SIN el horario si vienen juntos.
+- horario_visita: horario o disponibilidad comprensible ("mañanas de 9 a 12", "15-17h").
+- descripcion: qué necesita el cliente sobre equipos o servicios contra incendios (mínimo 10 caracteres).
+- razon_social: nombre legal de la empresa o persona (mínimo 2 caracteres).
+- cuit: 11 dígitos, con o sin guiones (ej: 20-12345678-9).
+
+**CONSERVADURISMO**: Es mejor dejar "valor" vacío y "valido": false que inventar información.
+
+Devuelve un objeto JSON con la clave "campos" y, para CADA campo listado, un objeto con:
+- "valor": valor final normalizado (cadena, vacía si no hay)
+- "valido": true/false
+- "sugerencia": corrección o motivo breve si no es válido (cadena, puede estar vacía)
+
+Ejemplo:
+{{ "{" }}"campos": {{ "{" }}"email": {{ "{" }}"valor": "juan@empresa.com", "valido": true, "sugerencia": ""{{ "}" }}, "cuit": {{ "{" }}"valor": "2012345678", "valido": false, "sugerencia": "El CUIT debe tener 11 dígitos"{{ "}" }}{{ "}" }}{{ "}" }}
+
+Responde ÚNICAMENTE con JSON válido.
+""")
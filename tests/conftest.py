@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 from pathlib import Path
 
 import pytest
@@ -24,6 +25,11 @@ ENV_DEFAULTS = {
     "ENABLE_ERROR_EMAILS": "false",
     "ENABLE_SHEETS_METRICS": "false",
     "OPENAI_API_KEY": "test-key",
+    "LLM_CACHE_ENABLED": "false",
+    "AGENT_NOTIFY_WINDOW_SECONDS": "0",
+    "JOB_RUNNER_ENABLED": "false",
+    "STARTUP_WARMUP_ENABLED": "false",
+    "LEAD_OUTBOX_PATH": os.path.join(tempfile.gettempdir(), f"lead_outbox_test_{os.getpid()}.jsonl"),
     "ENV": "test",
 }
 
@@ -39,11 +45,17 @@ def reset_conversation_state():
     conversation_manager.recently_finalized.clear()
     conversation_manager.handoff_queue.clear()
     conversation_manager.active_handoff = None
+    conversation_manager.active_handoffs.clear()
+    conversation_manager.handoff_assignments.clear()
+    conversation_manager.handoff_deadlines.clear()
     yield
     conversation_manager.conversaciones.clear()
     conversation_manager.recently_finalized.clear()
     conversation_manager.handoff_queue.clear()
     conversation_manager.active_handoff = None
+    conversation_manager.active_handoffs.clear()
+    conversation_manager.handoff_assignments.clear()
+    conversation_manager.handoff_deadlines.clear()
 
 
 @pytest.fixture
@@ -0,0 +1,62 @@
+import time
+
+from services.agent_notification_service import AgentNotificationBatcher
+
+
+AGENT = "+5491111111111"
+
+
+def test_rafaga_de_mensajes_sale_en_un_solo_resumen():
+    enviados = []
+    batcher = AgentNotificationBatcher(sender=lambda to, text: enviados.append((to, text)) or True, window_seconds=60)
+
+    for idx in range(5):
+        batcher.notify_client_message(AGENT, "+5491122223333", "Ana", f"linea {idx}", True)
+    batcher.notify_client_message(AGENT, "+5491144445555", "Beto", "sigo esperando", False, 2)
+    batcher.notify_client_message(AGENT, "+5491144445555", "Beto", "hola?", False, 2)
+    assert enviados == []
+
+    assert batcher.flush() == 1
+    assert len(enviados) == 1
+    to, text = enviados[0]
+    assert to == AGENT
+    assert text.count("linea") == 5
+    assert "💬 *[#2] Beto:* (en cola)" in text
+    # Un solo recordatorio por resumen, no uno por mensaje en cola
+    assert text.count("ℹ️") == 1
+    assert batcher.stats == {"messages": 7, "digests_sent": 1, "send_failures": 0}
+
+
+def test_mensaje_suelto_conserva_el_formato_y_respeta_la_latencia_maxima():
+    enviados = []
+    batcher = AgentNotificationBatcher(sender=lambda to, text: enviados.append(text) or True, window_seconds=0.05)
+
+    batcher.notify_client_message(AGENT, "+5491122223333", "Ana", "hola", True)
+    deadline = time.monotonic() + 2
+    while not enviados and time.monotonic() < deadline:
+        time.sleep(0.01)
+    batcher.stop()
+
+    assert enviados == ['💬 *Ana:* "hola"']
+
+
+def test_ventana_cero_y_tope_de_mensajes_envian_sin_esperar():
+    enviados = []
+    inmediato = AgentNotificationBatcher(sender=lambda to, text: enviados.append(text) or True, window_seconds=0)
+    inmediato.notify_client_message(AGENT, "+5491122223333", "Ana", "hola", True)
+    assert len(enviados) == 1
+
+    por_tope = AgentNotificationBatcher(
+        sender=lambda to, text: enviados.append(text) or True,
+        window_seconds=60,
+        max_messages=3,
+    )
+    for idx in range(3):
+        por_tope.notify_client_message(AGENT, "+5491122223333", "Ana", f"m{idx}", True)
+    deadline = time.monotonic() + 2
+    while len(enviados) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    por_tope.stop()
+
+    assert len(enviados) == 2
+    assert enviados[1].count('"m') == 3
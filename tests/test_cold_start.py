@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+import main as main_module
+from benchmarks.cold_start import IMPORT_BUDGET_RATIO, compare_to_baseline, measure_import
+
+
+def _run_warmup(after=None):
+    # `after` corre dentro del loop: asyncio.run además espera los threads que siguen al cerrar
+    async def _measure():
+        results = dict(await main_module._warmup_runtime())
+        if after is not None:
+            after()
+        return results
+
+    return asyncio.run(_measure())
+
+
+def test_import_de_main_no_carga_sdks_bajo_demanda_y_respeta_presupuesto():
+    report = measure_import()
+
+    assert report["lazy_loaded"] == []
+    assert report["app_import_ratio"] < IMPORT_BUDGET_RATIO, report["top"]
+
+
+def test_comparacion_marca_sdk_cargado_y_arranque_lento():
+    baseline = {"import_ms": 800.0, "app_import_ms": 300.0, "lifespan_ms": 20.0, "first_response_ms": 60.0, "total_ms": 2000.0}
+    report = dict(baseline, app_import_ratio=0.8, lazy_loaded=["openai"], lifespan_ms=500.0)
+
+    regressions = compare_to_baseline(report, baseline)
+
+    assert len(regressions) == 2
+    assert "openai" in regressions[0]
+    assert compare_to_baseline(dict(baseline, app_import_ratio=0.8, lazy_loaded=[]), baseline) == []
+    assert len(compare_to_baseline(dict(baseline, app_import_ratio=2.2, lazy_loaded=[]), baseline)) == 1
+
+
+def test_warmup_corre_en_paralelo_y_un_paso_fallido_no_frena_el_arranque(monkeypatch):
+    # Los dos pasos solo pasan la barrera si corren a la vez; en serie se rompe por timeout
+    barrier = threading.Barrier(2, timeout=5)
+
+    def _inbox():
+        barrier.wait()
+        return ["case-1"]
+
+    def _broken():
+        raise RuntimeError("graph caído")
+
+    monkeypatch.setattr(main_module, "_sync_runtime_handoff_state", _inbox)
+    monkeypatch.setattr(main_module, "_startup_warmups", lambda: {"meta": _broken, "firestore": barrier.wait})
+    monkeypatch.setattr(main_module, "_background_warmups", lambda: {})
+
+    results = _run_warmup()
+
+    assert results["inbox"] == ["case-1"]
+    assert "meta" not in results
+    assert "firestore" in results
+    assert not barrier.broken
+
+
+def test_warmup_lento_se_corta_pero_el_inbox_siempre_se_espera(monkeypatch):
+    monkeypatch.setattr(main_module, "STARTUP_WARMUP_TIMEOUT_SECONDS", 0.05)
+    inbox_released = threading.Event()
+    firestore_released = threading.Event()
+    firestore_done = threading.Event()
+
+    def _inbox():
+        # El inbox tarda más que el timeout de los warmups y aun así se espera
+        assert inbox_released.wait(5)
+        return ["case-1"]
+
+    def _firestore():
+        firestore_released.wait(5)
+        firestore_done.set()
+
+    monkeypatch.setattr(main_module, "_sync_runtime_handoff_state", _inbox)
+    monkeypatch.setattr(main_module, "_startup_warmups", lambda: {"firestore": _firestore})
+    monkeypatch.setattr(main_module, "_background_warmups", lambda: {})
+    threading.Timer(0.2, inbox_released.set).start()
+
+    returned_before_firestore = []
+
+    def _after_warmup():
+        returned_before_firestore.append(not firestore_done.is_set())
+        firestore_released.set()
+
+    results = _run_warmup(after=_after_warmup)
+
+    assert results["inbox"] == ["case-1"]
+    assert "firestore" not in results
+    assert returned_before_firestore == [True]
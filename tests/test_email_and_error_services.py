@@ -10,6 +10,7 @@ os.environ.setdefault("AWS_REGION", "us-east-1")
 from chatbot.models import ConversacionData, DatosContacto, EstadoConversacion, TipoConsulta
 import services.email_service as email_module
 import services.error_reporter as error_module
+from services.email_transport import EmailTransportError, FileTransport, SESTransport
 
 
 def _build_conversacion(tipo: TipoConsulta = TipoConsulta.PRESUPUESTO) -> ConversacionData:
@@ -34,15 +35,7 @@ def _build_multi_producto_conversacion() -> ConversacionData:
         email="lead@example.com",
         direccion="Calle Falsa 123",
         horario_visita="Lunes 9-12",
-        descripcion=(
-            "- Compra de 1 extintor de 1 kg PQ (ABC).\n"
-            "- Consulta IFCI (Hidrantes)\n"
-            "  - Nivel de instalación: No sé\n"
-            "  - Cantidad de hidrantes: No sé\n"
-            "  - Pisos / subsuelo / estacionamiento: PB y 1 piso\n"
-            "  - Detectores de humo: No\n"
-            "  - Plano de incendio: Sí"
-        ),
+        descripcion="- Compra de 1 extintor de 1 kg PQ (ABC).\n- Consulta IFCI (Hidrantes)",
         razon_social="Empresa de Prueba SA",
         cuit="30-12345678-9",
     )
@@ -51,6 +44,25 @@ def _build_multi_producto_conversacion() -> ConversacionData:
         estado=EstadoConversacion.ENVIANDO,
         tipo_consulta=TipoConsulta.PRESUPUESTO,
         datos_contacto=datos,
+        datos_temporales={
+            "_presupuesto_items": [
+                {
+                    "kind": "extintor",
+                    "summary": "Compra de 1 extintor de 1 kg PQ (ABC).",
+                    "details": {"cantidad": "1", "capacidad": "1 kg", "tipo": "PQ (ABC)", "servicio": "compra"},
+                },
+                {
+                    "kind": "ifci",
+                    "details": {
+                        "nivel": "No sé",
+                        "hidrantes": "No sé",
+                        "establecimiento": "PB y 1 piso",
+                        "detectores": "No",
+                        "plano": "Sí",
+                    },
+                },
+            ]
+        },
     )
 
 
@@ -69,14 +81,11 @@ def test_email_service_envia_lead_exitoso(monkeypatch):
         "ResponseMetadata": {"HTTPStatusCode": 200},
         "MessageId": "msg-123",
     }
-    mock_boto3 = MagicMock()
-    mock_boto3.client.return_value = ses_mock
 
-    monkeypatch.setattr(email_module, "boto3", mock_boto3)
     monkeypatch.setattr(email_module, "get_active_company_profile", _mock_profile)
     monkeypatch.delenv("REPLY_TO_EMAIL", raising=False)
 
-    service = email_module.EmailService()
+    service = email_module.EmailService(transport=SESTransport(client=ses_mock))
     conversacion = _build_conversacion()
 
     assert service.enviar_lead_email(conversacion) is True
@@ -92,13 +101,10 @@ def test_email_service_envia_lead_falla_status(monkeypatch):
         "ResponseMetadata": {"HTTPStatusCode": 500},
         "MessageId": "msg-500",
     }
-    mock_boto3 = MagicMock()
-    mock_boto3.client.return_value = ses_mock
 
-    monkeypatch.setattr(email_module, "boto3", mock_boto3)
     monkeypatch.setattr(email_module, "get_active_company_profile", _mock_profile)
 
-    service = email_module.EmailService()
+    service = email_module.EmailService(transport=SESTransport(client=ses_mock))
     assert service.enviar_lead_email(_build_conversacion()) is False
 
 
@@ -108,15 +114,12 @@ def test_email_service_permite_override_por_entorno(monkeypatch):
         "ResponseMetadata": {"HTTPStatusCode": 200},
         "MessageId": "msg-override",
     }
-    mock_boto3 = MagicMock()
-    mock_boto3.client.return_value = ses_mock
 
-    monkeypatch.setattr(email_module, "boto3", mock_boto3)
     monkeypatch.setattr(email_module, "get_active_company_profile", _mock_profile)
     monkeypatch.setenv("LEAD_FROM_EMAIL", "bot@eventually-ai.com.ar")
     monkeypatch.setenv("LEAD_TO_EMAIL", "ventas@eventually-ai.com.ar")
 
-    service = email_module.EmailService()
+    service = email_module.EmailService(transport=SESTransport(client=ses_mock))
 
     assert service.from_email == "bot@eventually-ai.com.ar"
     assert service.to_email == "ventas@eventually-ai.com.ar"
@@ -133,15 +136,12 @@ def test_email_service_ignora_overrides_vacios(monkeypatch):
         "ResponseMetadata": {"HTTPStatusCode": 200},
         "MessageId": "msg-fallback",
     }
-    mock_boto3 = MagicMock()
-    mock_boto3.client.return_value = ses_mock
 
-    monkeypatch.setattr(email_module, "boto3", mock_boto3)
     monkeypatch.setattr(email_module, "get_active_company_profile", _mock_profile)
     monkeypatch.setenv("LEAD_FROM_EMAIL", "   ")
     monkeypatch.setenv("LEAD_TO_EMAIL", "")
 
-    service = email_module.EmailService()
+    service = email_module.EmailService(transport=SESTransport(client=ses_mock))
 
     assert service.from_email == "bot@example.com"
     assert service.to_email == "ventas@example.com"
@@ -153,8 +153,6 @@ def test_email_service_ignora_overrides_vacios(monkeypatch):
 
 
 def test_email_service_renderiza_presupuesto_multi_producto_como_bloques_html(monkeypatch):
-    mock_boto3 = MagicMock()
-    monkeypatch.setattr(email_module, "boto3", mock_boto3)
     monkeypatch.setattr(email_module, "get_active_company_profile", _mock_profile)
 
     service = email_module.EmailService()
@@ -170,8 +168,6 @@ def test_email_service_renderiza_presupuesto_multi_producto_como_bloques_html(mo
 
 
 def test_email_service_mantiene_bloque_legacy_para_consultas_no_presupuesto(monkeypatch):
-    mock_boto3 = MagicMock()
-    monkeypatch.setattr(email_module, "boto3", mock_boto3)
     monkeypatch.setattr(email_module, "get_active_company_profile", _mock_profile)
 
     service = email_module.EmailService()
@@ -183,8 +179,6 @@ def test_email_service_mantiene_bloque_legacy_para_consultas_no_presupuesto(monk
 
 
 def test_email_service_escapa_campos_usuario_en_html(monkeypatch):
-    mock_boto3 = MagicMock()
-    monkeypatch.setattr(email_module, "boto3", mock_boto3)
     monkeypatch.setattr(email_module, "get_active_company_profile", _mock_profile)
 
     conversacion = _build_conversacion()
@@ -197,25 +191,48 @@ def test_email_service_escapa_campos_usuario_en_html(monkeypatch):
     service = email_module.EmailService()
     html_output = service._generate_email_html(conversacion)
 
-    assert '&lt;b onclick=&quot;x&quot;&gt;Empresa&lt;/b&gt;' in html_output
+    assert '&lt;b onclick=&#34;x&#34;&gt;Empresa&lt;/b&gt;' in html_output
     assert '&lt;script&gt;alert(1)&lt;/script&gt;' in html_output
     assert 'Calle &lt;i&gt;123&lt;/i&gt;' in html_output
     assert '9 &lt; 18' in html_output
     assert '+54911&lt;234&gt;' in html_output
 
 
+def test_email_service_presupuesto_sin_items_muestra_descripcion(monkeypatch):
+    monkeypatch.setattr(email_module, "get_active_company_profile", _mock_profile)
+
+    service = email_module.EmailService()
+    html_output = service._generate_email_html(_build_conversacion(TipoConsulta.PRESUPUESTO))
+
+    assert "🧯 Productos solicitados" not in html_output
+    assert '"Necesito un presupuesto completo para planta industrial."' in html_output
+
+
+def test_error_reporter_build_email_escapa_detalles(monkeypatch):
+    monkeypatch.setattr(error_module, "get_active_company_profile", _mock_profile)
+
+    reporter = error_module.ErrorReporter()
+    payload = reporter._build_email(
+        "[Chatbot Error] exception",
+        ["Trigger: exception", "Phone: +54911****"],
+        {"message": "<img src=x onerror=alert(1)>"},
+    )
+
+    assert "Empresa Test" in payload["html"]
+    assert "Trigger: exception<br/>Phone: +54911****" in payload["html"]
+    assert "&lt;img src=x onerror=alert(1)&gt;" in payload["html"]
+    assert payload["from_name"] == "Eva · Error Reporter"
+
+
 def test_error_reporter_send_email_exitoso(monkeypatch):
     ses_mock = MagicMock()
     ses_mock.send_email.return_value = {
         "ResponseMetadata": {"HTTPStatusCode": 200},
         "MessageId": "err-1",
     }
-    mock_boto3 = MagicMock()
-    mock_boto3.client.return_value = ses_mock
-    monkeypatch.setattr(error_module, "boto3", mock_boto3)
     monkeypatch.setenv("ERROR_LOG_EMAIL", "alerts@example.com")
 
-    reporter = error_module.ErrorReporter()
+    reporter = error_module.ErrorReporter(transport=SESTransport(client=ses_mock))
     assert (
         reporter._send_email(
             subject="Test error",
@@ -235,12 +252,9 @@ def test_error_reporter_send_email_falla(monkeypatch):
         "ResponseMetadata": {"HTTPStatusCode": 400},
         "MessageId": "err-2",
     }
-    mock_boto3 = MagicMock()
-    mock_boto3.client.return_value = ses_mock
-    monkeypatch.setattr(error_module, "boto3", mock_boto3)
     monkeypatch.setenv("ERROR_LOG_EMAIL", "alerts@example.com")
 
-    reporter = error_module.ErrorReporter()
+    reporter = error_module.ErrorReporter(transport=SESTransport(client=ses_mock))
     assert (
         reporter._send_email(
             subject="Test error",
@@ -249,3 +263,29 @@ def test_error_reporter_send_email_falla(monkeypatch):
         )
         is False
     )
+
+
+def test_email_service_transporte_file_no_usa_red(tmp_path, monkeypatch):
+    monkeypatch.setattr(email_module, "get_active_company_profile", _mock_profile)
+
+    service = email_module.EmailService(transport=FileTransport(str(tmp_path)))
+
+    assert service.enviar_lead_email(_build_conversacion()) is True
+    archivos = list(tmp_path.iterdir())
+    assert len(archivos) == 1
+    contenido = archivos[0].read_text(encoding="utf-8")
+    assert "ventas@example.com" in contenido
+    assert "Empresa Test" in contenido
+
+
+def test_email_service_error_de_transporte_retorna_false(monkeypatch):
+    monkeypatch.setattr(email_module, "get_active_company_profile", _mock_profile)
+
+    class TransporteCaido:
+        name = "smtp"
+
+        def send(self, email):
+            raise EmailTransportError("ConnectionRefusedError: [Errno 111]")
+
+    service = email_module.EmailService(transport=TransporteCaido())
+    assert service.enviar_lead_email(_build_conversacion()) is False
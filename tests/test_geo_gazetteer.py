@@ -0,0 +1,45 @@
+from chatbot.geo_gazetteer import GeoGazetteer, geo_gazetteer
+from chatbot.rules import ChatbotRules
+
+
+def test_gazetteer_barrios_partidos_y_localidades():
+    assert geo_gazetteer.classify("Av. Rivadavia 1234, CABA").zona == "CABA"
+    assert geo_gazetteer.classify("Mendoza 2000, Belgrano").zona == "CABA"
+    assert geo_gazetteer.classify("Morón, zona oeste").zona == "PROVINCIA"
+    assert geo_gazetteer.classify("Calle 7 n 123, La Plata").zona == "PROVINCIA"
+    assert geo_gazetteer.classify("Av. Libertador 14000, Martínez").zona == "PROVINCIA"
+
+
+def test_gazetteer_distingue_calles_de_localidades():
+    # Rivadavia / San Martín son partidos, pero seguidos de altura son calles
+    assert geo_gazetteer.classify("Rivadavia 1234").zona == "UNCLEAR"
+    assert geo_gazetteer.classify("Av. San Martín 2100, Villa del Parque").zona == "CABA"
+    assert geo_gazetteer.classify("Av Mitre 500, Avellaneda").zona == "PROVINCIA"
+    assert geo_gazetteer.classify("Av. Cabildo 2000").zona == "CABA"
+
+
+def test_gazetteer_barrio_pesa_mas_que_buenos_aires():
+    resultado = geo_gazetteer.classify("Palermo, Buenos Aires")
+
+    assert resultado.zona == "CABA"
+    assert {m.nombre for m in resultado.evidencia} == {"Palermo", "Buenos Aires"}
+
+
+def test_gazetteer_codigos_postales():
+    assert geo_gazetteer.classify("Gorriti 4000 C1414BJL").zona == "CABA"
+    assert geo_gazetteer.classify("Calle falsa 123, B1636").zona == "PROVINCIA"
+    assert geo_gazetteer.classify("CP 1425").zona == "CABA"
+
+
+def test_gazetteer_umbral_configurable():
+    estricto = GeoGazetteer(threshold=0.95)
+
+    assert estricto.classify("Palermo").zona == "UNCLEAR"
+    assert estricto.classify("Palermo").confianza == 0.9
+    assert geo_gazetteer.classify("").zona == "UNCLEAR"
+
+
+def test_validar_ubicacion_usa_gazetteer():
+    assert ChatbotRules._validar_ubicacion_geografica("Morón, zona oeste") == "PROVINCIA"
+    assert ChatbotRules._validar_ubicacion_geografica("Av. Rivadavia 1234, CABA") == "CABA"
+    assert ChatbotRules._validar_ubicacion_geografica("Av. Santa Fe 3000") == "UNCLEAR"
@@ -0,0 +1,179 @@
+import asyncio
+import importlib
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from chatbot.handoff_deadlines import (
+    CLOSE_REASON_INACTIVITY,
+    CLOSE_REASON_SURVEY,
+    HandoffDeadlineIndex,
+    handoff_deadline,
+)
+from chatbot.models import EstadoConversacion
+from chatbot.states import ConversationManager
+
+
+class _NoCheckpoints:
+    def load_for_key(self, numero_telefono):
+        return None
+
+    def delete_for_key(self, numero_telefono):
+        return None
+
+
+def _handoff(manager, phone, last_message_at):
+    conversacion = manager.get_conversacion(phone)
+    conversacion.estado = EstadoConversacion.ATENDIDO_POR_HUMANO
+    conversacion.atendido_por_humano = True
+    conversacion.handoff_started_at = last_message_at
+    manager.schedule_handoff_deadline(phone)
+    return conversacion
+
+
+def test_index_pops_only_expired_in_deadline_order():
+    index = HandoffDeadlineIndex()
+    base = datetime(2026, 4, 7, 12, 0)
+    index.schedule("+2", base + timedelta(minutes=2))
+    index.schedule("+1", base + timedelta(minutes=1))
+    index.schedule("+3", base + timedelta(minutes=30))
+
+    assert index.pop_expired(base + timedelta(minutes=5)) == ["+1", "+2"]
+    assert len(index) == 1
+    assert index.next_deadline() == base + timedelta(minutes=30)
+
+
+def test_index_keeps_earliest_entry_and_drops_discarded():
+    index = HandoffDeadlineIndex()
+    base = datetime(2026, 4, 7, 12, 0)
+    index.schedule("+1", base + timedelta(minutes=60))
+    index.schedule("+1", base + timedelta(minutes=90))
+    index.schedule("+1", base + timedelta(minutes=2))
+    index.schedule("+2", base + timedelta(minutes=1))
+    index.discard("+2")
+
+    assert index.pop_expired(base + timedelta(minutes=5)) == ["+1"]
+    assert index.pop_expired(base + timedelta(minutes=120)) == []
+    assert len(index) == 0
+
+
+def test_deadline_normalizes_aware_inbox_timestamps():
+    manager = ConversationManager(session_service=_NoCheckpoints())
+    conversacion = _handoff(manager, "+5491133333333", datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
+    conversacion.last_client_message_at = datetime(2026, 4, 7, 9, 30, tzinfo=timezone(timedelta(hours=-3)))
+
+    deadline, reason = handoff_deadline(conversacion, inactivity_minutes=60)
+
+    assert deadline == datetime(2026, 4, 7, 13, 30)
+    assert reason == CLOSE_REASON_INACTIVITY
+
+
+def test_pop_expired_handoffs_reschedules_conversations_with_new_messages():
+    manager = ConversationManager(session_service=_NoCheckpoints())
+    started = datetime.utcnow() - timedelta(hours=3)
+    _handoff(manager, "+5491111111111", started)
+    activa = _handoff(manager, "+5491122222222", started)
+    # Mensaje reciente del cliente: el vencimiento se atrasa sin nueva entrada en el heap
+    activa.last_client_message_at = datetime.utcnow()
+    manager.schedule_handoff_deadline("+5491122222222")
+
+    expired = manager.pop_expired_handoffs()
+
+    assert expired == [("+5491111111111", CLOSE_REASON_INACTIVITY)]
+    assert "+5491122222222" in manager.handoff_deadlines
+    assert "+5491111111111" not in manager.handoff_deadlines
+
+
+def test_survey_sent_moves_deadline_earlier():
+    manager = ConversationManager(session_service=_NoCheckpoints())
+    conversacion = _handoff(manager, "+5491111111111", datetime.utcnow())
+    conversacion.estado = EstadoConversacion.ENCUESTA_SATISFACCION
+    conversacion.survey_sent_at = datetime.utcnow() - timedelta(minutes=20)
+    manager.schedule_handoff_deadline("+5491111111111")
+
+    assert manager.pop_expired_handoffs() == [("+5491111111111", CLOSE_REASON_SURVEY)]
+
+
+def test_sync_handoff_runtime_con_checkpoints_precargados_no_lee_firestore():
+    loads = []
+
+    class _CountingCheckpoints(_NoCheckpoints):
+        def load_for_key(self, numero_telefono):
+            loads.append(numero_telefono)
+            return None
+
+    manager = ConversationManager(session_service=_CountingCheckpoints())
+    case = SimpleNamespace(client_phone="+5491144444444", case_id="case-1", is_active=True, assigned_agent="+5491000000001")
+
+    checkpoints = manager.load_missing_checkpoints([case.client_phone])
+    assert loads == ["+5491144444444"]
+    manager.sync_handoff_runtime([case], checkpoints)
+
+    assert loads == ["+5491144444444"]
+    assert manager.conversaciones["+5491144444444"].handoff_case_id == "case-1"
+    assert manager.handoff_assignments == {"+5491144444444": "+5491000000001"}
+
+
+def test_sync_con_lectura_previa_al_cierre_no_reinstala_la_conversacion():
+    manager = ConversationManager(session_service=_NoCheckpoints())
+    _handoff(manager, "+5491155555555", datetime.utcnow())
+    stale_case = SimpleNamespace(client_phone="+5491155555555", case_id="case-1", is_active=True, assigned_agent=None)
+
+    # Un thread leyó el inbox justo antes de que el sweep cerrara el caso
+    loaded_at = datetime.utcnow()
+    manager.finalizar_conversacion_runtime("+5491155555555")
+    manager.sync_handoff_runtime([stale_case], {}, loaded_at)
+
+    assert "+5491155555555" not in manager.conversaciones
+    assert manager.handoff_queue == []
+
+
+def test_run_on_loop_desde_un_thread_corre_en_el_event_loop():
+    manager = ConversationManager(session_service=_NoCheckpoints())
+
+    async def _main():
+        manager.bind_event_loop(asyncio.get_running_loop())
+        ran_in = await asyncio.to_thread(manager.run_on_loop, threading.get_ident)
+        return threading.get_ident(), ran_in
+
+    loop_thread, ran_in = asyncio.run(_main())
+
+    assert ran_in == loop_thread
+    # Con el loop cerrado se llama directo, sin quedar esperando
+    assert manager.run_on_loop(threading.get_ident) == threading.get_ident()
+
+
+def test_ttl_sweep_closes_expired_and_syncs_once(monkeypatch):
+    monkeypatch.setenv("AGENT_API_TOKEN", "secret-token")
+    sys.modules.pop("main", None)
+    main_module = importlib.import_module("main")
+    manager = main_module.conversation_manager
+    sync_calls = []
+    sent = []
+
+    def _list_cases():
+        sync_calls.append(True)
+        raise RuntimeError("inbox no disponible")
+
+    monkeypatch.setattr(main_module.handoff_inbox_service, "get_open_case_for_client", lambda phone: None)
+    monkeypatch.setattr(main_module.handoff_inbox_service, "list_cases", _list_cases)
+    monkeypatch.setattr(main_module, "send_message", lambda phone, text: sent.append(phone) or True)
+
+    started = datetime.utcnow() - timedelta(hours=3)
+    for phone in ("+5491111111111", "+5491122222222"):
+        _handoff(manager, phone, started)
+        manager.add_to_handoff_queue(phone)
+    _handoff(manager, "+5491133333333", datetime.utcnow())
+    manager.add_to_handoff_queue("+5491133333333")
+
+    client = TestClient(main_module.app)
+    response = client.post("/handoff/ttl-sweep", data={"token": "secret-token"})
+
+    assert response.json() == {"closed": 2}
+    assert sorted(sent) == ["+5491111111111", "+5491122222222"]
+    assert len(sync_calls) == 1
+    assert manager.handoff_queue == ["+5491133333333"]
+    assert manager.active_handoff == "+5491133333333"
@@ -1,8 +1,10 @@
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 from services.handoff_inbox_models import HandoffInboxMessageSender, HandoffInboxOutboxStatus
 from services.handoff_inbox_service import HandoffInboxService
+from services.handoff_scheduler import HandoffAgent, HandoffScheduler
+from services.in_memory_firestore import InMemoryFirestoreClient
 
 
 class MutableClock:
@@ -17,87 +19,9 @@ class MutableClock:
         return self.current
 
 
-def _empty_doc_record():
-    return {"__data__": None, "__subcollections__": {}}
-
-
-class FakeSnapshot:
-    def __init__(self, collection_storage, doc_id):
-        self.id = doc_id
-        self._collection_storage = collection_storage
-        self._doc_id = doc_id
-        doc_record = collection_storage.get(doc_id)
-        self.exists = bool(doc_record and doc_record.get("__data__") is not None)
-        self.reference = FakeDocumentReference(collection_storage, doc_id)
-
-    def to_dict(self):
-        doc_record = self._collection_storage.get(self._doc_id) or _empty_doc_record()
-        payload = doc_record.get("__data__")
-        return deepcopy(payload) if payload is not None else None
-
-
-class FakeDocumentReference:
-    def __init__(self, collection_storage, doc_id):
-        self._collection_storage = collection_storage
-        self._doc_id = doc_id
-
-    def _doc_record(self):
-        return self._collection_storage.setdefault(self._doc_id, _empty_doc_record())
-
-    def set(self, payload):
-        self._doc_record()["__data__"] = deepcopy(payload)
-
-    def create(self, payload):
-        existing = self._collection_storage.get(self._doc_id)
-        if existing and existing.get("__data__") is not None:
-            raise RuntimeError("exists")
-        self.set(payload)
-
-    def get(self):
-        return FakeSnapshot(self._collection_storage, self._doc_id)
-
-    def delete(self):
-        self._collection_storage.pop(self._doc_id, None)
-
-    def collection(self, name):
-        subcollections = self._doc_record()["__subcollections__"]
-        return FakeCollectionReference(subcollections, name)
-
-
-class FakeCollectionReference:
-    def __init__(self, root_storage, name):
-        self._root_storage = root_storage
-        self._name = name
-
-    def _collection_storage(self):
-        return self._root_storage.setdefault(self._name, {})
-
-    def document(self, doc_id):
-        return FakeDocumentReference(self._collection_storage(), doc_id)
-
-    def stream(self):
-        collection = self._collection_storage()
-        snapshots = [
-            FakeSnapshot(collection, doc_id)
-            for doc_id, payload in collection.items()
-            if payload.get("__data__") is not None
-        ]
-        snapshots.sort(key=lambda item: item.id)
-        return snapshots
-
-
-class FakeFirestoreClient:
-    def __init__(self, database="(default)"):
-        self.database = database
-        self._collections = {}
-
-    def collection(self, name):
-        return FakeCollectionReference(self._collections, name)
-
-
 def _build_service(clock: MutableClock) -> HandoffInboxService:
     return HandoffInboxService(
-        firestore_client=FakeFirestoreClient("(default)"),
+        firestore_client=InMemoryFirestoreClient(),
         now_fn=clock,
     )
 
@@ -216,7 +140,7 @@ def test_close_case_promotes_next_and_advance_next_rotates_queue():
 
 def test_autoclose_and_purge_closed_case_history():
     clock = MutableClock(datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
-    fake_client = FakeFirestoreClient("(default)")
+    fake_client = InMemoryFirestoreClient()
     service = HandoffInboxService(
         firestore_client=fake_client,
         now_fn=clock,
@@ -267,3 +191,222 @@ def test_autoclose_and_purge_closed_case_history():
     assert purge.messages_deleted == 2
     assert purge.outbox_deleted == 1
     assert list(fake_client.collection(service.collection_name).stream()) == []
+
+
+def _build_multi_agent_service(clock: MutableClock, *agents, strategy="least_loaded") -> HandoffInboxService:
+    return HandoffInboxService(
+        firestore_client=InMemoryFirestoreClient(),
+        now_fn=clock,
+        scheduler=HandoffScheduler(list(agents), strategy=strategy),
+    )
+
+
+def test_multiple_agents_take_cases_concurrently_and_drain_queue():
+    clock = MutableClock(datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
+    service = _build_multi_agent_service(
+        clock,
+        HandoffAgent("+5491000000001"),
+        HandoffAgent("+5491000000002"),
+    )
+
+    cases = []
+    for idx in range(4):
+        cases.append(
+            service.create_or_get_case(
+                client_phone=f"+549155500000{idx}",
+                client_name=f"Cliente {idx}",
+                tipo_consulta="otras",
+                handoff_context=f"caso {idx}",
+            )
+        )
+        clock.advance(seconds=1)
+
+    assert [case.is_active for case in cases] == [True, True, False, False]
+    assert {cases[0].assigned_agent, cases[1].assigned_agent} == {"+5491000000001", "+5491000000002"}
+    assert cases[2].assigned_agent is None
+
+    # Al cerrar un caso, el lugar libre lo ocupa el siguiente de la cola con el mismo agente
+    service.close_case(cases[1].case_id)
+    listed = {item.client_phone: item for item in service.list_cases()}
+    assert listed["+5491555000002"].is_active is True
+    assert listed["+5491555000002"].assigned_agent == cases[1].assigned_agent
+    assert listed["+5491555000003"].is_active is False
+    assert service.agent_loads() == {"+5491000000001": 1, "+5491000000002": 1}
+
+
+def test_pausa_del_agente_se_comparte_entre_instancias():
+    clock = MutableClock(datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
+    client = InMemoryFirestoreClient()
+    agents = [HandoffAgent("+5491000000001"), HandoffAgent("+5491000000002")]
+    instancias = [
+        HandoffInboxService(firestore_client=client, now_fn=clock, scheduler=HandoffScheduler(agents))
+        for _ in range(2)
+    ]
+
+    # /pausa recibido por una instancia; el caso lo crea la otra
+    instancias[0].set_agent_available("5491000000001", False)
+    case = instancias[1].create_or_get_case(
+        client_phone="+5491555000009",
+        client_name="Cliente",
+        tipo_consulta="otras",
+        handoff_context="caso",
+    )
+    assert instancias[1].paused_agents() == {"+5491000000001"}
+    assert case.assigned_agent == "+5491000000002"
+
+    instancias[1].set_agent_available("+5491000000001", True)
+    assert instancias[0].paused_agents() == frozenset()
+
+
+def test_handoffs_concurrentes_en_dos_instancias_respetan_la_capacidad():
+    clock = MutableClock(datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
+    # La latencia abre la ventana entre leer la carga y escribir el caso
+    client = InMemoryFirestoreClient(latency_seconds=0.002)
+    agents = [HandoffAgent("+5491000000001", capacity=1)]
+    instancias = [
+        HandoffInboxService(firestore_client=client, now_fn=clock, scheduler=HandoffScheduler(agents))
+        for _ in range(2)
+    ]
+
+    def _handoff(idx):
+        return instancias[idx % 2].create_or_get_case(
+            client_phone=f"+549177700000{idx}",
+            client_name=f"Cliente {idx}",
+            tipo_consulta="otras",
+            handoff_context="caso",
+        )
+
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        cases = list(pool.map(_handoff, range(6)))
+    assert sum(case.is_active for case in cases) == 1
+
+    active = next(case for case in cases if case.is_active)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        pool.submit(instancias[0].close_case, active.case_id).result()
+        promoted = list(pool.map(lambda service: service.assign_queued_cases(), instancias))
+    assert sum(len(items) for items in promoted) <= 1
+    assert instancias[1].agent_loads() == {"+5491000000001": 1}
+
+
+def test_next_concurrente_de_dos_agentes_no_toma_dos_veces_el_mismo_caso():
+    clock = MutableClock(datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
+    client = InMemoryFirestoreClient(latency_seconds=0.002)
+    agents = [HandoffAgent("+5491000000001", capacity=1), HandoffAgent("+5491000000002", capacity=1)]
+    instancias = [
+        HandoffInboxService(firestore_client=client, now_fn=clock, scheduler=HandoffScheduler(agents))
+        for _ in range(2)
+    ]
+    for idx in range(3):
+        instancias[0].create_or_get_case(
+            client_phone=f"+549188800000{idx}", client_name=f"Cliente {idx}", tipo_consulta="otras", handoff_context="caso"
+        )
+        clock.advance(seconds=1)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        promoted = list(pool.map(lambda idx: instancias[idx].advance_next(agents[idx].phone), range(2)))
+
+    assert len({case.case_id for case in promoted}) == 2
+    assert {case.assigned_agent for case in promoted} == {"+5491000000001", "+5491000000002"}
+    assert instancias[1].agent_loads() == {"+5491000000001": 1, "+5491000000002": 1}
+    assert [item.is_active for item in instancias[1].list_cases()].count(False) == 1
+
+
+def test_next_de_un_agente_en_pausa_no_toma_casos_de_la_cola():
+    clock = MutableClock(datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
+    service = _build_multi_agent_service(clock, HandoffAgent("+5491000000001"))
+    service.set_agent_available("+5491000000001", False)
+    service.create_or_get_case(
+        client_phone="+5491888000009", client_name="Cliente", tipo_consulta="otras", handoff_context="caso"
+    )
+
+    assert service.advance_next("+5491000000001") is None
+    assert service.agent_loads() == {}
+
+
+def test_advance_next_only_touches_the_calling_agent_cases():
+    clock = MutableClock(datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
+    service = _build_multi_agent_service(
+        clock,
+        HandoffAgent("+5491000000001", skills=frozenset({"presupuesto"})),
+        HandoffAgent("+5491000000002"),
+        strategy="skills",
+    )
+
+    presupuesto = service.create_or_get_case(
+        client_phone="+5491555000000", client_name="Ana", tipo_consulta="presupuesto", handoff_context="p1"
+    )
+    clock.advance(seconds=1)
+    urgencia = service.create_or_get_case(
+        client_phone="+5491555000001", client_name="Beto", tipo_consulta="urgencia", handoff_context="u1"
+    )
+    clock.advance(seconds=1)
+    en_cola = service.create_or_get_case(
+        client_phone="+5491555000002", client_name="Caro", tipo_consulta="urgencia", handoff_context="u2"
+    )
+
+    assert presupuesto.assigned_agent == "+5491000000001"
+    assert urgencia.assigned_agent == "+5491000000002"
+    assert en_cola.is_active is False
+
+    # El especialista en presupuestos no puede tomar una urgencia
+    assert service.advance_next(agent_phone="5491000000001").client_phone == "+5491555000000"
+
+    promoted = service.advance_next(agent_phone="+5491000000002")
+    assert promoted.client_phone == "+5491555000002"
+    assert promoted.assigned_agent == "+5491000000002"
+    listed = {item.client_phone: item for item in service.list_cases()}
+    assert listed["+5491555000001"].is_active is False
+    assert listed["+5491555000000"].assigned_agent == "+5491000000001"
+
+
+def test_purge_resumes_from_cursor_when_batch_limit_is_reached():
+    clock = MutableClock(datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
+    service = _build_service(clock)
+    for idx, phone in enumerate(("+5491111111111", "+5491222222222", "+5491333333333")):
+        case = service.create_or_get_case(
+            client_phone=phone,
+            client_name=f"Cliente {idx}",
+            tipo_consulta="presupuesto",
+            handoff_context="caso cerrado",
+        )
+        service.close_case(case.case_id)
+        clock.advance(minutes=1)
+
+    clock.advance(days=1)
+    first = service.purge_closed_case_history(dry_run=True, batch_limit=2, cases_days=7)
+    second = service.purge_closed_case_history(dry_run=True, batch_limit=2, cases_days=7, cursor=first.next_cursor)
+    wrapped = service.purge_closed_case_history(dry_run=True, batch_limit=2, cases_days=7, cursor=second.next_cursor)
+
+    assert first.cases_scanned == 2
+    assert first.next_cursor is not None
+    assert second.cases_scanned == 1
+    assert second.next_cursor is None
+    assert wrapped.cases_scanned == 2
+
+
+def test_purge_consulta_solo_el_lote_sin_leer_toda_la_coleccion(monkeypatch):
+    clock = MutableClock(datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
+    service = _build_service(clock)
+    for idx in range(3):
+        case = service.create_or_get_case(
+            client_phone=f"+549144400000{idx}",
+            client_name=f"Cliente {idx}",
+            tipo_consulta="otras",
+            handoff_context="caso cerrado",
+        )
+        service.close_case(case.case_id)
+        clock.advance(minutes=1)
+    service.create_or_get_case(
+        client_phone="+5491444000009", client_name="Abierto", tipo_consulta="otras", handoff_context="abierto"
+    )
+
+    def _full_scan():
+        raise AssertionError("la purga no debe recorrer toda la colección")
+
+    monkeypatch.setattr(service, "_list_case_records", _full_scan)
+    clock.advance(days=8)
+    first = service.purge_closed_case_history(dry_run=False, batch_limit=2, cases_days=7)
+    second = service.purge_closed_case_history(dry_run=False, batch_limit=2, cases_days=7, cursor=first.next_cursor)
+
+    assert (first.cases_deleted, second.cases_deleted) == (2, 1)
+    assert second.next_cursor is None
@@ -1,3 +1,4 @@
+import asyncio
 import importlib
 import os
 import sys
@@ -20,6 +21,14 @@ if REPO_ROOT not in sys.path:
     sys.path.insert(0, REPO_ROOT)
 
 
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
 def _load_main_module():
     sys.modules.pop("main", None)
     return importlib.import_module("main")
@@ -110,6 +119,7 @@ def test_internal_handoff_autoclose_notifies_and_finalizes_closed_cases(monkeypa
 
     sent_messages = []
     finalized = []
+    deleted_checkpoints = []
     sync_calls = []
 
     monkeypatch.setattr(
@@ -124,14 +134,19 @@ def test_internal_handoff_autoclose_notifies_and_finalizes_closed_cases(monkeypa
     )
     monkeypatch.setattr(
         main_module,
-        "_sync_runtime_handoff_state",
+        "_load_handoff_cases",
         lambda: sync_calls.append("sync") or [],
     )
     monkeypatch.setattr(
         main_module.conversation_manager,
-        "finalizar_conversacion",
+        "finalizar_conversacion_runtime",
         lambda phone: finalized.append(phone),
     )
+    monkeypatch.setattr(
+        main_module.conversation_manager,
+        "delete_checkpoint",
+        lambda phone: deleted_checkpoints.append((phone, _in_event_loop())),
+    )
 
     client = TestClient(main_module.app)
     response = client.post(
@@ -147,6 +162,8 @@ def test_internal_handoff_autoclose_notifies_and_finalizes_closed_cases(monkeypa
         )
     ]
     assert finalized == ["+5491111111111"]
+    # El borrado del checkpoint (Firestore) corre fuera del event loop
+    assert deleted_checkpoints == [("+5491111111111", False)]
     assert sync_calls == ["sync"]
     assert response.json()["cases_closed"] == 1
     assert response.json()["closed_cases"][0]["case_id"] == "case-1"
@@ -0,0 +1,43 @@
+from services.handoff_scheduler import HandoffAgent, HandoffScheduler, normalize_agent_phone, parse_agents
+
+
+def test_parse_agents_lee_capacidad_y_skills():
+    agents = parse_agents("+5491111111111:2:presupuesto|urgencia, 5492222222222 ,5491111111111")
+
+    assert [agent.phone for agent in agents] == ["+5491111111111", "+5492222222222"]
+    assert agents[0].capacity == 2
+    assert agents[0].skills == frozenset({"presupuesto", "urgencia"})
+    assert agents[1].skills == frozenset()
+    assert normalize_agent_phone("whatsapp:+5491111111111") == "+5491111111111"
+
+
+def test_least_loaded_reparte_y_respeta_capacidad():
+    scheduler = HandoffScheduler(
+        [HandoffAgent("+5491111111111", capacity=2), HandoffAgent("+5492222222222", capacity=1)],
+        strategy="least_loaded",
+    )
+
+    assert scheduler.pick_agent("otras", {"+5491111111111": 1}) == "+5492222222222"
+    assert scheduler.pick_agent("otras", {"+5491111111111": 1, "+5492222222222": 1}) == "+5491111111111"
+    assert scheduler.pick_agent("otras", {"+5491111111111": 2, "+5492222222222": 1}) is None
+
+    paused = frozenset({"+5492222222222"})
+    assert scheduler.pick_agent("otras", {"+5491111111111": 2}, paused=paused) is None
+    assert scheduler.pick_agent("otras", {}, paused=paused) == "+5491111111111"
+    assert scheduler.status(paused=paused)[1]["available"] is False
+
+
+def test_skills_prioriza_especialistas_y_usa_generalistas_de_respaldo():
+    scheduler = HandoffScheduler(
+        [
+            HandoffAgent("+5491111111111"),
+            HandoffAgent("+5492222222222", skills=frozenset({"presupuesto"})),
+        ],
+        strategy="skills",
+    )
+
+    assert scheduler.pick_agent("presupuesto", {}) == "+5492222222222"
+    assert scheduler.pick_agent("presupuesto", {"+5492222222222": 1}) == "+5491111111111"
+    assert scheduler.pick_agent("urgencia", {}) == "+5491111111111"
+    assert scheduler.pick_agent("urgencia", {"+5491111111111": 1}) is None
+    assert scheduler.can_handle("+5492222222222", "urgencia") is False
@@ -0,0 +1,28 @@
+from benchmarks.hot_paths import build_cases, compare_to_baseline, load_baseline, run_benchmark
+
+
+def test_baseline_cubre_todos_los_casos():
+    names = {case.name for case in build_cases()}
+
+    assert "list_cases_1000" in names
+    assert "extract_message_data_list_reply" in names
+    assert set(load_baseline()) == names
+
+
+def test_reporte_incluye_tiempo_y_asignaciones():
+    report = run_benchmark(iterations=1, only=["normalizar_texto", "email_lead_html"])
+
+    assert set(report) == {"normalizar_texto", "email_lead_html"}
+    for values in report.values():
+        assert values["min_us"] > 0
+        assert values["peak_bytes"] >= 0
+        assert values["min_us"] <= values["median_us"]
+
+
+def test_comparacion_detecta_regresion_de_asignaciones_y_latencia():
+    baseline = {"list_cases_100": {"min_us": 100.0, "peak_bytes": 10_000}}
+    report = {"list_cases_100": {"min_us": 150.0, "peak_bytes": 20_000}}
+
+    assert len(compare_to_baseline(report, baseline)) == 1
+    assert len(compare_to_baseline(report, baseline, latency_factor=1.2)) == 2
+    assert compare_to_baseline({"nuevo_caso": {"min_us": 1.0, "peak_bytes": 1}}, baseline) == []
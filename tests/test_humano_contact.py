@@ -47,6 +47,39 @@ def test_patrones_humano_basicos():
         assert nlu_service.detectar_solicitud_humano(msg) is False, f"No debería detectar HUMANO: {msg}"
 
 
+def test_alternancias_compiladas_equivalen_a_patrones_individuales():
+    import re
+    from services import nlu_service as nlu_module
+
+    mensajes = [
+        "cual es su telefono",
+        "donde estan ubicados",
+        "hasta que hora atienden",
+        "quiero hablar con una persona",
+        "no me entendes",
+        "humnao",
+        "necesito un presupuesto",
+        "datos de contacto",
+        "mi correo es ana@mail.com",
+    ]
+    tablas = [
+        (nlu_module.CONTACT_QUERY_REGEX, nlu_module.CONTACT_QUERY_PATTERNS),
+        (nlu_module.HUMAN_INTENT_REGEX, nlu_module.HUMAN_INTENT_PATTERNS),
+        (nlu_module.HUMAN_NEGATION_REGEX, nlu_module.HUMAN_NEGATION_PATTERNS),
+        (nlu_module.CONTACT_SUMMARY_REGEX, nlu_module.CONTACT_SUMMARY_PATTERNS),
+    ]
+    for field, patterns in nlu_module.CONTACT_RESPONSE_FIELD_PATTERNS.items():
+        tablas.append((nlu_module.CONTACT_RESPONSE_FIELD_REGEX[field], patterns))
+
+    for compiled, patterns in tablas:
+        for msg in mensajes:
+            esperado = any(re.search(p, msg, re.IGNORECASE) for p in patterns)
+            fired = nlu_module._search_pattern(compiled, patterns, msg)
+            assert (fired is not None) == esperado, msg
+            if fired is not None:
+                assert re.search(fired, msg, re.IGNORECASE)
+
+
 def test_respuesta_humano_con_telefonos():
     respuesta = nlu_service.generar_respuesta_humano("quiero hablar con una persona")
     assert "Teléfono fijo" in respuesta
@@ -0,0 +1,115 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.in_memory_firestore import DESCENDING, InMemoryFirestoreClient
+from services.job_runner import FirestoreJobLeaseStore
+
+
+def test_queries_filtran_ordenan_y_paginan_con_cursor():
+    client = InMemoryFirestoreClient()
+    cases = client.collection("cases")
+    for index in range(6):
+        cases.document(f"case-{index}").set({"status": "open" if index % 3 else "closed", "rank": index % 2, "n": index})
+    cases.document("case-0").collection("messages").document("m1").set({"text": "hola"})
+
+    query = cases.where("status", "==", "open").order_by("rank").order_by("n", direction=DESCENDING)
+    first_page = list(query.limit(2).stream())
+    second_page = list(query.start_after(first_page[-1]).stream())
+
+    assert [snapshot.id for snapshot in first_page] == ["case-4", "case-2"]
+    assert [snapshot.id for snapshot in second_page] == ["case-5", "case-1"]
+    assert [snapshot.id for snapshot in cases.where("n", "in", [1, 5]).stream()] == ["case-1", "case-5"]
+
+    # Lo que devuelve to_dict() es una copia: mutarla no toca lo guardado ni otros snapshots
+    snapshot = cases.document("case-1").get()
+    snapshot.to_dict()["status"] = "mutado"
+    assert snapshot.to_dict()["status"] == "open"
+    assert cases.document("case-1").get().get("status") == "open"
+
+    # Como en Firestore, borrar el documento no borra sus subcolecciones
+    cases.document("case-0").delete()
+    assert [snapshot.id for snapshot in cases.document("case-0").collection("messages").stream()] == ["m1"]
+
+
+def test_transacciones_con_firestore_transactional_y_batches_atomicos():
+    client = InMemoryFirestoreClient()
+    now = datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc)
+    leases = FirestoreJobLeaseStore(firestore_client=client, now_fn=lambda: now)
+
+    assert leases.acquire("ttl_sweep", "instancia-a", 60) is True
+    assert leases.acquire("ttl_sweep", "instancia-b", 60) is False
+    assert client.rpcs["begin_transaction"] == 2
+    assert client.rpcs["commit"] == 2
+
+    docs = client.collection("docs")
+    docs.document("existente").set({"v": 1})
+    batch = client.batch()
+    batch.set(docs.document("nuevo"), {"v": 2})
+    batch.create(docs.document("existente"), {"v": 3})
+    with pytest.raises(Exception):
+        batch.commit()
+    assert docs.document("nuevo").get().exists is False
+    assert docs.document("existente").get().to_dict() == {"v": 1}
+
+
+def test_on_snapshot_informa_altas_cambios_y_bajas():
+    client = InMemoryFirestoreClient()
+    cases = client.collection("cases")
+    cases.document("a").set({"status": "open"})
+    events = []
+
+    watch = cases.where("status", "==", "open").on_snapshot(
+        lambda docs, changes, read_time: events.append([(change.type, change.document.id) for change in changes])
+    )
+    cases.document("b").set({"status": "open"})
+    cases.document("a").update({"status": "closed"})
+    watch.unsubscribe()
+    cases.document("c").set({"status": "open"})
+
+    assert events == [[("ADDED", "a")], [("ADDED", "b")], [("REMOVED", "a")]]
+
+
+def test_latencia_fallas_inyectadas_y_contadores():
+    client = InMemoryFirestoreClient(latency_by_operation={"run_query": 0.01})
+    document = client.collection("docs").document("x")
+    document.set({"v": 1})
+    client.fail_next("get", times=2)
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="Falla inyectada"):
+            document.get()
+    assert document.get().to_dict() == {"v": 1}
+
+    started = datetime.now()
+    list(client.collection("docs").stream())
+    assert datetime.now() - started >= timedelta(milliseconds=10)
+    assert client.rpcs == {"set": 1, "get": 3, "run_query": 1}
+    assert client.rpc_count == 5
+
+
+def test_round_trips_de_firestore_por_webhook(meta_spy, monkeypatch):
+    import main
+    from benchmarks.load_test import build_payload, sign
+
+    client = InMemoryFirestoreClient()
+    monkeypatch.setattr(main.conversation_session_service, "_fs_client", client)
+    monkeypatch.setattr(main.handoff_inbox_service, "_firestore_client", client)
+    http = TestClient(main.app)
+    secret = main.meta_whatsapp_service.app_secret
+    phone_number_id = main.meta_whatsapp_service.phone_number_id
+
+    def _post(text, message_id):
+        body = json.dumps(build_payload("5491150000001", "text", text, message_id, phone_number_id=phone_number_id)).encode()
+        client.reset_counters()
+        response = http.post("/webhook/whatsapp", content=body, headers={"X-Hub-Signature-256": sign(body, secret)})
+        assert response.status_code == 200
+        return dict(client.rpcs)
+
+    # Dedupe (create), checkpoint (get) y caso abierto del inbox; un reintento de Meta solo paga el dedupe
+    saludo = _post("hola", "wamid.rt.1")
+    assert saludo["create"] == 1
+    assert sum(saludo.values()) <= 6
+    assert _post("hola", "wamid.rt.1") == {"create": 1}
@@ -0,0 +1,104 @@
+from chatbot.intent_classifier import IntentClassifier, intent_classifier
+from chatbot.models import EstadoConversacion, TipoConsulta
+from chatbot.rules import ChatbotRules
+from chatbot.states import conversation_manager
+from services.nlu_service import nlu_service
+
+
+def test_clasificador_local_intenciones_frecuentes():
+    assert intent_classifier.classify("cuanto sale recargar un extintor") == TipoConsulta.PRESUPUESTO
+    assert intent_classifier.classify("hay incendio en el local") == TipoConsulta.URGENCIA
+    assert intent_classifier.classify("hacen visitas?") == TipoConsulta.OTRAS
+
+
+def test_clasificador_local_baja_confianza_fuera_de_dominio():
+    for texto in ("asdfgh", "buen dia", "me gusta el futbol", ""):
+        prediccion = intent_classifier.predict(texto)
+        assert prediccion is None or prediccion.confianza < intent_classifier.threshold
+
+
+def test_clasificador_aprende_ejemplos_etiquetados(tmp_path):
+    corpus = tmp_path / "corpus.tsv"
+    corpus.write_text("PRESUPUESTO\tprecio de matafuegos\nOTRAS\thorarios de atencion\n", encoding="utf-8")
+    clasificador = IntentClassifier(corpus_paths=[str(corpus)], threshold=0.8)
+
+    assert clasificador.classify("se quema el deposito") is None
+    clasificador.learn("se quema el deposito", TipoConsulta.URGENCIA)
+    assert clasificador.predict("se quema el deposito").tipo == TipoConsulta.URGENCIA
+
+
+def test_aprendizaje_en_linea_acotado_y_sin_urgencia(tmp_path):
+    corpus = tmp_path / "corpus.tsv"
+    corpus.write_text(
+        "PRESUPUESTO\tprecio de matafuegos\nPRESUPUESTO\tcotizacion de recarga\n"
+        "URGENCIA\tse prendio fuego\nOTRAS\thorarios de atencion\n",
+        encoding="utf-8",
+    )
+    apagado = IntentClassifier(corpus_paths=[str(corpus)])
+    assert apagado.learn_from_llm("precio de recarga de matafuegos", TipoConsulta.PRESUPUESTO) is False
+
+    clasificador = IntentClassifier(
+        corpus_paths=[str(corpus)], online_learning=True, online_max_examples=1, online_min_confidence=0.4
+    )
+    # URGENCIA nunca se aprende; tampoco una etiqueta que contradice al modelo
+    assert clasificador.learn_from_llm("se prendio fuego el deposito", TipoConsulta.URGENCIA) is False
+    assert clasificador.learn_from_llm("precio de recarga de matafuegos", TipoConsulta.OTRAS) is False
+    assert clasificador.learn_from_llm("precio de recarga de matafuegos", TipoConsulta.PRESUPUESTO) is True
+    # Tope alcanzado
+    assert clasificador.learn_from_llm("cotizacion de matafuegos", TipoConsulta.PRESUPUESTO) is False
+
+
+def test_seleccion_opcion_usa_clasificador_sin_llm(monkeypatch):
+    def _fail_if_llm_called(_mensaje):
+        raise AssertionError("No debería consultarse el LLM")
+
+    monkeypatch.setattr(nlu_service, "mapear_intencion", _fail_if_llm_called)
+    numero = "+5491100000031"
+    conversation_manager.update_estado(numero, EstadoConversacion.ESPERANDO_OPCION)
+
+    ChatbotRules._procesar_seleccion_opcion(numero, "cuanto me sale recargar los extintores")
+
+    assert conversation_manager.get_conversacion(numero).tipo_consulta == TipoConsulta.PRESUPUESTO
+
+
+def test_seleccion_opcion_usa_respuesta_del_llm(monkeypatch):
+    monkeypatch.setattr(nlu_service, "mapear_intencion", lambda _mensaje: TipoConsulta.OTRAS)
+    numero = "+5491100000032"
+    conversation_manager.update_estado(numero, EstadoConversacion.ESPERANDO_OPCION)
+
+    ChatbotRules._procesar_seleccion_opcion(numero, "zzz qwerty")
+
+    conversacion = conversation_manager.get_conversacion(numero)
+    assert conversacion.tipo_consulta == TipoConsulta.OTRAS
+    assert conversacion.estado == EstadoConversacion.RECOLECTANDO_SECUENCIAL
+
+
+def test_clasificador_se_abstiene_con_respuestas_cortas_y_negativas():
+    for texto in ("no", "no sé", "no entiendo", "se", "si", "no quiero nada", "ninguna"):
+        assert intent_classifier.predict(texto) is None, texto
+        assert intent_classifier.classify(texto) is None, texto
+
+
+def test_urgencia_local_exige_umbral_alto_y_varias_palabras():
+    # "ayuda" sola puntúa alto como URGENCIA pero no alcanza para un handoff sin el LLM
+    assert intent_classifier.classify("ayuda") is None
+    assert intent_classifier.classify("hay incendio en el local") == TipoConsulta.URGENCIA
+
+
+def test_seleccion_opcion_negativa_consulta_al_llm(monkeypatch):
+    llamadas = []
+
+    def _llm(mensaje):
+        llamadas.append(mensaje)
+        return None
+
+    monkeypatch.setattr(nlu_service, "mapear_intencion", _llm)
+    numero = "+5491100000033"
+    conversation_manager.update_estado(numero, EstadoConversacion.ESPERANDO_OPCION)
+
+    ChatbotRules._procesar_seleccion_opcion(numero, "no entiendo")
+
+    assert llamadas == ["no entiendo"]
+    conversacion = conversation_manager.get_conversacion(numero)
+    assert conversacion.tipo_consulta is None
+    assert conversacion.estado == EstadoConversacion.ESPERANDO_OPCION
@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from services.job_runner import JobResult, JobRunner, LocalJobLeaseStore
+
+
+class MutableClock:
+    def __init__(self, current: datetime):
+        self.current = current
+
+    def __call__(self) -> datetime:
+        return self.current
+
+    def advance(self, **kwargs) -> datetime:
+        self.current = self.current + timedelta(**kwargs)
+        return self.current
+
+
+def test_local_lease_blocks_other_holders_until_expiry():
+    clock = MutableClock(datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc))
+    store = LocalJobLeaseStore(now_fn=clock)
+
+    assert store.acquire("ttl_sweep", "instancia-a", 60) is True
+    assert store.acquire("ttl_sweep", "instancia-b", 60) is False
+    assert store.acquire("ttl_sweep", "instancia-a", 60) is True
+
+    clock.advance(seconds=61)
+    assert store.acquire("ttl_sweep", "instancia-b", 60) is True
+
+
+def test_only_the_lease_holder_runs_and_cursor_carries_over():
+    store = LocalJobLeaseStore()
+    seen_cursors = []
+
+    def _job(cursor):
+        seen_cursors.append(cursor)
+        return JobResult(items=3, cursor=f"pos-{len(seen_cursors)}")
+
+    leader = JobRunner(lease_store=store, holder="instancia-a")
+    follower = JobRunner(lease_store=store, holder="instancia-b")
+    for runner in (leader, follower):
+        runner.register("handoff_purge", 300, _job)
+
+    assert asyncio.run(leader.run_once("handoff_purge")).items == 3
+    assert asyncio.run(follower.run_once("handoff_purge")) is None
+    asyncio.run(leader.run_once("handoff_purge"))
+
+    assert seen_cursors == [None, "pos-1"]
+    assert leader.stats["handoff_purge"]["runs"] == 2
+    assert leader.stats["handoff_purge"]["items"] == 6
+    assert follower.stats["handoff_purge"]["lease_skipped"] == 1
+
+
+def test_failed_run_releases_lease_and_keeps_cursor():
+    store = LocalJobLeaseStore()
+    store.record_run("checkpoint_cleanup", cursor="pos-7", items=0, duration_ms=1.0)
+
+    def _boom(cursor):
+        raise RuntimeError("firestore no disponible")
+
+    failing = JobRunner(lease_store=store, holder="instancia-a")
+    failing.register("checkpoint_cleanup", 300, _boom)
+    other = JobRunner(lease_store=store, holder="instancia-b")
+    other.register("checkpoint_cleanup", 300, lambda cursor: JobResult(items=1, cursor=cursor))
+
+    assert asyncio.run(failing.run_once("checkpoint_cleanup")) is None
+    assert failing.stats["checkpoint_cleanup"]["failures"] == 1
+    assert asyncio.run(other.run_once("checkpoint_cleanup")).cursor == "pos-7"
+
+
+def test_disabled_interval_skips_registration():
+    runner = JobRunner(lease_store=LocalJobLeaseStore())
+    runner.register("ttl_sweep", 0, lambda cursor: JobResult())
+
+    assert runner.jobs == {}
+
+
+def test_job_sin_lease_corre_en_cada_instancia_y_los_async_en_el_loop():
+    store = LocalJobLeaseStore()
+    loops = []
+
+    async def _sweep(cursor):
+        loops.append(asyncio.get_running_loop())
+        return JobResult(items=1)
+
+    runners = [JobRunner(lease_store=store, holder=f"instancia-{idx}") for idx in range(2)]
+    for runner in runners:
+        runner.register("ttl_sweep", 300, _sweep, leased=False)
+
+    async def _run_all():
+        return [await runner.run_once("ttl_sweep") for runner in runners], asyncio.get_running_loop()
+
+    results, loop = asyncio.run(_run_all())
+
+    assert [result.items for result in results] == [1, 1]
+    assert loops == [loop, loop]
+    assert store.load_cursor("ttl_sweep") is None
+    assert all(runner.stats["ttl_sweep"]["lease_skipped"] == 0 for runner in runners)
+
+
+def test_corrida_mas_larga_que_el_intervalo_renueva_el_lease():
+    store = LocalJobLeaseStore()
+
+    async def _slow(cursor):
+        await asyncio.sleep(0.25)
+        return JobResult(items=1)
+
+    leader = JobRunner(lease_store=store, holder="instancia-a")
+    follower = JobRunner(lease_store=store, holder="instancia-b")
+    for runner in (leader, follower):
+        runner.register("handoff_autoclose", 0.1, _slow)
+
+    async def _overlap():
+        running = asyncio.create_task(leader.run_once("handoff_autoclose"))
+        # El lease original (0.1 s) ya venció: solo sigue tomado porque el líder lo renueva
+        await asyncio.sleep(0.18)
+        skipped = await follower.run_once("handoff_autoclose")
+        return await running, skipped
+
+    result, skipped = asyncio.run(_overlap())
+
+    assert result.items == 1
+    assert skipped is None
+    assert follower.stats["handoff_autoclose"]["lease_skipped"] == 1
@@ -0,0 +1,68 @@
+import pytest
+
+from chatbot.keyword_index import KeywordIndex
+from chatbot.rules import ChatbotRules
+
+
+def test_keyword_index_encuentra_superposiciones_en_una_pasada():
+    index = KeywordIndex([
+        ("he", "a", False),
+        ("she", "b", False),
+        ("his", "c", False),
+        ("hers", "d", False),
+    ])
+
+    matches = index.find_all("ushers")
+
+    assert sorted((m.keyword, m.start, m.end) for m in matches) == [
+        ("he", 2, 4),
+        ("hers", 2, 6),
+        ("she", 1, 4),
+    ]
+    assert index.categories("ushers") == {"a", "b", "d"}
+
+
+def test_keyword_index_palabra_completa():
+    index = KeywordIndex([("urgencia", "menu:urgencia", True), ("grac", "gratitud", False)])
+
+    assert index.categories("tengo una urgencia") == {"menu:urgencia"}
+    assert index.categories("urgenciasss") == set()
+    assert index.categories("muchas gracias") == {"gratitud"}
+
+
+def test_keyword_index_equivale_a_busqueda_lineal():
+    keywords = ["caba", "capital", "palermo", "bs as", "la plata", "once", "prov"]
+    index = KeywordIndex((kw, kw, False) for kw in keywords)
+    textos = ["av santa fe 1234 palermo caba", "calle 7 la plata bs as", "doscientos once", "rivadavia 3000"]
+
+    for texto in textos:
+        assert index.categories(texto) == {kw for kw in keywords if kw in texto}
+
+
+def test_indice_compartido_de_reglas():
+    index = ChatbotRules._get_keyword_index()
+    categorias = index.categories("gracias por el presupuesto de palermo")
+
+    assert {"gratitud", "menu:presupuesto"} <= categorias
+
+
+def test_keyword_index_reconstruir_no_duplica_salidas():
+    index = KeywordIndex([("he", "a", False), ("she", "b", False)])
+    index.find_all("she")
+    index.add("hers", "d")
+
+    assert sorted(m.keyword for m in index.find_all("she")) == ["he", "she"]
+
+
+def test_keyword_index_congelado_y_concurrente():
+    from concurrent.futures import ThreadPoolExecutor
+
+    index = KeywordIndex((kw, kw, False) for kw in ("he", "she", "his", "hers"))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        resultados = list(pool.map(lambda _i: len(index.find_all("ushers")), range(64)))
+    assert set(resultados) == {3}
+
+    index.freeze()
+    with pytest.raises(RuntimeError):
+        index.add("nuevo", "x")
+    assert ChatbotRules._get_keyword_index() is ChatbotRules._get_keyword_index()
@@ -0,0 +1,234 @@
+import time
+
+from chatbot.models import ConversacionData, DatosContacto, EstadoConversacion, TipoConsulta
+from services.in_memory_firestore import InMemoryFirestoreClient
+from services.lead_outbox_service import (
+    LEAD_CONFIRMATION_ID_KEY,
+    LEAD_OUTBOX_RETENTION_HOURS,
+    STATUS_FAILED,
+    STATUS_IN_FLIGHT,
+    STATUS_PENDING,
+    STATUS_SENT,
+    FileOutboxStore,
+    FirestoreOutboxStore,
+    LeadOutbox,
+    build_lead_key,
+)
+
+
+def _build_conversacion(numero: str = "+5491112345678", confirmacion: str = "conf-1") -> ConversacionData:
+    return ConversacionData(
+        numero_telefono=numero,
+        estado=EstadoConversacion.ENVIANDO,
+        datos_temporales={LEAD_CONFIRMATION_ID_KEY: confirmacion},
+        tipo_consulta=TipoConsulta.PRESUPUESTO,
+        datos_contacto=DatosContacto(
+            email="lead@example.com",
+            direccion="Calle Falsa 123",
+            horario_visita="Lunes 9-12",
+            descripcion="- Compra de 2 extintores de 5 kg",
+        ),
+    )
+
+
+def test_outbox_envia_en_segundo_plano_y_deduplica(tmp_path):
+    enviados = []
+    outbox = LeadOutbox(store=FileOutboxStore(str(tmp_path / "outbox.jsonl")), sender=lambda c: enviados.append(c) or True)
+
+    key = outbox.enqueue(_build_conversacion())
+    assert outbox.enqueue(_build_conversacion()) == key
+    assert outbox.drain()
+
+    assert len(enviados) == 1
+    assert enviados[0].datos_contacto.email == "lead@example.com"
+    assert outbox.store.get(key)["status"] == STATUS_SENT
+    stats = outbox.stats()
+    assert stats["sent"] == 1
+    assert stats["duplicates"] == 1
+    assert stats["send_latency"]["count"] == 1
+
+
+def test_outbox_reintenta_y_manda_a_dead_letter(tmp_path):
+    intentos = []
+
+    def sender(conversacion):
+        intentos.append(conversacion.numero_telefono)
+        raise RuntimeError("SES throttling")
+
+    outbox = LeadOutbox(
+        store=FileOutboxStore(str(tmp_path / "outbox.jsonl")),
+        sender=sender,
+        max_attempts=3,
+        backoff_seconds=0,
+    )
+    key = outbox.enqueue(_build_conversacion())
+    assert outbox.drain()
+
+    entry = outbox.store.get(key)
+    assert len(intentos) == 3
+    assert entry["status"] == STATUS_FAILED
+    assert "SES throttling" in entry["last_error"]
+    assert outbox.stats()["dead_letters"] == 1
+
+
+def _pending_entry(conversacion: ConversacionData) -> dict:
+    return {
+        "key": build_lead_key(conversacion),
+        "phone": conversacion.numero_telefono,
+        "status": STATUS_PENDING,
+        "attempts": 0,
+        "payload": conversacion.model_dump(mode="json"),
+        "created_at": 0.0,
+        "updated_at": 0.0,
+        "last_error": None,
+    }
+
+
+def test_journal_recupera_pendientes_al_reiniciar(tmp_path):
+    path = str(tmp_path / "outbox.jsonl")
+    conversacion = _build_conversacion("+5491100000001")
+    # Instancia que persistió el lead pero se cayó antes de enviarlo
+    store = FileOutboxStore(path)
+    store.create(_pending_entry(conversacion))
+    with open(path, "a", encoding="utf-8") as handle:
+        handle.write('{"key": "trunc')
+
+    enviados = []
+    outbox = LeadOutbox(store=FileOutboxStore(path), sender=lambda c: enviados.append(c.numero_telefono) or True)
+    assert outbox.start() == 1
+    assert outbox.drain()
+
+    assert enviados == ["+5491100000001"]
+    assert FileOutboxStore(path).pending() == []
+
+
+def test_dos_instancias_sobre_firestore_envian_el_lead_una_sola_vez():
+    client = InMemoryFirestoreClient()
+    conversacion = _build_conversacion("+5491100000002")
+    FirestoreOutboxStore(firestore_client=client).create(_pending_entry(conversacion))
+    enviados = []
+
+    def sender(c):
+        time.sleep(0.05)
+        enviados.append(c.numero_telefono)
+        return True
+
+    instancias = [LeadOutbox(store=FirestoreOutboxStore(firestore_client=client), sender=sender) for _ in range(2)]
+    for outbox in instancias:
+        outbox.start()
+    assert all(outbox.drain() for outbox in instancias)
+
+    assert enviados == ["+5491100000002"]
+    assert FirestoreOutboxStore(firestore_client=client).get(build_lead_key(conversacion))["status"] == STATUS_SENT
+
+
+def test_lease_vencido_se_retoma_tras_caida_del_worker(tmp_path):
+    path = str(tmp_path / "outbox.jsonl")
+    conversacion = _build_conversacion("+5491100000003")
+    key = build_lead_key(conversacion)
+    store = FileOutboxStore(path)
+    store.create(_pending_entry(conversacion))
+
+    # Worker que reclamó el lead y se cayó sin enviarlo
+    assert store.claim(key, "instancia-caida", lease_seconds=60)["status"] == STATUS_IN_FLIGHT
+    assert store.claim(key, "otra", lease_seconds=60) is None
+    assert FileOutboxStore(path).pending() == []
+
+    store.update(key, {"lease_until": time.time() - 1})
+    enviados = []
+    outbox = LeadOutbox(store=FileOutboxStore(path), sender=lambda c: enviados.append(c.numero_telefono) or True)
+    assert outbox.start() == 1
+    assert outbox.drain()
+
+    assert enviados == ["+5491100000003"]
+
+
+def test_falla_al_guardar_el_resultado_reintenta_la_escritura_sin_reenviar(tmp_path):
+    class _StoreInestable(FileOutboxStore):
+        fallas = 1
+
+        def update(self, key, fields):
+            if fields.get("status") == STATUS_SENT and self.fallas:
+                self.fallas -= 1
+                raise RuntimeError("firestore unavailable")
+            super().update(key, fields)
+
+    enviados = []
+    outbox = LeadOutbox(
+        store=_StoreInestable(str(tmp_path / "outbox.jsonl")),
+        sender=lambda c: enviados.append(c) or True,
+        backoff_seconds=0.01,
+    )
+    key = outbox.enqueue(_build_conversacion())
+    assert outbox.drain()
+
+    assert len(enviados) == 1
+    assert outbox.store.get(key)["status"] == STATUS_SENT
+
+
+def test_nueva_confirmacion_con_los_mismos_datos_envia_otro_lead(tmp_path):
+    enviados = []
+    outbox = LeadOutbox(store=FileOutboxStore(str(tmp_path / "outbox.jsonl")), sender=lambda c: enviados.append(c) or True)
+
+    primera = outbox.enqueue(_build_conversacion(confirmacion="conf-1"))
+    segunda = outbox.enqueue(_build_conversacion(confirmacion="conf-2"))
+    assert outbox.drain()
+
+    assert primera != segunda
+    assert len(enviados) == 2
+    assert outbox.stats()["duplicates"] == 0
+
+
+def test_purga_de_firestore_borra_solo_envios_terminados_vencidos():
+    client = InMemoryFirestoreClient()
+    store = FirestoreOutboxStore(firestore_client=client)
+    enviado = _build_conversacion("+5491100000004")
+    pendiente = _build_conversacion("+5491100000005")
+    for conversacion in (enviado, pendiente):
+        store.create(_pending_entry(conversacion))
+    now = time.time()
+    store.update(build_lead_key(enviado), {"status": STATUS_SENT, "attempts": 1, "updated_at": now})
+
+    assert store.get(build_lead_key(enviado))["expires_at"] is not None
+    assert store.purge_expired(now=now) == 0
+
+    later = now + LEAD_OUTBOX_RETENTION_HOURS * 3600 + 1
+    assert LeadOutbox(store=store).purge_expired(now=later) == 1
+    assert store.get(build_lead_key(enviado)) is None
+    assert store.get(build_lead_key(pendiente))["status"] == STATUS_PENDING
+
+
+def test_purga_del_journal_compacta_el_archivo(tmp_path):
+    path = str(tmp_path / "outbox.jsonl")
+    store = FileOutboxStore(path)
+    conversacion = _build_conversacion("+5491100000006")
+    key = build_lead_key(conversacion)
+    store.create(_pending_entry(conversacion))
+    store.update(key, {"status": STATUS_SENT, "attempts": 1, "updated_at": time.time()})
+
+    later = time.time() + LEAD_OUTBOX_RETENTION_HOURS * 3600 + 1
+    assert store.purge_expired(now=later) == 1
+    assert store.get(key) is None
+    with open(path, encoding="utf-8") as handle:
+        assert handle.read() == ""
+
+
+def test_recover_periodico_retoma_leases_vencidos_sin_reiniciar(tmp_path):
+    path = str(tmp_path / "outbox.jsonl")
+    store = FileOutboxStore(path)
+    conversacion = _build_conversacion("+5491100000007")
+    key = build_lead_key(conversacion)
+    store.create(_pending_entry(conversacion))
+    # Instancia que se apagó con el envío en curso
+    store.claim(key, "instancia-apagada", lease_seconds=60)
+
+    enviados = []
+    outbox = LeadOutbox(store=store, sender=lambda c: enviados.append(c.numero_telefono) or True)
+    assert outbox.start() == 0
+
+    store.update(key, {"lease_until": time.time() - 1})
+    assert outbox.recover() == 1
+    assert outbox.drain()
+
+    assert enviados == ["+5491100000007"]
+    assert outbox.recover() == 0
@@ -0,0 +1,82 @@
+from services.llm_cache import LLMCache, LRUCache, SQLiteCacheBackend, normalize_exact
+
+
+def test_llm_cache_reutiliza_frases_equivalentes():
+    cache = LLMCache(max_entries=10, ttl_seconds=60, enabled=True)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "PRESUPUESTO"
+
+    assert cache.get_or_compute("intent", "v1", ["Quiero presupuesto!"], compute) == "PRESUPUESTO"
+    assert cache.get_or_compute("intent", "v1", ["  quiero   PRESUPUESTO "], compute) == "PRESUPUESTO"
+    assert len(calls) == 1
+
+    # Otra versión de prompt no comparte entradas
+    cache.get_or_compute("intent", "v2", ["quiero presupuesto"], compute)
+    assert len(calls) == 2
+
+    stats = cache.stats()
+    assert stats["namespaces"]["intent"]["hits_memory"] == 1
+    assert stats["namespaces"]["intent"]["misses"] == 2
+    assert stats["hit_rate"] == round(1 / 3, 4)
+
+
+def test_llm_cache_no_guarda_resultados_invalidos_ni_comparte_mutaciones():
+    cache = LLMCache(max_entries=10, ttl_seconds=60, enabled=True)
+
+    assert cache.get_or_compute("extraction", "v1", ["hola"], lambda: None) is None
+    assert len(cache.memory) == 0
+
+    datos = cache.get_or_compute("extraction", "v1", ["juan@mail.com"], lambda: {"email": "juan@mail.com"}, normalizer=normalize_exact)
+    datos["email"] = "otro"
+    again = cache.get_or_compute("extraction", "v1", ["juan@mail.com"], lambda: {}, normalizer=normalize_exact)
+    assert again == {"email": "juan@mail.com"}
+
+
+def test_lru_cache_expulsa_y_expira():
+    lru = LRUCache(max_entries=2, ttl_seconds=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+
+    lru.set("d", 4, ttl_seconds=-1)
+    assert lru.get("d") is None
+
+
+def test_llm_cache_nivel_persistente_sqlite(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"))
+    LLMCache(enabled=True, backend=backend).get_or_compute("intent", "v1", ["urgente"], lambda: "URGENCIA")
+
+    # Un proceso nuevo (memoria vacía) lee del nivel persistente
+    fresh = LLMCache(enabled=True, backend=backend)
+    assert fresh.get_or_compute("intent", "v1", ["Urgente"], lambda: "OTRAS") == "URGENCIA"
+    assert fresh.stats()["namespaces"]["intent"]["hits_persistent"] == 1
+
+
+def test_llm_cache_deshabilitado_siempre_calcula():
+    cache = LLMCache(enabled=False)
+    calls = []
+
+    cache.get_or_compute("intent", "v1", ["hola"], lambda: calls.append(1) or "OTRAS")
+    cache.get_or_compute("intent", "v1", ["hola"], lambda: calls.append(1) or "OTRAS")
+
+    assert len(calls) == 2
+
+
+def test_nlu_no_cachea_intencion_vacia(monkeypatch):
+    import services.nlu_service as nlu_module
+
+    cache = LLMCache(max_entries=10, ttl_seconds=60, enabled=True)
+    monkeypatch.setattr(nlu_module, "llm_cache", cache)
+    respuestas = iter(["", "PRESUPUESTO"])
+    monkeypatch.setattr(nlu_module.nlu_service, "_chat", lambda *args, **kwargs: next(respuestas))
+
+    assert nlu_module.nlu_service.mapear_intencion("necesito cotizar") is None
+    assert nlu_module.nlu_service.mapear_intencion("necesito cotizar") == nlu_module.TipoConsulta.PRESUPUESTO
+    assert cache.stats()["namespaces"]["intent"]["misses"] == 2
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services.llm_client import AsyncLLMRunner, LLMTimeoutError
+from services.nlu_service import NLUService
+
+
+class _FakeCompletions:
+    def __init__(self, delays, content="OTRAS"):
+        self.delays = list(delays)
+        self.content = content
+        self.calls = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+
+    async def create(self, **request):
+        delay = self.delays[min(self.calls, len(self.delays) - 1)]
+        self.calls += 1
+        self._in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._in_flight -= 1
+        message = SimpleNamespace(content=f" {self.content} ")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def _fake_client(delays, content="OTRAS"):
+    return SimpleNamespace(chat=SimpleNamespace(completions=_FakeCompletions(delays, content)))
+
+
+def test_runner_completa_dentro_del_deadline():
+    runner = AsyncLLMRunner(timeout=1)
+    response = runner.complete(_fake_client([0.01]), model="m", messages=[])
+
+    assert response.choices[0].message.content.strip() == "OTRAS"
+    assert runner.stats()["p50_ms"] is not None
+
+
+def test_runner_timeout_levanta_error_degradable():
+    runner = AsyncLLMRunner(timeout=0.05)
+
+    with pytest.raises(LLMTimeoutError):
+        runner.complete(_fake_client([1.0]), model="m", messages=[])
+    assert runner.timeouts >= 1
+
+
+def test_runner_hedging_usa_la_respuesta_mas_rapida():
+    runner = AsyncLLMRunner(timeout=1, hedge_enabled=True, hedge_delay_ms=50)
+    client = _fake_client([0.8, 0.01])
+
+    runner.complete(client, model="m", messages=[])
+
+    assert client.chat.completions.calls == 2
+    assert runner.hedges == 1
+
+
+def test_runner_limita_llamadas_en_vuelo():
+    runner = AsyncLLMRunner(timeout=2, max_concurrency=2)
+    client = _fake_client([0.05])
+
+    async def _burst():
+        await asyncio.gather(*(runner.arun(client, model="m", messages=[]) for _ in range(6)))
+
+    asyncio.run(_burst())
+
+    assert client.chat.completions.max_in_flight <= 2
+
+
+def test_nlu_degrada_a_unclear_en_timeout(monkeypatch):
+    service = NLUService()
+    monkeypatch.setattr(service, "_get_client", lambda: _fake_client([1.0]))
+    monkeypatch.setattr("services.nlu_service.llm_runner", AsyncLLMRunner(timeout=0.05))
+
+    assert service.mapear_intencion("algo raro") is None
+
+
+def test_lote_extrae_y_valida_en_una_llamada(monkeypatch):
+    contenido = (
+        '{"campos": {"email": {"valor": "juan@mail.com", "valido": true, "sugerencia": ""},'
+        ' "direccion": {"valor": "Av. Siempre Viva 123", "valido": true, "sugerencia": ""},'
+        ' "cuit": {"valor": "2012", "valido": false, "sugerencia": "El CUIT debe tener 11 dígitos"}}}'
+    )
+    client = _fake_client([0.01], content=contenido)
+    service = NLUService()
+    monkeypatch.setattr(service, "_get_client", lambda: client)
+
+    resultado = service.procesar_campos_lote(
+        {"email": "", "direccion": "", "cuit": "2012"},
+        mensaje_usuario="juan@mail.com, Av. Siempre Viva 123",
+    )
+
+    assert client.chat.completions.calls == 1
+    assert resultado["email"] == {"valor": "juan@mail.com", "valido": True, "sugerencia": ""}
+    assert resultado["cuit"]["valido"] is False
+
+
+def test_lote_fuera_de_esquema_usa_valores_originales(monkeypatch):
+    service = NLUService()
+    monkeypatch.setattr(service, "_get_client", lambda: _fake_client([0.01], content='{"email": "x"}'))
+
+    resultado = service.procesar_campos_lote({"email": "a@b.com", "descripcion": ""})
+
+    assert resultado == {
+        "email": {"valor": "a@b.com", "valido": True, "sugerencia": ""},
+        "descripcion": {"valor": "", "valido": False, "sugerencia": ""},
+    }
@@ -0,0 +1,28 @@
+import json
+
+from benchmarks.load_test import SCENARIOS, build_payload, parse_mix, sign
+
+
+def test_payload_firmado_pasa_validacion_y_extraccion():
+    from services.meta_whatsapp_service import meta_whatsapp_service
+
+    payload = build_payload(
+        "5491150000001", "list", "presupuesto", "wamid.in.1", phone_number_id=meta_whatsapp_service.phone_number_id
+    )
+    body = json.dumps(payload).encode("utf-8")
+
+    assert meta_whatsapp_service.validate_webhook_signature(body, sign(body, meta_whatsapp_service.app_secret))
+    numero, mensaje, message_id, profile_name, message_type = meta_whatsapp_service.extract_message_data(payload)
+    assert (mensaje, message_id, profile_name) == ("presupuesto", "wamid.in.1", "Cliente Carga")
+    assert numero.endswith("5491150000001")
+
+
+def test_mix_rechaza_escenarios_desconocidos():
+    assert parse_mix("saludo=2, encuesta=1") == {"saludo": 2, "encuesta": 1}
+    assert set(parse_mix("saludo,presupuesto,ifci,handoff,encuesta")) == set(SCENARIOS)
+    try:
+        parse_mix("spam=1")
+    except ValueError as e:
+        assert "spam" in str(e)
+    else:
+        raise AssertionError("parse_mix aceptó un escenario desconocido")
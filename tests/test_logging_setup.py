@@ -0,0 +1,72 @@
+import io
+import json
+import logging
+
+from services import logging_setup
+from services.logging_setup import JsonFormatter, SamplingFilter, parse_sample_rates
+
+
+def _record(name, level=logging.INFO, msg="hola %s", args=("mundo",), **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_severity_and_extra_fields():
+    line = JsonFormatter().format(_record("chatbot.webhook", phone="+5491111111111"))
+
+    payload = json.loads(line)
+    assert payload["severity"] == "INFO"
+    assert payload["logger"] == "chatbot.webhook"
+    assert payload["message"] == "hola mundo"
+    assert payload["phone"] == "+5491111111111"
+
+
+def test_sampling_filter_uses_longest_prefix_and_keeps_warnings():
+    rates = parse_sample_rates("chatbot=0.5, chatbot.webhook=0.25,invalido=x")
+    sampling = SamplingFilter(rates)
+
+    webhook = [sampling.filter(_record("chatbot.webhook.status")) for _ in range(8)]
+    warnings = [sampling.filter(_record("chatbot.webhook", level=logging.WARNING)) for _ in range(3)]
+    otros = [sampling.filter(_record("services.nlu_service")) for _ in range(3)]
+
+    assert rates == {"chatbot": 0.5, "chatbot.webhook": 0.25}
+    assert webhook == [True, False, False, False, True, False, False, False]
+    assert warnings == [True, True, True]
+    assert otros == [True, True, True]
+
+
+def test_configure_logging_writes_through_queue_listener(monkeypatch):
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    stream = io.StringIO()
+    monkeypatch.setattr(logging_setup.sys, "stdout", stream)
+    try:
+        logging_setup.configure_logging("INFO", "json", {"chatbot.webhook": 0.0}, force=True)
+        logging.getLogger("chatbot.webhook").info("descartado")
+        logging.getLogger("tests.logging").info("emitido %s", 1)
+        logging_setup.stop_logging()
+    finally:
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in saved_handlers:
+            root.addHandler(handler)
+        root.setLevel(saved_level)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["message"] for line in lines] == ["emitido 1"]
+
+
+def test_queue_handler_congela_el_mensaje_al_encolar():
+    import queue
+
+    cola = queue.Queue()
+    handler = logging_setup._InProcessQueueHandler(cola)
+    estado = {"estado": "inicial"}
+
+    handler.handle(_record("chatbot.webhook", msg="conversacion %s", args=(estado,)))
+    estado["estado"] = "mutado"
+    record = cola.get_nowait()
+
+    assert record.getMessage() == "conversacion {'estado': 'inicial'}"
+    assert record.args is None
@@ -0,0 +1,51 @@
+from chatbot.message_context import MessageContext
+from chatbot.rules import ChatbotRules, normalizar_texto
+from services.nlu_service import nlu_service
+from services.survey_service import survey_service
+
+
+def test_message_context_formas_normalizadas():
+    contexto = MessageContext("  ¿Cuál es su Teléfono?  ")
+
+    assert contexto.raw == "  ¿Cuál es su Teléfono?  "
+    assert contexto.stripped == "¿Cuál es su Teléfono?"
+    assert contexto.lower == "¿cuál es su teléfono?"
+    assert contexto.accent_free == "¿cual es su telefono?"
+    assert contexto.words == "cual es su telefono"
+    assert contexto.tokens == ("cual", "es", "su", "telefono")
+    assert MessageContext("Bs. As.").compact == "bsas"
+
+
+def test_message_context_from_text_reutiliza_instancia():
+    contexto = MessageContext("Hola")
+
+    assert MessageContext.from_text(contexto) is contexto
+    assert MessageContext.from_text(None).raw == ""
+    assert str(contexto) == "Hola"
+
+
+def test_message_context_cachea_normalizacion():
+    contexto = MessageContext("Quiero hablar con una persona")
+
+    assert contexto.accent_free is contexto.accent_free
+    assert "accent_free" in vars(contexto)
+
+
+def test_helpers_aceptan_str_y_contexto():
+    texto = "Muchas Gracias!!"
+    contexto = MessageContext(texto)
+
+    assert normalizar_texto("Capital Federal") == normalizar_texto(MessageContext("Capital Federal"))
+    assert ChatbotRules._normalize_menu_text(texto) == ChatbotRules._normalize_menu_text(contexto)
+    assert ChatbotRules.es_mensaje_agradecimiento(contexto) is True
+    assert ChatbotRules._match_menu_option(MessageContext("Necesito un presupuesto"))[1] == "keyword"
+    assert nlu_service.detectar_consulta_contacto(MessageContext("¿Cuál es su teléfono?")) is True
+    assert nlu_service.detectar_solicitud_humano(MessageContext("Quiero hablar con una persona")) is True
+    assert nlu_service.detectar_solicitud_humano(MessageContext("No quiero hablar con nadie")) is False
+
+
+def test_survey_parser_acepta_contexto():
+    question = survey_service.questions[2]
+
+    assert survey_service._parse_response(MessageContext("  Excelente "), question) == "Muy satisfecho"
+    assert survey_service._parse_response(MessageContext("4"), question) == "Satisfecho"
@@ -0,0 +1,78 @@
+import services.metrics_service as metrics_module
+from services.metrics_service import MetricsService
+
+
+class FakeSheets:
+    def __init__(self, fail_times: int = 0):
+        self.fail_times = fail_times
+        self.appends = []
+        self.updates = []
+        self._next_row = {}
+
+    def append_rows(self, target, rows):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("429 quota exceeded")
+        self.appends.append((target, rows))
+        first = self._next_row.get(target, 2)
+        self._next_row[target] = first + len(rows)
+        return f"A{first}:P{first + len(rows) - 1}"
+
+    def update_rows(self, target, updates):
+        self.updates.append((target, updates))
+
+
+def _service(monkeypatch, sheets):
+    monkeypatch.setenv("ENABLE_SHEETS_METRICS", "true")
+    monkeypatch.setattr(metrics_module, "sheets_service", sheets)
+    service = MetricsService()
+    service.retry_backoff_seconds = 0
+    return service
+
+
+def test_flush_agrega_una_vez_y_despues_actualiza_la_fila_del_dia(monkeypatch):
+    sheets = FakeSheets()
+    service = _service(monkeypatch, sheets)
+
+    service.on_conversation_started()
+    assert service.flush() is True
+    assert [target for target, _ in sheets.appends] == ["business", "tech"]
+    assert sheets.appends[0][1][0][1] == 1
+
+    assert service.flush() is False  # sin cambios no hay escritura
+
+    service.on_conversation_started()
+    assert service.flush() is True
+    assert len(sheets.appends) == 2
+    business_update = dict(sheets.updates)["business"]
+    assert list(business_update) == ["A2:P2"]
+    assert business_update["A2:P2"][1] == 2
+
+
+def test_flush_reintenta_y_conserva_los_dias_si_falla(monkeypatch):
+    sheets = FakeSheets(fail_times=10)
+    service = _service(monkeypatch, sheets)
+    service.max_retries = 1
+
+    service.on_lead_sent()
+    assert service.flush() is False
+    assert sheets.appends == []
+
+    sheets.fail_times = 0
+    assert service.flush() is True
+    assert sheets.appends[0][1][0][3] == 1
+
+
+def test_flush_descarta_dias_anteriores(monkeypatch):
+    sheets = FakeSheets()
+    service = _service(monkeypatch, sheets)
+    monkeypatch.setattr(service, "_key", lambda: "2024-01-01")
+    service.on_exception()
+    assert service.flush() is True
+
+    monkeypatch.setattr(service, "_key", lambda: "2024-01-02")
+    service.on_exception()
+    assert service.flush() is True
+
+    assert list(service._day_cache) == ["2024-01-02"]
+    assert all(day == "2024-01-02" for _, day in service._day_rows)
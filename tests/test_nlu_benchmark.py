@@ -0,0 +1,17 @@
+from benchmarks.nlu_replay import compare_to_baseline, load_baseline, load_corpus, run_benchmark
+
+
+def test_corpus_nlu_sin_regresiones_de_accuracy():
+    report = run_benchmark(load_corpus(), iterations=1)
+
+    regressions = compare_to_baseline(report, load_baseline())
+    assert regressions == [], "\n".join(regressions)
+
+
+def test_comparacion_detecta_caida_de_accuracy_y_latencia():
+    baseline = {"menu_intent": {"accuracy": 1.0, "p95_us": 10.0}}
+    report = {"menu_intent": {"accuracy": 0.9, "p95_us": 50.0}}
+
+    assert len(compare_to_baseline(report, baseline)) == 1
+    assert len(compare_to_baseline(report, baseline, latency_factor=3.0)) == 2
+    assert compare_to_baseline({}, baseline) == ["menu_intent: falta en el reporte"]
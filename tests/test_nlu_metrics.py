@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+from services.nlu_metrics import LatencyHistogram, NLUMetrics, estimate_cost_usd, llm_caller_state
+from services.nlu_service import NLUService
+
+
+def test_histograma_latencia_cuantiles():
+    histograma = LatencyHistogram(buckets=(100, 500, 1000))
+    for value in (20, 80, 90, 400, 2000):
+        histograma.observe(value)
+
+    snapshot = histograma.snapshot()
+    assert snapshot["count"] == 5
+    assert snapshot["buckets"] == {"le_100": 3, "le_500": 1, "le_1000": 0, "le_inf": 1}
+    assert snapshot["p50_ms"] == 100
+    assert snapshot["p95_ms"] == float("inf")
+
+
+def test_metricas_agrupan_por_operacion_y_estado():
+    metrics = NLUMetrics()
+    with llm_caller_state("esperando_opcion"):
+        metrics.record("intent", "gpt-3.5-turbo", 300, prompt_tokens=400, completion_tokens=2)
+    metrics.record("extraction", "gpt-3.5-turbo", 900, prompt_tokens=900, completion_tokens=80,
+                   outcome="timeout", estado="recolectando_datos")
+
+    snapshot = metrics.snapshot()
+    assert snapshot["calls"] == 2
+    assert list(snapshot["by_state"]) == ["recolectando_datos", "esperando_opcion"]
+    timeout_row = next(row for row in snapshot["series"] if row["operation"] == "extraction")
+    assert timeout_row["timeouts"] == 1
+    assert snapshot["cost_usd"] == round(
+        estimate_cost_usd("gpt-3.5-turbo", 400, 2) + estimate_cost_usd("gpt-3.5-turbo", 900, 80), 6
+    )
+
+
+def test_nlu_registra_tokens_de_usage(monkeypatch):
+    recorded = []
+    monkeypatch.setattr("services.nlu_service.nlu_metrics", SimpleNamespace(record=lambda *args: recorded.append(args)))
+
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="OTRAS"))],
+        usage=SimpleNamespace(prompt_tokens=321, completion_tokens=3),
+    )
+    request = NLUService._build_request("sys", "user", 10)
+    NLUService._record_call("intent", request, response, started=0.0)
+
+    operation, model, _latency, prompt_tokens, completion_tokens, outcome = recorded[0]
+    assert (operation, model, prompt_tokens, completion_tokens, outcome) == ("intent", "gpt-3.5-turbo", 321, 3, "ok")
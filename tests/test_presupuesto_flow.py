@@ -696,6 +696,68 @@ def test_webhook_interactive_dispatch_reaches_new_presupuesto_flow(meta_spy):
     assert conversation_manager.get_conversacion(f"+{numero}").estado == EstadoConversacion.PRESUPUESTO_EXTINTOR_TIPO
 
 
+def test_webhook_texto_procesa_fuera_del_event_loop(meta_spy, monkeypatch):
+    client = TestClient(app)
+    numero = "5491100000031"
+    llamadas = []
+
+    def _procesar(numero_telefono, contexto, profile_name):
+        try:
+            asyncio.get_running_loop()
+            llamadas.append("loop")
+        except RuntimeError:
+            llamadas.append(contexto.raw)
+        return "respuesta"
+
+    monkeypatch.setattr(main_module.ChatbotRules, "procesar_mensaje", staticmethod(_procesar))
+    payload = _build_interactive_payload("x", numero)
+    payload["entry"][0]["changes"][0]["value"]["messages"][0] = {
+        "from": numero,
+        "id": "wamid.text123",
+        "timestamp": "1234567890",
+        "type": "text",
+        "text": {"body": "hola"},
+    }
+
+    response = _post_signed(client, payload)
+
+    assert response.status_code == 200
+    assert llamadas == ["hola"]
+    assert any(call["message"] == "respuesta" for call in meta_spy["texts"])
+
+
+def test_webhook_rehidrata_y_responde_encuesta_con_lock_fuera_del_loop(meta_spy, monkeypatch):
+    client = TestClient(app)
+    numero = "5491100000032"
+    llamadas = []
+
+    def _rehydrate(numero_telefono):
+        try:
+            asyncio.get_running_loop()
+            llamadas.append("loop")
+        except RuntimeError:
+            llamadas.append(main_module._phone_lock(numero_telefono).locked())
+        conversacion = conversation_manager.get_conversacion(numero_telefono)
+        conversacion.estado = EstadoConversacion.ESPERANDO_RESPUESTA_ENCUESTA
+        return conversacion
+
+    monkeypatch.setattr(main_module, "_rehydrate_handoff_conversation", _rehydrate)
+    payload = _build_interactive_payload("x", numero)
+    payload["entry"][0]["changes"][0]["value"]["messages"][0] = {
+        "from": numero,
+        "id": "wamid.text124",
+        "timestamp": "1234567890",
+        "type": "text",
+        "text": {"body": "tal vez"},
+    }
+
+    response = _post_signed(client, payload)
+
+    assert response.status_code == 200
+    assert llamadas == [True]
+    assert any("1️⃣ para aceptar la encuesta" in call["message"] for call in meta_spy["texts"])
+
+
 def test_webhook_interactive_confirmacion_dispara_post_procesado(meta_spy, monkeypatch):
     numero = "5491100000015"
     numero_con_prefijo = f"+{numero}"
@@ -727,18 +789,25 @@ def test_webhook_interactive_confirmacion_dispara_post_procesado(meta_spy, monke
     response = _post_signed(client, _build_interactive_payload("si", numero, "button_reply"))
 
     assert response.status_code == 200
+    assert main_module.lead_outbox.drain()
     assert lead_calls == [numero_con_prefijo]
     assert any("Procesando tu solicitud" in call["message"] for call in meta_spy["texts"])
     assert any("Tu solicitud ha sido enviada exitosamente" in call["message"] for call in meta_spy["texts"])
     assert numero_con_prefijo not in conversation_manager.conversaciones
 
 
-def test_webhook_interactive_confirmacion_con_error_de_email_finaliza_conversacion(meta_spy, monkeypatch):
+def test_webhook_interactive_confirmacion_con_error_de_email_agradece_y_reintenta(meta_spy, monkeypatch):
     numero = "5491100000028"
     numero_con_prefijo = f"+{numero}"
     client = TestClient(app)
+    intentos = []
 
-    monkeypatch.setattr(main_module.email_service, "enviar_lead_email", lambda conversacion: False)
+    monkeypatch.setattr(
+        main_module.email_service,
+        "enviar_lead_email",
+        lambda conversacion: intentos.append(conversacion.numero_telefono) or len(intentos) > 1,
+    )
+    monkeypatch.setattr(main_module.lead_outbox, "backoff_seconds", 0)
 
     ChatbotRules.procesar_mensaje(numero_con_prefijo, "hola", "Ana")
     asyncio.run(handle_interactive_button(numero_con_prefijo, "presupuesto", "Ana"))
@@ -756,9 +825,10 @@ def test_webhook_interactive_confirmacion_con_error_de_email_finaliza_conversaci
     response = _post_signed(client, _build_interactive_payload("si", numero, "button_reply"))
 
     assert response.status_code == 200
-    assert any("Procesando tu solicitud" in call["message"] for call in meta_spy["texts"])
-    assert any("Hubo un error procesando tu solicitud" in call["message"] for call in meta_spy["texts"])
+    assert any("Tu solicitud ha sido enviada exitosamente" in call["message"] for call in meta_spy["texts"])
     assert numero_con_prefijo not in conversation_manager.conversaciones
+    assert main_module.lead_outbox.drain()
+    assert intentos == [numero_con_prefijo, numero_con_prefijo]
 
 
 def test_webhook_interactive_finalizar_chat_no_revive_conversacion(meta_spy):
@@ -0,0 +1,55 @@
+import importlib
+import sys
+
+from fastapi.testclient import TestClient
+
+from services.runtime_metrics import MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets_in_prometheus_format():
+    registry = MetricsRegistry()
+    latency = registry.histogram("demo_seconds", "Latencia de prueba", ("stage",), buckets=(0.1, 1.0))
+    latency.observe(0.05, stage="firma")
+    latency.observe(0.1, stage="firma")
+    latency.observe(3.0, stage="firma")
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE demo_seconds histogram" in lines
+    assert 'demo_seconds_bucket{stage="firma",le="0.1"} 2' in lines
+    assert 'demo_seconds_bucket{stage="firma",le="1"} 2' in lines
+    assert 'demo_seconds_bucket{stage="firma",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{stage="firma"} 3' in lines
+
+
+def test_timer_works_as_decorator_and_counter_escapes_labels():
+    registry = MetricsRegistry()
+    latency = registry.histogram("demo_seconds", "Latencia de prueba", ("operation",))
+    sends = registry.counter("demo_total", "Envíos", ("to",))
+
+    @latency.time(operation="load")
+    def _load():
+        return "ok"
+
+    assert _load() == "ok"
+    assert _load() == "ok"
+    sends.inc(to='a"b')
+
+    assert latency.count(operation="load") == 2
+    assert 'demo_total{to="a\\"b"} 1' in registry.render()
+    # Registrar dos veces el mismo nombre devuelve la métrica existente
+    assert registry.counter("demo_total", "Envíos", ("to",)) is sends
+
+
+def test_metrics_endpoint_exposes_request_latency_by_route():
+    sys.modules.pop("main", None)
+    main_module = importlib.import_module("main")
+    client = TestClient(main_module.app)
+
+    client.get("/health")
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'chatbot_http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in response.text
+    assert "chatbot_active_conversations 0" in response.text
@@ -1,91 +1,9 @@
-from copy import deepcopy
 from datetime import datetime, timedelta, timezone
-from types import SimpleNamespace
 
 from chatbot.models import ConversacionData, DatosContacto, EstadoConversacion, TipoConsulta
 from chatbot.states import ConversationManager
 from services import conversation_session_service as session_module
-
-
-class FakeSnapshot:
-    def __init__(self, doc_id, data, collection):
-        self.id = doc_id
-        self._data = deepcopy(data)
-        self.exists = data is not None
-        self.reference = FakeDocumentReference(collection, doc_id)
-
-    def to_dict(self):
-        return deepcopy(self._data)
-
-
-class FakeDocumentReference:
-    def __init__(self, storage, doc_id):
-        self._storage = storage
-        self._doc_id = doc_id
-
-    def set(self, payload):
-        self._storage[self._doc_id] = deepcopy(payload)
-
-    def create(self, payload):
-        if self._doc_id in self._storage:
-            raise session_module.AlreadyExists("exists") if session_module.AlreadyExists else RuntimeError("exists")
-        self._storage[self._doc_id] = deepcopy(payload)
-
-    def get(self):
-        return FakeSnapshot(self._doc_id, self._storage.get(self._doc_id), self._storage)
-
-    def delete(self):
-        self._storage.pop(self._doc_id, None)
-
-
-class FakeQuery:
-    def __init__(self, storage, field_path, op_string, value):
-        self._storage = storage
-        self._field_path = field_path
-        self._op_string = op_string
-        self._value = value
-        self._limit = None
-
-    def limit(self, amount):
-        self._limit = amount
-        return self
-
-    def stream(self):
-        matches = []
-        for doc_id, payload in self._storage.items():
-            current = payload.get(self._field_path)
-            if self._op_string == "<=" and current is not None and current <= self._value:
-                matches.append(FakeSnapshot(doc_id, payload, self._storage))
-        matches.sort(key=lambda snapshot: snapshot.id)
-        if self._limit is not None:
-            matches = matches[: self._limit]
-        return matches
-
-
-class FakeCollectionReference:
-    def __init__(self, storage, name):
-        self._storage = storage
-        self._name = name
-
-    def document(self, doc_id):
-        collection = self._storage.setdefault(self._name, {})
-        return FakeDocumentReference(collection, doc_id)
-
-    def where(self, field_path, op_string, value):
-        collection = self._storage.setdefault(self._name, {})
-        return FakeQuery(collection, field_path, op_string, value)
-
-
-class FakeFirestoreClient:
-    instances = []
-
-    def __init__(self, database):
-        self.database = database
-        self.collections = {}
-        FakeFirestoreClient.instances.append(self)
-
-    def collection(self, name):
-        return FakeCollectionReference(self.collections, name)
+from services.in_memory_firestore import InMemoryFirestoreClient
 
 
 def _build_conversation():
@@ -110,16 +28,9 @@ def _build_conversation():
     )
 
 
-def test_checkpoint_service_round_trip(monkeypatch):
-    FakeFirestoreClient.instances.clear()
-    monkeypatch.setenv(session_module.FIRESTORE_DATABASE_ENV, "(default)")
-    monkeypatch.setattr(
-        session_module,
-        "firestore",
-        SimpleNamespace(Client=FakeFirestoreClient),
-    )
-
-    service = session_module.ConversationSessionService()
+def test_checkpoint_service_round_trip():
+    client = InMemoryFirestoreClient()
+    service = session_module.ConversationSessionService(firestore_client=client)
     conversation = _build_conversation()
     updated_at = datetime(2026, 4, 7, 12, 0, tzinfo=timezone.utc)
     last_user_message_at = datetime(2026, 4, 7, 11, 55, tzinfo=timezone.utc)
@@ -136,8 +47,7 @@ def test_checkpoint_service_round_trip(monkeypatch):
     assert payload["schema_version"] == session_module.CHECKPOINT_SCHEMA_VERSION
     assert payload["expires_at"] == last_user_message_at + timedelta(hours=24)
 
-    client = FakeFirestoreClient.instances[-1]
-    raw_doc = client.collections[session_module.CHECKPOINT_COLLECTION]["whatsapp:+5491122334455"]
+    raw_doc = client.collection(session_module.CHECKPOINT_COLLECTION).document("whatsapp:+5491122334455").get().to_dict()
     assert set(raw_doc.keys()) == session_module.CHECKPOINT_FIELDS
     assert raw_doc["datos_contacto"]["email"] == "ana@example.com"
     assert "message_history" not in raw_doc
@@ -157,31 +67,15 @@ def test_checkpoint_service_round_trip(monkeypatch):
     assert checkpoint.conversation.message_history == []
 
 
-def test_checkpoint_service_marks_duplicate_message_ids(monkeypatch):
-    FakeFirestoreClient.instances.clear()
-    monkeypatch.setenv(session_module.FIRESTORE_DATABASE_ENV, "(default)")
-    monkeypatch.setattr(
-        session_module,
-        "firestore",
-        SimpleNamespace(Client=FakeFirestoreClient),
-    )
-
-    service = session_module.ConversationSessionService()
+def test_checkpoint_service_marks_duplicate_message_ids():
+    service = session_module.ConversationSessionService(firestore_client=InMemoryFirestoreClient())
 
     assert service.mark_message_processed("wamid-1") is False
     assert service.mark_message_processed("wamid-1") is True
 
 
-def test_conversation_manager_hydrates_resumable_state(monkeypatch):
-    FakeFirestoreClient.instances.clear()
-    monkeypatch.setenv(session_module.FIRESTORE_DATABASE_ENV, "(default)")
-    monkeypatch.setattr(
-        session_module,
-        "firestore",
-        SimpleNamespace(Client=FakeFirestoreClient),
-    )
-
-    service = session_module.ConversationSessionService()
+def test_conversation_manager_hydrates_resumable_state():
+    service = session_module.ConversationSessionService(firestore_client=InMemoryFirestoreClient())
     conversation = _build_conversation()
     service.save_for_key(conversation.numero_telefono, conversation)
 
@@ -193,15 +87,8 @@ def test_conversation_manager_hydrates_resumable_state(monkeypatch):
     assert hydrated.datos_contacto.email == "ana@example.com"
 
 
-def test_cleanup_service_deletes_only_expired_checkpoints(monkeypatch):
-    FakeFirestoreClient.instances.clear()
-    monkeypatch.setenv(session_module.FIRESTORE_DATABASE_ENV, "(default)")
-    monkeypatch.setattr(
-        session_module,
-        "firestore",
-        SimpleNamespace(Client=FakeFirestoreClient),
-    )
-    service = session_module.ConversationSessionService()
+def test_cleanup_service_deletes_only_expired_checkpoints():
+    service = session_module.ConversationSessionService(firestore_client=InMemoryFirestoreClient())
     now = datetime(2026, 4, 7, 15, 0, tzinfo=timezone.utc)
 
     expired = ConversacionData(numero_telefono="+5491111111111", estado=EstadoConversacion.CONFIRMANDO)
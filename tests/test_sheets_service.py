@@ -0,0 +1,126 @@
+from services.sheets_service import SheetsService
+
+
+class FakeWorksheet:
+    def __init__(self, fail_times: int = 0, error: str = "APIError: [429]: Quota exceeded for quota metric"):
+        self.fail_times = fail_times
+        self.error = error
+        self.appends = []
+
+    def append_rows(self, rows, value_input_option="RAW"):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError(self.error)
+        self.appends.append(rows)
+        return {"updates": {"updatedRange": f"ERRORS!A2:N{len(rows) + 1}"}}
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self._worksheet = worksheet
+        self.worksheet_calls = 0
+
+    def worksheet(self, name):
+        self.worksheet_calls += 1
+        return self._worksheet
+
+
+class FakeClient:
+    def __init__(self, worksheet):
+        self.spreadsheet = FakeSpreadsheet(worksheet)
+        self.open_calls = 0
+
+    def open_by_key(self, key):
+        self.open_calls += 1
+        return self.spreadsheet
+
+
+def _service(monkeypatch, worksheet):
+    monkeypatch.setenv("ENABLE_SHEETS_METRICS", "true")
+    monkeypatch.setenv("SHEETS_METRICS_SPREADSHEET_ID", "sheet-id")
+    service = SheetsService()
+    client = FakeClient(worksheet)
+    monkeypatch.setattr(service, "_get_client", lambda: client)
+    # El worker no arranca: los tests escriben con flush_buffers()
+    monkeypatch.setattr(service, "_ensure_worker", lambda: None)
+    return service, client
+
+
+def test_filas_se_escriben_en_un_solo_append_por_target(monkeypatch):
+    worksheet = FakeWorksheet()
+    service, client = _service(monkeypatch, worksheet)
+
+    for idx in range(25):
+        assert service.append_row("errors", [idx, "error"]) is True
+    assert worksheet.appends == []
+
+    assert service.flush_buffers() is True
+    assert len(worksheet.appends) == 1
+    assert [row[0] for row in worksheet.appends[0]] == list(range(25))
+
+    service.append_row("errors", [99, "error"])
+    service.flush_buffers()
+    # El handle de la hoja se reutiliza entre escrituras
+    assert client.open_calls == 1
+    assert client.spreadsheet.worksheet_calls == 1
+    assert service.stats["api_calls"] == 2
+    assert service.stats["rows_written"] == 26
+
+
+def test_quota_conserva_filas_en_orden_y_aplica_backoff(monkeypatch):
+    worksheet = FakeWorksheet(fail_times=1)
+    service, client = _service(monkeypatch, worksheet)
+
+    service.append_row("errors", ["a"])
+    service.append_row("errors", ["b"])
+    assert service.flush_buffers() is False
+    assert service.stats["quota_errors"] == 1
+    assert service._backoff_seconds >= 5
+
+    service.append_row("errors", ["c"])
+    assert service.flush_buffers() is True
+    assert worksheet.appends == [[["a"], ["b"], ["c"]]]
+    # Tras el error se vuelve a abrir la hoja
+    assert client.open_calls == 2
+    assert service._backoff_seconds == 0
+
+
+def test_buffer_acotado_descarta_las_filas_mas_viejas(monkeypatch):
+    worksheet = FakeWorksheet()
+    service, _ = _service(monkeypatch, worksheet)
+    service.max_buffered_rows = 3
+
+    for idx in range(5):
+        service.append_row("kpis", [idx])
+    service.flush_buffers()
+
+    assert worksheet.appends == [[[2], [3], [4]]]
+    assert service.stats["rows_dropped"] == 2
+
+
+def test_stats_consistentes_con_requests_y_worker_concurrentes(monkeypatch):
+    import threading
+
+    worksheet = FakeWorksheet()
+    service, _ = _service(monkeypatch, worksheet)
+    service.max_buffered_rows = 10_000
+
+    def _requests():
+        for idx in range(500):
+            service.append_row("tech", [idx])
+
+    def _worker():
+        for _ in range(50):
+            service.flush_buffers()
+            service._invalidate_worksheet("tech")
+
+    threads = [threading.Thread(target=_requests) for _ in range(4)] + [threading.Thread(target=_worker)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    service.flush_buffers()
+
+    assert service.stats["rows_buffered"] == 2000
+    assert service.stats["rows_written"] == sum(len(rows) for rows in worksheet.appends) == 2000
+    assert service.stats["api_calls"] == len(worksheet.appends)